@@ -1,24 +1,22 @@
 import asyncio
+import contextvars
 import functools
 import concurrent.futures
+import multiprocessing
 import os
-from typing import Any, Callable, TypeVar, Coroutine
-import logging
-from dotenv import load_dotenv
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, TypeVar, Coroutine
 
-# Carregar variáveis de ambiente
-load_dotenv()
+from config import get_logger
+from metrics_utils import executor_metrics
 
 # Configurar o logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/async_utils.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("async_utils")
+logger = get_logger("async_utils", "async_utils.log")
 
 # Pegar MAX_WORKERS do ambiente, ou usar um valor padrão
 MAX_WORKERS = int(os.getenv('MAX_WORKERS', '20'))
@@ -26,17 +24,485 @@ MAX_WORKERS = int(os.getenv('MAX_WORKERS', '20'))
 # Pegar TIMEOUT do ambiente, ou usar um valor padrão (10 minutos)
 API_TIMEOUT = float(os.getenv('API_TIMEOUT', '600'))
 
+# Classes de chamadas bloqueantes: verificações rápidas, ações que o usuário aguarda e varreduras em lote
+CALL_CLASS_CONTROL = "control"
+CALL_CLASS_INTERACTIVE = "interactive"
+CALL_CLASS_BATCH = "batch"
+CALL_CLASSES = (CALL_CLASS_CONTROL, CALL_CLASS_INTERACTIVE, CALL_CLASS_BATCH)
+
+# Prioridade de cada classe (menor é atendida primeiro)
+CALL_CLASS_PRIORITIES = {CALL_CLASS_CONTROL: 0, CALL_CLASS_INTERACTIVE: 1, CALL_CLASS_BATCH: 2}
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """
+    Converte limites por nome no formato "batch=8,control=4".
+
+    Returns:
+        dict: Limite por nome
+    """
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+# Limites do agendador (bulkhead): chamadas simultâneas no total (protege a API), por usuário e por classe
+BULKHEAD_GLOBAL_LIMIT = int(os.getenv('BULKHEAD_GLOBAL_LIMIT', str(MAX_WORKERS)))
+BULKHEAD_USER_LIMIT = int(os.getenv('BULKHEAD_USER_LIMIT', '4'))
+BULKHEAD_CLASS_LIMITS = parse_limits(os.getenv('BULKHEAD_CLASS_LIMITS', 'batch=8'))
+# Segundos de espera para uma chamada pendente subir um nível de prioridade (evita que o lote espere indefinidamente)
+BULKHEAD_AGING_SECONDS = float(os.getenv('BULKHEAD_AGING_SECONDS', '5'))
+
+# Espera na fila (segundos) acima da qual um alerta é registrado: sinal de executor saturado
+EXECUTOR_WAIT_WARNING = float(os.getenv('EXECUTOR_WAIT_WARNING', '1'))
+
+# Processos para etapas puramente de CPU (montagem de gráficos, pontuação de blocos), fora do GIL das threads de I/O;
+# 0 executa essas etapas nas threads do executor
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Prazo (segundos) das chamadas bloqueantes feitas durante uma requisição; 0 desativa
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '110'))
+
+# Usuário e classe das chamadas bloqueantes feitas no contexto atual (requisição ou job)
+current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_user", default=None)
+current_call_class: contextvars.ContextVar[str] = contextvars.ContextVar("current_call_class", default=CALL_CLASS_INTERACTIVE)
+
 # Criar um executor global de threads
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+EXECUTOR_THREAD_PREFIX = "blocking-executor"
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix=EXECUTOR_THREAD_PREFIX)
 logger.info(f"ThreadPoolExecutor inicializado com {MAX_WORKERS} workers")
 
 # Tipos genéricos para as funções
 T = TypeVar('T')
 
+
+class OperationCanceled(Exception):
+    """Chamada bloqueante interrompida por cancelamento ou prazo esgotado."""
+
+
+class CancellationToken:
+    """
+    Sinal de cancelamento cooperativo para chamadas bloqueantes.
+
+    A thread que executa a chamada consulta o token nos seus laços de espera e de nova tentativa
+    (ex: Polarium.get_candles) e desiste quando ele é cancelado ou o prazo termina, liberando a
+    vaga no executor. Um token filho herda o cancelamento e o prazo do pai (ex: requisição -> chamada).
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["CancellationToken"] = None):
+        """
+        Inicializa o CancellationToken.
+
+        Args:
+            timeout (float): Prazo em segundos a partir de agora (None: sem prazo próprio)
+            parent (CancellationToken): Token pai, cujo cancelamento e prazo valem também para este
+        """
+        self._event = threading.Event()
+        self._children: "weakref.WeakSet[CancellationToken]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        if parent is not None:
+            if parent.deadline is not None and (self.deadline is None or parent.deadline < self.deadline):
+                self.deadline = parent.deadline
+            parent._add_child(self)
+
+    def _add_child(self, child: "CancellationToken") -> None:
+        with self._lock:
+            if not self._event.is_set():
+                self._children.add(child)
+                return
+        child.cancel(self.reason)
+
+    def cancel(self, reason: str = "cancelado") -> None:
+        """Cancela o token e seus filhos."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            children = list(self._children)
+            self._children.clear()
+        for child in children:
+            child.cancel(reason)
+
+    @property
+    def canceled(self) -> bool:
+        """True se o token foi cancelado ou o prazo terminou."""
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("prazo esgotado")
+            return True
+        return False
+
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo (None: sem prazo; 0 se cancelado)."""
+        if self.canceled:
+            return 0.0
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_canceled(self) -> None:
+        """Lança OperationCanceled se o token foi cancelado ou o prazo terminou."""
+        if self.canceled:
+            raise OperationCanceled(self.reason)
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Aguarda até `seconds` segundos, retornando antes se o token for cancelado.
+
+        Returns:
+            bool: True se o token foi cancelado
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(seconds)
+        return self.canceled
+
+
+# Token de cancelamento das chamadas bloqueantes feitas no contexto atual (requisição, job ou chamada com timeout)
+current_cancel_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "current_cancel_token", default=None
+)
+
+
+def callable_name(func: Callable) -> str:
+    """
+    Nome de uma função para as métricas (ex: "Polarium.get_candles", "estrategia_minoria.load_candles").
+    """
+    while isinstance(func, functools.partial):
+        func = func.func
+    owner = getattr(func, "__self__", None)
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    if owner is not None and not isinstance(owner, types.ModuleType):
+        return f"{type(owner).__name__}.{getattr(func, '__name__', name)}"
+    return f"{getattr(func, '__module__', None) or 'builtins'}.{name}"
+
+
+class _Call:
+    """Chamada bloqueante agendada (pendente ou em execução)."""
+
+    __slots__ = ("fn", "name", "user_id", "call_class", "cancel_token", "future", "enqueued_at")
+
+    def __init__(self, fn: Callable, name: str, user_id: Optional[str], call_class: str,
+                 cancel_token: Optional[CancellationToken] = None):
+        self.fn = fn
+        self.name = name
+        self.user_id = user_id
+        self.call_class = call_class
+        self.cancel_token = cancel_token
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BulkheadScheduler:
+    """
+    Agenda chamadas bloqueantes no executor limitando quantas rodam ao mesmo tempo no total,
+    por usuário e por classe de chamada.
+
+    Chamadas acima dos limites aguardam em filas por classe e, dentro de cada classe, por usuário.
+    Sempre que uma chamada termina, a próxima é escolhida pela prioridade da classe (control,
+    depois interactive, depois batch) e, dentro da classe, alternando entre os usuários com chamadas
+    pendentes: uma varredura longa de um usuário não impede que as chamadas dos demais sejam atendidas.
+    A prioridade de uma chamada pendente sobe um nível a cada aging_seconds de espera, então
+    chamadas de lote não ficam paradas indefinidamente sob carga interativa constante.
+
+    Cada chamada registra, por função, o tempo na fila, o tempo de execução e erros
+    (executor_metrics); esperas acima de wait_warning acionam os ganchos de alerta.
+    """
+
+    def __init__(self, pool: concurrent.futures.Executor, global_limit: int = BULKHEAD_GLOBAL_LIMIT,
+                 user_limit: int = BULKHEAD_USER_LIMIT, class_limits: Optional[Dict[str, int]] = None,
+                 aging_seconds: float = BULKHEAD_AGING_SECONDS, wait_warning: float = EXECUTOR_WAIT_WARNING):
+        """
+        Inicializa o BulkheadScheduler.
+
+        Args:
+            pool: Executor onde as chamadas rodam
+            global_limit (int): Máximo de chamadas simultâneas no total (padrão: MAX_WORKERS)
+            user_limit (int): Máximo de chamadas simultâneas por usuário; 0 desativa (padrão: 4)
+            class_limits (dict): Máximo de chamadas simultâneas por classe (padrão: batch=8)
+            aging_seconds (float): Espera para subir um nível de prioridade (padrão: 5s)
+            wait_warning (float): Espera na fila que aciona os ganchos de alerta; 0 desativa (padrão: 1s)
+        """
+        self._pool = pool
+        self._global_limit = max(1, global_limit)
+        self._user_limit = user_limit
+        self._class_limits = dict(BULKHEAD_CLASS_LIMITS if class_limits is None else class_limits)
+        self._aging_seconds = max(0.001, aging_seconds)
+        self._wait_warning = wait_warning
+        self._wait_hooks: List[Callable[[Dict[str, Any]], None]] = []
+
+        self._lock = threading.Lock()
+        # Fila de cada classe: usuário -> chamadas pendentes; a ordem dos usuários define a vez
+        self._queues: Dict[str, "OrderedDict[Optional[str], Deque[_Call]]"] = {
+            call_class: OrderedDict() for call_class in CALL_CLASSES
+        }
+        self._active = 0
+        self._active_by_class: Dict[str, int] = {call_class: 0 for call_class in CALL_CLASSES}
+        self._active_by_user: Dict[Optional[str], int] = {}
+
+    def submit(self, fn: Callable[[], T], user_id: Optional[str] = None,
+               call_class: str = CALL_CLASS_INTERACTIVE, name: Optional[str] = None,
+               cancel_token: Optional[CancellationToken] = None) -> concurrent.futures.Future:
+        """
+        Agenda uma chamada bloqueante.
+
+        Args:
+            fn: Função sem argumentos a ser executada
+            user_id (str): Usuário dono da chamada (None: sem limite por usuário)
+            call_class (str): Classe da chamada (control, interactive ou batch)
+            name (str): Nome da função nas métricas (padrão: obtido de fn)
+            cancel_token (CancellationToken): Token da chamada; se cancelado antes de iniciar, a chamada é descartada
+
+        Returns:
+            concurrent.futures.Future: Resultado da chamada
+        """
+        if call_class not in self._queues:
+            call_class = CALL_CLASS_INTERACTIVE
+        call = _Call(fn, name or callable_name(fn), user_id, call_class, cancel_token)
+        with self._lock:
+            self._queues[call_class].setdefault(user_id, deque()).append(call)
+            self._dispatch()
+        return call.future
+
+    def add_wait_hook(self, hook: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Registra um gancho chamado quando uma chamada espera na fila mais que wait_warning.
+
+        Args:
+            hook: Função que recebe {"name", "call_class", "user_id", "wait", "active", "queued"}
+        """
+        self._wait_hooks.append(hook)
+
+    def _user_has_capacity(self, user_id: Optional[str]) -> bool:
+        return user_id is None or self._user_limit <= 0 or self._active_by_user.get(user_id, 0) < self._user_limit
+
+    def _class_has_capacity(self, call_class: str) -> bool:
+        limit = self._class_limits.get(call_class)
+        return limit is None or self._active_by_class[call_class] < limit
+
+    def _pop_next(self) -> Optional[_Call]:
+        """
+        Escolhe a próxima chamada a executar (com o lock adquirido): em cada classe, a do próximo
+        usuário na vez; entre as classes, a de melhor prioridade descontado o tempo de espera.
+        """
+        now = time.monotonic()
+        best = None
+        for call_class in CALL_CLASSES:
+            if not self._class_has_capacity(call_class):
+                continue
+            for user_id, pending in self._queues[call_class].items():
+                if self._user_has_capacity(user_id):
+                    score = CALL_CLASS_PRIORITIES[call_class] - (now - pending[0].enqueued_at) / self._aging_seconds
+                    if best is None or score < best[0]:
+                        best = (score, call_class, user_id)
+                    break
+        if best is None:
+            return None
+
+        _, call_class, user_id = best
+        queue = self._queues[call_class]
+        pending = queue[user_id]
+        call = pending.popleft()
+        if pending:
+            queue.move_to_end(user_id)  # Próxima chamada deste usuário vai para o fim da vez
+        else:
+            del queue[user_id]
+        return call
+
+    def _dispatch(self) -> None:
+        """Inicia chamadas pendentes enquanto houver capacidade (com o lock adquirido)."""
+        while self._active < self._global_limit:
+            call = self._pop_next()
+            if call is None:
+                return
+            if call.cancel_token is not None and call.cancel_token.canceled:
+                call.future.cancel()
+            if not call.future.set_running_or_notify_cancel():
+                executor_metrics.inc("canceled", func=call.name)
+                continue  # Cancelada enquanto aguardava (ex: timeout de quem a aguardava)
+            self._active += 1
+            self._active_by_class[call.call_class] += 1
+            self._active_by_user[call.user_id] = self._active_by_user.get(call.user_id, 0) + 1
+            self._pool.submit(self._run, call)
+
+    def _run(self, call: _Call) -> None:
+        """Executa uma chamada no executor, registrando esperas e duração, e libera sua vaga ao terminar."""
+        started = time.monotonic()
+        try:
+            wait = started - call.enqueued_at
+            executor_metrics.observe("wait", wait, func=call.name, call_class=call.call_class)
+            if self._wait_warning and wait >= self._wait_warning:
+                self._notify_wait(call, wait)
+            call.future.set_result(call.fn())
+        except BaseException as e:
+            executor_metrics.inc("canceled" if isinstance(e, OperationCanceled) else "errors", func=call.name)
+            call.future.set_exception(e)
+        finally:
+            executor_metrics.observe("run", time.monotonic() - started, func=call.name)
+            with self._lock:
+                self._active -= 1
+                self._active_by_class[call.call_class] -= 1
+                remaining = self._active_by_user[call.user_id] - 1
+                if remaining:
+                    self._active_by_user[call.user_id] = remaining
+                else:
+                    del self._active_by_user[call.user_id]
+                self._dispatch()
+
+    def _notify_wait(self, call: _Call, wait: float) -> None:
+        """Aciona os ganchos de alerta de espera longa na fila."""
+        executor_metrics.inc("slow_waits", func=call.name, call_class=call.call_class)
+        with self._lock:
+            active = self._active
+            queued = sum(len(pending) for queue in self._queues.values() for pending in queue.values())
+        info = {
+            "name": call.name,
+            "call_class": call.call_class,
+            "user_id": call.user_id,
+            "wait": wait,
+            "active": active,
+            "queued": queued,
+        }
+        for hook in list(self._wait_hooks):
+            try:
+                hook(info)
+            except Exception as e:
+                logger.error(f"Erro no gancho de alerta do executor: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Ocupação atual do agendador: chamadas em execução e pendentes por classe e por usuário.
+
+        Returns:
+            dict: Estatísticas
+        """
+        now = time.monotonic()
+        with self._lock:
+            queued_by_user: Dict[Optional[str], int] = {}
+            for queue in self._queues.values():
+                for user_id, pending in queue.items():
+                    queued_by_user[user_id] = queued_by_user.get(user_id, 0) + len(pending)
+            return {
+                "global_limit": self._global_limit,
+                "user_limit": self._user_limit,
+                "class_limits": dict(self._class_limits),
+                "active": self._active,
+                "queued": sum(queued_by_user.values()),
+                "classes": {
+                    call_class: {
+                        "active": self._active_by_class[call_class],
+                        "queued": sum(len(pending) for pending in self._queues[call_class].values()),
+                        "oldest_wait": max(
+                            (now - pending[0].enqueued_at for pending in self._queues[call_class].values()), default=0.0
+                        ),
+                    }
+                    for call_class in CALL_CLASSES
+                },
+                "users": {
+                    str(user_id): {"active": self._active_by_user.get(user_id, 0), "queued": queued_by_user.get(user_id, 0)}
+                    for user_id in set(self._active_by_user) | set(queued_by_user)
+                },
+            }
+
+
+# Agendador global das chamadas bloqueantes
+scheduler = BulkheadScheduler(executor)
+
+_last_wait_warning: Dict[str, float] = {}
+
+
+def log_slow_wait(info: Dict[str, Any]) -> None:
+    """
+    Gancho padrão de espera longa: registra um aviso (no máximo um a cada 10s por função).
+
+    Args:
+        info (dict): Dados da chamada (name, call_class, user_id, wait, active, queued)
+    """
+    now = time.monotonic()
+    if now - _last_wait_warning.get(info["name"], 0.0) < 10:
+        return
+    _last_wait_warning[info["name"]] = now
+    logger.warning(
+        f"{info['name']} ({info['call_class']}) aguardou {info['wait']:.2f}s na fila do executor "
+        f"({info['active']} em execução, {info['queued']} na fila): considere ajustar MAX_WORKERS"
+    )
+
+
+scheduler.add_wait_hook(log_slow_wait)
+
+
+def executor_stats() -> Dict[str, Any]:
+    """
+    Retrato atual do executor: ocupação do agendador e, por função, esperas na fila,
+    tempos de execução, erros, cancelamentos e timeouts.
+
+    Returns:
+        dict: {"max_workers", "threads", "scheduler", "functions"}
+    """
+    return {
+        "max_workers": MAX_WORKERS,
+        "threads": len(executor._threads),
+        "scheduler": scheduler.stats(),
+        "functions": executor_metrics.snapshot(group_by="func"),
+    }
+
+
+def executor_metrics_prometheus() -> str:
+    """
+    Métricas do executor no formato texto do Prometheus (histogramas de espera e execução por
+    função e ocupação atual por classe).
+
+    Returns:
+        str: Métricas no formato de exposição do Prometheus
+    """
+    stats = scheduler.stats()
+    gauges = [("active", {}, stats["active"]), ("queued", {}, stats["queued"])]
+    for call_class, info in stats["classes"].items():
+        gauges.append(("class_active", {"call_class": call_class}, info["active"]))
+        gauges.append(("class_queued", {"call_class": call_class}, info["queued"]))
+        gauges.append(("class_oldest_wait_seconds", {"call_class": call_class}, info["oldest_wait"]))
+    return executor_metrics.to_prometheus(gauges)
+
+
+@contextmanager
+def blocking_context(user_id: Optional[str] = None, call_class: Optional[str] = None,
+                     cancel_token: Optional[CancellationToken] = None) -> Iterator[None]:
+    """
+    Define o usuário, a classe e/ou o token de cancelamento das chamadas bloqueantes feitas
+    dentro do bloco (na requisição ou task atual).
+
+    Args:
+        user_id (str): Usuário dono das chamadas (None mantém o atual)
+        call_class (str): Classe das chamadas (None mantém a atual)
+        cancel_token (CancellationToken): Token de cancelamento das chamadas (None mantém o atual)
+    """
+    user_token = current_user.set(user_id) if user_id is not None else None
+    class_token = current_call_class.set(call_class) if call_class is not None else None
+    cancel_token_token = current_cancel_token.set(cancel_token) if cancel_token is not None else None
+    try:
+        yield
+    finally:
+        if cancel_token_token is not None:
+            current_cancel_token.reset(cancel_token_token)
+        if class_token is not None:
+            current_call_class.reset(class_token)
+        if user_token is not None:
+            current_user.reset(user_token)
+
 def run_blocking_func(func: Callable[..., T], *args, **kwargs) -> Coroutine[Any, Any, T]:
     """
     Executa uma função bloqueante em um thread separado usando o ThreadPoolExecutor.
     
+    A chamada passa pelo agendador, respeitando os limites do usuário e da classe
+    definidos no contexto atual (ver blocking_context). O contexto é copiado para a thread,
+    então a função pode consultar current_cancel_token.
+    
     Args:
         func: A função bloqueante a ser executada
         *args: Argumentos posicionais para a função
@@ -45,10 +511,206 @@ def run_blocking_func(func: Callable[..., T], *args, **kwargs) -> Coroutine[Any,
     Returns:
         Coroutine que pode ser aguardada com await
     """
-    return asyncio.get_event_loop().run_in_executor(
-        executor,
-        functools.partial(func, *args, **kwargs)
+    cancel_token = current_cancel_token.get()
+    if cancel_token is not None:
+        cancel_token.raise_if_canceled()
+    context = contextvars.copy_context()
+    future = scheduler.submit(
+        functools.partial(context.run, func, *args, **kwargs),
+        current_user.get(),
+        current_call_class.get(),
+        name=callable_name(func),
+        cancel_token=cancel_token
     )
+    return asyncio.wrap_future(future, loop=asyncio.get_event_loop())
+
+# Pool de processos das etapas de CPU, iniciado em cada processo antes das threads (ver start_process_pool)
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_process_pool_pid: Optional[int] = None
+_process_pool_lock = threading.Lock()
+
+
+def start_process_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    """
+    Cria o pool de processos deste processo e já inicia todos os seus processos.
+
+    Deve ser chamado antes de qualquer thread da aplicação (no post_fork do Gunicorn ou no início
+    de main.py): um fork de um processo com threads de requisição, de websocket e do agendador
+    pode herdar locks adquiridos por elas (logging, cache) e travar o processo filho. Com fork os
+    processos também não reimportam a aplicação, o que aconteceria com spawn ou forkserver.
+
+    Returns:
+        ProcessPoolExecutor ou None se CPU_WORKERS for 0
+    """
+    global _process_pool, _process_pool_pid
+    if CPU_WORKERS <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_pid != os.getpid():
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("fork")
+            )
+            # Com fork, o primeiro envio cria todos os processos de uma vez
+            pool.submit(int).result()
+            _process_pool = pool
+            _process_pool_pid = os.getpid()
+            logger.info(f"ProcessPoolExecutor inicializado com {CPU_WORKERS} processos no processo {_process_pool_pid}")
+        return _process_pool
+
+
+def get_process_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    """
+    Retorna o pool de processos deste processo, se iniciado por start_process_pool.
+    O pool não é criado sob demanda, pois o processo já teria threads no momento do fork.
+
+    Returns:
+        ProcessPoolExecutor ou None (as etapas de CPU rodam nas threads do executor)
+    """
+    if _process_pool is not None and _process_pool_pid == os.getpid():
+        return _process_pool
+    return None
+
+
+async def run_cpu_func(func: Callable[..., T], *args) -> T:
+    """
+    Executa uma etapa puramente de CPU no pool de processos, sem disputar o GIL com as threads de I/O.
+    
+    A função deve ser de nível de módulo e seus argumentos e resultado, compactos (listas, arrays,
+    strings), pois são serializados entre os processos. Sem o pool (CPU_WORKERS=0, pool não
+    iniciado neste processo) ou se ele falhar, a função é executada nas threads do executor.
+    
+    Args:
+        func: Função pura a ser executada
+        *args: Argumentos posicionais para a função
+        
+    Returns:
+        O resultado da função
+    """
+    global _process_pool
+    cancel_token = current_cancel_token.get()
+    if cancel_token is not None:
+        cancel_token.raise_if_canceled()
+    name = callable_name(func)
+    pool = get_process_pool()
+    if pool is not None:
+        started = time.monotonic()
+        try:
+            result = await asyncio.wrap_future(pool.submit(func, *args))
+            executor_metrics.observe("cpu_run", time.monotonic() - started, func=name)
+            return result
+        except concurrent.futures.process.BrokenProcessPool as e:
+            with _process_pool_lock:
+                if _process_pool is pool:
+                    # Não é recriado (o processo já tem threads): até o worker ser reciclado, usa as threads
+                    _process_pool = None
+            executor_metrics.inc("errors", func=name)
+            logger.error(f"Pool de processos indisponível ({str(e)}), executando {name} em thread")
+    return await run_blocking_func(func, *args)
+
+def run_control_func(func: Callable[..., T], *args, **kwargs) -> Coroutine[Any, Any, T]:
+    """
+    Executa uma verificação rápida (ex: check_connect, saldo) na classe de maior prioridade.
+    
+    Args:
+        func: A função bloqueante a ser executada
+        *args: Argumentos posicionais para a função
+        **kwargs: Argumentos nomeados para a função
+        
+    Returns:
+        Coroutine que pode ser aguardada com await
+    """
+    with blocking_context(call_class=CALL_CLASS_CONTROL):
+        return run_blocking_func(func, *args, **kwargs)
+
+def in_executor_thread() -> bool:
+    """Indica se o código atual roda numa thread do executor de chamadas bloqueantes."""
+    return threading.current_thread().name.startswith(EXECUTOR_THREAD_PREFIX)
+
+def submit_background_func(func: Callable[..., T], *args, **kwargs) -> concurrent.futures.Future:
+    """
+    Agenda uma função bloqueante em segundo plano, na classe de lote, sem aguardar o resultado
+    (ex: atualização de uma entrada desatualizada do cache).
+    
+    A chamada passa pelo agendador com o usuário e o token de cancelamento do contexto atual,
+    e o contexto é copiado para a thread.
+    
+    Args:
+        func: A função bloqueante a ser executada
+        *args: Argumentos posicionais para a função
+        **kwargs: Argumentos nomeados para a função
+        
+    Returns:
+        concurrent.futures.Future: Resultado da chamada
+    """
+    context = contextvars.copy_context()
+    context.run(current_call_class.set, CALL_CLASS_BATCH)
+    return scheduler.submit(
+        functools.partial(context.run, func, *args, **kwargs),
+        current_user.get(),
+        CALL_CLASS_BATCH,
+        name=callable_name(func),
+        cancel_token=current_cancel_token.get()
+    )
+
+
+# Loop de eventos para coroutines em segundo plano, criado sob demanda em cada processo
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_pid: Optional[int] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Retorna o loop de eventos de segundo plano deste processo, iniciando sua thread no primeiro uso.
+    
+    Returns:
+        asyncio.AbstractEventLoop: Loop executando em uma thread dedicada
+    """
+    global _background_loop, _background_loop_pid
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop_pid != os.getpid():
+            _background_loop = asyncio.new_event_loop()
+            _background_loop_pid = os.getpid()
+            threading.Thread(target=_background_loop.run_forever, daemon=True).start()
+        return _background_loop
+
+
+def submit_background_coro(coro_func: Callable[..., Coroutine[Any, Any, T]], *args) -> concurrent.futures.Future:
+    """
+    Agenda uma coroutine em segundo plano, no loop de segundo plano, sem aguardar o resultado.
+    
+    A coroutine roda com uma cópia do contexto atual (usuário e token de cancelamento) e suas
+    chamadas bloqueantes entram no agendador na classe de lote. Ela não ocupa uma thread do
+    executor enquanto aguarda essas chamadas.
+    
+    Args:
+        coro_func: Função assíncrona a ser executada
+        *args: Argumentos posicionais para a função
+        
+    Returns:
+        concurrent.futures.Future: Resultado da coroutine
+    """
+    async def run() -> T:
+        with blocking_context(call_class=CALL_CLASS_BATCH):
+            return await coro_func(*args)
+    
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    context = contextvars.copy_context()
+    loop = get_background_loop()
+    
+    def done(task: asyncio.Task) -> None:
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+    
+    def start() -> None:
+        loop.create_task(run(), context=context).add_done_callback(done)
+    
+    loop.call_soon_threadsafe(start)
+    return future
 
 async def run_with_timeout(coro: Coroutine[Any, Any, T], timeout: float = 600.0) -> T:
     """
@@ -77,6 +739,10 @@ async def run_blocking_with_timeout(func: Callable[..., T], *args, timeout: floa
     """
     Executa uma função bloqueante em um thread separado com timeout.
     
+    A chamada recebe um token de cancelamento (filho do token atual) que é cancelado quando o
+    timeout termina: funções que o consultam (current_cancel_token) interrompem seus laços e
+    liberam a vaga no executor, em vez de continuar rodando sem ninguém aguardando.
+    
     Args:
         func: A função bloqueante a ser executada
         *args: Argumentos posicionais para a função
@@ -87,10 +753,23 @@ async def run_blocking_with_timeout(func: Callable[..., T], *args, timeout: floa
         O resultado da função
         
     Raises:
-        asyncio.TimeoutError: Se a função não completar dentro do timeout
+        asyncio.TimeoutError: Se a função não completar dentro do timeout (inclusive quando
+            ela própria desiste ao ver o prazo do token esgotado)
     """
-    coro = run_blocking_func(func, *args, **kwargs)
-    return await run_with_timeout(coro, timeout=timeout)
+    cancel_token = CancellationToken(timeout, parent=current_cancel_token.get())
+    with blocking_context(cancel_token=cancel_token):
+        coro = run_blocking_func(func, *args, **kwargs)
+    try:
+        return await run_with_timeout(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        cancel_token.cancel("timeout")
+        executor_metrics.inc("timeouts", func=callable_name(func))
+        raise
+    except OperationCanceled as e:
+        if cancel_token.reason != "prazo esgotado":
+            raise  # Cancelamento de quem aguardava (ex: job cancelado), não timeout
+        executor_metrics.inc("timeouts", func=callable_name(func))
+        raise asyncio.TimeoutError(str(e)) from e
 
 def cleanup():
     """
@@ -101,4 +780,14 @@ def cleanup():
         executor.shutdown(wait=True)
         logger.info("ThreadPoolExecutor encerrado com sucesso")
     except Exception as e:
-        logger.error(f"Erro ao encerrar ThreadPoolExecutor: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Erro ao encerrar ThreadPoolExecutor: {str(e)}") 
+    
+    if _process_pool is not None and _process_pool_pid == os.getpid():
+        try:
+            _process_pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("ProcessPoolExecutor encerrado com sucesso")
+        except Exception as e:
+            logger.error(f"Erro ao encerrar ProcessPoolExecutor: {str(e)}")
+    
+    if _background_loop is not None and _background_loop_pid == os.getpid():
+        _background_loop.call_soon_threadsafe(_background_loop.stop)
\ No newline at end of file
@@ -0,0 +1,413 @@
+"""
+Backtest offline das estratégias de catalogação.
+
+Carrega históricos de velas (arquivos JSON ou o armazenamento local de velas) e avalia combinações de parâmetros
+(tamanho do bloco, posição da linha, martingales, política para dojis e faixas de horário)
+em paralelo, sem acessar a corretora. As velas de cada ativo ficam em memória compartilhada
+(multiprocessing.shared_memory) e são lidas pelos processos do pool sem cópia.
+
+Uso:
+    python backtest.py historico/*.json --strategies minoria,mhi --block-sizes 3,5 --martingales 0,1,2
+    python backtest.py --store data/candles.db --actives EURUSD,GBPUSD --days 30
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import get_logger
+from candle_store import CANDLE_STORE_PATH, CandleStore
+from strategies import STRATEGIES, DOJI_VOID, DOJI_IGNORE, CALL_CODE, PUT_CODE, DOJI_CODE
+
+# Configurar o logging
+logger = get_logger("backtest", "backtest.log")
+
+# Código de vela ausente no histórico (lacuna)
+MISSING_CODE = 127
+
+# Séries dos ativos anexadas em cada processo do pool: ativo -> (memória compartilhada, t0, timeframe, direções)
+_series: Dict[str, Tuple[shared_memory.SharedMemory, int, int, np.ndarray]] = {}
+
+
+def load_candles_file(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Carrega velas de um arquivo JSON.
+
+    Formatos aceitos:
+        - Lista de velas (o nome do arquivo, sem extensão, é o ativo)
+        - Dicionário {"active": "...", "candles": [...]}
+        - Dicionário {ativo: [velas], ...}
+
+    Args:
+        path (str): Caminho do arquivo
+
+    Returns:
+        dict: Velas por ativo
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        return {os.path.splitext(os.path.basename(path))[0]: data}
+    if isinstance(data, dict) and "candles" in data:
+        return {data.get("active") or os.path.splitext(os.path.basename(path))[0]: data["candles"]}
+    if isinstance(data, dict):
+        return {active: candles for active, candles in data.items() if isinstance(candles, list)}
+    raise ValueError(f"Formato de arquivo de velas não reconhecido: {path}")
+
+
+def load_candles_store(path: str, actives: Optional[List[str]] = None, days: Optional[float] = None,
+                       timeframe: int = 60) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Carrega velas do armazenamento local (candle_store).
+
+    Args:
+        path (str): Caminho do arquivo SQLite
+        actives: Ativos a carregar (padrão: todos os armazenados)
+        days (float): Carregar apenas os últimos N dias
+        timeframe (int): Duração de cada vela em segundos
+
+    Returns:
+        dict: Velas por ativo
+    """
+    store = CandleStore(path, retention_days=0)
+    start = int(time.time() - days * 86400) if days else None
+    return {active: store.read(active, timeframe, start=start) for active in (actives or store.list_actives(timeframe))}
+
+
+def build_direction_series(candles: List[Dict[str, Any]], timeframe: int = 60) -> Tuple[int, np.ndarray]:
+    """
+    Converte velas em uma série contínua de direções, uma posição por vela do período.
+
+    Args:
+        candles: Velas no formato da API (from, open, close)
+        timeframe (int): Duração de cada vela em segundos
+
+    Returns:
+        tuple: (horário da primeira vela, direções em int8 com MISSING_CODE nas lacunas)
+    """
+    times = np.fromiter((c['from'] for c in candles), dtype=np.int64, count=len(candles))
+    opens = np.fromiter((c['open'] for c in candles), dtype=np.float64, count=len(candles))
+    closes = np.fromiter((c['close'] for c in candles), dtype=np.float64, count=len(candles))
+
+    t0 = int(times.min())
+    directions = np.full((int(times.max()) - t0) // timeframe + 1, MISSING_CODE, dtype=np.int8)
+    directions[(times - t0) // timeframe] = np.sign(closes - opens).astype(np.int8)
+    return t0, directions
+
+
+def _attach_series(specs: List[Tuple[str, str, int, int, int]]) -> None:
+    """
+    Inicializador dos processos do pool: anexa as séries de direções em memória compartilhada.
+    """
+    for active, shm_name, length, t0, timeframe in specs:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _series[active] = (shm, t0, timeframe, np.ndarray((length,), dtype=np.int8, buffer=shm.buf))
+
+
+def parse_hours(window: str) -> Optional[Tuple[int, int]]:
+    """
+    Converte uma faixa de horário "H1-H2" (UTC, inclusiva) em tupla; "all" significa sem filtro.
+    """
+    if window in ("all", "*", ""):
+        return None
+    start, end = (int(h) for h in window.split("-"))
+    return start, end
+
+
+def hours_label(hours: Optional[Tuple[int, int]]) -> str:
+    """Representação de uma faixa de horário para tabelas e CSV."""
+    return "all" if hours is None else f"{hours[0]}-{hours[1]}"
+
+
+def _hour_mask(block_starts: np.ndarray, hours: Optional[Tuple[int, int]]) -> np.ndarray:
+    if hours is None:
+        return np.ones(len(block_starts), dtype=bool)
+    block_hours = (block_starts // 3600) % 24
+    start, end = hours
+    if start <= end:
+        return (block_hours >= start) & (block_hours <= end)
+    return (block_hours >= start) | (block_hours <= end)  # Faixa que passa da meia-noite
+
+
+def evaluate_series(directions: np.ndarray, t0: int, timeframe: int, params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Avalia uma estratégia sobre toda a série de um ativo, de forma vetorizada.
+
+    Segue as mesmas regras de strategies.evaluate_strategies: só blocos completos, dojis conforme
+    a política, apuração nas velas seguintes ao bloco e lacunas tratadas como velas não fechadas.
+
+    Args:
+        directions: Série de direções (CALL_CODE, PUT_CODE, DOJI_CODE ou MISSING_CODE)
+        t0 (int): Horário da primeira vela da série
+        timeframe (int): Duração de cada vela em segundos
+        params (dict): strategy, block_size, line_offset, max_martingale, doji_policy, hours
+
+    Returns:
+        dict: Horário dos blocos com resultado, se foi vitória e em qual nível (entrada = 0)
+    """
+    strategy = STRATEGIES[params["strategy"]].with_params(
+        block_size=params["block_size"],
+        line_offset=params["line_offset"],
+        max_martingale=params["max_martingale"],
+        doji_policy=params["doji_policy"],
+        timeframe=timeframe
+    )
+    block_seconds = strategy.block_seconds
+    t_end = t0 + len(directions) * timeframe
+
+    block_starts = np.arange(t0 - (t0 % block_seconds), t_end, block_seconds, dtype=np.int64)
+    block_offsets = np.array(strategy.block_candle_times(0), dtype=np.int64)
+    settle_offsets = np.array(strategy.settle_candle_times(0), dtype=np.int64)
+
+    # Posição extra no fim da série para índices fora do histórico (tratados como lacuna)
+    padded = np.append(directions, np.int8(MISSING_CODE))
+    missing_index = len(directions)
+
+    def gather(offsets):
+        index = (block_starts[:, None] + offsets[None, :] - t0) // timeframe
+        index[(index < 0) | (index >= missing_index)] = missing_index
+        return padded[index]
+
+    block_values = gather(block_offsets)
+    complete = (block_values != MISSING_CODE).all(axis=1)
+
+    window = block_values[:, -strategy.signal_window:] if strategy.signal_window else block_values
+    verde = (window == CALL_CODE).sum(axis=1)
+    vermelha = (window == PUT_CODE).sum(axis=1)
+    nulo = (window == DOJI_CODE).any(axis=1) if strategy.doji_policy == DOJI_VOID else np.zeros(len(window), dtype=bool)
+    signals = strategy.pick_signal_codes(verde, vermelha)
+
+    settle_values = gather(settle_offsets)
+    present = np.cumprod(settle_values != MISSING_CODE, axis=1).astype(bool)  # Só vale até a primeira lacuna
+    matches = (settle_values == signals[:, None]) & present
+    win = matches.any(axis=1)
+    loss = ~win & present.all(axis=1)
+
+    decided = complete & ~nulo & (win | loss) & _hour_mask(block_starts, params.get("hours"))
+    return {
+        "block_time": block_starts[decided],
+        "win": win[decided],
+        "level": np.argmax(matches, axis=1)[decided]
+    }
+
+
+def summarize(outcomes: Dict[str, np.ndarray], max_martingale: int, payout: float, multiplier: float) -> Dict[str, Any]:
+    """
+    Calcula taxa de acerto, lucro e drawdown de uma sequência de operações.
+
+    O lucro considera entrada de 1 unidade, multiplicada por `multiplier` a cada martingale.
+
+    Args:
+        outcomes: Resultado de evaluate_series (um ou mais ativos)
+        max_martingale (int): Quantidade de martingales
+        payout (float): Retorno da corretora por unidade em caso de vitória (ex: 0.8)
+        multiplier (float): Fator de multiplicação da entrada em cada martingale
+
+    Returns:
+        dict: Estatísticas agregadas
+    """
+    order = np.argsort(outcomes["block_time"], kind="stable")
+    win = outcomes["win"][order]
+    level = outcomes["level"][order]
+
+    stakes = multiplier ** np.arange(max_martingale + 1)
+    spent = np.cumsum(stakes)
+    win_profit = payout * stakes - (spent - stakes)
+    pnl = np.where(win, win_profit[level], -spent[-1])
+
+    equity = np.concatenate(([0.0], np.cumsum(pnl)))
+    drawdown = float(np.max(np.maximum.accumulate(equity) - equity))
+
+    max_loss_streak = 0
+    streak = 0
+    for is_win in win:
+        streak = 0 if is_win else streak + 1
+        max_loss_streak = max(max_loss_streak, streak)
+
+    operations = len(win)
+    wins = int(win.sum())
+    return {
+        "operations": operations,
+        "wins": wins,
+        "losses": operations - wins,
+        "win_rate": round(wins / operations * 100, 2) if operations else 0.0,
+        "wins_by_level": np.bincount(level[win], minlength=max_martingale + 1).tolist(),
+        "profit": round(float(equity[-1]), 2),
+        "max_drawdown": round(drawdown, 2),
+        "max_loss_streak": max_loss_streak
+    }
+
+
+def _run_combination(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Executa uma combinação de parâmetros sobre todos os ativos (executado nos processos do pool).
+    """
+    per_asset = []
+    for active, (_, t0, timeframe, directions) in _series.items():
+        per_asset.append((active, evaluate_series(directions, t0, timeframe, params)))
+
+    rows = []
+    combined = {
+        key: np.concatenate([outcomes[key] for _, outcomes in per_asset])
+        for key in ("block_time", "win", "level")
+    }
+    rows.append(dict(params, active="*", **summarize(combined, params["max_martingale"], params["payout"], params["multiplier"])))
+    if params.get("by_asset"):
+        for active, outcomes in per_asset:
+            rows.append(dict(params, active=active, **summarize(outcomes, params["max_martingale"], params["payout"], params["multiplier"])))
+    return rows
+
+
+def run_sweep(candles_by_asset: Dict[str, List[Dict[str, Any]]], grid: Dict[str, Iterable[Any]],
+              payout: float = 0.8, multiplier: float = 2.0, by_asset: bool = False,
+              workers: Optional[int] = None, timeframe: int = 60) -> List[Dict[str, Any]]:
+    """
+    Avalia todas as combinações de parâmetros em paralelo.
+
+    Args:
+        candles_by_asset: Velas por ativo
+        grid: Valores de strategy, block_size, line_offset, max_martingale, doji_policy e hours
+        payout (float): Retorno por unidade em caso de vitória
+        multiplier (float): Fator de multiplicação da entrada em cada martingale
+        by_asset (bool): Incluir também uma linha por ativo
+        workers (int): Número de processos (padrão: número de CPUs)
+        timeframe (int): Duração de cada vela em segundos
+
+    Returns:
+        list: Uma linha de estatísticas por combinação (e por ativo, se solicitado)
+    """
+    keys = ("strategy", "block_size", "line_offset", "max_martingale", "doji_policy", "hours")
+    combinations = [
+        dict(zip(keys, values), payout=payout, multiplier=multiplier, by_asset=by_asset)
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+
+    shared_blocks = []
+    specs = []
+    try:
+        # Copiar a série de cada ativo uma única vez para a memória compartilhada
+        for active, candles in candles_by_asset.items():
+            if not candles:
+                continue
+            t0, directions = build_direction_series(candles, timeframe)
+            shm = shared_memory.SharedMemory(create=True, size=directions.nbytes)
+            np.ndarray(directions.shape, dtype=np.int8, buffer=shm.buf)[:] = directions
+            shared_blocks.append(shm)
+            specs.append((active, shm.name, len(directions), t0, timeframe))
+
+        logger.info(f"Backtest: {len(combinations)} combinações sobre {len(specs)} ativos")
+        started = time.time()
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_series, initargs=(specs,)) as executor:
+            for result in executor.map(_run_combination, combinations, chunksize=max(1, len(combinations) // 64)):
+                rows.extend(result)
+
+        logger.info(f"Backtest concluído em {time.time() - started:.1f}s")
+        return rows
+
+    finally:
+        for shm in shared_blocks:
+            shm.close()
+            shm.unlink()
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    """
+    Formata as linhas do backtest como tabela de texto.
+    """
+    header = ["estratégia", "bloco", "linha", "mg", "doji", "horas", "ativo",
+              "ops", "acerto%", "vitórias/nível", "derrotas", "lucro", "drawdown", "seq.derrotas"]
+    lines = [
+        [
+            row["strategy"], str(row["block_size"]), str(row["line_offset"]), str(row["max_martingale"]),
+            row["doji_policy"], hours_label(row["hours"]),
+            row["active"], str(row["operations"]), f"{row['win_rate']:.2f}",
+            "/".join(str(n) for n in row["wins_by_level"]), str(row["losses"]),
+            f"{row['profit']:.2f}", f"{row['max_drawdown']:.2f}", str(row["max_loss_streak"])
+        ]
+        for row in rows
+    ]
+    widths = [max(len(col), *(len(line[i]) for line in lines)) if lines else len(col) for i, col in enumerate(header)]
+    output = ["  ".join(col.ljust(widths[i]) for i, col in enumerate(header)).rstrip()]
+    output.append("  ".join("-" * w for w in widths))
+    output.extend("  ".join(value.ljust(widths[i]) for i, value in enumerate(line)).rstrip() for line in lines)
+    return "\n".join(output)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _str_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backtest offline das estratégias de catalogação")
+    parser.add_argument("files", nargs="*", help="Arquivos JSON com histórico de velas")
+    parser.add_argument("--store", nargs="?", const=CANDLE_STORE_PATH,
+                        help=f"Ler o histórico do armazenamento local de velas (padrão: {CANDLE_STORE_PATH})")
+    parser.add_argument("--actives", type=_str_list, default=None, help="Ativos do armazenamento, ex: EURUSD,GBPUSD")
+    parser.add_argument("--days", type=float, default=None, help="Usar apenas os últimos N dias do armazenamento")
+    parser.add_argument("--strategies", type=_str_list, default=["minoria"], help="Ex: minoria,maioria,mhi")
+    parser.add_argument("--block-sizes", type=_int_list, default=[5], help="Velas por bloco, ex: 3,5")
+    parser.add_argument("--line-offsets", type=_int_list, default=[30], help="Segundos da linha antes do bloco, ex: 0,30")
+    parser.add_argument("--martingales", type=_int_list, default=[2], help="Quantidade de martingales, ex: 0,1,2")
+    parser.add_argument("--doji", type=_str_list, default=[DOJI_VOID], help=f"Política para dojis: {DOJI_VOID},{DOJI_IGNORE}")
+    parser.add_argument("--hours", type=_str_list, default=["all"], help="Faixas de horário UTC, ex: all,8-12,13-17")
+    parser.add_argument("--payout", type=float, default=0.8, help="Retorno por unidade em caso de vitória")
+    parser.add_argument("--multiplier", type=float, default=2.0, help="Multiplicador da entrada em cada martingale")
+    parser.add_argument("--by-asset", action="store_true", help="Incluir resultados por ativo")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: CPUs)")
+    parser.add_argument("--top", type=int, default=20, help="Quantidade de linhas exibidas")
+    parser.add_argument("--csv", help="Salvar todas as linhas em um arquivo CSV")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.strategies if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"Estratégias desconhecidas: {', '.join(unknown)}. Disponíveis: {', '.join(STRATEGIES)}")
+
+    if not args.files and not args.store:
+        parser.error("Informe arquivos JSON ou --store")
+
+    candles_by_asset: Dict[str, List[Dict[str, Any]]] = {}
+    if args.store:
+        candles_by_asset.update(load_candles_store(args.store, args.actives, args.days))
+    for path in args.files:
+        for active, candles in load_candles_file(path).items():
+            candles_by_asset.setdefault(active, []).extend(candles)
+
+    grid = {
+        "strategy": args.strategies,
+        "block_size": args.block_sizes,
+        "line_offset": args.line_offsets,
+        "max_martingale": args.martingales,
+        "doji_policy": args.doji,
+        "hours": [parse_hours(h) for h in args.hours]
+    }
+    rows = run_sweep(candles_by_asset, grid, args.payout, args.multiplier, args.by_asset, args.workers)
+    rows.sort(key=lambda r: (r["active"] != "*", -r["win_rate"], -r["profit"]))
+
+    print(format_table(rows[:args.top]))
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=[k for k in rows[0] if k not in ("payout", "multiplier", "by_asset")], extrasaction="ignore")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(row, hours=hours_label(row["hours"]),
+                                     wins_by_level="/".join(str(n) for n in row["wins_by_level"])))
+        logger.info(f"{len(rows)} linhas salvas em {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Teste de estresse do cache em memória (MemoryCache) com várias threads.
+
+Leitores, escritores e uma thread de manutenção (delete_many, keys, sweep e clear) operam
+ao mesmo tempo sobre o mesmo cache. Ao final são verificados:
+- integridade: todo valor lido pertence à chave consultada;
+- ordem: cada leitor nunca vê uma versão mais antiga de uma chave depois de uma mais nova;
+- contabilidade: itens e bytes de cada partição batem com os itens armazenados e respeitam os limites;
+- ausência de exceções em todas as threads.
+
+A vazão (leituras e gravações por segundo) é exibida para cada quantidade de partições,
+permitindo comparar um único lock (--shards 1) com o cache particionado.
+
+Uso:
+    python benchmarks/cache_stress.py
+    python benchmarks/cache_stress.py --threads 16 --seconds 5 --shards 1,4,16 --read-ratio 0.95
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_utils import MemoryCache, key_prefix  # noqa: E402
+
+PREFIXES = ("candles", "chart", "available_actives")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def check_accounting(cache: MemoryCache) -> List[str]:
+    """
+    Confere a contabilidade de cada partição (com o lock adquirido).
+
+    Returns:
+        list: Descrição das inconsistências encontradas (vazia se tudo estiver correto)
+    """
+    errors = []
+    for index, shard in enumerate(cache._shards):
+        with shard.lock:
+            total = sum(entry.size for entry in shard.items.values())
+            per_prefix = Counter()
+            for key, entry in shard.items.items():
+                per_prefix[key_prefix(key)] += entry.size
+            if total != shard.bytes:
+                errors.append(f"partição {index}: {shard.bytes} bytes contabilizados, {total} armazenados")
+            if +per_prefix != +shard.prefix_bytes:
+                errors.append(f"partição {index}: bytes por prefixo divergentes")
+            if len(shard.items) > shard.max_items:
+                errors.append(f"partição {index}: {len(shard.items)} itens, limite {shard.max_items}")
+            if shard.bytes > shard.max_bytes:
+                errors.append(f"partição {index}: {shard.bytes} bytes, limite {shard.max_bytes}")
+    return errors
+
+
+def run(shards: int, threads: int, seconds: float, keys: int, read_ratio: float,
+        max_items: int, value_size: int) -> Dict[str, Any]:
+    """
+    Executa uma rodada de estresse.
+
+    Args:
+        shards (int): Quantidade de partições do cache
+        threads (int): Quantidade de threads de leitura/gravação
+        seconds (float): Duração da rodada
+        keys (int): Quantidade de chaves distintas
+        read_ratio (float): Fração das operações que são leituras
+        max_items (int): Limite de itens do cache (menor que keys força remoções)
+        value_size (int): Tamanho aproximado de cada valor em bytes
+
+    Returns:
+        dict: Vazão, contagens e erros encontrados
+    """
+    cache = MemoryCache(max_items=max_items, max_bytes=max_items * value_size * 2, quotas={},
+                        sweep_interval=0, shards=shards)
+    all_keys = [f"{PREFIXES[i % len(PREFIXES)]}:{i}" for i in range(keys)]
+    payload = "x" * value_size
+
+    # Cada chave pertence a um único escritor, que grava versões crescentes
+    versions = [0] * keys
+    stop = threading.Event()
+    errors: List[str] = []
+    reads = Counter()
+    writes = Counter()
+
+    def worker(worker_id: int) -> None:
+        rng = random.Random(worker_id)
+        last_seen: Dict[str, int] = {}
+        owned = list(range(worker_id, keys, threads))
+        n_reads = n_writes = 0
+        try:
+            while not stop.is_set():
+                if rng.random() < read_ratio or not owned:
+                    key = all_keys[rng.randrange(keys)]
+                    hit, value = cache.get(key)
+                    if hit:
+                        if value[0] != key:
+                            errors.append(f"valor de {value[0]} lido na chave {key}")
+                        elif value[1] < last_seen.get(key, 0):
+                            errors.append(f"versão {value[1]} de {key} lida após a versão {last_seen[key]}")
+                        else:
+                            last_seen[key] = value[1]
+                    n_reads += 1
+                else:
+                    index = rng.choice(owned)
+                    versions[index] += 1
+                    key = all_keys[index]
+                    cache.set(key, (key, versions[index], payload), value_size, 60)
+                    n_writes += 1
+        except Exception as e:
+            errors.append(f"thread {worker_id}: {type(e).__name__}: {e}")
+        reads[worker_id] = n_reads
+        writes[worker_id] = n_writes
+
+    def maintenance() -> None:
+        rng = random.Random(-1)
+        try:
+            while not stop.wait(0.01):
+                operation = rng.randrange(4)
+                if operation == 0:
+                    cache.delete_many(rng.sample(all_keys, 20))
+                elif operation == 1:
+                    cache.keys(f"{rng.choice(PREFIXES)}:*")
+                elif operation == 2:
+                    cache.sweep()
+                    cache.stats()
+                elif rng.random() < 0.05:
+                    cache.clear()
+        except Exception as e:
+            errors.append(f"manutenção: {type(e).__name__}: {e}")
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    pool.append(threading.Thread(target=maintenance))
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    errors.extend(check_accounting(cache))
+    stats = cache.stats()
+    return {
+        "shards": shards,
+        "reads_per_s": sum(reads.values()) / elapsed,
+        "writes_per_s": sum(writes.values()) / elapsed,
+        "hit_ratio": stats["hits"] / max(1, stats["hits"] + stats["misses"]),
+        "evictions": sum(stats["evictions"].values()),
+        "items": stats["items"],
+        "errors": errors,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Teste de estresse do cache em memória com várias threads")
+    parser.add_argument("--threads", type=int, default=8, help="Threads de leitura/gravação")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duração de cada rodada")
+    parser.add_argument("--keys", type=int, default=5000, help="Quantidade de chaves distintas")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="Fração de leituras")
+    parser.add_argument("--max-items", type=int, default=2000, help="Limite de itens (menor que --keys força remoções)")
+    parser.add_argument("--value-size", type=int, default=256, help="Tamanho de cada valor em bytes")
+    parser.add_argument("--shards", type=_int_list, default=[1, 16], help="Quantidades de partições, ex: 1,4,16")
+    args = parser.parse_args(argv)
+
+    print(f"{'partições':>9} {'leituras/s':>12} {'gravações/s':>12} {'acertos':>8} {'remoções':>9} {'itens':>6}  resultado")
+    failed = False
+    for shards in args.shards:
+        result = run(shards, args.threads, args.seconds, args.keys, args.read_ratio, args.max_items, args.value_size)
+        status = "ok" if not result["errors"] else f"{len(result['errors'])} erros"
+        print(f"{result['shards']:>9} {result['reads_per_s']:>12,.0f} {result['writes_per_s']:>12,.0f} "
+              f"{result['hit_ratio']:>8.1%} {result['evictions']:>9} {result['items']:>6}  {status}")
+        for error in result["errors"][:10]:
+            print(f"    {error}")
+        failed = failed or bool(result["errors"])
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
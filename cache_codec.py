@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+from config import get_logger
+
+# Configurar o logging
+logger = get_logger("cache_codec", "cache.log")
+
+# Configuração da serialização dos valores enviados ao Redis
+CACHE_SERIALIZER = os.getenv('CACHE_SERIALIZER', 'auto')  # auto, orjson, msgpack ou json
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'auto')  # auto, lz4, zstd, zlib ou none
+CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', '4096'))  # Bytes; 0 desativa
+CACHE_COMPRESS_LEVEL = int(os.getenv('CACHE_COMPRESS_LEVEL', '1'))
+
+# Cabeçalho de um byte: identificador do serializador (bits 0-1) e do compressor (bits 2-3).
+# Os valores são bytes de controle, que nunca iniciam um JSON; assim valores antigos (JSON puro) continuam legíveis.
+# O zlib ocupa o antigo indicador de compressão (0x04), então valores gravados antes continuam legíveis.
+SERIALIZER_IDS = {"json": 1, "orjson": 2, "msgpack": 3}
+SERIALIZER_MASK = 0x03
+COMPRESSOR_IDS = {"zlib": 0x04, "lz4": 0x08, "zstd": 0x0C}
+COMPRESSOR_MASK = 0x0C
+
+
+def _json_serializer() -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    return (lambda value: json.dumps(value, separators=(",", ":")).encode()), json.loads
+
+
+def _orjson_serializer() -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    import orjson
+    return (lambda value: orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)), orjson.loads
+
+
+def _msgpack_serializer() -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    import msgpack
+    return (
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+    )
+
+
+_SERIALIZER_FACTORIES: Dict[str, Callable[[], Tuple[Callable, Callable]]] = {
+    "json": _json_serializer,
+    "orjson": _orjson_serializer,
+    "msgpack": _msgpack_serializer,
+}
+
+
+def _zlib_compressor(level: int) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    return (lambda data: zlib.compress(data, level)), zlib.decompress
+
+
+def _lz4_compressor(level: int) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import lz4.frame
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zstd_compressor(level: int) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import zstandard
+    # Os objetos do zstandard não são thread-safe: um por thread
+    local = threading.local()
+
+    def compress(data: bytes) -> bytes:
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(level=level)
+        return local.compressor.compress(data)
+
+    def decompress(data: bytes) -> bytes:
+        if not hasattr(local, "decompressor"):
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.decompressor.decompress(data)
+
+    return compress, decompress
+
+
+_COMPRESSOR_FACTORIES: Dict[str, Callable[[int], Tuple[Callable, Callable]]] = {
+    "zlib": _zlib_compressor,
+    "lz4": _lz4_compressor,
+    "zstd": _zstd_compressor,
+}
+
+
+class CacheCodec:
+    """
+    Codifica valores do cache em bytes para o Redis.
+
+    O serializador é escolhido entre orjson, msgpack e json (o primeiro disponível no modo "auto")
+    e valores grandes são comprimidos com lz4, zstd ou zlib (o primeiro disponível no modo "auto").
+    Um byte de cabeçalho registra o formato e o compressor usados, então valores gravados com outra
+    configuração (ou por outro worker) continuam legíveis.
+    """
+
+    def __init__(self, serializer: str = CACHE_SERIALIZER, compress_threshold: int = CACHE_COMPRESS_THRESHOLD,
+                 compress_level: int = CACHE_COMPRESS_LEVEL, compression: str = CACHE_COMPRESSION):
+        """
+        Inicializa o CacheCodec.
+
+        Args:
+            serializer (str): "auto", "orjson", "msgpack" ou "json" (padrão: auto)
+            compress_threshold (int): Tamanho mínimo em bytes para comprimir; 0 desativa (padrão: 4096)
+            compress_level (int): Nível de compressão do zlib e do zstd (padrão: 1, o mais rápido)
+            compression (str): "auto", "lz4", "zstd", "zlib" ou "none" (padrão: auto)
+        """
+        self._compress_threshold = compress_threshold
+
+        # Decodificadores de todos os serializadores disponíveis, para ler valores de qualquer formato
+        self._decoders: Dict[int, Callable[[bytes], Any]] = {}
+        encoders: Dict[str, Callable[[Any], bytes]] = {}
+        for name, factory in _SERIALIZER_FACTORIES.items():
+            try:
+                encoders[name], self._decoders[SERIALIZER_IDS[name]] = factory()
+            except ImportError:
+                continue
+
+        if serializer == "auto":
+            serializer = next(name for name in ("orjson", "msgpack", "json") if name in encoders)
+        elif serializer not in encoders:
+            logger.warning(f"Serializador '{serializer}' indisponível, usando json")
+            serializer = "json"
+
+        self.serializer = serializer
+        self._encode = encoders[serializer]
+        self._serializer_id = SERIALIZER_IDS[serializer]
+
+        # Descompressores de todos os compressores disponíveis, pelo mesmo motivo
+        self._decompressors: Dict[int, Callable[[bytes], bytes]] = {}
+        compressors: Dict[str, Callable[[bytes], bytes]] = {}
+        for name, factory in _COMPRESSOR_FACTORIES.items():
+            try:
+                compressors[name], self._decompressors[COMPRESSOR_IDS[name]] = factory(compress_level)
+            except ImportError:
+                continue
+
+        if compression == "auto":
+            compression = next(name for name in ("lz4", "zstd", "zlib") if name in compressors)
+        elif compression != "none" and compression not in compressors:
+            logger.warning(f"Compressor '{compression}' indisponível, usando zlib")
+            compression = "zlib"
+
+        self.compression = compression
+        self._compress = compressors.get(compression)
+        self._compressor_id = COMPRESSOR_IDS.get(compression, 0)
+        if self._compress is None:
+            self._compress_threshold = 0
+
+        # Totais dos valores comprimidos (antes e depois), para a taxa de compressão
+        self._stats_lock = threading.Lock()
+        self._compressed_values = 0
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        logger.info(f"CacheCodec usando {serializer} (compressão {compression} acima de {compress_threshold} bytes)")
+
+    @property
+    def threshold(self) -> int:
+        """Tamanho mínimo em bytes para comprimir (0 se a compressão estiver desativada)."""
+        return self._compress_threshold
+
+    def dumps(self, value: Any) -> bytes:
+        """
+        Codifica um valor.
+
+        Args:
+            value: Valor serializável (tipos JSON)
+
+        Returns:
+            bytes: Cabeçalho de um byte seguido do conteúdo
+        """
+        payload = self._encode(value)
+        header = self._serializer_id
+        if self._compress_threshold and len(payload) >= self._compress_threshold:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                # Só entram nas estatísticas os valores gravados comprimidos
+                with self._stats_lock:
+                    self._compressed_values += 1
+                    self._raw_bytes += len(payload)
+                    self._compressed_bytes += len(compressed)
+                payload = compressed
+                header |= self._compressor_id
+        return bytes((header,)) + payload
+
+    def is_compressed(self, data: bytes) -> bool:
+        """Indica se um valor codificado por dumps foi gravado comprimido."""
+        return bool(data) and data[0] <= 0x0F and bool(data[0] & COMPRESSOR_MASK)
+
+    def loads(self, data: bytes) -> Any:
+        """
+        Decodifica um valor gravado por dumps (ou um JSON puro, formato anterior).
+
+        Args:
+            data (bytes): Valor lido do Redis
+
+        Returns:
+            Valor decodificado
+        """
+        header = data[0]
+        decoder = self._decoders.get(header & SERIALIZER_MASK) if header <= 0x0F else None
+        if decoder is None:
+            return json.loads(data)  # Formato anterior: JSON sem cabeçalho
+        payload = data[1:]
+        compressor_id = header & COMPRESSOR_MASK
+        if compressor_id:
+            decompress = self._decompressors.get(compressor_id)
+            if decompress is None:
+                raise ValueError(f"Compressor do valor em cache indisponível (cabeçalho {header:#04x})")
+            payload = decompress(payload)
+        return decoder(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estatísticas da compressão dos valores gravados comprimidos: quantidade, bytes antes e depois
+        e a taxa (original/comprimido).
+
+        Returns:
+            dict: Estatísticas
+        """
+        with self._stats_lock:
+            return {
+                "serializer": self.serializer,
+                "compression": self.compression,
+                "compress_threshold": self._compress_threshold,
+                "compressed_values": self._compressed_values,
+                "raw_bytes": self._raw_bytes,
+                "compressed_bytes": self._compressed_bytes,
+                "compression_ratio": round(self._raw_bytes / self._compressed_bytes, 2) if self._compressed_bytes else None,
+            }
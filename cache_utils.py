@@ -1,29 +1,721 @@
+import asyncio
+import functools
 import json
+import uuid
 import time
 import hashlib
-import logging
-from typing import Any, Dict, Optional, Tuple, List, Union
+import threading
+from datetime import date, datetime, time as dt_time
+from enum import Enum
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from fnmatch import fnmatchcase
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, List, Union
 import os
-from dotenv import load_dotenv
-
-# Carregar variáveis de ambiente
-load_dotenv()
-
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/cache.log"),
-        logging.StreamHandler()
-    ]
+
+from config import get_logger
+from cache_codec import CacheCodec
+from async_utils import OperationCanceled, in_executor_thread, submit_background_coro, submit_background_func
+from metrics_utils import cache_metrics
+
+try:
+    import xxhash  # Digest rápido das chaves, opcional
+except ImportError:
+    xxhash = None
+
+# Configurar o logging
+logger = get_logger("cache_utils", "cache.log")
+
+
+def parse_size(value: str) -> int:
+    """
+    Converte um tamanho em bytes, aceitando os sufixos K, M e G (ex: "64M").
+
+    Args:
+        value (str): Tamanho
+
+    Returns:
+        int: Tamanho em bytes
+    """
+    value = value.strip().upper().rstrip("B")
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def parse_quotas(value: str) -> Dict[str, int]:
+    """
+    Converte cotas por prefixo no formato "prefixo=tamanho,..." (ex: "candles=32M,chart=8M").
+
+    Returns:
+        dict: Limite de bytes por prefixo
+    """
+    quotas = {}
+    for item in value.split(","):
+        if "=" in item:
+            prefix, size = item.split("=", 1)
+            quotas[prefix.strip()] = parse_size(size)
+    return quotas
+
+
+# Limites do cache em memória (usado quando Redis não está disponível)
+CACHE_MEMORY_MAX_ITEMS = int(os.getenv('CACHE_MEMORY_MAX_ITEMS', '10000'))
+CACHE_MEMORY_MAX_BYTES = parse_size(os.getenv('CACHE_MEMORY_MAX_BYTES', '64M'))
+CACHE_PREFIX_QUOTAS = parse_quotas(os.getenv('CACHE_PREFIX_QUOTAS', 'candles=32M,chart=8M'))
+CACHE_SWEEP_INTERVAL = int(os.getenv('CACHE_SWEEP_INTERVAL', '60'))
+CACHE_MEMORY_SHARDS = int(os.getenv('CACHE_MEMORY_SHARDS', '16'))  # Partições (locks) do cache em memória
+# Prefixos guardados codificados e comprimidos no cache em memória (padrão: velas); vazio desativa
+CACHE_MEMORY_COMPRESS_PREFIXES = frozenset(
+    prefix.strip() for prefix in os.getenv('CACHE_MEMORY_COMPRESS_PREFIXES', 'candles').split(',') if prefix.strip()
 )
-logger = logging.getLogger("cache_utils")
+
+# Quantidade de chaves por comando nas operações em lote no Redis
+CACHE_BATCH_SIZE = 500
+
+# Cache local (L1) à frente do Redis: limites e tempo máximo de um item sem nova leitura do Redis
+CACHE_L1_MAX_ITEMS = int(os.getenv('CACHE_L1_MAX_ITEMS', '2000'))
+CACHE_L1_MAX_BYTES = parse_size(os.getenv('CACHE_L1_MAX_BYTES', '16M'))
+CACHE_L1_TTL = float(os.getenv('CACHE_L1_TTL', '30'))
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache:invalidate')
+
+# Tempo máximo em segundos aguardando um cálculo em andamento da mesma chave
+CACHE_SINGLE_FLIGHT_TIMEOUT = float(os.getenv('CACHE_SINGLE_FLIGHT_TIMEOUT', '10'))
+
+
+def approx_size(value: Any) -> int:
+    """
+    Estima o tamanho em bytes de um valor para os limites do cache em memória, sem serializá-lo.
+
+    Listas longas são estimadas por amostragem (primeiro, meio e último item), o que basta
+    para as listas homogêneas do cache (velas, ativos) e mantém o custo independente do tamanho.
+
+    Args:
+        value: Valor a ser armazenado
+
+    Returns:
+        int: Tamanho aproximado em bytes
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return 2 + sum(len(str(k)) + 4 + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if len(value) <= 3:
+            return 2 + sum(approx_size(item) + 1 for item in value)
+        sample = (value[0], value[len(value) // 2], value[-1])
+        return 2 + len(value) * (sum(approx_size(item) for item in sample) // 3 + 1)
+    return 8  # Números, booleanos e None
+
+
+def key_prefix(key: str) -> str:
+    """Prefixo de uma chave de cache (parte antes do primeiro ":")."""
+    return key.split(":", 1)[0]
+
+
+def _encode_key_part(value: Any, out: bytearray) -> None:
+    """
+    Acrescenta a codificação canônica de um valor: marcador de tipo, tamanho e conteúdo.
+
+    A codificação depende apenas do valor (nunca de hash() ou id()), então é a mesma em
+    qualquer processo. Dicionários e conjuntos são ordenados pela codificação dos itens.
+    Outros objetos podem definir __cache_key__() retornando um valor codificável.
+
+    Raises:
+        TypeError: Se o valor não tiver representação estável
+    """
+    if value is None:
+        out += b"N"
+    elif value is True or value is False:
+        out += b"T" if value else b"F"
+    elif isinstance(value, int) and not isinstance(value, Enum):
+        out += b"i%d;" % value
+    elif isinstance(value, float):
+        out += b"f" + repr(value).encode() + b";"
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        out += b"s%d:" % len(data) + data
+    elif isinstance(value, (bytes, bytearray)):
+        out += b"b%d:" % len(value) + bytes(value)
+    elif isinstance(value, (list, tuple)):
+        out += (b"l%d:" if isinstance(value, list) else b"t%d:") % len(value)
+        for item in value:
+            _encode_key_part(item, out)
+    elif isinstance(value, dict):
+        pairs = []
+        for k, v in value.items():
+            encoded = bytearray()
+            _encode_key_part(k, encoded)
+            _encode_key_part(v, encoded)
+            pairs.append(bytes(encoded))
+        out += b"d%d:" % len(pairs) + b"".join(sorted(pairs))
+    elif isinstance(value, (set, frozenset)):
+        items = []
+        for item in value:
+            encoded = bytearray()
+            _encode_key_part(item, encoded)
+            items.append(bytes(encoded))
+        out += b"S%d:" % len(items) + b"".join(sorted(items))
+    elif isinstance(value, (datetime, date, dt_time)):
+        data = value.isoformat().encode()
+        out += b"D%d:" % len(data) + data
+    elif isinstance(value, Enum):
+        out += b"E"
+        _encode_key_part(f"{type(value).__module__}.{type(value).__qualname__}", out)
+        _encode_key_part(value.value, out)
+    elif isinstance(value, uuid.UUID):
+        out += b"u" + value.hex.encode()
+    elif hasattr(value, "__cache_key__"):
+        out += b"o"
+        _encode_key_part(f"{type(value).__module__}.{type(value).__qualname__}", out)
+        _encode_key_part(value.__cache_key__(), out)
+    else:
+        raise TypeError(f"Argumento sem representação estável para chave de cache: {type(value).__name__}")
+
+
+def encode_key_args(*args, **kwargs) -> bytes:
+    """
+    Codificação canônica e determinística dos argumentos de uma chamada.
+
+    Returns:
+        bytes: Argumentos posicionais seguidos dos nomeados (ordenados pelo nome)
+
+    Raises:
+        TypeError: Se algum argumento não tiver representação estável
+    """
+    out = bytearray()
+    _encode_key_part(args, out)
+    _encode_key_part(kwargs, out)
+    return bytes(out)
+
+
+def key_digest(data: bytes) -> str:
+    """Digest não criptográfico de 128 bits (xxh3 se disponível, blake2b caso contrário)."""
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PackedValue:
+    """Valor guardado codificado (e comprimido) no cache em memória, decodificado a cada leitura."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class _Entry:
+    """Item do cache em memória. O bit de referência é marcado nas leituras, sem lock (algoritmo CLOCK)."""
+
+    __slots__ = ("value", "expiry", "size", "referenced")
+
+    def __init__(self, value: Any, expiry: float, size: int):
+        self.value = value
+        self.expiry = expiry
+        self.size = size
+        self.referenced = False
+
+
+class _Shard:
+    """
+    Uma partição do MemoryCache, com lock, limites e contadores próprios.
+
+    As leituras não adquirem o lock: a consulta ao dicionário é atômica e apenas marcam o bit de
+    referência do item. As gravações e remoções adquirem o lock da partição. Na remoção por limite,
+    itens referenciados desde a última passagem ganham uma segunda chance (vão para o fim da fila),
+    o que aproxima o LRU sem que as leituras alterem a ordem dos itens.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int, quotas: Dict[str, int]):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.quotas = quotas
+
+        self.items: "OrderedDict[str, _Entry]" = OrderedDict()  # Ordem de inserção (fila do CLOCK)
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.prefix_bytes: Counter = Counter()
+
+        # Acertos e faltas são contados sem lock (podem ser aproximados sob concorrência)
+        self.hits = 0
+        self.misses = 0
+        self.counters: Counter = Counter()         # sets, rejected
+        self.evictions: Counter = Counter()        # Remoções por motivo (lru, quota, expired)
+        self.prefix_evictions: Counter = Counter()
+
+    def remove(self, key: str, reason: Optional[str] = None) -> None:
+        """Remove um item (com o lock adquirido), registrando o motivo se for uma remoção automática."""
+        entry = self.items.pop(key)
+        prefix = key_prefix(key)
+        self.bytes -= entry.size
+        self.prefix_bytes[prefix] -= entry.size
+        if self.prefix_bytes[prefix] <= 0:
+            del self.prefix_bytes[prefix]
+        if reason:
+            self.evictions[reason] += 1
+            self.prefix_evictions[prefix] += 1
+
+    def lookup(self, key: str, now: float) -> Tuple[bool, Any]:
+        """Consulta uma chave sem adquirir o lock, marcando-a como referenciada."""
+        entry = self.items.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        if now >= entry.expiry:
+            with self.lock:
+                if self.items.get(key) is entry:
+                    self.remove(key, "expired")
+            self.misses += 1
+            return False, None
+        entry.referenced = True
+        self.hits += 1
+        return True, entry.value
+
+    def _evict_prefix(self, prefix: str, needed: int, quota: int) -> None:
+        """Remove itens do prefixo (com o lock adquirido) até caber na cota, poupando os referenciados na primeira passagem."""
+        candidates = [key for key in self.items if key_prefix(key) == prefix]
+        for second_pass in (False, True):
+            for key in candidates:
+                entry = self.items.get(key)
+                if entry is None:
+                    continue
+                if entry.referenced and not second_pass:
+                    entry.referenced = False
+                    continue
+                self.remove(key, "quota")
+                if self.prefix_bytes[prefix] + needed <= quota:
+                    return
+
+    def _evict_one(self) -> None:
+        """Remove um item (com o lock adquirido) pelo algoritmo CLOCK."""
+        while True:
+            key, entry = next(iter(self.items.items()))
+            if not entry.referenced:
+                self.remove(key, "lru")
+                return
+            entry.referenced = False
+            self.items.move_to_end(key)
+
+    def store(self, key: str, value: Any, size: int, expiry: float) -> bool:
+        """Armazena um valor (com o lock adquirido), removendo itens se necessário."""
+        prefix = key_prefix(key)
+        quota = self.quotas.get(prefix)
+        if size > self.max_bytes or (quota is not None and size > quota):
+            self.counters["rejected"] += 1
+            logger.warning(f"Valor de {size} bytes excede o limite do cache em memória: {key}")
+            return False
+
+        if key in self.items:
+            self.remove(key)
+
+        # Cota do prefixo: remover primeiro itens do mesmo prefixo
+        if quota is not None and self.prefix_bytes[prefix] + size > quota:
+            self._evict_prefix(prefix, size, quota)
+
+        # Limites globais da partição: remover itens de qualquer prefixo
+        while self.items and (len(self.items) >= self.max_items or self.bytes + size > self.max_bytes):
+            self._evict_one()
+
+        self.items[key] = _Entry(value, expiry, size)
+        self.bytes += size
+        self.prefix_bytes[prefix] += size
+        self.counters["sets"] += 1
+        return True
+
+    def sweep(self, now: float) -> int:
+        """Remove os itens expirados (adquire o lock)."""
+        with self.lock:
+            expired = [key for key, entry in self.items.items() if now >= entry.expiry]
+            for key in expired:
+                self.remove(key, "expired")
+        return len(expired)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+            self.prefix_bytes.clear()
+            self.bytes = 0
+
+
+class MemoryCache:
+    """
+    Cache em memória com limite de itens e de bytes, removendo os itens menos usados (CLOCK, aproximação do LRU).
+
+    As chaves são distribuídas em partições (CACHE_MEMORY_SHARDS), cada uma com seu próprio lock e
+    uma fração dos limites: leituras nunca bloqueiam (nem são bloqueadas por) outras leituras, e
+    gravações concorrem apenas com as da mesma partição.
+
+    Cada prefixo de chave (ex: "candles") pode ter uma cota de bytes própria, para que um tipo
+    de dado não expulse os demais. Itens expirados são removidos na leitura e por uma varredura
+    periódica em segundo plano, pois muitas chaves (ex: velas por minuto) nunca são lidas de novo.
+    """
+
+    def __init__(self, max_items: int = CACHE_MEMORY_MAX_ITEMS, max_bytes: int = CACHE_MEMORY_MAX_BYTES,
+                 quotas: Optional[Dict[str, int]] = None, sweep_interval: int = CACHE_SWEEP_INTERVAL,
+                 shards: int = CACHE_MEMORY_SHARDS):
+        """
+        Inicializa o MemoryCache.
+
+        Args:
+            max_items (int): Quantidade máxima de itens (padrão: 10000)
+            max_bytes (int): Total máximo de bytes armazenados (padrão: 64 MB)
+            quotas (dict): Limite de bytes por prefixo de chave
+            sweep_interval (int): Intervalo em segundos da varredura de itens expirados (padrão: 60)
+            shards (int): Quantidade de partições; cada uma recebe uma fração dos limites (padrão: 16)
+        """
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._quotas = dict(CACHE_PREFIX_QUOTAS if quotas is None else quotas)
+        self._sweep_interval = sweep_interval
+
+        count = max(1, shards)
+        shard_quotas = {prefix: -(-quota // count) for prefix, quota in self._quotas.items()}
+        self._shards = [
+            _Shard(-(-max_items // count), -(-max_bytes // count), shard_quotas)
+            for _ in range(count)
+        ]
+
+        # A varredura é iniciada sob demanda em cada processo (com preload_app, threads não sobrevivem ao fork)
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_pid: Optional[int] = None
+        self._sweeper_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _ensure_sweeper(self) -> None:
+        """Inicia a thread de varredura neste processo, se ainda não estiver rodando."""
+        if self._sweep_interval <= 0:
+            return
+        if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._stop_event.clear()
+            self._sweeper = threading.Thread(target=self._sweep_task, daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_task(self) -> None:
+        """
+        Tarefa em background que remove itens expirados periodicamente.
+        """
+        while not self._stop_event.wait(self._sweep_interval):
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.debug(f"Varredura do cache em memória removeu {removed} itens expirados")
+            except Exception as e:
+                logger.error(f"Erro na varredura do cache em memória: {str(e)}")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Recupera um valor, marcando-o como usado recentemente.
+
+        Returns:
+            tuple: (hit, value)
+        """
+        return self._shard(key).lookup(key, time.time())
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Recupera vários valores de uma vez.
+
+        Returns:
+            dict: Valores encontrados por chave (chaves ausentes ou expiradas são omitidas)
+        """
+        now = time.time()
+        found = {}
+        for key in keys:
+            hit, value = self._shard(key).lookup(key, now)
+            if hit:
+                found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, size: int, ttl: int) -> bool:
+        """
+        Armazena um valor, removendo os itens menos usados se algum limite for excedido.
+
+        Args:
+            key: Chave do cache
+            value: Valor a ser armazenado
+            size (int): Tamanho do valor em bytes
+            ttl (int): Tempo de vida em segundos
+
+        Returns:
+            bool: True se armazenado, False se o valor sozinho excede os limites da partição
+        """
+        self._ensure_sweeper()
+        shard = self._shard(key)
+        with shard.lock:
+            return shard.store(key, value, size, time.time() + ttl)
+
+    def set_many(self, items: Dict[str, Tuple[Any, int]], ttl: int) -> bool:
+        """
+        Armazena vários valores de uma vez.
+
+        Args:
+            items (dict): (valor, tamanho em bytes) por chave
+            ttl (int): Tempo de vida em segundos
+
+        Returns:
+            bool: True se todos foram armazenados
+        """
+        self._ensure_sweeper()
+        expiry = time.time() + ttl
+        stored = True
+        for shard, keys in self._group(items).items():
+            with shard.lock:
+                for key in keys:
+                    value, size = items[key]
+                    stored = shard.store(key, value, size, expiry) and stored
+        return stored
+
+    def _group(self, keys) -> Dict[_Shard, List[str]]:
+        """Agrupa chaves por partição, para adquirir cada lock uma única vez."""
+        groups: Dict[_Shard, List[str]] = {}
+        for key in keys:
+            groups.setdefault(self._shard(key), []).append(key)
+        return groups
+
+    def delete(self, key: str) -> bool:
+        """
+        Remove um valor.
+
+        Returns:
+            bool: True se o item existia
+        """
+        return self.delete_many([key]) == 1
+
+    def delete_many(self, keys: List[str]) -> int:
+        """
+        Remove vários valores de uma vez.
+
+        Returns:
+            int: Quantidade de itens removidos
+        """
+        removed = 0
+        for shard, shard_keys in self._group(keys).items():
+            with shard.lock:
+                for key in shard_keys:
+                    if key in shard.items:
+                        shard.remove(key)
+                        removed += 1
+        return removed
+
+    def keys(self, pattern: Optional[str] = None) -> List[str]:
+        """
+        Cópia da lista de chaves armazenadas (pode ser percorrida enquanto o cache é alterado).
+
+        Args:
+            pattern (str): Padrão no estilo do Redis (ex: "candles:EURUSD:*"); None lista todas
+        """
+        keys = []
+        for shard in self._shards:
+            with shard.lock:
+                keys.extend(shard.items)
+        if pattern is None or pattern == "*":
+            return keys
+        return [key for key in keys if fnmatchcase(key, pattern)]
+
+    def sweep(self) -> int:
+        """
+        Remove todos os itens expirados.
+
+        Returns:
+            int: Quantidade de itens removidos
+        """
+        now = time.time()
+        return sum(shard.sweep(now) for shard in self._shards)
+
+    def clear(self) -> None:
+        """Remove todos os itens."""
+        for shard in self._shards:
+            shard.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estatísticas do cache em memória: ocupação, acertos e remoções por motivo e por prefixo.
+
+        Returns:
+            dict: Estatísticas
+        """
+        items = size = hits = misses = 0
+        counters, evictions, prefix_bytes, prefix_evictions = Counter(), Counter(), Counter(), Counter()
+        for shard in self._shards:
+            with shard.lock:
+                items += len(shard.items)
+                size += shard.bytes
+                hits += shard.hits
+                misses += shard.misses
+                counters.update(shard.counters)
+                evictions.update(shard.evictions)
+                prefix_bytes.update(shard.prefix_bytes)
+                prefix_evictions.update(shard.prefix_evictions)
+
+        return {
+            "items": items,
+            "bytes": size,
+            "max_items": self._max_items,
+            "max_bytes": self._max_bytes,
+            "shards": len(self._shards),
+            "hits": hits,
+            "misses": misses,
+            "sets": counters["sets"],
+            "rejected": counters["rejected"],
+            "evictions": dict(evictions),
+            "prefixes": {
+                prefix: {
+                    "bytes": prefix_bytes.get(prefix, 0),
+                    "quota": self._quotas.get(prefix),
+                    "evictions": prefix_evictions.get(prefix, 0)
+                }
+                for prefix in set(prefix_bytes) | set(self._quotas) | set(prefix_evictions)
+            }
+        }
+
+    def close(self) -> None:
+        """Encerra a varredura e libera a memória."""
+        self._stop_event.set()
+        self.clear()
+
+class LocalInvalidationBus:
+    """
+    Substituto local do pub/sub do Redis: entrega as invalidações aos caches do mesmo processo.
+    Usado quando Redis não está disponível, com a mesma interface de RedisInvalidationBus.
+    """
+
+    def __init__(self):
+        self._handlers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._handlers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            handler(message)
+
+    def ensure_started(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RedisInvalidationBus:
+    """
+    Transmite invalidações do cache local (L1) entre workers pelo pub/sub do Redis.
+
+    A escuta roda em uma thread iniciada sob demanda em cada processo. Ao (re)conectar, os
+    assinantes recebem um aviso "reset", pois invalidações podem ter sido perdidas enquanto
+    a conexão estava fechada.
+    """
+
+    def __init__(self, redis_client, channel: str = CACHE_INVALIDATION_CHANNEL):
+        """
+        Args:
+            redis_client: Cliente Redis
+            channel (str): Canal de pub/sub das invalidações
+        """
+        self._redis = redis_client
+        self._channel = channel
+        self._handlers: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._pubsub = None
+        self._stop_event = threading.Event()
+
+    def subscribe(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._handlers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        try:
+            self._redis.publish(self._channel, json.dumps(message))
+        except Exception as e:
+            logger.error(f"Erro ao publicar invalidação do cache: {str(e)}")
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Erro ao aplicar invalidação do cache: {str(e)}")
+
+    def ensure_started(self) -> None:
+        """Inicia a escuta neste processo, se ainda não estiver rodando."""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._listen, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _listen(self) -> None:
+        """
+        Tarefa em background que recebe as invalidações, reconectando em caso de erro.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(self._channel)
+                self._dispatch({"reset": True})
+                for item in self._pubsub.listen():
+                    if self._stop_event.is_set():
+                        break
+                    if item.get("type") == "message":
+                        self._dispatch(json.loads(item["data"]))
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logger.error(f"Conexão de invalidação do cache perdida: {str(e)}, reconectando")
+                self._stop_event.wait(1)
+
+    def close(self) -> None:
+        """Encerra a escuta."""
+        self._stop_event.set()
+        try:
+            if self._pubsub is not None:
+                self._pubsub.close()
+        except Exception:
+            pass
+
+
+# Barramento local compartilhado pelos caches do processo (sem Redis)
+local_invalidation_bus = LocalInvalidationBus()
+
 
 class CacheManager:
     """
     Classe para gerenciar cache de dados, com suporte para operações com e sem Redis.
     Quando Redis não estiver disponível, usa cache em memória.
+    
+    Com Redis, um cache local pequeno (L1) fica à frente do Redis (L2): leituras frequentes são
+    servidas da memória do processo, e gravações e remoções são anunciadas pelo pub/sub do Redis
+    para que os demais workers descartem suas cópias locais.
     """
     
     def __init__(self, app=None):
@@ -34,8 +726,15 @@ class CacheManager:
             app: Instância do Flask (opcional, pode ser inicializada posteriormente)
         """
         self.redis_client = None
-        self.memory_cache = {}
-        self.ttl_info = {}  # Para armazenar TTLs quando usando cache em memória
+        self.memory = MemoryCache()  # Cache em memória (único nível sem Redis, L1 com Redis)
+        self.codec = CacheCodec()    # Serialização dos valores enviados ao Redis
+        self._inflight: Dict[str, Future] = {}  # Cálculos em andamento por chave (single-flight)
+        self._inflight_lock = threading.Lock()
+        
+        # Invalidações do cache local: pelo Redis entre workers, ou localmente sem Redis
+        self._origin = uuid.uuid4().hex
+        self._bus = local_invalidation_bus
+        self._bus.subscribe(self._on_invalidation)
         
         if app is not None:
             self.init_app(app)
@@ -67,9 +766,7 @@ class CacheManager:
         
         try:
             import redis
-            self.redis_client = redis.from_url(redis_url)
-            # Testar a conexão
-            self.redis_client.ping()
+            self._attach_redis(redis.from_url(redis_url))
             logger.info(f"Conexão com Redis estabelecida: {redis_url}")
         except ImportError:
             logger.warning("Pacote 'redis' não encontrado, usando cache em memória")
@@ -77,10 +774,35 @@ class CacheManager:
             logger.error(f"Erro ao conectar ao Redis: {str(e)}, usando cache em memória")
             self.redis_client = None
     
+    def _attach_redis(self, redis_client) -> None:
+        """
+        Passa a usar o Redis como cache compartilhado (L2), com um cache local (L1) menor à
+        frente, coerente entre workers via pub/sub.
+        
+        Args:
+            redis_client: Cliente Redis já criado
+            
+        Raises:
+            Exception: Se o Redis não responder ao ping
+        """
+        # Testar a conexão
+        redis_client.ping()
+        self.redis_client = redis_client
+        
+        self._bus.unsubscribe(self._on_invalidation)
+        self._bus.close()
+        self.memory.close()
+        self.memory = MemoryCache(max_items=CACHE_L1_MAX_ITEMS, max_bytes=CACHE_L1_MAX_BYTES)
+        self._bus = RedisInvalidationBus(self.redis_client)
+        self._bus.subscribe(self._on_invalidation)
+    
     def _generate_key(self, prefix: str, *args, **kwargs) -> str:
         """
         Gera uma chave de cache consistente baseada nos argumentos.
         
+        A chave é a mesma em todos os workers e após reinícios, pois depende apenas
+        do valor dos argumentos (ver encode_key_args).
+        
         Args:
             prefix: Prefixo para a chave (ex: nome da função)
             *args: Argumentos posicionais
@@ -88,55 +810,152 @@ class CacheManager:
             
         Returns:
             str: Chave de cache
+            
+        Raises:
+            TypeError: Se algum argumento não tiver representação estável
         """
-        # Criar uma representação dos argumentos
-        key_parts = [prefix]
-        
-        # Adicionar args
-        for arg in args:
-            if isinstance(arg, (str, int, float, bool, type(None))):
-                key_parts.append(str(arg))
-            else:
-                # Para objetos complexos, usar seu hash em vez de str completo
-                try:
-                    key_parts.append(str(hash(arg)))
-                except:
-                    key_parts.append(str(id(arg)))
+        return f"{prefix}:{key_digest(encode_key_args(*args, **kwargs))}"
+    
+    def _publish_invalidation(self, keys: Optional[List[str]] = None, pattern: Optional[str] = None) -> None:
+        """Anuncia aos demais caches que chaves (ou um padrão de chaves) foram alteradas ou removidas."""
+        message = {"origin": self._origin}
+        if keys is not None:
+            message["keys"] = keys
+        if pattern is not None:
+            message["pattern"] = pattern
+        self._bus.publish(message)
+    
+    def _on_invalidation(self, message: Dict[str, Any]) -> None:
+        """Descarta do cache local as chaves invalidadas por outro worker (ou outro cache do processo)."""
+        if message.get("origin") == self._origin:
+            return
+        if message.get("reset"):
+            if self.redis_client:
+                self.memory.clear()
+            return
+        if message.get("keys"):
+            self.memory.delete_many(message["keys"])
+        if message.get("pattern"):
+            self.memory.delete_many(self.memory.keys(message["pattern"]))
+    
+    def _record_hits(self, keys, tier: str) -> None:
+        """Contabiliza acertos por prefixo e nível (memory, l1 ou redis)."""
+        for prefix, count in Counter(key_prefix(key) for key in keys).items():
+            cache_metrics.inc("hits", count, prefix=prefix, tier=tier)
+    
+    def _record_gets(self, keys: List[str], found, tier: str, seconds: float,
+                     latency_keys: Optional[List[str]] = None) -> None:
+        """
+        Contabiliza uma leitura: acertos e faltas por prefixo e a latência da operação.
         
-        # Adicionar kwargs (ordenados por chave para consistência)
-        for k in sorted(kwargs.keys()):
-            v = kwargs[k]
-            key_parts.append(f"{k}={v}")
+        Args:
+            keys: Chaves consultadas neste nível
+            found: Chaves encontradas
+            tier (str): Nível que respondeu (memory, l1 ou redis)
+            seconds (float): Duração da operação
+            latency_keys: Chaves cujos prefixos recebem a latência (padrão: keys)
+        """
+        self._record_hits(found, tier)
+        for prefix, count in Counter(key_prefix(key) for key in keys if key not in found).items():
+            cache_metrics.inc("misses", count, prefix=prefix)
+        backend = "redis" if self.redis_client else "memory"
+        for prefix in {key_prefix(key) for key in latency_keys or keys}:
+            cache_metrics.observe("get", seconds, prefix=prefix, backend=backend)
+    
+    def _record_sets(self, sizes: Dict[str, int], seconds: float) -> None:
+        """Contabiliza gravações por prefixo: quantidade, bytes gravados e latência da operação."""
+        backend = "redis" if self.redis_client else "memory"
+        per_prefix: Dict[str, List[int]] = {}
+        for key, size in sizes.items():
+            per_prefix.setdefault(key_prefix(key), []).append(size)
+        for prefix, prefix_sizes in per_prefix.items():
+            cache_metrics.inc("sets", len(prefix_sizes), prefix=prefix)
+            cache_metrics.inc("bytes_written", sum(prefix_sizes), prefix=prefix)
+            cache_metrics.observe("set", seconds, prefix=prefix, backend=backend)
+    
+    def _pack_local(self, key: str, value: Any, size: int, data: Optional[bytes] = None) -> Tuple[Any, int]:
+        """
+        Forma de um valor no cache em memória: o próprio objeto ou, para os prefixos de
+        CACHE_MEMORY_COMPRESS_PREFIXES, os bytes codificados quando o CacheCodec os comprimiu
+        (o limite de compressão vale para o tamanho codificado, como no Redis).
         
-        # Criar um hash MD5 da string combinada para ter um tamanho fixo
-        combined = ":".join(key_parts)
-        hashed = hashlib.md5(combined.encode()).hexdigest()
+        Args:
+            key: Chave do cache
+            value: Valor a ser armazenado
+            size (int): Tamanho estimado do objeto
+            data (bytes): Valor já codificado (gravado no Redis), reaproveitado se informado
+            
+        Returns:
+            tuple: (valor armazenado, tamanho em bytes)
+        """
+        if self.codec.threshold and key_prefix(key) in CACHE_MEMORY_COMPRESS_PREFIXES:
+            data = data if data is not None else self.codec.dumps(value)
+            if self.codec.is_compressed(data):
+                return PackedValue(data), len(data) + 16
+        return value, size
+    
+    def _unpack_local(self, value: Any) -> Any:
+        """Valor lido do cache em memória, decodificando-o se foi guardado codificado."""
+        if isinstance(value, PackedValue):
+            return self.codec.loads(value.data)
+        return value
+    
+    def _fill_l1(self, key: str, value: Any, pttl: int, data: Optional[bytes] = None) -> None:
+        """Copia para o cache local um valor lido do Redis, sem ultrapassar o tempo restante no Redis."""
+        ttl = CACHE_L1_TTL if pttl is None or pttl < 0 else min(CACHE_L1_TTL, pttl / 1000)
+        if ttl > 0:
+            self.memory.set(key, *self._pack_local(key, value, approx_size(value), data), ttl)
+    
+    def _read_redis(self, keys: List[str]) -> Dict[str, Any]:
+        """Lê chaves do Redis (valor e tempo restante) em uma única ida ao servidor, preenchendo o cache local."""
+        self._bus.ensure_started()
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.pttl(key)
+        replies = pipe.execute()
         
-        return f"{prefix}:{hashed}"
+        found = {}
+        for i, key in enumerate(keys):
+            raw, pttl = replies[2 * i], replies[2 * i + 1]
+            if raw:
+                value = self.codec.loads(raw)
+                self._fill_l1(key, value, pttl, raw)
+                found[key] = value
+        return found
     
     def set(self, key: str, value: Any, ttl: int = 60) -> bool:
         """
         Armazena um valor no cache.
         
+        No cache em memória o próprio objeto é guardado, sem cópia: o valor não deve ser
+        alterado depois de armazenado, nem os valores retornados por get.
+        
         Args:
             key: Chave do cache
-            value: Valor a ser armazenado
+            value: Valor a ser armazenado (tipos JSON)
             ttl: Tempo de vida em segundos
             
         Returns:
             bool: True se armazenado com sucesso, False caso contrário
         """
         try:
-            # Serializar o valor para JSON
-            serialized = json.dumps(value)
-            
+            start = time.perf_counter()
+            size = approx_size(value)
             if self.redis_client:
-                return self.redis_client.setex(key, ttl, serialized)
+                # Serializar o valor (formato registrado no cabeçalho)
+                self._bus.ensure_started()
+                data = self.codec.dumps(value)
+                stored = self.redis_client.setex(key, ttl, data)
+                self.memory.set(key, *self._pack_local(key, value, size, data), min(ttl, CACHE_L1_TTL))
+                size = len(data)
             else:
-                # Cache em memória com TTL
-                self.memory_cache[key] = serialized
-                self.ttl_info[key] = (time.time() + ttl, ttl)
-                return True
+                # Cache em memória com TTL e limite de tamanho: o próprio objeto é armazenado
+                value, size = self._pack_local(key, value, size)
+                stored = self.memory.set(key, value, size, ttl)
+            self._publish_invalidation(keys=[key])
+            self._record_sets({key: size}, time.perf_counter() - start)
+            return stored
         except Exception as e:
             logger.error(f"Erro ao armazenar no cache: {str(e)}")
             return False
@@ -152,22 +971,17 @@ class CacheManager:
             tuple: (hit, value) onde hit é True se encontrado, e value é o valor ou None
         """
         try:
-            if self.redis_client:
-                value = self.redis_client.get(key)
-                if value:
-                    return True, json.loads(value)
-                return False, None
+            start = time.perf_counter()
+            hit, value = self.memory.get(key)
+            tier = "l1" if self.redis_client else "memory"
+            if not hit and self.redis_client:
+                # Não encontrado no cache local: consultar o Redis
+                found = self._read_redis([key])
+                hit, value, tier = key in found, found.get(key), "redis"
             else:
-                # Verificar expiração para cache em memória
-                if key in self.memory_cache:
-                    expiry_time, _ = self.ttl_info.get(key, (0, 0))
-                    if time.time() < expiry_time:
-                        return True, json.loads(self.memory_cache[key])
-                    else:
-                        # Remover item expirado
-                        del self.memory_cache[key]
-                        del self.ttl_info[key]
-                return False, None
+                value = self._unpack_local(value)
+            self._record_gets([key], [key] if hit else [], tier, time.perf_counter() - start)
+            return hit, value
         except Exception as e:
             logger.error(f"Erro ao recuperar do cache: {str(e)}")
             return False, None
@@ -182,56 +996,312 @@ class CacheManager:
         Returns:
             bool: True se removido com sucesso, False caso contrário
         """
+        return self.delete_many([key]) == 1
+    
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Recupera vários valores do cache em uma única operação (pipeline no Redis).
+        
+        Args:
+            keys: Chaves do cache
+            
+        Returns:
+            dict: Valores encontrados por chave (chaves ausentes são omitidas)
+        """
+        if not keys:
+            return {}
+        try:
+            start = time.perf_counter()
+            found = {key: self._unpack_local(value) for key, value in self.memory.get_many(keys).items()}
+            if self.redis_client:
+                self._record_hits(found, "l1")
+                missing = [key for key in keys if key not in found]
+                from_redis = {}
+                for i in range(0, len(missing), CACHE_BATCH_SIZE):
+                    from_redis.update(self._read_redis(missing[i:i + CACHE_BATCH_SIZE]))
+                self._record_gets(missing, from_redis, "redis", time.perf_counter() - start, keys)
+                found.update(from_redis)
+            else:
+                self._record_gets(keys, found, "memory", time.perf_counter() - start)
+            return found
+        except Exception as e:
+            logger.error(f"Erro ao recuperar do cache em lote: {str(e)}")
+            return {}
+    
+    def set_many(self, items: Dict[str, Any], ttl: int = 60) -> bool:
+        """
+        Armazena vários valores no cache em uma única operação (pipeline no Redis).
+        
+        Args:
+            items: Valores por chave
+            ttl: Tempo de vida em segundos
+            
+        Returns:
+            bool: True se todos foram armazenados
+        """
+        if not items:
+            return True
         try:
+            start = time.perf_counter()
             if self.redis_client:
-                return bool(self.redis_client.delete(key))
+                self._bus.ensure_started()
+                pipe = self.redis_client.pipeline(transaction=False)
+                sizes = {}
+                sized = {}
+                for key, value in items.items():
+                    data = self.codec.dumps(value)
+                    sizes[key] = len(data)
+                    sized[key] = self._pack_local(key, value, approx_size(value), data)
+                    pipe.setex(key, ttl, data)
+                stored = all(pipe.execute())
+                self.memory.set_many(sized, min(ttl, CACHE_L1_TTL))
             else:
-                if key in self.memory_cache:
-                    del self.memory_cache[key]
-                    if key in self.ttl_info:
-                        del self.ttl_info[key]
-                    return True
-                return False
+                sized = {key: self._pack_local(key, value, approx_size(value)) for key, value in items.items()}
+                sizes = {key: size for key, (_, size) in sized.items()}
+                stored = self.memory.set_many(sized, ttl)
+            self._publish_invalidation(keys=list(items))
+            self._record_sets(sizes, time.perf_counter() - start)
+            return stored
         except Exception as e:
-            logger.error(f"Erro ao remover do cache: {str(e)}")
+            logger.error(f"Erro ao armazenar no cache em lote: {str(e)}")
             return False
     
+    def delete_many(self, keys: List[str]) -> int:
+        """
+        Remove vários valores do cache em uma única operação.
+        
+        Args:
+            keys: Chaves do cache
+            
+        Returns:
+            int: Quantidade de chaves removidas
+        """
+        if not keys:
+            return 0
+        try:
+            removed = self.memory.delete_many(keys)
+            if self.redis_client:
+                removed = sum(
+                    self.redis_client.delete(*keys[i:i + CACHE_BATCH_SIZE])
+                    for i in range(0, len(keys), CACHE_BATCH_SIZE)
+                )
+            self._publish_invalidation(keys=keys)
+            return removed
+        except Exception as e:
+            logger.error(f"Erro ao remover do cache em lote: {str(e)}")
+            return 0
+    
     def clear(self, pattern: str = "*") -> bool:
         """
         Limpa o cache com um padrão específico.
         
+        No Redis as chaves são percorridas com SCAN e removidas em lotes com UNLINK,
+        sem bloquear o servidor como KEYS em bases grandes.
+        
         Args:
-            pattern: Padrão de chaves a serem removidas
+            pattern: Padrão de chaves a serem removidas (estilo Redis, ex: "candles:*")
             
         Returns:
             bool: True se a operação foi bem-sucedida
         """
         try:
+            # Para cache em memória, usar a mesma semântica de padrões do Redis
+            self.memory.delete_many(self.memory.keys(pattern))
+            
             if self.redis_client:
-                keys = self.redis_client.keys(pattern)
-                if keys:
-                    return bool(self.redis_client.delete(*keys))
-                return True
-            else:
-                # Para cache em memória, filtrar chaves que correspondem ao padrão
-                pattern = pattern.replace("*", "")  # Simplificação básica
-                keys_to_delete = [k for k in self.memory_cache if pattern in k]
-                for k in keys_to_delete:
-                    del self.memory_cache[k]
-                    if k in self.ttl_info:
-                        del self.ttl_info[k]
-                return True
+                batch = []
+                removed = 0
+                for key in self.redis_client.scan_iter(match=pattern, count=CACHE_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) >= CACHE_BATCH_SIZE:
+                        removed += self.redis_client.unlink(*batch)
+                        batch = []
+                if batch:
+                    removed += self.redis_client.unlink(*batch)
+                logger.info(f"{removed} chaves removidas do cache com o padrão {pattern}")
+            self._publish_invalidation(pattern=pattern)
+            return True
         except Exception as e:
             logger.error(f"Erro ao limpar cache: {str(e)}")
             return False
     
-    def cached(self, prefix: str = None, ttl: int = 60):
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Registra o cálculo de uma chave em andamento (single-flight).
+        
+        Returns:
+            tuple: (future compartilhado, True se quem chamou é o responsável pelo cálculo)
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+    
+    def _release(self, key: str, future: Future, value: Any = None, error: Optional[BaseException] = None) -> None:
+        """Conclui o cálculo em andamento de uma chave, entregando o resultado a quem aguarda."""
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+    
+    def _lookup_entry(self, key: str) -> Tuple[bool, bool, Any]:
+        """
+        Consulta uma entrada gravada por get_or_compute.
+        
+        Returns:
+            tuple: (hit, fresh, value) — fresh é False quando a entrada já passou do TTL e está no período stale
+        """
+        hit, entry = self.get(key)
+        if not hit or not isinstance(entry, dict) or "fresh_until" not in entry:
+            return False, False, None
+        return True, time.time() < entry["fresh_until"], entry["value"]
+    
+    def _store_entry(self, key: str, value: Any, ttl: int, stale_ttl: int) -> None:
+        """Grava uma entrada com o instante até o qual é considerada atualizada."""
+        if value is None or value == [] or value == {}:
+            return  # Resultados vazios (falhas) não são armazenados
+        self.set(key, {"value": value, "fresh_until": time.time() + ttl}, ttl + stale_ttl)
+    
+    def _refresh(self, key: str, compute: Callable[[], Any], ttl: int, stale_ttl: int) -> None:
+        """Recalcula uma entrada desatualizada (em background, no agendador, na classe de lote)."""
+        future, leader = self._claim(key)
+        if not leader:
+            return  # Já existe uma atualização em andamento
+        try:
+            value = compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            self._release(key, future, value)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar em background a chave {key}: {str(e)}")
+            self._release(key, future, error=e)
+    
+    async def _refresh_async(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int) -> None:
+        """Recalcula uma entrada desatualizada (em background, no loop de segundo plano)."""
+        future, leader = self._claim(key)
+        if not leader:
+            return  # Já existe uma atualização em andamento
+        try:
+            value = await compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            self._release(key, future, value)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar em background a chave {key}: {str(e)}")
+            self._release(key, future, error=e)
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: int = 60, stale_ttl: int = 0) -> Any:
+        """
+        Retorna o valor em cache ou o calcula, com uma única execução para chamadas simultâneas.
+        
+        Se várias threads não encontrarem a chave ao mesmo tempo, apenas uma executa compute e as
+        demais aguardam o mesmo resultado. Depois do TTL e durante stale_ttl, o valor anterior
+        continua sendo servido enquanto uma única atualização roda em background.
+        
+        Args:
+            key: Chave do cache
+            compute: Função sem argumentos que calcula o valor
+            ttl: Tempo em segundos em que o valor é considerado atualizado
+            stale_ttl: Tempo adicional em segundos em que o valor desatualizado ainda é servido
+            
+        Returns:
+            Valor em cache ou calculado
+        """
+        hit, fresh, value = self._lookup_entry(key)
+        if hit:
+            if not fresh:
+                submit_background_func(self._refresh, key, compute, ttl, stale_ttl)
+            return value
+        
+        future, leader = self._claim(key)
+        if not leader:
+            # Numa thread do executor não aguardar: o cálculo pode estar na fila do mesmo executor,
+            # e threads paradas esperando por ele o esgotariam
+            timeout = 0 if in_executor_thread() else CACHE_SINGLE_FLIGHT_TIMEOUT
+            try:
+                return future.result(timeout=timeout)
+            except OperationCanceled:
+                # O cálculo foi cancelado por quem o iniciou (ex: análise cancelada), não por este chamador
+                logger.info(f"Cálculo de {key} cancelado por outro chamador, calculando novamente")
+            except FutureTimeoutError:
+                if timeout:
+                    logger.warning(f"Tempo esgotado aguardando o cálculo de {key}, calculando novamente")
+            value = compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            return value
+        
+        try:
+            value = compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            self._release(key, future, value)
+            return value
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+    
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: int = 60,
+                                   stale_ttl: int = 0) -> Any:
+        """
+        Versão assíncrona de get_or_compute, para funções async.
+        
+        O cálculo em andamento é compartilhado também entre requisições de threads e event loops
+        diferentes; a atualização em background roda no loop de segundo plano de async_utils.
+        
+        Args:
+            key: Chave do cache
+            compute: Função sem argumentos que retorna a coroutine que calcula o valor
+            ttl: Tempo em segundos em que o valor é considerado atualizado
+            stale_ttl: Tempo adicional em segundos em que o valor desatualizado ainda é servido
+            
+        Returns:
+            Valor em cache ou calculado
+        """
+        hit, fresh, value = self._lookup_entry(key)
+        if hit:
+            if not fresh:
+                submit_background_coro(self._refresh_async, key, compute, ttl, stale_ttl)
+            return value
+        
+        future, leader = self._claim(key)
+        if not leader:
+            try:
+                # shield: o timeout de quem aguarda não cancela o cálculo compartilhado
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), CACHE_SINGLE_FLIGHT_TIMEOUT)
+            except OperationCanceled:
+                # O cálculo foi cancelado por quem o iniciou (ex: análise cancelada), não por este chamador
+                logger.info(f"Cálculo de {key} cancelado por outro chamador, calculando novamente")
+            except asyncio.TimeoutError:
+                logger.warning(f"Tempo esgotado aguardando o cálculo de {key}, calculando novamente")
+            value = await compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            return value
+        
+        try:
+            value = await compute()
+            self._store_entry(key, value, ttl, stale_ttl)
+            self._release(key, future, value)
+            return value
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+    
+    def cached(self, prefix: str = None, ttl: int = 60, stale_ttl: int = 0):
         """
-        Decorador para cache de função.
+        Decorador para cache de função (síncrona ou async), com execução única para chamadas simultâneas.
+        
+        Os argumentos devem ser tipos simples, coleções, datas, Enum ou objetos com __cache_key__();
+        chamadas com outros argumentos são executadas sem cache.
         
         Args:
             prefix: Prefixo opcional para a chave de cache
             ttl: Tempo de vida em segundos
+            stale_ttl: Tempo adicional em segundos em que o valor desatualizado é servido enquanto é atualizado
             
         Returns:
             Decorator
@@ -239,23 +1309,30 @@ class CacheManager:
         def decorator(func):
             func_prefix = prefix or func.__name__
             
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    # Gerar chave de cache baseada nos argumentos
+                    try:
+                        cache_key = self._generate_key(func_prefix, *args, **kwargs)
+                    except TypeError as e:
+                        logger.warning(f"Chamada de {func_prefix} sem cache: {str(e)}")
+                        return await func(*args, **kwargs)
+                    return await self.get_or_compute_async(
+                        cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl
+                    )
+                
+                return async_wrapper
+            
+            @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 # Gerar chave de cache baseada nos argumentos
-                cache_key = self._generate_key(func_prefix, *args, **kwargs)
-                
-                # Tentar obter do cache
-                hit, cached_value = self.get(cache_key)
-                if hit:
-                    logger.debug(f"Cache hit para {func_prefix}")
-                    return cached_value
-                
-                # Executar função se não estiver no cache
-                logger.debug(f"Cache miss para {func_prefix}")
-                result = func(*args, **kwargs)
-                
-                # Armazenar resultado no cache
-                self.set(cache_key, result, ttl)
-                return result
+                try:
+                    cache_key = self._generate_key(func_prefix, *args, **kwargs)
+                except TypeError as e:
+                    logger.warning(f"Chamada de {func_prefix} sem cache: {str(e)}")
+                    return func(*args, **kwargs)
+                return self.get_or_compute(cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl)
             
             return wrapper
         
@@ -266,6 +1343,8 @@ class CacheManager:
         Limpa recursos ao encerrar a aplicação.
         """
         try:
+            self._bus.unsubscribe(self._on_invalidation)
+            self._bus.close()
             if self.redis_client:
                 self.redis_client.close()
                 logger.info("Conexão Redis fechada")
@@ -273,8 +1352,74 @@ class CacheManager:
             logger.error(f"Erro ao fechar conexão Redis: {str(e)}")
             
         # Limpar caches em memória
-        self.memory_cache.clear()
-        self.ttl_info.clear()
+        self.memory.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna estatísticas do cache.
+        
+        Returns:
+            dict: Backend em uso, compressão (valores comprimidos, bytes e taxa) e ocupação, acertos e
+            remoções do cache em memória
+        """
+        if self.redis_client:
+            return {"backend": "redis", "codec": self.codec.stats(), "l1": self.memory.stats()}
+        return {"backend": "memory", "codec": self.codec.stats(), **self.memory.stats()}
+    
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Métricas por prefixo de chave: acertos (por nível), faltas, gravações, bytes, remoções
+        automáticas e latências de leitura e gravação, além das estatísticas do backend.
+        
+        Returns:
+            dict: {"backend", "prefixes": {prefixo: métricas}, "memory"/"l1", "redis"}
+        """
+        memory_stats = self.memory.stats()
+        prefixes = cache_metrics.snapshot(group_by="prefix")
+        for prefix, info in memory_stats["prefixes"].items():
+            entry = prefixes.setdefault(prefix, {})
+            entry["bytes_stored"] = info["bytes"]
+            entry["quota"] = info["quota"]
+            entry["evictions"] = info["evictions"]
+        for entry in prefixes.values():
+            hits = sum(value for name, value in entry.items() if name.startswith("hits:"))
+            total = hits + entry.get("misses", 0)
+            entry["hit_ratio"] = round(hits / total, 4) if total else None
+        
+        result = {"backend": "redis" if self.redis_client else "memory", "prefixes": prefixes, "codec": self.codec.stats()}
+        result["l1" if self.redis_client else "memory"] = {
+            name: value for name, value in memory_stats.items() if name != "prefixes"
+        }
+        if self.redis_client:
+            try:
+                # Remoções do Redis (maxmemory e expiração) são globais, não por prefixo
+                info = self.redis_client.info("stats")
+                result["redis"] = {name: info.get(name) for name in ("evicted_keys", "expired_keys", "keyspace_hits", "keyspace_misses")}
+            except Exception as e:
+                logger.error(f"Erro ao consultar estatísticas do Redis: {str(e)}")
+        return result
+    
+    def metrics_prometheus(self) -> str:
+        """
+        Métricas do cache no formato texto do Prometheus (contadores, histogramas de latência
+        e ocupação atual por prefixo).
+        
+        Returns:
+            str: Métricas no formato de exposição do Prometheus
+        """
+        memory_stats = self.memory.stats()
+        tier = "l1" if self.redis_client else "memory"
+        codec_stats = self.codec.stats()
+        gauges = [
+            ("items", {"tier": tier}, memory_stats["items"]),
+            ("bytes", {"tier": tier}, memory_stats["bytes"]),
+            ("compression_raw_bytes", {"codec": codec_stats["compression"]}, codec_stats["raw_bytes"]),
+            ("compression_compressed_bytes", {"codec": codec_stats["compression"]}, codec_stats["compressed_bytes"]),
+        ]
+        for prefix, info in memory_stats["prefixes"].items():
+            gauges.append(("prefix_bytes", {"prefix": prefix, "tier": tier}, info["bytes"]))
+            gauges.append(("prefix_evictions", {"prefix": prefix, "tier": tier}, info["evictions"]))
+        return cache_metrics.to_prometheus(gauges)
 
 
 # Instância global do gerenciador de cache
@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from config import get_logger
+
+# Configurar o logging
+logger = get_logger("candle_store", "candle_store.log")
+
+# Configuração do armazenamento de velas
+CANDLE_STORE_ENABLED = os.getenv('CANDLE_STORE_ENABLED', 'True').lower() == 'true'
+CANDLE_STORE_PATH = os.getenv('CANDLE_STORE_PATH', 'data/candles.db')
+CANDLE_STORE_RETENTION_DAYS = int(os.getenv('CANDLE_STORE_RETENTION_DAYS', '90'))
+
+# Tamanho máximo mapeado em memória para leitura (256 MB)
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Limite de velas por requisição à API
+MAX_CANDLES_PER_REQUEST = 1000
+
+
+class CandleStore:
+    """
+    Classe responsável por armazenar em disco (SQLite) todas as velas obtidas da API.
+    As velas são gravadas à medida que são buscadas (write-through) e a sincronização é incremental:
+    só é solicitada à API a lacuna desde a última vela armazenada. Leituras usam páginas mapeadas
+    em memória (mmap) e o modo WAL permite leituras simultâneas a uma escrita, inclusive entre processos.
+    """
+
+    def __init__(self, path: str = CANDLE_STORE_PATH, retention_days: int = CANDLE_STORE_RETENTION_DAYS):
+        """
+        Inicializa o CandleStore.
+
+        Args:
+            path (str): Caminho do arquivo SQLite
+            retention_days (int): Dias de histórico mantidos; 0 mantém tudo (padrão: 90)
+        """
+        self._path = path
+        self._retention_days = retention_days
+        self._local = threading.local()  # Uma conexão por thread
+        self._write_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._created = False
+        self._last_prune = 0.0
+
+    def _ensure_created(self) -> None:
+        """
+        Cria o diretório, o arquivo (em modo WAL) e a tabela no primeiro uso: importar o módulo não toca o disco.
+        """
+        if self._created:
+            return
+
+        with self._init_lock:
+            if self._created:
+                return
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            conn = sqlite3.connect(self._path, timeout=30)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS candles (
+                        active TEXT NOT NULL,
+                        timeframe INTEGER NOT NULL,
+                        time INTEGER NOT NULL,
+                        open REAL NOT NULL,
+                        close REAL NOT NULL,
+                        min REAL NOT NULL,
+                        max REAL NOT NULL,
+                        volume REAL,
+                        PRIMARY KEY (active, timeframe, time)
+                    ) WITHOUT ROWID
+                """)
+                conn.commit()
+            finally:
+                conn.close()
+            self._created = True
+            logger.info(f"CandleStore inicializado em {self._path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Obtém a conexão SQLite da thread atual (criada sob demanda, também após o fork de processos).
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            self._ensure_created()
+            conn = sqlite3.connect(self._path, timeout=30)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def write(self, active: str, timeframe: int, candles: List[Dict[str, Any]]) -> int:
+        """
+        Grava (ou atualiza) velas no armazenamento.
+
+        Args:
+            active (str): Nome do ativo
+            timeframe (int): Duração de cada vela em segundos
+            candles: Velas no formato da API (from, open, close, min, max, volume)
+
+        Returns:
+            int: Quantidade de velas gravadas
+        """
+        if not candles:
+            return 0
+
+        rows = [
+            (active, timeframe, int(c['from']), c['open'], c['close'], c['min'], c['max'], c.get('volume'))
+            for c in candles
+        ]
+        with self._write_lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+
+        if self._retention_days and time.time() - self._last_prune > 3600:
+            self.prune(time.time() - self._retention_days * 86400)
+        return len(rows)
+
+    def read(self, active: str, timeframe: int, start: Optional[int] = None, end: Optional[int] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Lê velas armazenadas em ordem cronológica.
+
+        Args:
+            active (str): Nome do ativo
+            timeframe (int): Duração de cada vela em segundos
+            start (int): Horário inicial (inclusivo)
+            end (int): Horário final (inclusivo)
+            limit (int): Retornar apenas as últimas N velas do intervalo
+
+        Returns:
+            list: Velas no formato da API
+        """
+        query = "SELECT time, open, close, min, max, volume FROM candles WHERE active = ? AND timeframe = ?"
+        params: List[Any] = [active, timeframe]
+        if start is not None:
+            query += " AND time >= ?"
+            params.append(int(start))
+        if end is not None:
+            query += " AND time <= ?"
+            params.append(int(end))
+        query += " ORDER BY time DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        rows = self._connection().execute(query, params).fetchall()
+        return [
+            {'from': t, 'to': t + timeframe, 'open': o, 'close': c, 'min': lo, 'max': hi, 'volume': v}
+            for t, o, c, lo, hi, v in reversed(rows)
+        ]
+
+    def coverage(self, active: str, timeframe: int, start: int):
+        """
+        Primeira vela, última vela e quantidade de velas armazenadas a partir de start.
+
+        Returns:
+            tuple: (primeiro horário, último horário, quantidade) — horários None se não houver velas
+        """
+        return self._connection().execute(
+            "SELECT MIN(time), MAX(time), COUNT(*) FROM candles WHERE active = ? AND timeframe = ? AND time >= ?",
+            (active, timeframe, int(start))
+        ).fetchone()
+
+    def get_candles(self, fetch_func: Callable[..., List[Dict[str, Any]]], active: str, timeframe: int,
+                    count: int, end_time: int) -> List[Dict[str, Any]]:
+        """
+        Retorna as últimas `count` velas até end_time, buscando na API apenas o que falta.
+
+        Se o armazenamento já cobre o início do período sem lacunas, só o trecho desde a última vela
+        armazenada é solicitado (a última vela é buscada de novo, pois pode ainda estar em formação).
+        Caso contrário, o período inteiro é solicitado, em páginas de até MAX_CANDLES_PER_REQUEST velas
+        do fim para o início. Operação bloqueante.
+
+        Args:
+            fetch_func: Função da API (ativo, timeframe, quantidade, timestamp) -> velas
+            active (str): Nome do ativo
+            timeframe (int): Duração de cada vela em segundos
+            count (int): Quantidade de velas
+            end_time (int): Horário de referência (normalmente o atual)
+
+        Returns:
+            list: Velas no formato da API, em ordem cronológica
+        """
+        end_time = int(end_time)
+        start = end_time - end_time % timeframe - (count - 1) * timeframe
+
+        first, last, stored = self.coverage(active, timeframe, start)
+
+        # Sincronização incremental só se o período armazenado começa no início da janela e não tem lacunas
+        if first is not None and first <= start + timeframe and stored >= (last - first) // timeframe + 1:
+            missing = (end_time - last) // timeframe + 1
+        else:
+            missing = count
+
+        # Buscar as velas faltantes em páginas, cada uma terminando antes da vela mais antiga da anterior
+        page_end = end_time
+        remaining = missing
+        received = 0
+        while remaining > 0:
+            size = min(remaining, MAX_CANDLES_PER_REQUEST)
+            fetched = fetch_func(active, timeframe, size, page_end)
+            if not fetched:
+                break
+            self.write(active, timeframe, fetched)
+            received += len(fetched)
+            remaining -= size
+            oldest = min(int(c['from']) for c in fetched)
+            if len(fetched) < size or oldest >= page_end:
+                break  # A API não tem histórico anterior
+            page_end = oldest - 1
+        if missing > 0:
+            logger.debug(f"{active}: {received} velas obtidas da API ({missing} faltantes)")
+
+        return self.read(active, timeframe, start, end_time)
+
+    def list_actives(self, timeframe: int = 60) -> List[str]:
+        """
+        Lista os ativos com velas armazenadas.
+        """
+        rows = self._connection().execute(
+            "SELECT DISTINCT active FROM candles WHERE timeframe = ? ORDER BY active", (timeframe,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def prune(self, older_than: float) -> int:
+        """
+        Remove velas anteriores a um horário.
+
+        Args:
+            older_than (float): Horário limite
+
+        Returns:
+            int: Quantidade de velas removidas
+        """
+        with self._write_lock:
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM candles WHERE time < ?", (int(older_than),)).rowcount
+            conn.commit()
+            self._last_prune = time.time()
+
+        if removed:
+            logger.info(f"{removed} velas antigas removidas do armazenamento")
+        return removed
+
+
+# Instância global do armazenamento de velas
+candle_store = CandleStore() if CANDLE_STORE_ENABLED else None
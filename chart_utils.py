@@ -0,0 +1,202 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_logger
+
+logger = get_logger("chart_utils")
+
+# Modos de gráfico: dados compactos (layout montado no cliente) ou figura Plotly completa
+CHART_MODE_COMPACT = "compact"
+CHART_MODE_PLOTLY = "plotly"
+
+# Cores das velas
+INCREASING_COLOR = '#26a69a'  # Verde mais suave
+DECREASING_COLOR = '#ef5350'  # Vermelho mais suave
+
+# Cor e espessura das linhas de bloco por resultado
+PENDING_LINE = ("#555555", 1)  # Cinza para blocos sem resultado
+RESULT_LINES = {
+    ("WIN", 0): ("#00c853", 2),  # Verde vibrante
+    ("WIN", 1): ("#2979ff", 2),  # Azul vibrante
+    ("WIN", 2): ("#ffd600", 2),  # Amarelo vibrante
+}
+LOSS_LINE = ("#f44336", 2)  # Vermelho vibrante
+NULO_LINE = ("#ffffff", 2)  # Branco para blocos com doji
+
+
+def line_style(block: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """
+    Cor e espessura da linha de um bloco conforme o resultado.
+
+    Returns:
+        tuple: (cor, espessura) ou None se a linha não deve ser desenhada
+    """
+    result = block["result"]
+    if result is None:
+        return PENDING_LINE
+    if result == "WIN":
+        return RESULT_LINES.get((result, block["martingale"]))
+    if result == "LOSS":
+        return LOSS_LINE
+    if result == "NULO":
+        return NULO_LINE
+    return None
+
+
+def build_chart_payload(active: str, data: List[Dict[str, Any]], candles: List[Dict[str, Any]],
+                        block_seconds: int = 300, line_offset: int = 30) -> Dict[str, Any]:
+    """
+    Monta os dados compactos do gráfico: séries OHLC em colunas e as linhas dos blocos.
+
+    O layout é fixo e montado no cliente; apenas os dados variam a cada análise.
+
+    Args:
+        active (str): Nome do ativo
+        data: Blocos analisados (com block_time, result e martingale)
+        candles: Velas do gráfico (time, open, high, low, close), em ordem cronológica
+        block_seconds (int): Duração de cada bloco em segundos
+        line_offset (int): Segundos entre a linha e o início do bloco seguinte
+
+    Returns:
+        dict: Dados do gráfico em listas simples
+    """
+    lines_t, lines_c, lines_w = [], [], []
+    for block in data:
+        style = line_style(block)
+        if style is None:
+            continue  # Pular blocos sem resultado definido
+        # Posição da linha 30 segundos antes do FINAL do bloco
+        lines_t.append(block["block_time"] + block_seconds - line_offset)
+        lines_c.append(style[0])
+        lines_w.append(style[1])
+
+    return {
+        "mode": CHART_MODE_COMPACT,
+        "active": active,
+        "tz_offset": time.localtime().tm_gmtoff,  # Horários exibidos no fuso do servidor, como na tabela
+        "t": [c["time"] for c in candles],
+        "o": [c["open"] for c in candles],
+        "h": [c["high"] for c in candles],
+        "l": [c["low"] for c in candles],
+        "c": [c["close"] for c in candles],
+        "lines": {"t": lines_t, "color": lines_c, "width": lines_w}
+    }
+
+
+def build_plotly_chart(payload: Dict[str, Any]) -> str:
+    """
+    Monta a figura Plotly completa a partir dos dados compactos (modo de compatibilidade).
+
+    Args:
+        payload (dict): Dados retornados por build_chart_payload
+
+    Returns:
+        str: Figura serializada em JSON
+    """
+    # Importado sob demanda: o plotly é pesado e só é usado neste modo
+    import plotly.graph_objects as go
+
+    times = [datetime.fromtimestamp(t) for t in payload["t"]]
+
+    # Obter o intervalo de tempo e de preço para ajustar os eixos
+    if payload["t"]:
+        min_time, max_time = min(payload["t"]), max(payload["t"])
+        time_buffer = (max_time - min_time) * 0.05  # 5% de buffer
+        x_range = [datetime.fromtimestamp(min_time - time_buffer), datetime.fromtimestamp(max_time + time_buffer)]
+        y_min, y_max = min(payload["l"]), max(payload["h"])
+        y_buffer = (y_max - y_min) * 0.1  # 10% de buffer
+        y_range = [y_min - y_buffer, y_max + y_buffer]
+    else:
+        x_range = None
+        y_range = None
+
+    # Linhas verticais para delimitar blocos (montadas de uma vez, sem validar shape por shape)
+    lines = payload["lines"]
+    shapes = [
+        dict(type="line", x0=datetime.fromtimestamp(t), y0=0, x1=datetime.fromtimestamp(t), y1=1,
+             yref="paper", line=dict(color=color, width=width, dash="solid"))
+        for t, color, width in zip(lines["t"], lines["color"], lines["width"])
+    ]
+
+    fig = go.Figure(data=[go.Candlestick(
+        x=times,
+        open=payload["o"],
+        high=payload["h"],
+        low=payload["l"],
+        close=payload["c"],
+        increasing_line_color=INCREASING_COLOR,
+        decreasing_line_color=DECREASING_COLOR,
+        increasing_fillcolor=INCREASING_COLOR,
+        decreasing_fillcolor=DECREASING_COLOR,
+        line=dict(width=1.5),             # Linhas mais grossas
+        opacity=0.8                       # Leve transparência
+    )])
+
+    # Configurar layout
+    fig.update_layout(
+        shapes=shapes,
+        title={
+            'text': f'Gráfico de {payload["active"]} - Catalogação Estratégia Sodré',
+            'font': {'size': 24, 'color': '#ffffff'},
+            'y': 0.97,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        xaxis={
+            'title': 'Horário',
+            'title_font': {'size': 16},
+            'tickfont': {'size': 14},
+            'showgrid': False,
+            'gridcolor': '#333333',
+            'range': x_range,
+            'zeroline': False,
+            'autorange': True,
+        },
+        yaxis={
+            'title': 'Preço',
+            'title_font': {'size': 16},
+            'tickfont': {'size': 14},
+            'showgrid': True,
+            'gridcolor': '#333333',
+            'zeroline': False,
+            'range': y_range,
+            'autorange': True,
+        },
+        template='plotly_dark',
+        plot_bgcolor='rgba(25, 25, 25, 0.8)',
+        paper_bgcolor='rgba(25, 25, 25, 0.8)',
+        height=700,
+        autosize=True,
+        margin=dict(l=50, r=50, t=70, b=50),
+        hovermode='x',
+        legend_orientation='h',
+        legend=dict(
+            x=0.5,
+            y=1.02,
+            xanchor='center',
+            font=dict(size=14)
+        ),
+        showlegend=False
+    )
+
+    # Adicionar linhas de grid
+    fig.update_xaxes(
+        showline=True,
+        linewidth=1,
+        linecolor='#555555',
+        mirror=True,
+        rangeslider=dict(visible=False),
+        autorange=True
+    )
+
+    fig.update_yaxes(
+        showline=True,
+        linewidth=1,
+        linecolor='#555555',
+        mirror=True,
+        autorange=True
+    )
+
+    return fig.to_json()
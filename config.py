@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
+from dotenv import load_dotenv
+
+# Início da inicialização do processo (referência para o perfil de startup)
+STARTUP_TIME = time.perf_counter()
+
+# Carregar variáveis de ambiente (uma única vez por processo)
+load_dotenv()
+
+# Configurações de logging
+LOGS_DIR = os.getenv('LOGS_DIR', 'logs')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Módulos pesados que devem ser carregados apenas quando usados
+LAZY_MODULES = ("pandas", "plotly", "numpy")
+
+_logging_lock = threading.Lock()
+_logging_configured = False
+_startup_steps: List[Tuple[str, float]] = []
+
+
+def setup_logging() -> None:
+    """
+    Configura o logging da aplicação uma única vez: saída no console e arquivo geral (main.log).
+    """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+
+        os.makedirs(LOGS_DIR, exist_ok=True)
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        for handler in (logging.FileHandler(os.path.join(LOGS_DIR, "main.log"), delay=True), logging.StreamHandler()):
+            handler.setFormatter(formatter)
+            root.addHandler(handler)
+
+        _logging_configured = True
+
+
+def get_logger(name: str, log_file: str = None) -> logging.Logger:
+    """
+    Obtém um logger, configurando o logging na primeira chamada.
+
+    Args:
+        name (str): Nome do logger
+        log_file (str): Arquivo de log próprio do módulo, além do arquivo geral (ex: "cache.log")
+
+    Returns:
+        logging.Logger: Logger configurado
+    """
+    setup_logging()
+    logger = logging.getLogger(name)
+
+    if log_file:
+        path = os.path.abspath(os.path.join(LOGS_DIR, log_file))
+        with _logging_lock:
+            if not any(getattr(h, 'baseFilename', None) == path for h in logger.handlers):
+                # O arquivo só é aberto na primeira mensagem
+                handler = logging.FileHandler(path, delay=True)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                logger.addHandler(handler)
+
+    return logger
+
+
+@contextmanager
+def startup_step(name: str):
+    """
+    Mede o tempo de uma etapa da inicialização (ex: importação de um módulo) para o perfil de startup.
+
+    Args:
+        name (str): Nome da etapa
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _startup_steps.append((name, time.perf_counter() - start))
+
+
+def _current_rss_mb() -> float:
+    """Memória residente atual do processo em MB (0 se indisponível)."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def log_startup_profile(logger: logging.Logger) -> None:
+    """
+    Registra o perfil de inicialização: tempo total, tempo de cada etapa, memória e módulos carregados.
+
+    Para o detalhamento por módulo, execute `python -X importtime -c "import wsgi"`.
+    """
+    total = time.perf_counter() - STARTUP_TIME
+    steps = ", ".join(f"{name}={duration * 1000:.0f}ms" for name, duration in _startup_steps)
+    loaded = [name for name in LAZY_MODULES if name in sys.modules]
+
+    logger.info(
+        f"Inicialização concluída em {total * 1000:.0f}ms (pid {os.getpid()}) - "
+        f"etapas: {steps or 'nenhuma'}; RSS: {_current_rss_mb():.1f} MB; "
+        f"módulos: {len(sys.modules)}; pesados carregados: {', '.join(loaded) or 'nenhum'}"
+    )
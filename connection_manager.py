@@ -1,44 +1,102 @@
+import os
 import threading
 import time
-from typing import Dict, Any, Optional, Tuple
-import logging
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
+from config import get_logger
+
 # Configurar o logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/connection_manager.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("ConnectionManager")
+logger = get_logger("ConnectionManager", "connection_manager.log")
+
+# Partições (locks) do registro de conexões
+CONNECTION_SHARDS = int(os.getenv('CONNECTION_SHARDS', '16'))
+
+
+class _ConnectionShard:
+    """
+    Uma partição do ConnectionManager: parte dos usuários e o lock que protege suas alterações.
+
+    As leituras (get_connection, get_user_data, get_lock) não adquirem o lock: a consulta ao
+    dicionário é atômica e o timestamp de atividade é gravado diretamente no registro do usuário.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.RLock()
+
 
 class ConnectionManager:
     """
     Classe responsável por gerenciar as conexões dos usuários com a API da Polarium.
     Mantém o estado de cada usuário separadamente, permitindo múltiplas conexões simultâneas.
+
+    Os usuários são distribuídos em partições com locks próprios, e o fechamento das conexões
+    (que pode levar segundos) acontece fora dos locks, então as rotas não esperam pela limpeza.
     """
     
-    def __init__(self, cleanup_interval: int = 900, max_idle_time: int = 3600):
+    def __init__(self, cleanup_interval: int = 900, max_idle_time: int = 3600, shards: int = CONNECTION_SHARDS):
         """
         Inicializa o ConnectionManager.
         
         Args:
             cleanup_interval (int): Intervalo em segundos para verificar conexões inativas (padrão: 15 minutos)
             max_idle_time (int): Tempo máximo em segundos que uma conexão pode ficar inativa (padrão: 1 hora)
+            shards (int): Quantidade de partições do registro de conexões (padrão: 16)
         """
-        self._connections: Dict[str, Dict[str, Any]] = {}
-        self._lock = threading.RLock()  # Lock para acesso thread-safe
+        self._shards = [_ConnectionShard() for _ in range(max(1, shards))]
         self._cleanup_interval = cleanup_interval
         self._max_idle_time = max_idle_time
         
-        # Iniciar thread de limpeza em background
-        self._cleanup_thread = threading.Thread(target=self._cleanup_task, daemon=True)
-        self._cleanup_thread.start()
+        # Thread de limpeza, criada na primeira conexão em cada processo (threads não sobrevivem ao fork)
+        self._cleanup_thread: Optional[threading.Thread] = None
+        self._cleanup_lock = threading.Lock()
+        self._pid: Optional[int] = None
         
-        logger.info("ConnectionManager inicializado")
+        logger.info(f"ConnectionManager inicializado ({len(self._shards)} partições)")
+    
+    def _ensure_cleanup(self) -> None:
+        """
+        Inicia a thread de limpeza neste processo, se ainda não estiver rodando.
+        A verificação por PID garante que cada worker (após o fork do Gunicorn) tenha sua própria thread.
+        """
+        if self._pid == os.getpid() and self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+            return
+        with self._cleanup_lock:
+            if self._pid == os.getpid() and self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._cleanup_thread = threading.Thread(target=self._cleanup_task, daemon=True)
+            self._cleanup_thread.start()
+    
+    def _shard(self, user_id: str) -> _ConnectionShard:
+        return self._shards[hash(user_id) % len(self._shards)]
+    
+    def _lookup(self, user_id: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+        """Registro do usuário sem adquirir lock, atualizando o timestamp de atividade."""
+        data = self._shard(user_id).connections.get(user_id)
+        if data is not None and touch:
+            data['last_activity'] = time.time()
+        return data
+    
+    def _snapshot(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Cópia dos registros de todas as partições (cada partição travada apenas durante a cópia)."""
+        items = []
+        for shard in self._shards:
+            with shard.lock:
+                items.extend(shard.connections.items())
+        return items
+    
+    @staticmethod
+    def _close_api(user_id: str, api_instance, reason: str) -> None:
+        """Fecha uma instância da API (chamado fora dos locks)."""
+        if api_instance is None:
+            return
+        try:
+            api_instance.close()
+            logger.info(f"Conexão API fechada para usuário {user_id}")
+        except Exception as e:
+            logger.error(f"Erro ao fechar {reason} para usuário {user_id}: {str(e)}")
     
     def add_connection(self, user_id: str, api_instance) -> None:
         """
@@ -48,27 +106,24 @@ class ConnectionManager:
             user_id (str): ID único do usuário
             api_instance: Instância da API Polarium
         """
-        with self._lock:
+        self._ensure_cleanup()
+        shard = self._shard(user_id)
+        with shard.lock:
             # Se já existir, atualizar a instância da API
-            if user_id in self._connections:
+            old = shard.connections.get(user_id)
+            if old is not None:
                 logger.info(f"Atualizando conexão existente para usuário {user_id}")
-                # Desconectar a instância antiga se existir
-                old_api = self._connections[user_id].get('api')
-                if old_api is not None:
-                    try:
-                        old_api.close()
-                    except Exception as e:
-                        logger.error(f"Erro ao fechar conexão antiga para usuário {user_id}: {str(e)}")
             else:
                 logger.info(f"Adicionando nova conexão para usuário {user_id}")
             
             # Criar ou atualizar o registro do usuário
-            self._connections[user_id] = {
+            shard.connections[user_id] = {
                 'api': api_instance,
                 'lock': threading.RLock(),
                 'connected': True,
                 'last_results': {},
                 'stats': {},  # Estatísticas para todos os ativos analisados
+                'ranking_cleared': False,  # Ranking limpo pelo usuário (não atualizar após análises individuais)
                 'analysis_progress': {
                     "in_progress": False,
                     "total_assets": 0,
@@ -80,6 +135,10 @@ class ConnectionManager:
                 },
                 'last_activity': time.time()
             }
+        
+        # Desconectar a instância antiga fora do lock
+        if old is not None and old.get('api') is not api_instance:
+            self._close_api(user_id, old.get('api'), "conexão antiga")
     
     def get_connection(self, user_id: str) -> Tuple[Any, bool]:
         """
@@ -91,14 +150,37 @@ class ConnectionManager:
         Returns:
             tuple: (api_instance, connected_status)
         """
-        with self._lock:
-            if user_id not in self._connections:
-                return None, False
-            
-            # Atualizar timestamp da última atividade
-            self._connections[user_id]['last_activity'] = time.time()
-            return self._connections[user_id]['api'], self._connections[user_id]['connected']
+        data = self._lookup(user_id)
+        if data is None:
+            return None, False
+        return data['api'], data['connected']
     
+    def get_any_connection(self) -> Tuple[Optional[str], Any]:
+        """
+        Obtém o ID e a instância da API do usuário conectado com atividade mais recente.
+        Usado por tarefas globais (ex: ranking); não atualiza o timestamp de atividade,
+        para não manter vivas conexões de usuários inativos.
+
+        Returns:
+            tuple: (user_id, api_instance) ou (None, None) se não houver usuário conectado
+        """
+        user_id = self.most_recent_user()
+        data = self._lookup(user_id, touch=False) if user_id is not None else None
+        return (user_id, data['api']) if data is not None else (None, None)
+
+    def most_recent_user(self) -> Optional[str]:
+        """
+        Obtém o ID do usuário conectado com atividade mais recente (sem atualizar o timestamp).
+
+        Returns:
+            str: ID do usuário ou None se não houver usuário conectado
+        """
+        candidates = [
+            (data['last_activity'], user_id) for user_id, data in self._snapshot()
+            if data['connected'] and data['api'] is not None
+        ]
+        return max(candidates)[1] if candidates else None
+
     def get_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
         Obtém todos os dados associados a um usuário.
@@ -109,13 +191,80 @@ class ConnectionManager:
         Returns:
             dict: Dados do usuário ou None se não existir
         """
-        with self._lock:
-            if user_id not in self._connections:
-                return None
+        return self._lookup(user_id)
+    
+    def has_connection(self, user_id: str) -> bool:
+        """
+        Verifica se existe uma conexão registrada para o usuário (sem atualizar o timestamp).
+        
+        Args:
+            user_id (str): ID do usuário
+            
+        Returns:
+            bool: True se o usuário tiver uma conexão registrada
+        """
+        return self._lookup(user_id, touch=False) is not None
+    
+    def get_user_state(self, user_id: str, key: str, default: Any = None) -> Any:
+        """
+        Obtém um único item do estado do usuário (sem copiar o restante do registro).
+        
+        Args:
+            user_id (str): ID do usuário
+            key (str): Chave do estado (ex: "analysis_progress", "ranking_cleared")
+            default (Any): Valor retornado se o usuário ou a chave não existirem
+            
+        Returns:
+            Valor do item (não deve ser alterado diretamente; use set_user_state)
+        """
+        data = self._lookup(user_id)
+        if data is None:
+            return default
+        return data.get(key, default)
+    
+    def get_user_item(self, user_id: str, key: str, item: str, default: Any = None) -> Any:
+        """
+        Obtém um elemento de um item do estado que é um dicionário (ex: last_results de um ativo).
+        
+        Args:
+            user_id (str): ID do usuário
+            key (str): Chave do estado (ex: "last_results")
+            item (str): Chave dentro do dicionário (ex: nome do ativo)
+            default (Any): Valor retornado se não existir
+            
+        Returns:
+            Valor do elemento
+        """
+        value = self.get_user_state(user_id, key)
+        if not isinstance(value, dict):
+            return default
+        return value.get(item, default)
+    
+    def update_user_items(self, user_id: str, key: str, items: Dict[str, Any]) -> bool:
+        """
+        Atualiza elementos de um item do estado que é um dicionário (ex: stats de um ativo),
+        criando-o se não existir. A atualização é atômica em relação às demais alterações do usuário.
+        
+        Args:
+            user_id (str): ID do usuário
+            key (str): Chave do estado (ex: "stats", "last_results")
+            items (dict): Elementos a gravar
+            
+        Returns:
+            bool: True se atualizado com sucesso, False se o usuário não existir
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.get(user_id)
+            if data is None:
+                return False
             
-            # Atualizar timestamp da última atividade
-            self._connections[user_id]['last_activity'] = time.time()
-            return self._connections[user_id]
+            current = data.get(key)
+            if not isinstance(current, dict):
+                current = data[key] = {}
+            current.update(items)
+            data['last_activity'] = time.time()
+            return True
     
     def get_lock(self, user_id: str) -> Optional[threading.RLock]:
         """
@@ -127,12 +276,9 @@ class ConnectionManager:
         Returns:
             threading.RLock: Lock do usuário ou None se não existir
         """
-        with self._lock:
-            if user_id not in self._connections:
-                return None
-            
-            # Não atualiza o timestamp aqui, pois isso pode ser chamado com muita frequência
-            return self._connections[user_id]['lock']
+        # Não atualiza o timestamp aqui, pois isso pode ser chamado com muita frequência
+        data = self._lookup(user_id, touch=False)
+        return data['lock'] if data is not None else None
     
     def update_connection_status(self, user_id: str, connected: bool) -> bool:
         """
@@ -145,12 +291,14 @@ class ConnectionManager:
         Returns:
             bool: True se atualizado com sucesso, False caso contrário
         """
-        with self._lock:
-            if user_id not in self._connections:
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.get(user_id)
+            if data is None:
                 return False
             
-            self._connections[user_id]['connected'] = connected
-            self._connections[user_id]['last_activity'] = time.time()
+            data['connected'] = connected
+            data['last_activity'] = time.time()
             return True
     
     def update_user_state(self, user_id: str, key: str, value: Any) -> bool:
@@ -165,44 +313,77 @@ class ConnectionManager:
         Returns:
             bool: True se atualizado com sucesso, False caso contrário
         """
-        with self._lock:
-            if user_id not in self._connections:
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.get(user_id)
+            if data is None or key not in data:
                 return False
             
-            if key in self._connections[user_id]:
-                self._connections[user_id][key] = value
-                self._connections[user_id]['last_activity'] = time.time()
-                return True
-            return False
+            data[key] = value
+            data['last_activity'] = time.time()
+            return True
     
-    def remove_connection(self, user_id: str) -> bool:
+    def set_user_state(self, user_id: str, key: str, value: Any) -> bool:
         """
-        Remove a conexão de um usuário, fechando-a adequadamente.
+        Define um item do estado do usuário, criando-o se não existir (ex: top5_ativos).
         
         Args:
             user_id (str): ID do usuário
+            key (str): Chave a ser definida
+            value (Any): Novo valor
             
         Returns:
-            bool: True se removido com sucesso, False caso contrário
+            bool: True se definido com sucesso, False se o usuário não existir
         """
-        with self._lock:
-            if user_id not in self._connections:
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.get(user_id)
+            if data is None:
                 return False
             
-            # Tentar fechar a conexão da API
-            api_instance = self._connections[user_id].get('api')
-            if api_instance is not None:
-                try:
-                    api_instance.close()
-                    logger.info(f"Conexão API fechada para usuário {user_id}")
-                except Exception as e:
-                    logger.error(f"Erro ao fechar conexão API para usuário {user_id}: {str(e)}")
-            
-            # Remover do dicionário
-            del self._connections[user_id]
-            logger.info(f"Conexão removida para usuário {user_id}")
+            data[key] = value
+            data['last_activity'] = time.time()
             return True
     
+    def pop_user_state(self, user_id: str, key: str) -> Any:
+        """
+        Remove um item do estado do usuário.
+        
+        Args:
+            user_id (str): ID do usuário
+            key (str): Chave a ser removida
+            
+        Returns:
+            Valor removido ou None se não existir
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.get(user_id)
+            if data is None:
+                return None
+            return data.pop(key, None)
+    
+    def remove_connection(self, user_id: str) -> bool:
+        """
+        Remove a conexão de um usuário, fechando-a adequadamente.
+        
+        Args:
+            user_id (str): ID do usuário
+            
+        Returns:
+            bool: True se removido com sucesso, False caso contrário
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            data = shard.connections.pop(user_id, None)
+        if data is None:
+            return False
+        
+        # Fechar a conexão da API fora do lock (pode levar segundos)
+        self._close_api(user_id, data.get('api'), "conexão API")
+        logger.info(f"Conexão removida para usuário {user_id}")
+        return True
+    
     def list_connections(self) -> Dict[str, Dict[str, Any]]:
         """
         Lista informações resumidas sobre todas as conexões.
@@ -210,22 +391,21 @@ class ConnectionManager:
         Returns:
             dict: Informações de todas as conexões ativas
         """
-        with self._lock:
-            result = {}
-            current_time = time.time()
-            
-            for user_id, data in self._connections.items():
-                # Criar um resumo sem a instância da API e outros objetos grandes
-                idle_time = current_time - data['last_activity']
-                result[user_id] = {
-                    'connected': data['connected'],
-                    'idle_time': idle_time,
-                    'idle_time_formatted': str(datetime.utcfromtimestamp(idle_time).strftime('%H:%M:%S')),
-                    'has_results': bool(data['last_results']),
-                    'analysis_in_progress': data['analysis_progress']['in_progress']
-                }
-            
-            return result
+        result = {}
+        current_time = time.time()
+        
+        for user_id, data in self._snapshot():
+            # Criar um resumo sem a instância da API e outros objetos grandes
+            idle_time = current_time - data['last_activity']
+            result[user_id] = {
+                'connected': data['connected'],
+                'idle_time': idle_time,
+                'idle_time_formatted': str(datetime.utcfromtimestamp(idle_time).strftime('%H:%M:%S')),
+                'has_results': bool(data['last_results']),
+                'analysis_in_progress': data['analysis_progress']['in_progress']
+            }
+        
+        return result
     
     def _cleanup_task(self) -> None:
         """
@@ -241,23 +421,31 @@ class ConnectionManager:
     def _cleanup_inactive_connections(self) -> None:
         """
         Remove conexões que estão inativas por muito tempo.
+
+        Os candidatos vêm de uma cópia dos registros; cada um é retirado da partição somente se
+        continuar inativo (e for o mesmo registro), e as conexões são fechadas depois, fora dos locks.
         """
-        with self._lock:
-            current_time = time.time()
-            to_remove = []
-            
-            for user_id, data in self._connections.items():
-                if current_time - data['last_activity'] > self._max_idle_time:
-                    to_remove.append(user_id)
-            
-            for user_id in to_remove:
-                try:
-                    self.remove_connection(user_id)
-                    logger.info(f"Conexão inativa removida para usuário {user_id}")
-                except Exception as e:
-                    logger.error(f"Erro ao remover conexão inativa para usuário {user_id}: {str(e)}")
-            
-            if to_remove:
-                logger.info(f"Limpeza concluída, {len(to_remove)} conexões removidas")
-            else:
-                logger.debug("Limpeza concluída, nenhuma conexão inativa encontrada") 
\ No newline at end of file
+        current_time = time.time()
+        candidates = [
+            (user_id, data) for user_id, data in self._snapshot()
+            if current_time - data['last_activity'] > self._max_idle_time
+        ]
+        
+        removed = []
+        for user_id, data in candidates:
+            shard = self._shard(user_id)
+            with shard.lock:
+                # O usuário pode ter voltado a usar (ou reconectado) depois da cópia
+                if shard.connections.get(user_id) is not data or time.time() - data['last_activity'] <= self._max_idle_time:
+                    continue
+                del shard.connections[user_id]
+            removed.append((user_id, data))
+        
+        for user_id, data in removed:
+            self._close_api(user_id, data.get('api'), "conexão API")
+            logger.info(f"Conexão inativa removida para usuário {user_id}")
+        
+        if removed:
+            logger.info(f"Limpeza concluída, {len(removed)} conexões removidas")
+        else:
+            logger.debug("Limpeza concluída, nenhuma conexão inativa encontrada") 
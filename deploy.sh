@@ -43,6 +43,11 @@ echo "=== Configurando diretório de logs ==="
 mkdir -p logs
 chown -R www-data:www-data logs
 
+# Configurar histórico local de velas
+echo "=== Configurando diretório de dados ==="
+mkdir -p data
+chown -R www-data:www-data data
+
 # Configurar serviço systemd
 echo "=== Configurando serviço systemd ==="
 cp catalogador.service /etc/systemd/system/
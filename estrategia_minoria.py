@@ -1,39 +1,38 @@
 import asyncio
+import copy
+import functools
 import os
 import time
 import json
 import math
 import gc
 import uuid
-import logging
 from typing import Dict, Any, Optional, Tuple, List
 from datetime import datetime, timedelta
 
-import pandas as pd
-import plotly.graph_objects as go
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_session import Session
-from dotenv import load_dotenv
 from polariumapi.stable_api import Polarium
 from polariumapi.constants import ACTIVES
 
+from config import get_logger
 from connection_manager import ConnectionManager
-from async_utils import run_blocking_func, run_with_timeout, cleanup as async_cleanup
+from session_broker import SESSION_BROKER_SOCKET, RemoteCache, RemoteConnectionManager, RemotePolarium, acquire_lease
+from job_manager import JobManager, RemoteJobStore
+from ranking_service import RankingService
+from strategies import (
+    STRATEGIES, candles_needed, evaluate_strategies, compute_block_stats, candle_columns, score_candle_columns
+)
+from chart_utils import CHART_MODE_COMPACT, CHART_MODE_PLOTLY, build_chart_payload, build_plotly_chart
+from event_stream import event_broker
+from async_utils import (
+    OperationCanceled, current_cancel_token, run_blocking_func, run_control_func, run_cpu_func, run_with_timeout, cleanup as async_cleanup
+)
 from cache_utils import cache_manager
+from candle_store import candle_store
 
-# Carregar variáveis de ambiente
-load_dotenv()
-
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/estrategia_minoria.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("estrategia_minoria")
+# Configurar o logging
+logger = get_logger("estrategia_minoria", "estrategia_minoria.log")
 
 # Inicializar aplicação Flask
 app = Flask(__name__)
@@ -53,12 +52,22 @@ if app.config['SESSION_TYPE'] == 'redis':
 # Inicializar extensão de sessão
 Session(app)
 
-# Inicializar gerenciador de conexões
-connection_manager = ConnectionManager()
+# Inicializar gerenciador de conexões (com o broker, as sessões ficam no processo do broker, compartilhadas pelos workers)
+connection_manager = RemoteConnectionManager() if SESSION_BROKER_SOCKET else ConnectionManager()
+
+# Inicializar gerenciador de jobs em segundo plano (com o broker, os registros dos jobs ficam no broker)
+job_manager = JobManager(
+    max_concurrent_jobs=int(os.getenv('MAX_CONCURRENT_JOBS', '4')),
+    retention_time=int(os.getenv('JOB_RETENTION_TIME', '3600')),
+    store=RemoteJobStore() if SESSION_BROKER_SOCKET else None
+)
 
 # Inicializar cache com a aplicação Flask
 cache_manager.init_app(app)
 
+# Estratégia usada na análise individual, no top 5 e no ranking global
+DEFAULT_STRATEGY = STRATEGIES["minoria"]
+
 # Lista de ativos recomendados
 ativos_recomendados = [
     # Criptomoedas
@@ -93,6 +102,18 @@ def generate_user_id():
     """Gera um ID único para um usuário."""
     return str(uuid.uuid4())
 
+# Canal de eventos (SSE) de um usuário
+def user_channel(user_id):
+    """Nome do canal de eventos de um usuário (atualizações de ranking)."""
+    return f"user:{user_id}"
+
+# Criar instância da API (no broker de sessões, se configurado)
+def create_api(email, password):
+    """Cria a instância Polarium no próprio processo ou, com SESSION_BROKER_SOCKET, no broker. Operação bloqueante."""
+    if SESSION_BROKER_SOCKET:
+        return RemotePolarium.open(email, password)
+    return Polarium(email, password)
+
 # Função para conectar à API Polarium (versão assíncrona)
 async def connect_to_polarium(email, password):
     """Conecta à API Polarium de forma assíncrona."""
@@ -100,7 +121,7 @@ async def connect_to_polarium(email, password):
     
     try:
         # Criar nova instância Polarium (operação bloqueante executada em thread)
-        new_api = await run_blocking_func(lambda: Polarium(email, password))
+        new_api = await run_blocking_func(create_api, email, password)
         logger.info("Instância Polarium criada")
         
         # Chamar método de conexão (operação bloqueante)
@@ -109,7 +130,7 @@ async def connect_to_polarium(email, password):
         
         if check:
             # Alterar o tipo de conta para practice
-            await run_blocking_func(new_api.change_balance, 'PRACTICE')
+            await run_control_func(new_api.change_balance, 'PRACTICE')
             logger.info("Balance alterado para PRACTICE")
             
             # Conectado com sucesso
@@ -126,450 +147,225 @@ async def connect_to_polarium(email, password):
         logger.exception(f"Exceção não esperada: {str(e)}")
         return False, f"Erro crítico ao conectar: {str(e)}", None, "error"
 
-# Função auxiliar para verificar blocos de 5 minutos
-def get_time_block(timestamp):
-    """Determina o início do bloco de 5 minutos para um timestamp."""
-    dt = datetime.fromtimestamp(timestamp)
-    minutes = dt.minute - (dt.minute % 5)
-    block_start = datetime(dt.year, dt.month, dt.day, dt.hour, minutes, 0)
-    return int(block_start.timestamp())
+# Tempo em cache dos gráficos montados (segundos)
+CHART_CACHE_TTL = int(os.getenv('CHART_CACHE_TTL', '300'))
 
 # Função para obter a posição da linha 30 segundos antes do início do bloco
 def get_line_position(block_time):
     """Determina a posição da linha 30 segundos antes do início do bloco."""
-    return block_time - 30
+    return block_time - DEFAULT_STRATEGY.line_offset
 
-# Função para verificar se um candle pertence ao bloco entre as linhas
-def candle_in_block(candle_time, block_start):
-    """Verifica se o candle está entre as linhas do bloco."""
-    block_line_start = get_line_position(block_start)
-    block_line_end = get_line_position(block_start + 300)  # +300 segundos (5 minutos)
-    return block_line_start <= candle_time < block_line_end
+# Função para obter candles de um ativo (com cache de curta duração)
+async def fetch_candles(api_instance, active, timeframe, count):
+    """
+    Obtém as últimas velas de um ativo, usando a instância da API do usuário.
 
-# Função para obter e analisar candles (refatorada para receber api_instance)
-async def analyze_candles(api_instance, active, timeframe=60, num_blocks=10):
-    """Analisa candles para um ativo específico, usando a instância da API do usuário."""
+    As velas ficam em cache por minuto: dentro do mesmo minuto as velas fechadas são as mesmas,
+    então usuários analisando o mesmo ativo compartilham uma única busca, inclusive quando as
+    requisições chegam ao mesmo tempo.
+    """
+    current_time = int(time.time())
+    cache_key = f"candles:{active}:{timeframe}:{count}:{current_time//60}"
+    return await cache_manager.get_or_compute_async(
+        cache_key,
+        lambda: load_candles(api_instance, active, timeframe, count, current_time),
+        ttl=30
+    )
+
+# Função para buscar candles no armazenamento local ou na API
+async def load_candles(api_instance, active, timeframe, count, current_time):
+    """Busca as últimas velas de um ativo no armazenamento local (sincronizado com a API) ou diretamente na API."""
+    # get_candles desiste das novas tentativas quando o job é cancelado ou o prazo da requisição termina
+    get_candles = functools.partial(api_instance.get_candles, cancel_token=current_cancel_token.get())
+    
+    logger.info(f"Analisando {active}, tempo atual: {datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Com o armazenamento local, só a lacuna desde a última vela gravada é solicitada à API
+    if candle_store is not None:
+        candles = await run_blocking_func(
+            candle_store.get_candles,
+            get_candles,
+            active,
+            timeframe,
+            count,
+            current_time
+        )
+        if candles and current_time - candles[-1]['from'] <= 120:
+            return candles
+        logger.warning(f"Armazenamento local sem velas recentes para {active}, consultando a API")
+    
+    # Obter candles da API (operação bloqueante)
+    logger.info(f"Solicitando {count} candles para {active}")
+    candles = await run_blocking_func(
+        get_candles, 
+        active, 
+        timeframe, 
+        count, 
+        current_time
+    )
+    
+    if not candles:
+        return candles
+    
+    # Log do candle mais recente
+    latest_candle_time = max(c['from'] for c in candles)
+    logger.info(f"Candle mais recente: {datetime.fromtimestamp(latest_candle_time).strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Verificar idade do candle mais recente
+    candle_age = current_time - latest_candle_time
+    logger.info(f"Último candle tem {candle_age} segundos de idade")
+    
+    if candle_age > 120:  # Mais de 2 minutos
+        logger.warning(f"Candle muito antigo para {active}, tentando novamente")
+        candles = await run_blocking_func(
+            get_candles, 
+            active, 
+            timeframe, 
+            count, 
+            current_time
+        )
+    
+    if candles and candle_store is not None:
+        await run_blocking_func(candle_store.write, active, timeframe, candles)
+    
+    return candles
+
+# Função para analisar várias estratégias sobre a mesma série de velas
+async def analyze_strategies(api_instance, active, strategy_names, timeframe=60, num_blocks=10):
+    """Busca as velas uma única vez e avalia todas as estratégias selecionadas, com resultados lado a lado."""
     if api_instance is None:
         return {"error": "API não conectada"}
     
     try:
         num_blocks = min(int(num_blocks), 100)
-        current_time = int(time.time())
-        logger.info(f"Analisando {active}, tempo atual: {datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')}")
-        current_block = get_time_block(current_time)
-        
-        # Determinar número de candles a obter
-        total_candles = num_blocks * 5 + 20
-        candles_to_request = total_candles + 30
-        
-        # Tentar obter do cache primeiro
-        cache_key = f"candles:{active}:{timeframe}:{candles_to_request}:{current_time//60}"
-        cache_hit, cached_candles = cache_manager.get(cache_key)
-        
-        if cache_hit:
-            logger.info(f"Cache hit para candles de {active}")
-            candles = cached_candles
-        else:
-            # Obter candles da API (operação bloqueante)
-            logger.info(f"Solicitando {candles_to_request} candles para {active}")
-            candles = await run_blocking_func(
-                api_instance.get_candles, 
-                active, 
-                timeframe, 
-                candles_to_request, 
-                current_time
-            )
-            
-            # Armazenar no cache se obtido com sucesso (TTL de 30 segundos)
-            if candles:
-                cache_manager.set(cache_key, candles, ttl=30)
+        strategies = [STRATEGIES[name] for name in strategy_names]
         
+        candles = await fetch_candles(api_instance, active, timeframe, candles_needed(strategies, num_blocks) + 30)
         if not candles:
             logger.error(f"API não retornou candles para {active}")
             return {"error": "API não retornou candles."}
-            
-        # Log do candle mais recente
-        latest_candle_time = max(c['from'] for c in candles)
-        logger.info(f"Candle mais recente: {datetime.fromtimestamp(latest_candle_time).strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Verificar idade do candle mais recente
-        candle_age = current_time - latest_candle_time
-        logger.info(f"Último candle tem {candle_age} segundos de idade")
-        
-        if candle_age > 120:  # Mais de 2 minutos
-            logger.warning(f"Candle muito antigo para {active}, tentando novamente")
-            candles = await run_blocking_func(
-                api_instance.get_candles, 
-                active, 
-                timeframe, 
-                candles_to_request, 
-                current_time
-            )
-        
-        # Organizar candles em blocos
-        blocks = {}
-        results = []
         
-        # Criar blocos formais primeiro
-        for i in range(num_blocks):
-            block_time = current_block - (i * 300)
-            blocks[block_time] = []
-        
-        # Distribuir candles nos blocos
-        for candle in candles:
-            for block_time in blocks.keys():
-                if candle_in_block(candle['from'], block_time):
-                    if len(blocks[block_time]) < 5:  # Limitar a 5 velas por bloco
-                        is_doji = candle['open'] == candle['close']
-                        direction = "doji" if is_doji else "verde" if candle['open'] < candle['close'] else "vermelha"
-                        blocks[block_time].append({
-                            "time": candle['from'],
-                            "direction": direction,
-                            "open": candle['open'],
-                            "close": candle['close'],
-                            "high": candle['max'],
-                            "low": candle['min']
-                        })
-                    break
-        
-        # Ordenar blocos por tempo
-        sorted_blocks = sorted(blocks.items(), key=lambda x: x[0])
-        
-        # Analisar cada bloco
-        for block_time, candles_block in sorted_blocks:
-            if len(candles_block) == 5:  # Só considerar blocos completos
-                # Calcular contagens de velas verdes e vermelhas
-                verde_count = sum(1 for c in candles_block if c['direction'] == "verde")
-                vermelha_count = sum(1 for c in candles_block if c['direction'] == "vermelha")
-                
-                # Verificar se há doji no bloco
-                has_doji = any(c['direction'] == "doji" for c in candles_block)
-                
-                if has_doji:
-                    signal = "NULO"
-                else:
-                    # Determinar minoria
-                    if verde_count < vermelha_count:
-                        signal = "CALL"
-                    elif vermelha_count < verde_count:
-                        signal = "PUT"
-                    else:
-                        signal = "DOJI"  # Igual número de verdes e vermelhas
-                
-                # Verificar resultado para blocos já finalizados
-                next_block_time = block_time + (5 * 60)
-                result_data = None
-                
-                if signal != "NULO":
-                    result_data = await check_result(api_instance, active, block_time, next_block_time, signal)
-                else:
-                    result_data = {"result": "NULO", "martingale": "NULO"}
-                
-                # Adicionar ao resultado
-                block_data = {
-                    "block_time": block_time,
-                    "time_str": datetime.fromtimestamp(block_time).strftime("%H:%M"),
-                    "verde_count": verde_count,
-                    "vermelha_count": vermelha_count,
-                    "signal": signal,
-                    "candles": candles_block,
-                    "result": result_data["result"] if result_data else None,
-                    "martingale": result_data["martingale"] if result_data else None
+        # Organizar candles em blocos e apurar entrada e martingales de cada estratégia
+        current_time = int(time.time())
+        evaluated = evaluate_strategies(candles, strategies, num_blocks, current_time)
+        
+        return {
+            "success": True,
+            "num_blocks": num_blocks,
+            "candles": [c for c in candles if c['from'] + timeframe <= current_time],  # Apenas velas fechadas
+            "strategies": {
+                strategy.name: {
+                    "label": strategy.label,
+                    "data": evaluated[strategy.name],
+                    "stats": compute_block_stats(evaluated[strategy.name])
                 }
-                
-                results.append(block_data)
-        
-        # Ordenar resultados cronologicamente
-        results = sorted(results, key=lambda x: x["block_time"])
-        
-        return {"success": True, "data": results}
+                for strategy in strategies
+            }
+        }
     
     except Exception as e:
-        logger.exception(f"Erro ao analisar candles de {active}: {str(e)}")
-        return {"error": f"Erro ao analisar candles: {str(e)}"}
+        logger.exception(f"Erro ao analisar estratégias de {active}: {str(e)}")
+        return {"error": f"Erro ao analisar estratégias: {str(e)}"}
 
-# Verificar resultado da operação (refatorada para receber api_instance)
-async def check_result(api_instance, active, block_time, next_block_time, signal):
-    """Verifica o resultado de uma operação usando a instância da API do usuário."""
-    try:
-        # Verificar o tempo atual
-        current_time = int(time.time())
-        line_end_time = get_line_position(next_block_time)
-        
-        # Tempo para primeiro candle completo (1 minuto após o final do bloco)
-        required_time_for_first = line_end_time + 60
-        
-        if current_time < required_time_for_first:
-            logger.info(f"Bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')} ainda não tem candle completo")
-            return None
-        
-        # Calcular quantos candles completos devemos ter
-        minutes_passed = min(3, max(1, (current_time - line_end_time) // 60))
-        logger.info(f"{minutes_passed} minutos desde o final do bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-        
-        # Buscar os candles disponíveis
-        candles = await run_blocking_func(
-            api_instance.get_candles,
-            active,
-            60,
-            minutes_passed,
-            line_end_time + (minutes_passed * 60)
-        )
-        
-        if len(candles) < 1:
-            logger.info(f"Sem candles para verificar resultado do bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-            return None
-        
-        logger.info(f"Analisando {len(candles)} candles para o bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-        
-        # Verificar candles sequencialmente
-        for i, candle in enumerate(candles):
-            candle_direction = "DOJI" if candle['open'] == candle['close'] else "CALL" if candle['open'] < candle['close'] else "PUT"
-            win = (signal == candle_direction)
-            
-            if win:
-                logger.info(f"WIN no candle {i+1} para o bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-                return {"result": "WIN", "martingale": i}
-            
-            # Se estamos no último candle disponível e ainda não ganhou
-            if i == len(candles) - 1:
-                # Se já verificamos todos os 3 candles, é loss
-                if i == 2 or minutes_passed >= 3:
-                    logger.info(f"LOSS confirmado para o bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-                    return {"result": "LOSS", "martingale": 2}
-                # Caso contrário, ainda não temos resultado definitivo
-                logger.info(f"Sem resultado definitivo para o bloco {datetime.fromtimestamp(block_time).strftime('%H:%M')}")
-                return None
-                
-        return None  # Ainda não temos resultado
-    
-    except Exception as e:
-        logger.exception(f"Erro ao verificar resultado: {str(e)}")
-        return None
+# Função para obter e analisar candles (refatorada para receber api_instance)
+async def analyze_candles(api_instance, active, timeframe=60, num_blocks=10):
+    """Analisa candles para um ativo específico pela estratégia da minoria, usando a instância da API do usuário."""
+    results = await analyze_strategies(api_instance, active, [DEFAULT_STRATEGY.name], timeframe, num_blocks)
+    if "error" in results:
+        return results
+    data = results["strategies"][DEFAULT_STRATEGY.name]["data"]
+    return {
+        "success": True,
+        "data": data,
+        "num_blocks": results["num_blocks"],
+        "candles": chart_candles(results["candles"], data)
+    }
+
+# Pontuação de um ativo para os rankings (sem os blocos e velas usados apenas na tela)
+async def score_active(api_instance, active, num_blocks, timeframe=60):
+    """
+    Busca as velas de um ativo e calcula as estatísticas da estratégia padrão no pool de processos.
 
-# Gerar gráfico com Plotly (refatorada para ser assíncrona)
-async def generate_chart(api_instance, active, data):
-    """Gera um gráfico para o ativo usando a instância da API do usuário."""
+    Usa a mesma série (e o mesmo cache de velas) da análise individual; as velas seguem em
+    colunas compactas e só as estatísticas voltam, mantendo barata a troca entre processos.
+
+    Returns:
+        dict: {"success": True, "stats": estatísticas ou None se não houver blocos completos} ou {"error": ...}
+    """
+    if api_instance is None:
+        return {"error": "API não conectada"}
+    num_blocks = min(int(num_blocks), 100)
+    candles = await fetch_candles(api_instance, active, timeframe, candles_needed([DEFAULT_STRATEGY], num_blocks) + 30)
+    if not candles:
+        logger.error(f"API não retornou candles para {active}")
+        return {"error": "API não retornou candles."}
+    stats = await run_cpu_func(score_candle_columns, candle_columns(candles), DEFAULT_STRATEGY.name,
+                               num_blocks, int(time.time()))
+    return {"success": True, "stats": stats}
+
+# Velas exibidas no gráfico, a partir da mesma série usada na análise
+def chart_candles(candles, data):
+    """
+    Seleciona as velas do gráfico: do primeiro bloco analisado até a última vela fechada.
+
+    Args:
+        candles: Velas fechadas no formato da API
+        data: Blocos analisados
+
+    Returns:
+        list: Velas (time, open, high, low, close) em ordem cronológica
+    """
     if not data:
+        return []
+    start = data[0]["candles"][0]["time"]
+    return sorted(
+        (
+            {"time": c['from'], "open": c['open'], "high": c['max'], "low": c['min'], "close": c['close']}
+            for c in candles if c['from'] >= start
+        ),
+        key=lambda c: c["time"]
+    )
+
+# Gerar dados do gráfico (com cache dos gráficos já montados)
+async def generate_chart(active, results, chart_mode=CHART_MODE_COMPACT):
+    """
+    Gera o gráfico do ativo a partir das velas já obtidas na análise, sem consultar a API.
+
+    No modo compacto retorna apenas os dados (séries OHLC e linhas dos blocos), e o layout
+    é montado no cliente; no modo "plotly" retorna a figura completa serializada em JSON.
+    O gráfico montado fica em cache por (ativo, blocos, última vela fechada, modo), pois
+    com as mesmas velas fechadas o resultado é idêntico para qualquer usuário.
+
+    Args:
+        active (str): Nome do ativo
+        results (dict): Resultado de analyze_candles (data, num_blocks e candles)
+        chart_mode (str): "compact" (padrão) ou "plotly"
+    """
+    data = results.get("data")
+    candles = results.get("candles")
+    if not data or not candles:
         return None
     
-    # Função interna para processamento bloqueante do gráfico
-    def process_chart():
-        try:
-            # Verificar se precisamos buscar mais candles recentes para o gráfico
-            current_time = int(time.time())
-            
-            # Preparar dados para o gráfico de candles
-            candles_data = []
-            for block in data:
-                for candle in block["candles"]:
-                    candles_data.append(candle)
-            
-            # Buscar candles adicionais
-            if len(candles_data) > 0:
-                latest_candle_time = max(candle["time"] for candle in candles_data)
-                
-                logger.info(f"Buscando candles adicionais para o gráfico. Último: {datetime.fromtimestamp(latest_candle_time).strftime('%H:%M:%S')}")
-                
-                # Buscar pelo menos os últimos 10 candles
-                extra_candles_count = max(10, int((current_time - latest_candle_time) / 60) + 3)
-                
-                try:
-                    # Buscar candles mais recentes
-                    extra_candles = api_instance.get_candles(active, 60, extra_candles_count, current_time)
-                    
-                    for candle in extra_candles:
-                        # Só adicionar candles que já não estão no dataset
-                        if not any(c["time"] == candle["from"] for c in candles_data):
-                            is_doji = candle['open'] == candle['close']
-                            direction = "doji" if is_doji else "verde" if candle['open'] < candle['close'] else "vermelha"
-                            candles_data.append({
-                                "time": candle["from"],
-                                "direction": direction,
-                                "open": candle["open"],
-                                "close": candle["close"],
-                                "high": candle["max"],
-                                "low": candle["min"]
-                            })
-                    
-                    logger.info(f"Adicionados {len(extra_candles)} candles extras ao gráfico")
-                except Exception as e:
-                    logger.error(f"Erro ao buscar candles adicionais: {str(e)}")
-            
-            # Ordenar por tempo
-            candles_data.sort(key=lambda x: x["time"])
-            
-            # Obter o intervalo de tempo para ajustar o eixo X
-            if len(candles_data) > 0:
-                min_time = min(candle["time"] for candle in candles_data)
-                max_time = max(candle["time"] for candle in candles_data)
-                time_buffer = (max_time - min_time) * 0.05  # 5% de buffer
-                x_range = [
-                    datetime.fromtimestamp(min_time - time_buffer),
-                    datetime.fromtimestamp(max_time + time_buffer)
-                ]
-                
-                # Calcular o intervalo do eixo Y
-                all_highs = [candle["high"] for candle in candles_data]
-                all_lows = [candle["low"] for candle in candles_data]
-                y_min = min(all_lows)
-                y_max = max(all_highs)
-                y_buffer = (y_max - y_min) * 0.1  # 10% de buffer
-                y_range = [y_min - y_buffer, y_max + y_buffer]
-            else:
-                x_range = None
-                y_range = None
-            
-            # Criar figura do gráfico
-            fig = go.Figure(data=[go.Candlestick(
-                x=[datetime.fromtimestamp(candle["time"]) for candle in candles_data],
-                open=[candle["open"] for candle in candles_data],
-                high=[candle["high"] for candle in candles_data],
-                low=[candle["low"] for candle in candles_data],
-                close=[candle["close"] for candle in candles_data],
-                increasing_line_color='#26a69a',  # Verde mais suave
-                decreasing_line_color='#ef5350',  # Vermelho mais suave
-                increasing_fillcolor='#26a69a',   
-                decreasing_fillcolor='#ef5350',
-                line=dict(width=1.5),             # Linhas mais grossas
-                opacity=0.8                       # Leve transparência
-            )])
-            
-            # Coletar posições das linhas
-            grid_positions = []
-            
-            # Adicionar linhas verticais para delimitar blocos
-            for i, block in enumerate(data):
-                # Posição da linha 30 segundos antes do FINAL do bloco
-                line_time = get_line_position(block["block_time"] + 300)
-                line_position = datetime.fromtimestamp(line_time)
-                
-                # Adicionar à lista de posições
-                grid_positions.append(line_position)
-                
-                # Adicionar linhas coloridas para blocos com resultados
-                if block["result"] is not None:
-                    # Definir cor da linha baseado no resultado
-                    if block["result"] == "WIN" and block["martingale"] == 0:
-                        color = "#00c853"  # Verde vibrante
-                        width = 2
-                    elif block["result"] == "WIN" and block["martingale"] == 1:
-                        color = "#2979ff"  # Azul vibrante
-                        width = 2
-                    elif block["result"] == "WIN" and block["martingale"] == 2:
-                        color = "#ffd600"  # Amarelo vibrante
-                        width = 2
-                    elif block["result"] == "LOSS":
-                        color = "#f44336"  # Vermelho vibrante
-                        width = 2
-                    elif block["result"] == "NULO":
-                        color = "#ffffff"  # Branco para blocos com doji
-                        width = 2
-                    else:
-                        continue  # Pular blocos sem resultado definido
-                    
-                    # Adicionar linha vertical
-                    fig.add_shape(
-                        type="line",
-                        x0=line_position,
-                        y0=0,
-                        x1=line_position,
-                        y1=1,
-                        yref="paper",
-                        line=dict(
-                            color=color,
-                            width=width,
-                            dash="solid"
-                        )
-                    )
-                else:
-                    # Linhas cinza para blocos sem resultado
-                    fig.add_shape(
-                        type="line",
-                        x0=line_position,
-                        y0=0,
-                        x1=line_position,
-                        y1=1,
-                        yref="paper",
-                        line=dict(
-                            color="#555555",  # Cinza
-                            width=1,
-                            dash="solid"
-                        )
-                    )
-            
-            # Configurar layout
-            fig.update_layout(
-                title={
-                    'text': f'Gráfico de {active} - Catalogação Estratégia Sodré',
-                    'font': {'size': 24, 'color': '#ffffff'},
-                    'y': 0.97,
-                    'x': 0.5,
-                    'xanchor': 'center',
-                    'yanchor': 'top'
-                },
-                xaxis={
-                    'title': 'Horário',
-                    'title_font': {'size': 16},
-                    'tickfont': {'size': 14},
-                    'showgrid': False,
-                    'gridcolor': '#333333',
-                    'range': x_range,
-                    'zeroline': False,
-                    'autorange': True,
-                },
-                yaxis={
-                    'title': 'Preço',
-                    'title_font': {'size': 16},
-                    'tickfont': {'size': 14},
-                    'showgrid': True,
-                    'gridcolor': '#333333',
-                    'zeroline': False,
-                    'range': y_range,
-                    'autorange': True,
-                },
-                template='plotly_dark',
-                plot_bgcolor='rgba(25, 25, 25, 0.8)',
-                paper_bgcolor='rgba(25, 25, 25, 0.8)',
-                height=700,
-                autosize=True,
-                margin=dict(l=50, r=50, t=70, b=50),
-                hovermode='x',
-                legend_orientation='h',
-                legend=dict(
-                    x=0.5,
-                    y=1.02,
-                    xanchor='center',
-                    font=dict(size=14)
-                ),
-                showlegend=False
-            )
-            
-            # Adicionar linhas de grid
-            fig.update_xaxes(
-                showline=True,
-                linewidth=1,
-                linecolor='#555555',
-                mirror=True,
-                rangeslider=dict(visible=False),
-                autorange=True
-            )
-            
-            fig.update_yaxes(
-                showline=True,
-                linewidth=1,
-                linecolor='#555555',
-                mirror=True,
-                autorange=True
-            )
-            
-            return fig.to_json()
-        except Exception as e:
-            logger.exception(f"Erro ao gerar gráfico: {str(e)}")
-            return None
+    cache_key = f"chart:{active}:{results.get('num_blocks')}:{candles[-1]['time']}:{chart_mode}"
+    cache_hit, cached_chart = cache_manager.get(cache_key)
+    if cache_hit:
+        logger.info(f"Cache hit para gráfico de {active}")
+        return cached_chart
     
-    # Executar o processamento do gráfico em um thread separado
-    return await run_blocking_func(process_chart)
+    try:
+        # Dados compactos (colunas simples); a figura Plotly, cara em CPU, é montada no pool de processos
+        payload = build_chart_payload(active, data, candles,
+                                      DEFAULT_STRATEGY.block_seconds, DEFAULT_STRATEGY.line_offset)
+        if chart_mode == CHART_MODE_PLOTLY:
+            chart = await run_cpu_func(build_plotly_chart, payload)
+        else:
+            chart = payload
+    except Exception as e:
+        logger.exception(f"Erro ao gerar gráfico: {str(e)}")
+        chart = None
+    if chart:
+        cache_manager.set(cache_key, chart, ttl=CHART_CACHE_TTL)
+    return chart
 
 # Função para verificar se um ativo é do tipo binary
 def is_binary_active(active_name):
@@ -579,23 +375,35 @@ def is_binary_active(active_name):
 
 # Função para obter ativos disponíveis (refatorada para receber api_instance)
 async def get_available_actives(api_instance):
-    """Obtém a lista de ativos disponíveis usando a instância da API do usuário."""
+    """
+    Obtém a lista de ativos disponíveis usando a instância da API do usuário.
+
+    A lista fica em cache por 5 minutos; depois disso, por mais 10 minutos a lista anterior
+    continua sendo servida enquanto uma única atualização roda em background.
+    """
     if api_instance is None:
         logger.error("API não conectada ou None em get_available_actives")
         return []
     
     try:
-        # Tentar obter do cache primeiro
-        cache_key = "available_actives"
-        cache_hit, cached_actives = cache_manager.get(cache_key)
-        
-        if cache_hit:
-            logger.info("Cache hit para lista de ativos disponíveis")
-            return cached_actives
-        
+        actives = await cache_manager.get_or_compute_async(
+            "available_actives",
+            lambda: load_available_actives(api_instance),
+            ttl=300,
+            stale_ttl=600
+        )
+        return actives or []
+    except Exception as e:
+        logger.exception(f"Erro geral em get_available_actives: {str(e)}")
+        return []
+
+# Função para consultar na API os ativos binary com payout
+async def load_available_actives(api_instance):
+    """Consulta na API os ativos binary com payout disponível, em ordem alfabética."""
+    try:
         # Verificar conexão da API
         try:
-            check_connection = await run_blocking_func(api_instance.check_connect)
+            check_connection = await run_control_func(api_instance.check_connect)
             logger.info(f"Resultado de check_connect: {check_connection}")
             if not check_connection:
                 logger.error("API não conectada (check_connect falhou)")
@@ -627,17 +435,29 @@ async def get_available_actives(api_instance):
         else:
             logger.error(f"Chave 'binary' não encontrada ou formato inesperado: {type(all_profits)}")
         
-        # Armazenar no cache por 5 minutos
-        if binary_actives:
-            cache_manager.set(cache_key, sorted(binary_actives), ttl=300)
-        
         logger.info(f"{len(binary_actives)} ativos 'binary' disponíveis")
         return sorted(binary_actives)
     
     except Exception as e:
-        logger.exception(f"Erro geral em get_available_actives: {str(e)}")
+        logger.exception(f"Erro geral em load_available_actives: {str(e)}")
         return []
 
+# Função para calcular as estatísticas de um ativo a partir do resultado da análise
+def compute_asset_stats(data):
+    """Calcula as estatísticas (vitórias, derrotas, martingales) dos blocos analisados de um ativo."""
+    return compute_block_stats(data["data"])
+
+# Função para gravar estatísticas já calculadas de um ativo (ex: por score_active)
+def store_asset_stats(user_id, active, stats):
+    """Grava as estatísticas de um ativo para um usuário específico."""
+    # Gravar apenas as estatísticas deste ativo no connection_manager
+    if not connection_manager.update_user_items(user_id, "stats", {active: stats}):
+        logger.error(f"Usuário {user_id} não encontrado para atualizar estatísticas")
+        return False
+    
+    logger.info(f"Estatísticas de {active} atualizadas para usuário {user_id}")
+    return True
+
 # Função para atualizar estatísticas de um ativo (refatorada para usar connection_manager)
 def update_asset_stats(user_id, active, data):
     """Atualiza estatísticas de um ativo para um usuário específico."""
@@ -646,65 +466,7 @@ def update_asset_stats(user_id, active, data):
         return False
     
     try:
-        # Obter dados do usuário
-        user_data = connection_manager.get_user_data(user_id)
-        if not user_data:
-            logger.error(f"Usuário {user_id} não encontrado para atualizar estatísticas")
-            return False
-        
-        # Inicializar estatísticas para este ativo se não existirem
-        if "stats" not in user_data or active not in user_data["stats"]:
-            user_data["stats"][active] = {
-                "wins": 0,
-                "losses": 0,
-                "win_rate": 0,
-                "martingale1_wins": 0,
-                "martingale2_wins": 0,
-                "direct_wins": 0,
-                "analyzed_blocks": 0,
-                "last_update": int(time.time())
-            }
-        
-        stats = user_data["stats"][active]
-        
-        # Contar blocos com resultados definidos
-        wins = 0
-        losses = 0
-        direct_wins = 0
-        martingale1_wins = 0
-        martingale2_wins = 0
-        total_blocks = 0
-        
-        for block in data["data"]:
-            if block["result"] is not None and block["result"] != "NULO":
-                total_blocks += 1
-                
-                if block["result"] == "WIN":
-                    wins += 1
-                    if block["martingale"] == 0:
-                        direct_wins += 1
-                    elif block["martingale"] == 1:
-                        martingale1_wins += 1
-                    elif block["martingale"] == 2:
-                        martingale2_wins += 1
-                elif block["result"] == "LOSS":
-                    losses += 1
-        
-        # Atualizar estatísticas
-        stats["wins"] = wins
-        stats["losses"] = losses
-        stats["direct_wins"] = direct_wins
-        stats["martingale1_wins"] = martingale1_wins
-        stats["martingale2_wins"] = martingale2_wins
-        stats["analyzed_blocks"] = total_blocks
-        stats["win_rate"] = round((wins / total_blocks * 100) if total_blocks > 0 else 0, 2)
-        stats["last_update"] = int(time.time())
-        
-        # Atualizar no connection_manager
-        connection_manager.update_user_state(user_id, "stats", user_data["stats"])
-        logger.info(f"Estatísticas de {active} atualizadas para usuário {user_id}")
-        
-        return True
+        return store_asset_stats(user_id, active, compute_asset_stats(data))
     
     except Exception as e:
         logger.exception(f"Erro ao atualizar estatísticas de {active}: {str(e)}")
@@ -722,4 +484,263 @@ def format_asset_name(asset_name):
     # Remover sufixo '-op' e adicionar ' (Mercado Aberto)' no final
     elif asset_name.endswith('-op'):
         return asset_name[:-3] + ' (Mercado Aberto)'
-    return asset_name 
\ No newline at end of file
+    return asset_name
+
+# Função para montar o ranking dos 5 melhores ativos a partir das estatísticas
+def build_top5_ranking(asset_stats):
+    """Ordena os ativos por taxa de sucesso e vitórias diretas e retorna os 5 melhores."""
+    top_assets = sorted(
+        [(active, stats) for active, stats in asset_stats.items()],
+        key=lambda x: (x[1]["win_rate"], x[1]["direct_wins"]),
+        reverse=True
+    )[:5]
+    
+    return [
+        {
+            "active": format_asset_name(active),
+            "active_id": active,
+            "win_rate": stats["win_rate"],
+            "wins": stats["wins"],
+            "losses": stats["losses"],
+            "analyzed_blocks": stats["analyzed_blocks"],
+            "direct_wins": stats["direct_wins"],
+            "martingale1_wins": stats["martingale1_wins"],
+            "martingale2_wins": stats["martingale2_wins"],
+            "total_operations": stats["wins"] + stats["losses"],
+            "win_first": stats["direct_wins"],
+            "win_g1": stats["martingale1_wins"],
+            "win_g2": stats["martingale2_wins"],
+            "loss": stats["losses"],
+            "name": format_asset_name(active),
+            "last_update": int(time.time())
+        }
+        for active, stats in top_assets
+    ]
+
+# Job de análise dos 5 melhores ativos (executado pelo job_manager)
+async def run_top5_analysis(job_id, user_id, api_instance, num_blocks):
+    """Analisa todos os ativos disponíveis em segundo plano e retorna o ranking top 5."""
+    analysis_progress = {
+        "in_progress": True,
+        "total_assets": 0,  # Será atualizado após obter a lista de ativos
+        "analyzed_assets": 0,
+        "current_asset": "",
+        "percent_complete": 0,
+        "success_count": 0,
+        "start_time": int(time.time()),
+        "job_id": job_id,
+        "canceled": False
+    }
+    
+    def publish_progress():
+        connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
+        job_manager.update_progress(job_id, analysis_progress)
+    
+    try:
+        publish_progress()
+        
+        # Verificar conexão
+        check = await run_control_func(api_instance.check_connect)
+        if not check:
+            logger.error(f"API não conectada para usuário {user_id} no job {job_id}")
+            connection_manager.update_connection_status(user_id, False)
+            return {"success": False, "message": "API desconectada, faça login novamente"}
+        
+        # Obter lista de ativos disponíveis
+        logger.info(f"Obtendo lista de ativos disponíveis para usuário {user_id}")
+        available_actives = await get_available_actives(api_instance)
+        
+        if not available_actives:
+            logger.error(f"Nenhum ativo disponível para usuário {user_id}")
+            return {"success": False, "message": "Nenhum ativo disponível para análise"}
+        
+        # Filtrar apenas ativos binary e limitar aos primeiros 50
+        selected_actives = [active for active in available_actives if is_binary_active(active)][:50]
+        logger.info(f"Selecionados {len(selected_actives)} ativos binary para análise (limitado a 50)")
+        
+        analysis_progress["total_assets"] = len(selected_actives)
+        publish_progress()
+        
+        asset_stats = {}
+        analysis_results = {}  # Dicionário para rastrear resultados de cada ativo
+        canceled = False
+        
+        for i, active in enumerate(selected_actives):
+            # Verificar se a análise foi cancelada
+            if job_manager.is_canceled(job_id):
+                logger.info(f"Análise cancelada pelo usuário {user_id} após analisar {i} ativos")
+                canceled = True
+                analysis_progress["canceled"] = True
+                break
+            
+            try:
+                analysis_progress["current_asset"] = active
+                analysis_progress["analyzed_assets"] = i
+                analysis_progress["percent_complete"] = round((i / len(selected_actives)) * 100)
+                publish_progress()
+                
+                logger.info(f"Analisando ativo {i+1}/{len(selected_actives)}: {active} para usuário {user_id}")
+                
+                # Pontuar o ativo com a mesma série de velas usada na análise individual
+                results = await score_active(api_instance, active, num_blocks)
+                
+                if "error" not in results:
+                    analysis_results[active] = "Sucesso"
+                    
+                    # Atualizar estatísticas
+                    if results["stats"] is None:
+                        logger.warning(f"Sem dados para atualizar estatísticas de {active}")
+                    elif store_asset_stats(user_id, active, results["stats"]):
+                        asset_stats[active] = results["stats"]
+                        analysis_progress["success_count"] += 1
+                        
+                        # Publicar o ranking parcial à medida que os ativos são analisados
+                        job_manager.publish_event(job_id, "ranking", build_top5_ranking(asset_stats))
+                else:
+                    analysis_results[active] = f"Erro: {results['error']}"
+                    logger.error(f"Erro ao analisar {active} para usuário {user_id}: {results['error']}")
+            except OperationCanceled:
+                # Cancelamento pelo token do job: o ativo em andamento não entra nos resultados
+                logger.info(f"Análise cancelada pelo usuário {user_id} durante o ativo {active}")
+                canceled = True
+                analysis_progress["canceled"] = True
+                break
+            except Exception as e:
+                analysis_results[active] = f"Erro: {str(e)}"
+                logger.exception(f"Erro ao analisar {active} para usuário {user_id}: {str(e)}")
+            
+            job_manager.add_partial_result(job_id, active, analysis_results[active])
+        
+        if canceled:
+            logger.info(f"Finalizando análise cancelada para usuário {user_id} - Usando resultados parciais")
+        
+        top5_data = build_top5_ranking(asset_stats)
+        
+        # Salvar top5_data na chave 'top5_ativos' do user_data
+        connection_manager.set_user_state(user_id, "top5_ativos", top5_data)
+        event_broker.publish(user_channel(user_id), "ranking", top5_data)
+        
+        logger.info(f"Análise top 5 concluída para usuário {user_id} - Analisados {len(selected_actives)} ativos")
+        return {
+            "success": True,
+            "top5": top5_data,
+            "results": analysis_results,
+            "total_analyzed": len(selected_actives),
+            "successful_analysis": analysis_progress["success_count"],
+            "canceled": canceled
+        }
+    
+    finally:
+        # Finalizar progresso
+        analysis_progress["in_progress"] = False
+        analysis_progress["canceled"] = analysis_progress["canceled"] or job_manager.is_canceled(job_id)
+        analysis_progress["percent_complete"] = 100
+        analysis_progress["analyzed_assets"] = analysis_progress["total_assets"]
+        publish_progress()
+
+# Varredura de todos os ativos para o ranking global (executada pelo ranking_service)
+async def scan_ranking(api_instance, num_blocks):
+    """Analisa os ativos disponíveis sem vínculo com um usuário e retorna o ranking top 5."""
+    check = await run_control_func(api_instance.check_connect)
+    if not check:
+        logger.error("API não conectada para o ranking global")
+        return None
+    
+    available_actives = await get_available_actives(api_instance)
+    selected_actives = [active for active in available_actives if is_binary_active(active)][:50]
+    if not selected_actives:
+        logger.error("Nenhum ativo disponível para o ranking global")
+        return None
+    
+    asset_stats = {}
+    analysis_results = {}
+    
+    for active in selected_actives:
+        try:
+            results = await score_active(api_instance, active, num_blocks)
+            if "error" not in results and results["stats"]:
+                asset_stats[active] = results["stats"]
+                analysis_results[active] = "Sucesso"
+            else:
+                analysis_results[active] = f"Erro: {results.get('error', 'sem dados')}"
+        except Exception as e:
+            analysis_results[active] = f"Erro: {str(e)}"
+            logger.exception(f"Erro ao analisar {active} para o ranking global: {str(e)}")
+    
+    return {
+        "top5": build_top5_ranking(asset_stats),
+        "stats": asset_stats,
+        "results": analysis_results,
+        "total_analyzed": len(selected_actives),
+        "successful_analysis": len(asset_stats)
+    }
+
+# Conta de serviço do ranking global: com ela a varredura não usa a sessão de nenhum usuário
+RANKING_EMAIL = os.getenv('RANKING_EMAIL')
+RANKING_PASSWORD = os.getenv('RANKING_PASSWORD')
+RANKING_SERVICE_USER = "ranking-service"  # Dono das chamadas da conta de serviço no bulkhead
+_ranking_api = None  # Sessão da conta de serviço neste processo
+
+# Conexão usada pela varredura do ranking global (executada na thread do ranking_service)
+def ranking_connection():
+    """
+    Retorna (dono, instância da API) para o ranking global: a sessão própria da conta de serviço
+    (RANKING_EMAIL/RANKING_PASSWORD), reconectada quando cai; sem ela, ou se a conexão falhar,
+    a sessão do usuário com atividade mais recente, cujas chamadas contam no limite desse usuário.
+    """
+    global _ranking_api
+    if RANKING_EMAIL and RANKING_PASSWORD:
+        try:
+            if _ranking_api is None or not _ranking_api.check_connect():
+                success, message, api_instance, _ = asyncio.run(connect_to_polarium(RANKING_EMAIL, RANKING_PASSWORD))
+                _ranking_api = api_instance if success else None
+                if not success:
+                    logger.error(f"Falha ao conectar a conta de serviço do ranking: {message}")
+        except Exception as e:
+            _ranking_api = None
+            logger.exception(f"Erro na conexão da conta de serviço do ranking: {str(e)}")
+        if _ranking_api is not None:
+            return RANKING_SERVICE_USER, _ranking_api
+    return connection_manager.get_any_connection()
+
+# Aplicar um snapshot do ranking global aos dados de um usuário
+def apply_ranking_snapshot(user_id, snapshot):
+    """Copia o ranking e as estatísticas de um snapshot global para o usuário, como se ele tivesse feito a varredura."""
+    if not connection_manager.update_user_items(user_id, "stats", copy.deepcopy(snapshot["stats"])):
+        return None
+    
+    top5_data = copy.deepcopy(snapshot["top5"])
+    connection_manager.set_user_state(user_id, "top5_ativos", top5_data)
+    event_broker.publish(user_channel(user_id), "ranking", top5_data)
+    logger.info(f"Ranking global (versão {snapshot['version']}) aplicado para usuário {user_id}")
+    return top5_data
+
+# Próximo instante de recálculo do ranking global
+def next_ranking_refresh(timestamp):
+    """Retorna o próximo fechamento de bloco ou de vela de entrada/martingale após o timestamp."""
+    block_seconds = DEFAULT_STRATEGY.block_seconds
+    block = DEFAULT_STRATEGY.block_start(timestamp)
+    candidates = []
+    for block_start in (block - block_seconds, block, block + block_seconds):
+        block_end = block_start + block_seconds  # Fechamento do bloco
+        candidates.extend(
+            block_end + DEFAULT_STRATEGY.timeframe * m  # Fechamento da entrada e de cada martingale
+            for m in range(DEFAULT_STRATEGY.max_martingale + 2)
+        )
+    return min(t for t in candidates if t > timestamp) + RANKING_REFRESH_DELAY
+
+# Atraso após cada instante agendado, para que o último candle já esteja disponível na API
+RANKING_REFRESH_DELAY = int(os.getenv('RANKING_REFRESH_DELAY', '3'))
+
+# Inicializar serviço de ranking global pré-calculado
+RANKING_SERVICE_ENABLED = os.getenv('RANKING_SERVICE_ENABLED', 'True').lower() == 'true'
+ranking_service = RankingService(
+    scan_func=scan_ranking,
+    api_provider=ranking_connection,
+    schedule_func=next_ranking_refresh,
+    supported_num_blocks=[int(n) for n in os.getenv('RANKING_NUM_BLOCKS', '10').split(',') if n.strip()],
+    max_age=int(os.getenv('RANKING_MAX_AGE', '300')),
+    # Com o broker, um único worker (o líder) recalcula e os snapshots ficam no broker
+    store=RemoteCache() if SESSION_BROKER_SOCKET else cache_manager,
+    lease_func=functools.partial(acquire_lease, "ranking") if SESSION_BROKER_SOCKET else None
+)
@@ -0,0 +1,283 @@
+import os
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import get_logger
+from session_broker import SESSION_BROKER_SOCKET, BrokerClient, get_client
+
+# Configurar o logging
+logger = get_logger("event_stream", "event_stream.log")
+
+# Intervalo entre heartbeats e duração máxima de cada conexão SSE (o navegador reconecta sozinho)
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', '300'))
+# Conexões SSE simultâneas por processo: cada uma ocupa uma thread do worker (gthread) durante toda
+# a conexão, então o limite deve deixar threads livres para as demais requisições (GUNICORN_THREADS)
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '16'))
+
+# Vagas de conexões SSE deste processo
+sse_slots = threading.BoundedSemaphore(max(SSE_MAX_STREAMS, 1))
+
+
+class EventBroker:
+    """
+    Classe para distribuir eventos a clientes via Server-Sent Events (SSE).
+    Cada canal mantém um histórico limitado de eventos numerados, permitindo que um cliente
+    reconectado continue a partir do último evento recebido (cabeçalho Last-Event-ID).
+    """
+
+    def __init__(self, max_events_per_channel: int = 500, channel_ttl: int = 3600, cleanup_interval: int = 300):
+        """
+        Inicializa o EventBroker.
+
+        Args:
+            max_events_per_channel (int): Quantidade máxima de eventos guardados por canal (padrão: 500)
+            channel_ttl (int): Tempo em segundos sem atividade após o qual um canal é descartado (padrão: 1 hora)
+            cleanup_interval (int): Intervalo em segundos para remover canais inativos (padrão: 5 minutos)
+        """
+        self._channels: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()  # Cada canal tem sua própria condição sobre este lock
+        self._sequence = 0  # IDs globais e crescentes, mesmo se um canal for recriado
+        self._max_events_per_channel = max_events_per_channel
+        self._channel_ttl = channel_ttl
+        self._cleanup_interval = cleanup_interval
+
+        # Thread de limpeza, criada no primeiro uso em cada processo (threads não sobrevivem ao fork)
+        self._cleanup_thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        logger.info("EventBroker inicializado")
+
+    def _ensure_cleanup(self) -> None:
+        """
+        Inicia a thread de limpeza neste processo, se ainda não estiver rodando.
+        A verificação por PID garante que cada worker (após o fork do Gunicorn) tenha sua própria thread.
+        Deve ser chamado com o lock adquirido.
+        """
+        if self._pid == os.getpid() and self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._cleanup_thread = threading.Thread(target=self._cleanup_task, daemon=True)
+        self._cleanup_thread.start()
+
+    def _get_channel(self, channel: str) -> Dict[str, Any]:
+        """
+        Obtém (ou cria) um canal. Deve ser chamado com o lock adquirido.
+        """
+        data = self._channels.get(channel)
+        if data is None:
+            self._ensure_cleanup()
+            data = {
+                'condition': threading.Condition(self._lock),
+                'events': deque(maxlen=self._max_events_per_channel),
+                'closed': False,
+                'last_activity': time.time()
+            }
+            self._channels[channel] = data
+        return data
+
+    def publish(self, channel: str, event: str, data: Any) -> int:
+        """
+        Publica um evento em um canal e acorda os clientes que aguardam.
+
+        Args:
+            channel (str): Nome do canal (ex: "job:<id>", "user:<id>")
+            event (str): Tipo do evento (ex: "progress", "result")
+            data (Any): Dados serializáveis em JSON
+
+        Returns:
+            int: ID do evento publicado
+        """
+        with self._lock:
+            channel_data = self._get_channel(channel)
+            self._sequence += 1
+            channel_data['events'].append({'id': self._sequence, 'event': event, 'data': data})
+            channel_data['last_activity'] = time.time()
+            channel_data['condition'].notify_all()
+            return self._sequence
+
+    def last_event_id(self) -> int:
+        """
+        Obtém o ID do evento mais recente publicado em qualquer canal.
+
+        Returns:
+            int: ID do último evento (0 se nenhum evento foi publicado)
+        """
+        with self._lock:
+            return self._sequence
+
+    def close(self, channel: str) -> None:
+        """
+        Marca um canal como finalizado. Clientes recebem os eventos restantes e a transmissão termina.
+
+        Args:
+            channel (str): Nome do canal
+        """
+        with self._lock:
+            channel_data = self._get_channel(channel)
+            channel_data['closed'] = True
+            channel_data['last_activity'] = time.time()
+            channel_data['condition'].notify_all()
+
+    def remove(self, channel: str) -> None:
+        """
+        Remove um canal e seu histórico.
+
+        Args:
+            channel (str): Nome do canal
+        """
+        with self._lock:
+            channel_data = self._channels.pop(channel, None)
+            if channel_data is not None:
+                channel_data['condition'].notify_all()
+
+    def wait_for_events(self, channel: str, last_event_id: int = 0, timeout: float = 15.0,
+                        create: bool = False) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Aguarda eventos posteriores a last_event_id, bloqueando no máximo timeout segundos.
+
+        Args:
+            channel (str): Nome do canal
+            last_event_id (int): ID do último evento já recebido pelo cliente
+            timeout (float): Tempo máximo de espera em segundos
+            create (bool): Criar o canal se ainda não existir (canais permanentes, como os de usuário)
+
+        Returns:
+            tuple: (eventos, finalizado) onde finalizado indica que o canal foi fechado
+                   e não há mais eventos a entregar
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while True:
+                channel_data = self._get_channel(channel) if create else self._channels.get(channel)
+                if channel_data is None:
+                    return [], True
+                channel_data['last_activity'] = time.time()  # Clientes conectados mantêm o canal vivo
+
+                events = [e for e in channel_data['events'] if e['id'] > last_event_id]
+                if events:
+                    return events, False
+                if channel_data['closed']:
+                    return [], True
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return [], False
+                channel_data['condition'].wait(remaining)
+
+    def stream(self, channel: str, last_event_id: int = 0, heartbeat_interval: float = 15.0,
+               max_duration: Optional[float] = None, create: bool = False) -> Iterator[str]:
+        """
+        Gera as mensagens SSE de um canal, com heartbeat periódico.
+
+        Args:
+            channel (str): Nome do canal
+            last_event_id (int): ID do último evento recebido (reconexão)
+            heartbeat_interval (float): Intervalo em segundos entre heartbeats
+            max_duration (float): Duração máxima da transmissão; o navegador reconecta em seguida
+            create (bool): Criar o canal se ainda não existir
+
+        Yields:
+            str: Mensagens no formato text/event-stream
+        """
+        started = time.time()
+        yield "retry: 3000\n\n"  # Tempo de espera do navegador antes de reconectar
+
+        while True:
+            events, finished = self.wait_for_events(channel, last_event_id, heartbeat_interval, create)
+            for event in events:
+                last_event_id = event['id']
+                yield format_sse(event['id'], event['event'], event['data'])
+            if finished:
+                break
+            if not events:
+                yield ": heartbeat\n\n"
+            if max_duration is not None and time.time() - started > max_duration:
+                break
+
+    def _cleanup_task(self) -> None:
+        """
+        Tarefa em background que remove canais inativos periodicamente.
+        """
+        while True:
+            try:
+                time.sleep(self._cleanup_interval)
+                removed = self.cleanup_idle_channels()
+                if removed:
+                    logger.info(f"Limpeza de eventos concluída, {removed} canais removidos")
+            except Exception as e:
+                logger.error(f"Erro na tarefa de limpeza de eventos: {str(e)}")
+
+    def cleanup_idle_channels(self) -> int:
+        """
+        Remove canais sem atividade há mais tempo que o TTL.
+
+        Returns:
+            int: Número de canais removidos
+        """
+        with self._lock:
+            current_time = time.time()
+            to_remove = [
+                name for name, data in self._channels.items()
+                if current_time - data['last_activity'] > self._channel_ttl
+            ]
+            for name in to_remove:
+                self._channels.pop(name)['condition'].notify_all()
+        return len(to_remove)
+
+
+def format_sse(event_id: int, event: str, data: Any) -> str:
+    """
+    Formata um evento no padrão text/event-stream.
+
+    Args:
+        event_id (int): ID do evento
+        event (str): Tipo do evento
+        data (Any): Dados serializáveis em JSON
+
+    Returns:
+        str: Mensagem SSE
+    """
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class RemoteEventBroker(EventBroker):
+    """
+    EventBroker dos workers quando as sessões ficam no broker: os canais ficam no processo
+    do broker, então um cliente SSE recebe os eventos publicados por qualquer worker
+    (ex: o job roda em um worker e o navegador está conectado a outro).
+    """
+
+    def __init__(self, client: Optional[BrokerClient] = None):
+        self._client = client
+        logger.info("EventBroker remoto inicializado")
+
+    def _events(self, method: str, *args) -> Any:
+        return (self._client or get_client()).request({"op": "events", "method": method, "args": list(args)})
+
+    def publish(self, channel: str, event: str, data: Any) -> int:
+        return self._events("publish", channel, event, data)
+
+    def last_event_id(self) -> int:
+        return self._events("last_event_id")
+
+    def close(self, channel: str) -> None:
+        self._events("close", channel)
+
+    def remove(self, channel: str) -> None:
+        self._events("remove", channel)
+
+    def wait_for_events(self, channel: str, last_event_id: int = 0, timeout: float = 15.0,
+                        create: bool = False) -> Tuple[List[Dict[str, Any]], bool]:
+        events, finished = self._events("wait_for_events", channel, last_event_id, timeout, create)
+        return events, finished
+
+    def cleanup_idle_channels(self) -> int:
+        return 0  # Os canais inativos são removidos pelo próprio broker
+
+
+# Instância global do distribuidor de eventos (com o broker, compartilhada pelos workers)
+event_broker = RemoteEventBroker() if SESSION_BROKER_SOCKET else EventBroker()
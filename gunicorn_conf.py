@@ -4,10 +4,17 @@ import multiprocessing
 # Bind 
 bind = "0.0.0.0:5000"
 
-# Workers - voltando para configuração mais confiável
-workers = 1
+# Workers: sem o broker de sessões (SESSION_BROKER_SOCKET) as sessões da Polarium só existem
+# no processo que as criou, então um único worker; com o broker (que também guarda jobs, eventos SSE
+# e o ranking global), GUNICORN_WORKERS
+workers = int(os.getenv('GUNICORN_WORKERS', '1')) if os.getenv('SESSION_BROKER_SOCKET') else 1
 worker_class = "sync"  # Voltando para sync para compatibilidade
-threads = 4
+# Com threads, o worker sync vira gthread: cada conexão SSE aberta (/events e /jobs/<id>/events) ocupa
+# uma thread até terminar (SSE_MAX_DURATION), e uma página de top ativos abre duas. O limite é de threads,
+# não de CPU: até SSE_MAX_STREAMS conexões SSE por worker (padrão 16, ~8 páginas), as demais recebem 503
+# e a página passa a consultar o job periodicamente, deixando as threads restantes para as requisições.
+# Ao aumentar GUNICORN_THREADS, aumentar SSE_MAX_STREAMS na mesma proporção
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
 
 # Timeout mantido alto
 timeout = 1200  # 20 minutos
@@ -24,3 +31,9 @@ daemon = False
 preload_app = True  # Voltando para True
 max_requests = 1000
 max_requests_jitter = 50
+
+
+def post_fork(server, worker):
+    """Inicia o pool de processos de CPU no worker recém-criado, antes de qualquer thread."""
+    from async_utils import start_process_pool
+    start_process_pool()
@@ -0,0 +1,587 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from config import get_logger
+from async_utils import CALL_CLASS_BATCH, CancellationToken, blocking_context
+from event_stream import event_broker
+from session_broker import BrokerClient, get_client
+
+# Configurar o logging
+logger = get_logger("JobManager", "job_manager.log")
+
+# Estados possíveis de um job
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_CANCELED = "canceled"
+JOB_FAILED = "failed"
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_CANCELED, JOB_FAILED)
+
+# Intervalo em segundos entre verificações de cancelamento pedido por outro worker (JobStore compartilhado)
+JOB_CANCEL_POLL_INTERVAL = float(os.getenv('JOB_CANCEL_POLL_INTERVAL', '1'))
+
+
+def job_channel(job_id: str) -> str:
+    """Nome do canal de eventos (SSE) de um job."""
+    return f"job:{job_id}"
+
+
+class JobStore:
+    """
+    Registros dos jobs (status, progresso, resultados parciais e resultado final), separados
+    da execução: o JobManager executa os jobs no próprio processo e guarda o estado aqui.
+    Com o broker de sessões, os registros ficam no broker (RemoteJobStore) e qualquer
+    worker consulta ou cancela os jobs de qualquer outro.
+    """
+
+    shared = False  # Registros visíveis apenas neste processo
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()  # Lock para acesso thread-safe
+
+    def create(self, job: Dict[str, Any]) -> None:
+        """
+        Registra um novo job.
+
+        Args:
+            job (dict): Registro completo do job (com 'job_id')
+        """
+        with self._lock:
+            self._jobs[job['job_id']] = copy.deepcopy(job)
+
+    def get(self, job_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtém uma cópia de um job, completa ou apenas dos campos pedidos.
+
+        Args:
+            job_id (str): ID do job
+            fields (list): Campos a retornar (None: todos)
+
+        Returns:
+            dict: Cópia do job ou None se não existir
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if fields is None:
+                return copy.deepcopy(job)
+            return {field: copy.deepcopy(job.get(field)) for field in fields}
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> bool:
+        """
+        Atualiza campos de um job.
+
+        Args:
+            job_id (str): ID do job
+            fields (dict): Campos e novos valores
+
+        Returns:
+            bool: True se atualizado, False se o job não existir
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(copy.deepcopy(fields))
+            return True
+
+    def merge(self, job_id: str, key: str, items: Dict[str, Any], snapshot: bool = False) -> Any:
+        """
+        Mescla itens em um campo dicionário de um job (ex: progress, partial_results).
+
+        Args:
+            job_id (str): ID do job
+            key (str): Campo do job
+            items (dict): Itens a mesclar
+            snapshot (bool): Retornar uma cópia do campo após a mescla
+
+        Returns:
+            Cópia do campo (snapshot=True) ou True; None se o job não existir
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job[key].update(copy.deepcopy(items))
+            return dict(job[key]) if snapshot else True
+
+    def find_active(self, user_id: str, kind: str) -> Optional[str]:
+        """
+        Obtém o ID do job ainda não finalizado de um usuário para um tipo.
+        """
+        with self._lock:
+            for job_id, job in self._jobs.items():
+                if job['user_id'] == user_id and job['kind'] == kind and job['status'] not in FINISHED_STATES:
+                    return job_id
+            return None
+
+    def list(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Lista informações resumidas dos jobs de um usuário, do mais recente para o mais antigo.
+        """
+        with self._lock:
+            jobs = [
+                {
+                    'job_id': job['job_id'],
+                    'kind': job['kind'],
+                    'status': job['status'],
+                    'created_at': job['created_at'],
+                    'finished_at': job['finished_at']
+                }
+                for job in self._jobs.values() if job['user_id'] == user_id
+            ]
+        return sorted(jobs, key=lambda j: j['created_at'], reverse=True)
+
+    def request_cancel(self, job_id: str) -> bool:
+        """
+        Marca o cancelamento de um job ainda não finalizado.
+
+        Returns:
+            bool: True se o cancelamento foi marcado, False se o job não existir ou já terminou
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in FINISHED_STATES:
+                return False
+            job['cancel_requested'] = True
+            return True
+
+    def expire(self, retention_time: float) -> List[str]:
+        """
+        Remove jobs finalizados há mais tempo que o tempo de retenção.
+
+        Returns:
+            list: IDs dos jobs removidos
+        """
+        with self._lock:
+            current_time = time.time()
+            to_remove = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and current_time - job['finished_at'] > retention_time
+            ]
+            for job_id in to_remove:
+                del self._jobs[job_id]
+        return to_remove
+
+
+class RemoteJobStore(JobStore):
+    """
+    JobStore dos workers quando as sessões ficam no broker: os registros dos jobs ficam
+    no processo do broker, compartilhados por todos os workers.
+    """
+
+    shared = True  # Registros visíveis em todos os workers
+
+    def __init__(self, client: Optional[BrokerClient] = None):
+        self._client = client
+
+    def _jobs(self, method: str, *args) -> Any:
+        return (self._client or get_client()).request({"op": "jobs", "method": method, "args": list(args)})
+
+    def create(self, job: Dict[str, Any]) -> None:
+        self._jobs("create", job)
+
+    def get(self, job_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        return self._jobs("get", job_id, fields)
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> bool:
+        return self._jobs("update", job_id, fields)
+
+    def merge(self, job_id: str, key: str, items: Dict[str, Any], snapshot: bool = False) -> Any:
+        return self._jobs("merge", job_id, key, items, snapshot)
+
+    def find_active(self, user_id: str, kind: str) -> Optional[str]:
+        return self._jobs("find_active", user_id, kind)
+
+    def list(self, user_id: str) -> List[Dict[str, Any]]:
+        return self._jobs("list", user_id)
+
+    def request_cancel(self, job_id: str) -> bool:
+        return self._jobs("request_cancel", job_id)
+
+    def expire(self, retention_time: float) -> List[str]:
+        return self._jobs("expire", retention_time)
+
+
+class JobManager:
+    """
+    Classe responsável por executar análises longas em segundo plano.
+    Cada job recebe um ID, roda em um loop de eventos dedicado (fora das threads de requisição)
+    e mantém status, progresso, resultados parciais e resultado final por um tempo de retenção.
+    Progresso, resultados parciais e resultado final também são publicados no canal
+    de eventos do job, para transmissão via SSE.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 4, retention_time: int = 3600, cleanup_interval: int = 300,
+                 store: Optional[JobStore] = None):
+        """
+        Inicializa o JobManager.
+
+        Args:
+            max_concurrent_jobs (int): Número máximo de jobs executando ao mesmo tempo neste processo (padrão: 4)
+            retention_time (int): Tempo em segundos que jobs finalizados ficam disponíveis (padrão: 1 hora)
+            cleanup_interval (int): Intervalo em segundos para remover jobs expirados (padrão: 5 minutos)
+            store: Onde ficam os registros dos jobs (padrão: JobStore local; RemoteJobStore com o broker)
+        """
+        self._store = store if store is not None else JobStore()
+        self._futures: Dict[str, Any] = {}
+        # Token de cancelamento de cada job em andamento neste processo, repassado às chamadas bloqueantes
+        self._cancel_tokens: Dict[str, CancellationToken] = {}
+        self._lock = threading.RLock()  # Lock para acesso thread-safe
+        self._max_concurrent_jobs = max_concurrent_jobs
+        self._retention_time = retention_time
+        self._cleanup_interval = cleanup_interval
+
+        # Loop de eventos dedicado ao agendamento dos jobs (criado sob demanda em cada processo)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._scheduler_thread: Optional[threading.Thread] = None
+        self._cleanup_thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        logger.info(f"JobManager inicializado com {max_concurrent_jobs} jobs simultâneos")
+
+    def _ensure_scheduler(self) -> asyncio.AbstractEventLoop:
+        """
+        Inicia o loop do agendador e a thread de limpeza neste processo, se necessário. Threads não
+        sobrevivem ao fork dos workers do Gunicorn (preload_app), por isso são criadas no primeiro uso
+        em cada processo. Deve ser chamado com o lock adquirido.
+        """
+        if self._pid == os.getpid() and self._scheduler_thread is not None and self._scheduler_thread.is_alive():
+            return self._loop
+
+        if self._pid != os.getpid() or self._cleanup_thread is None or not self._cleanup_thread.is_alive():
+            self._cleanup_thread = threading.Thread(target=self._cleanup_task, daemon=True)
+            self._cleanup_thread.start()
+
+        self._pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        loop_ready = threading.Event()
+        self._scheduler_thread = threading.Thread(target=self._run_scheduler, args=(loop_ready,), daemon=True)
+        self._scheduler_thread.start()
+        loop_ready.wait()
+        return self._loop
+
+    def _run_scheduler(self, loop_ready: threading.Event) -> None:
+        """
+        Executa o loop de eventos do agendador em uma thread dedicada.
+        """
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self._max_concurrent_jobs)
+        loop_ready.set()
+        self._loop.run_forever()
+
+    def submit(self, user_id: str, kind: str, func: Callable[..., Coroutine[Any, Any, Any]], *args, **kwargs) -> str:
+        """
+        Agenda um novo job e retorna seu ID imediatamente.
+
+        A função recebe o job_id como primeiro argumento, para que possa reportar
+        progresso, publicar resultados parciais e verificar cancelamento.
+
+        Args:
+            user_id (str): ID do usuário dono do job
+            kind (str): Tipo do job (ex: "top5")
+            func: Função assíncrona a ser executada
+            *args: Argumentos posicionais para a função
+            **kwargs: Argumentos nomeados para a função
+
+        Returns:
+            str: ID do job criado
+        """
+        job_id = uuid.uuid4().hex
+
+        self._store.create({
+            'job_id': job_id,
+            'user_id': user_id,
+            'kind': kind,
+            'status': JOB_PENDING,
+            'progress': {},
+            'partial_results': {},
+            'result': None,
+            'error': None,
+            'cancel_requested': False,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        })
+        # Abre o canal já na fila: sem ele, o stream SSE de um job pendente terminaria na hora
+        event_broker.publish(job_channel(job_id), "status", {"status": JOB_PENDING})
+        with self._lock:
+            self._cancel_tokens[job_id] = CancellationToken()
+            self._futures[job_id] = asyncio.run_coroutine_threadsafe(
+                self._run_job(job_id, user_id, func, args, kwargs),
+                self._ensure_scheduler()
+            )
+
+        logger.info(f"Job {job_id} ({kind}) agendado para usuário {user_id}")
+        return job_id
+
+    async def _run_job(self, job_id: str, user_id: str, func, args, kwargs) -> None:
+        """
+        Executa um job respeitando o limite de jobs simultâneos.
+        """
+        async with self._semaphore:
+            cancel_token = self._cancel_tokens.get(job_id)
+            if self.is_canceled(job_id):
+                self._forget(job_id)
+                self._finish(job_id, {'status': JOB_CANCELED, 'result': None, 'error': None})
+                logger.info(f"Job {job_id} cancelado antes de iniciar")
+                return
+            self._store.update(job_id, {'status': JOB_RUNNING, 'started_at': time.time()})
+            event_broker.publish(job_channel(job_id), "status", {"status": JOB_RUNNING})
+
+            # Com registros compartilhados, o cancelamento pode ser pedido em outro worker
+            watcher = asyncio.ensure_future(self._watch_cancel(job_id, cancel_token)) if self._store.shared else None
+            outcome = {'status': JOB_FAILED, 'result': None, 'error': None}
+            try:
+                # Chamadas bloqueantes do job contam no limite do usuário, na classe de lote,
+                # e são interrompidas pelo token quando o job é cancelado
+                with blocking_context(user_id, CALL_CLASS_BATCH, cancel_token):
+                    outcome['result'] = await func(job_id, *args, **kwargs)
+                outcome['status'] = JOB_CANCELED if self.is_canceled(job_id) else JOB_COMPLETED
+                logger.info(f"Job {job_id} finalizado com status {outcome['status']}")
+            except asyncio.CancelledError:
+                outcome['status'] = JOB_CANCELED
+                logger.info(f"Job {job_id} interrompido")
+            except Exception as e:
+                outcome['error'] = str(e)
+                logger.exception(f"Erro ao executar job {job_id}: {str(e)}")
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+                self._forget(job_id)
+                self._finish(job_id, outcome)
+
+    def _forget(self, job_id: str) -> None:
+        """
+        Descarta o future e o token de um job que terminou neste processo.
+        """
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self._cancel_tokens.pop(job_id, None)
+
+    async def _watch_cancel(self, job_id: str, cancel_token: Optional[CancellationToken]) -> None:
+        """
+        Repassa ao token local o cancelamento pedido por outro worker.
+        """
+        while cancel_token is not None and not cancel_token.canceled:
+            await asyncio.sleep(JOB_CANCEL_POLL_INTERVAL)
+            try:
+                if self.is_canceled(job_id):
+                    cancel_token.cancel("job cancelado")
+            except Exception as e:
+                logger.error(f"Erro ao verificar cancelamento do job {job_id}: {str(e)}")
+
+    def _finish(self, job_id: str, outcome: Dict[str, Any]) -> None:
+        """
+        Grava o resultado de um job, publica seu evento final e fecha seu canal de eventos.
+        """
+        self._store.update(job_id, dict(outcome, finished_at=time.time()))
+        channel = job_channel(job_id)
+        event_broker.publish(channel, "result", outcome)
+        event_broker.close(channel)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém uma cópia do estado de um job.
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            dict: Estado do job ou None se não existir
+        """
+        return self._store.get(job_id)
+
+    def get_job_owner(self, job_id: str) -> Optional[str]:
+        """
+        Obtém o ID do usuário dono de um job, sem copiar seus resultados.
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            str: ID do usuário ou None se o job não existir
+        """
+        job = self._store.get(job_id, ['user_id'])
+        return job['user_id'] if job is not None else None
+
+    def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém o status de um job, sem copiar seus resultados.
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            dict: {"status", "cancel_requested", "in_progress"} ou None se o job não existir
+        """
+        job = self._store.get(job_id, ['status', 'cancel_requested'])
+        if job is None:
+            return None
+        job['in_progress'] = job['status'] not in FINISHED_STATES
+        return job
+
+    def get_active_job(self, user_id: str, kind: str) -> Optional[str]:
+        """
+        Obtém o ID do job ainda não finalizado de um usuário para um tipo.
+
+        Args:
+            user_id (str): ID do usuário
+            kind (str): Tipo do job
+
+        Returns:
+            str: ID do job ativo ou None
+        """
+        return self._store.find_active(user_id, kind)
+
+    def list_jobs(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Lista informações resumidas dos jobs de um usuário.
+
+        Args:
+            user_id (str): ID do usuário
+
+        Returns:
+            list: Resumo dos jobs, do mais recente para o mais antigo
+        """
+        return self._store.list(user_id)
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> bool:
+        """
+        Atualiza os campos de progresso de um job.
+
+        Args:
+            job_id (str): ID do job
+            progress (dict): Campos de progresso a atualizar
+
+        Returns:
+            bool: True se atualizado com sucesso, False caso contrário
+        """
+        snapshot = self._store.merge(job_id, 'progress', progress, True)
+        if snapshot is None:
+            return False
+        event_broker.publish(job_channel(job_id), "progress", snapshot)
+        return True
+
+    def add_partial_result(self, job_id: str, key: str, value: Any) -> bool:
+        """
+        Publica um resultado parcial de um job.
+
+        Args:
+            job_id (str): ID do job
+            key (str): Chave do resultado (ex: nome do ativo)
+            value (Any): Valor do resultado
+
+        Returns:
+            bool: True se armazenado com sucesso, False caso contrário
+        """
+        if self._store.merge(job_id, 'partial_results', {key: value}) is None:
+            return False
+        event_broker.publish(job_channel(job_id), "asset", {"key": key, "value": value})
+        return True
+
+    def publish_event(self, job_id: str, event: str, data: Any) -> bool:
+        """
+        Publica um evento adicional no canal do job (ex: ranking parcial).
+
+        Args:
+            job_id (str): ID do job
+            event (str): Tipo do evento
+            data (Any): Dados serializáveis em JSON
+
+        Returns:
+            bool: True se publicado, False se o job não existir
+        """
+        with self._lock:
+            running_here = job_id in self._futures
+        if not running_here and self._store.get(job_id, ['status']) is None:
+            return False
+        event_broker.publish(job_channel(job_id), event, data)
+        return True
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Solicita o cancelamento de um job. O job interrompe no próximo ponto de verificação
+        e mantém os resultados parciais obtidos até o momento. Se o job roda em outro worker,
+        ele percebe o pedido em até JOB_CANCEL_POLL_INTERVAL segundos.
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            bool: True se o cancelamento foi solicitado, False caso contrário
+        """
+        if not self._store.request_cancel(job_id):
+            return False
+        with self._lock:
+            cancel_token = self._cancel_tokens.get(job_id)
+        if cancel_token is not None:
+            cancel_token.cancel("job cancelado")
+        logger.info(f"Cancelamento solicitado para job {job_id}")
+        return True
+
+    def is_canceled(self, job_id: str) -> bool:
+        """
+        Verifica se o cancelamento de um job foi solicitado.
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            bool: True se o job deve ser interrompido
+        """
+        job = self._store.get(job_id, ['cancel_requested'])
+        return job is None or job['cancel_requested']
+
+    def _cleanup_task(self) -> None:
+        """
+        Tarefa em background que remove jobs finalizados após o tempo de retenção.
+        """
+        while True:
+            try:
+                time.sleep(self._cleanup_interval)
+                self._cleanup_expired_jobs()
+            except Exception as e:
+                logger.error(f"Erro na tarefa de limpeza de jobs: {str(e)}")
+
+    def _cleanup_expired_jobs(self) -> None:
+        """
+        Remove jobs finalizados há mais tempo que o tempo de retenção.
+        """
+        to_remove = self._store.expire(self._retention_time)
+        for job_id in to_remove:
+            event_broker.remove(job_channel(job_id))
+
+        if to_remove:
+            logger.info(f"Limpeza de jobs concluída, {len(to_remove)} jobs removidos")
+
+    def cleanup(self) -> None:
+        """
+        Cancela os jobs pendentes deste processo e encerra o loop do agendador.
+        """
+        with self._lock:
+            job_ids = list(self._futures.keys())
+            cancel_tokens = list(self._cancel_tokens.values())
+        for job_id in job_ids:
+            try:
+                self._store.request_cancel(job_id)
+            except Exception as e:
+                logger.error(f"Erro ao cancelar job {job_id}: {str(e)}")
+        for cancel_token in cancel_tokens:
+            cancel_token.cancel("encerramento")
+        if self._loop is None or self._pid != os.getpid():
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            logger.info("Agendador de jobs encerrado")
+        except Exception as e:
+            logger.error(f"Erro ao encerrar agendador de jobs: {str(e)}")
@@ -1,38 +1,31 @@
 import os
-import logging
 import atexit
-from dotenv import load_dotenv
 
-# Carregar variáveis de ambiente
-load_dotenv()
+# Carregar variáveis de ambiente e configurar o logging (uma única vez)
+from config import get_logger, startup_step, log_startup_profile
 
-# Configurar o diretório de logs
-logs_dir = "logs"
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
+logger = get_logger("main")
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/main.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("main")
+# Importar módulos da aplicação (medindo o tempo de cada etapa para o perfil de startup)
+with startup_step("estrategia_minoria"):
+    from estrategia_minoria import app, job_manager, ranking_service
+with startup_step("cache_utils/async_utils"):
+    from cache_utils import cache_manager
+    from async_utils import cleanup as async_cleanup, start_process_pool
+with startup_step("routes"):
+    import routes  # Importar as rotas para registrá-las
 
-# Importar módulos da aplicação
-from estrategia_minoria import app
-from cache_utils import cache_manager
-from async_utils import cleanup as async_cleanup
-import routes  # Importar as rotas para registrá-las
+log_startup_profile(logger)
 
 # Registrar função de limpeza para execução na saída
 def cleanup():
     """Limpa recursos ao encerrar a aplicação."""
     logger.info("Encerrando aplicação...")
     
+    # Encerrar jobs em segundo plano e o ranking global
+    job_manager.cleanup()
+    ranking_service.stop()
+    
     # Limpar cache
     cache_manager.cleanup()
     
@@ -51,6 +44,9 @@ if __name__ == "__main__":
     
     logger.info(f"Iniciando CATALOGADOR V1 em {host}:{port} (debug={debug})")
     
+    # Pool de processos de CPU criado antes das threads do servidor (no Gunicorn, em post_fork)
+    start_process_pool()
+    
     if debug:
         # Modo de desenvolvimento com Flask
         app.run(debug=True, host=host, port=port)
@@ -0,0 +1,189 @@
+import os
+import threading
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import get_logger
+
+# Configurar o logging
+logger = get_logger("metrics_utils")
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+# Limites (em segundos) dos buckets dos histogramas de duração de chamadas bloqueantes
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Token das rotas administrativas (métricas); vazio desativa as rotas
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Histograma de valores com buckets fixos (contagem por bucket, soma e total), no formato do Prometheus.
+    Não é thread-safe: o acesso é protegido pelo MetricsRegistry.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Último bucket: acima do maior limite (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimativa de um quantil (limite superior do bucket que o contém)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Registro de contadores e histogramas com rótulos, exportável em JSON ou no formato texto do Prometheus.
+    """
+
+    def __init__(self, namespace: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Args:
+            namespace (str): Prefixo dos nomes das métricas exportadas (ex: "cache")
+            buckets: Limites dos buckets dos histogramas, em segundos
+        """
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Counter] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Incrementa um contador."""
+        key = self._labels(labels)
+        with self._lock:
+            self._counters.setdefault(name, Counter())[key] += value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Registra um valor em um histograma."""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self, group_by: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Métricas agrupadas pelo valor de um rótulo (ex: por prefixo de chave).
+
+        Args:
+            group_by (str): Rótulo de agrupamento
+
+        Returns:
+            dict: {valor do rótulo: {métrica[:outros rótulos]: valor ou resumo do histograma}}
+        """
+        groups: Dict[str, Dict[str, Any]] = {}
+
+        def target(name: str, labels: Labels) -> Tuple[Dict[str, Any], str]:
+            group = dict(labels).get(group_by, "")
+            rest = ",".join(f"{k}={v}" for k, v in labels if k != group_by)
+            return groups.setdefault(group, {}), f"{name}:{rest}" if rest else name
+
+        with self._lock:
+            for name, series in self._counters.items():
+                for labels, value in series.items():
+                    entry, metric = target(name, labels)
+                    entry[metric] = value
+            for name, series in self._histograms.items():
+                for labels, histogram in series.items():
+                    entry, metric = target(name, labels)
+                    entry[metric] = histogram.snapshot()
+        return groups
+
+    def to_prometheus(self, gauges: Optional[List[Tuple[str, Dict[str, str], float]]] = None) -> str:
+        """
+        Exporta as métricas no formato texto do Prometheus.
+
+        Args:
+            gauges: Valores instantâneos adicionais (nome, rótulos, valor), ex: bytes ocupados
+
+        Returns:
+            str: Métricas no formato de exposição do Prometheus
+        """
+        def fmt(labels: Labels) -> str:
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.namespace}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{fmt(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.namespace}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{metric}_bucket{fmt(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{metric}_sum{fmt(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{fmt(labels)} {histogram.count}")
+
+        declared = set()
+        for name, labels, value in gauges or []:
+            metric = f"{self.namespace}_{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} gauge")
+                declared.add(metric)
+            lines.append(f"{metric}{fmt(self._labels(labels))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Métricas do cache (por prefixo de chave, nos dois backends)
+cache_metrics = MetricsRegistry("cache")
+
+# Métricas das chamadas bloqueantes (por função, no executor de async_utils)
+executor_metrics = MetricsRegistry("executor", DURATION_BUCKETS)
@@ -311,7 +311,9 @@ class Polarium(object):
             logging.error(f"[**ERROR**] Obtendo saldo da conta: {e}")
             self.reconnect()
 
-    def get_candles(self, ativo, timeframe, quantidade, timestamp):
+    def get_candles(self, ativo, timeframe, quantidade, timestamp, cancel_token=None):
+        # cancel_token (opcional): objeto com canceled/raise_if_canceled()/sleep(), consultado nas esperas
+        # e novas tentativas para desistir da busca quando quem a aguarda cancelar ou o prazo terminar
         if "-OTC" not in ativo:
             par = ativo + "-op"
             if par not in OP_code.ACTIVES:
@@ -322,6 +324,8 @@ class Polarium(object):
             raise ValueError(f'Ativo {par} não encontrado no Constants')
         self.candles.candles_data = None
         while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_canceled()
             try:
                 data = {"name":"get-candles",
                         "version":"2.0",
@@ -338,12 +342,19 @@ class Polarium(object):
                 while self.check_connect and request not in self.candles.candles:
                     if time.time() - t_time > 10:
                         raise TimeoutError(f'[**ERROR**] {par}: Aguardando get_candles, reconnect!')
+                    if cancel_token is not None and cancel_token.canceled:
+                        break
                     time.sleep(0.1) 
                 if request in self.candles.candles:
                     break
             except Exception as e:
+                if cancel_token is not None and cancel_token.canceled:
+                    continue
                 self.reconnect()
-            time.sleep(1)
+            if cancel_token is not None:
+                cancel_token.sleep(1)
+            else:
+                time.sleep(1)
         return self.candles.candles.pop(request)
 
     def __buy_bin(self, valor, ativo, direcao, expiracao, tipo):
@@ -437,7 +448,8 @@ class Polarium(object):
                     return False, self.buy_multi_option[req_id]["message"]
             return False, self.buy_multi_option
     
-    def check_win(self, id, tipo_operacao):
+    def check_win(self, id, tipo_operacao, cancel_token=None):
+        # cancel_token (opcional): interrompe a espera pelo resultado, ver get_candles
         try:
             self.reconnect()
             if tipo_operacao == 'digital':
@@ -446,6 +458,9 @@ class Polarium(object):
                         order = self.order_async.get(buy_order_id, {})
                         if order.get("position-changed"):
                             return order["position-changed"]["msg"]
+                        if cancel_token is not None:
+                            cancel_token.raise_if_canceled()
+                            cancel_token.sleep(0.05)
                 order_data = get_order_data(id)
                 if order_data != None:
                     if order_data["status"] == "closed":
@@ -459,7 +474,11 @@ class Polarium(object):
                     return False, None
             else:
                 while True:
-                    time.sleep(0.05)
+                    if cancel_token is not None:
+                        cancel_token.raise_if_canceled()
+                        cancel_token.sleep(0.05)
+                    else:
+                        time.sleep(0.05)
                     try:
                         if self.option_closed[id] is not None:
                             break
@@ -468,6 +487,8 @@ class Polarium(object):
                 x = self.option_closed[id]
                 return x['msg']['win'], (0 if x['msg']['win'] == 'equal' else float(x['msg']['sum']) * -1 if x['msg']['win'] == 'loose' else float(x['msg']['win_amount']) - float(x['msg']['sum']))
         except Exception as e:
+            if cancel_token is not None and cancel_token.canceled:
+                raise
             print(f"Erro em check_win: {e}")
             self.reconnect()
 
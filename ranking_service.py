@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config import get_logger
+from async_utils import CALL_CLASS_BATCH, blocking_context
+from cache_utils import cache_manager
+
+# Configurar o logging
+logger = get_logger("RankingService", "ranking_service.log")
+
+
+class RankingService:
+    """
+    Classe responsável por manter um ranking global pré-calculado dos melhores ativos.
+    O ranking é recalculado a cada fechamento de bloco e nos minutos de apuração dos martingales,
+    para cada quantidade de blocos suportada, e publicado como um snapshot versionado que as rotas
+    servem instantaneamente. Com vários processos, apenas o líder (lease_func) recalcula; os demais
+    leem os snapshots do armazenamento compartilhado (store).
+    """
+
+    def __init__(self,
+                 scan_func: Callable[[Any, int], Awaitable[Dict[str, Any]]],
+                 api_provider: Callable[[], Tuple[Optional[str], Any]],
+                 schedule_func: Callable[[float], float],
+                 supported_num_blocks: Iterable[int] = (10,),
+                 max_age: int = 300,
+                 retry_interval: int = 30,
+                 store: Any = cache_manager,
+                 lease_func: Optional[Callable[[float], bool]] = None):
+        """
+        Inicializa o RankingService.
+
+        Args:
+            scan_func: Função assíncrona (api_instance, num_blocks) que retorna o ranking calculado
+            api_provider: Função que retorna (dono, instância da API) da conexão usada na varredura, ou
+                          (None, None); as chamadas da varredura contam no limite do dono (bulkhead)
+            schedule_func: Função que, dado o instante atual, retorna o instante do próximo recálculo
+            supported_num_blocks: Quantidades de blocos pré-calculadas
+            max_age (int): Idade máxima em segundos de um snapshot servido às rotas (padrão: 1 bloco)
+            retry_interval (int): Espera em segundos quando não há API disponível (padrão: 30)
+            store: Armazenamento (get/set) onde os snapshots são compartilhados com outros processos
+                   (padrão: cache_manager)
+            lease_func: Função (validade em segundos) que obtém ou renova a liderança do recálculo
+                        entre processos; None: este processo sempre recalcula
+        """
+        self._scan_func = scan_func
+        self._api_provider = api_provider
+        self._schedule_func = schedule_func
+        self._supported_num_blocks = tuple(sorted(set(int(n) for n in supported_num_blocks)))
+        self._max_age = max_age
+        self._retry_interval = retry_interval
+        self._store = store
+        self._lease_func = lease_func
+        # Validade da liderança: renovada a cada ciclo (no máximo retry_interval) e a cada varredura
+        self._lease_ttl = max(max_age, 3 * retry_interval)
+
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._version = 0
+        self._lock = threading.RLock()  # Lock para acesso thread-safe
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        logger.info(f"RankingService inicializado para num_blocks={self._supported_num_blocks}")
+
+    @property
+    def supported_num_blocks(self):
+        return self._supported_num_blocks
+
+    def ensure_started(self) -> None:
+        """
+        Inicia a thread do ranking neste processo, se ainda não estiver rodando.
+        A verificação por PID garante que cada worker (após o fork do Gunicorn) tenha sua própria thread.
+        """
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            logger.info(f"Thread do ranking global iniciada no processo {self._pid}")
+
+    def stop(self) -> None:
+        """
+        Interrompe a thread do ranking.
+        """
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        """
+        Laço principal: recalcula o ranking nos instantes agendados.
+        """
+        next_run = 0.0
+        while not self._stop_event.is_set():
+            leader = False
+            try:
+                leader = self._is_leader()
+                if not leader:
+                    next_run = 0.0  # Se assumir a liderança, recalcular imediatamente
+                elif time.time() >= next_run:
+                    if self.refresh_all():
+                        next_run = self._schedule_func(time.time())
+                    else:
+                        next_run = time.time() + self._retry_interval
+            except Exception as e:
+                logger.exception(f"Erro no ciclo do ranking global: {str(e)}")
+                next_run = time.time() + self._retry_interval
+
+            if leader:
+                self._stop_event.wait(max(1.0, min(next_run - time.time(), self._retry_interval)))
+            else:
+                self._stop_event.wait(self._retry_interval)
+
+    def _is_leader(self) -> bool:
+        """
+        Verifica (e renova) a liderança do recálculo deste processo.
+        """
+        if self._lease_func is None:
+            return True
+        return self._lease_func(self._lease_ttl)
+
+    def refresh_all(self) -> bool:
+        """
+        Recalcula o ranking para todas as quantidades de blocos suportadas.
+
+        Returns:
+            bool: True se havia uma API disponível para o recálculo
+        """
+        owner, api_instance = self._api_provider()
+        if api_instance is None:
+            logger.debug("Nenhuma conexão disponível para o ranking global")
+            return False
+
+        for num_blocks in self._supported_num_blocks:
+            if self._stop_event.is_set() or not self._is_leader():
+                break
+            started = time.time()
+            # A varredura é lote: suas chamadas bloqueantes não competem com as das requisições e,
+            # numa conexão emprestada, ficam no limite do usuário dono
+            with blocking_context(owner, CALL_CLASS_BATCH):
+                payload = asyncio.run(self._scan_func(api_instance, num_blocks))
+            if payload:
+                self._publish(num_blocks, payload)
+                logger.info(f"Ranking global (num_blocks={num_blocks}) recalculado em {time.time() - started:.1f}s")
+        return True
+
+    def _publish(self, num_blocks: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Publica um novo snapshot versionado.
+        """
+        now = time.time()
+        key = f"ranking_snapshot:{num_blocks}"
+        # Versões crescentes mesmo quando a liderança passa para outro processo
+        hit, previous = self._store.get(key)
+        with self._lock:
+            self._version = max(self._version, previous["version"] if hit else 0) + 1
+            snapshot = dict(payload)
+            snapshot.update({
+                "version": self._version,
+                "num_blocks": num_blocks,
+                "generated_at": int(now),
+                "next_refresh": int(self._schedule_func(now))
+            })
+            self._snapshots[num_blocks] = snapshot
+
+        # Compartilhar com outros processos
+        self._store.set(key, snapshot, ttl=self._max_age * 2)
+        return snapshot
+
+    def get_snapshot(self, num_blocks: int, current_only: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Obtém o snapshot mais recente para uma quantidade de blocos.
+
+        Args:
+            num_blocks (int): Quantidade de blocos
+            current_only (bool): Só retornar se o snapshot não for mais antigo que a idade máxima
+
+        Returns:
+            dict: Snapshot do ranking ou None se não houver um disponível
+        """
+        num_blocks = int(num_blocks)
+        if num_blocks not in self._supported_num_blocks:
+            return None
+
+        with self._lock:
+            snapshot = self._snapshots.get(num_blocks)
+
+        # Sem snapshot local atual (outro processo é o líder): ler o compartilhado
+        if snapshot is None or time.time() >= snapshot["next_refresh"]:
+            hit, shared = self._store.get(f"ranking_snapshot:{num_blocks}")
+            if hit and (snapshot is None or shared["version"] > snapshot["version"]):
+                snapshot = shared
+            if snapshot is None:
+                return None
+
+        if current_only and time.time() - snapshot["generated_at"] > self._max_age:
+            return None
+        return snapshot
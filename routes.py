@@ -4,8 +4,10 @@ import logging
 from datetime import datetime
 from functools import wraps
 import random
+import hmac
 
 from flask import (
+    Response,
     render_template, 
     request, 
     jsonify, 
@@ -24,9 +26,23 @@ from estrategia_minoria import (
     ativos_recomendados,
     connect_to_polarium,
     analyze_candles,
+    analyze_strategies,
+    STRATEGIES,
     generate_chart,
-    get_available_actives
+    get_available_actives,
+    build_top5_ranking,
+    run_top5_analysis,
+    job_manager,
+    user_channel,
+    ranking_service,
+    apply_ranking_snapshot,
+    RANKING_SERVICE_ENABLED
 )
+from job_manager import job_channel
+from chart_utils import CHART_MODE_COMPACT
+from event_stream import event_broker, sse_slots, SSE_HEARTBEAT_INTERVAL, SSE_MAX_DURATION
+from cache_utils import cache_manager
+from metrics_utils import ADMIN_TOKEN
 # Importar async_utils diretamente
 import async_utils
 
@@ -41,15 +57,61 @@ def login_required(f):
             return redirect(url_for('index'))
         
         # Verificar se a conexão ainda existe
-        user_data = connection_manager.get_user_data(user_id)
-        if not user_data or not user_data.get('connected', False):
+        api_instance, connected = connection_manager.get_connection(user_id)
+        if api_instance is None or not connected:
             # Se a conexão foi perdida, limpar a sessão
             session.clear()
             return redirect(url_for('index'))
         
+        # Chamadas bloqueantes da requisição contam no limite do usuário e desistem
+        # (liberando o executor) quando o prazo da requisição termina
+        cancel_token = async_utils.CancellationToken(async_utils.REQUEST_DEADLINE) if async_utils.REQUEST_DEADLINE else None
+        with async_utils.blocking_context(user_id, cancel_token=cancel_token):
+            return await f(*args, **kwargs)
+    return decorated_function
+
+# Decorador para rotas administrativas: exigem o token ADMIN_TOKEN (desativadas se não configurado)
+def admin_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"success": False, "message": "Rota administrativa desativada"}), 404
+        
+        auth = request.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"success": False, "message": "Não autorizado"}), 401
+        
         return await f(*args, **kwargs)
     return decorated_function
 
+# Iniciar serviços em segundo plano no processo que atende as requisições (após o fork do Gunicorn)
+@app.before_request
+def start_background_services():
+    if RANKING_SERVICE_ENABLED:
+        ranking_service.ensure_started()
+
+# Resposta de transmissão de eventos (Server-Sent Events)
+def sse_response(stream):
+    # Sem vaga, recusar: o navegador passa a consultar o job periodicamente
+    if not sse_slots.acquire(blocking=False):
+        logger.warning("Limite de conexões SSE atingido neste worker")
+        return jsonify({"success": False, "message": "Limite de conexões de eventos atingido"}), 503, {'Retry-After': '30'}
+    response = Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Desativar buffer do Nginx para entregar eventos imediatamente
+    })
+    response.call_on_close(sse_slots.release)
+    return response
+
+# Obter o ID do último evento recebido pelo cliente (reconexão SSE)
+def get_last_event_id(default=0):
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value is not None else default
+    except ValueError:
+        return default
+
 # Página inicial / login
 @app.route('/')
 async def index():
@@ -58,11 +120,10 @@ async def index():
     
     # Se já estiver logado
     if user_id:
-        user_data = connection_manager.get_user_data(user_id)
-        if user_data and user_data.get('connected', False):
+        api_instance, connected = connection_manager.get_connection(user_id)
+        if api_instance is not None and connected:
             try:
                 # Obter lista de ativos disponíveis
-                api_instance = user_data['api']
                 raw_active_list = await get_available_actives(api_instance)
                 active_list = [(asset, format_asset_name(asset)) for asset in raw_active_list]
                 logger.info(f"Renderizando index.html com {len(active_list)} ativos para usuário {user_id}")
@@ -95,7 +156,7 @@ async def connect():
         
         # Tentar obter informações básicas para verificar a conexão
         try:
-            balance = await async_utils.run_blocking_func(api_instance.get_balance)
+            balance = await async_utils.run_control_func(api_instance.get_balance)
             logger.info(f"Saldo após conexão para usuário {user_id}: {balance}")
         except Exception as e:
             logger.error(f"Erro ao obter saldo para usuário {user_id}: {str(e)}")
@@ -128,16 +189,16 @@ async def verify_2fa():
         if success:
             logger.info("Autenticação 2FA bem-sucedida")
             # Alterar para conta de prática
-            await async_utils.run_blocking_func(temp_api.change_balance, 'PRACTICE')
+            await async_utils.run_control_func(temp_api.change_balance, 'PRACTICE')
             
             # Verificar conexão
-            if not await async_utils.run_blocking_func(temp_api.check_connect):
+            if not await async_utils.run_control_func(temp_api.check_connect):
                 logger.error("Falha no check_connect após 2FA bem-sucedido")
                 return jsonify({"success": False, "message": "Falha ao estabelecer conexão estável após 2FA"})
             
             # Verificar acesso aos dados fundamentais
             try:
-                balance = await async_utils.run_blocking_func(temp_api.get_balance)
+                balance = await async_utils.run_control_func(temp_api.get_balance)
                 logger.info(f"Saldo obtido após 2FA: {balance}")
             except Exception as e:
                 logger.error(f"Erro ao verificar dados após 2FA: {str(e)}")
@@ -168,12 +229,11 @@ async def verify_2fa():
 async def refresh_actives():
     """Atualiza a lista de ativos disponíveis."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
-    api_instance = user_data['api']
+    api_instance, _ = connection_manager.get_connection(user_id)
     
     try:
         # Verificar conexão
-        check = await async_utils.run_blocking_func(api_instance.check_connect)
+        check = await async_utils.run_control_func(api_instance.check_connect)
         if not check:
             logger.error(f"API não conectada para usuário {user_id} em refresh_actives")
             connection_manager.update_connection_status(user_id, False)
@@ -207,12 +267,11 @@ async def refresh_actives():
 async def check_connection():
     """Verifica se a conexão com a API ainda está ativa."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
-    api_instance = user_data['api']
+    api_instance, _ = connection_manager.get_connection(user_id)
     
     try:
         # Verificar conexão
-        check = await async_utils.run_blocking_func(api_instance.check_connect)
+        check = await async_utils.run_control_func(api_instance.check_connect)
         if check:
             logger.info(f"Conexão verificada para usuário {user_id}")
             connection_manager.update_connection_status(user_id, True)
@@ -232,19 +291,19 @@ async def check_connection():
 async def analyze():
     """Analisa um ativo específico."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
-    api_instance = user_data['api']
-    user_lock = user_data['lock']
+    api_instance, _ = connection_manager.get_connection(user_id)
+    user_lock = connection_manager.get_lock(user_id)
     
     active = request.form.get('active')
     num_blocks = int(request.form.get('num_blocks', 10))
+    chart_mode = request.form.get('chart_mode', CHART_MODE_COMPACT)
     
     logger.info(f"Analisando {active} com {num_blocks} blocos para usuário {user_id}")
     
     with user_lock:  # Usar lock específico do usuário
         try:
             # Verificar conexão
-            check = await async_utils.run_blocking_func(api_instance.check_connect)
+            check = await async_utils.run_control_func(api_instance.check_connect)
             if not check:
                 logger.error(f"API não conectada para usuário {user_id} em analyze")
                 connection_manager.update_connection_status(user_id, False)
@@ -261,106 +320,106 @@ async def analyze():
             update_asset_stats(user_id, active, results)
             
             # Armazenar resultados para uso posterior
-            user_data = connection_manager.get_user_data(user_id)
-            if "last_results" not in user_data:
-                user_data["last_results"] = {}
-            user_data["last_results"][active] = results
-            connection_manager.update_user_state(user_id, "last_results", user_data["last_results"])
+            connection_manager.update_user_items(user_id, "last_results", {active: results})
             
             # Gerar gráfico
-            chart_json = await generate_chart(api_instance, active, results["data"])
+            chart_json = await generate_chart(active, results, chart_mode)
             
             if not chart_json:
                 logger.error(f"Falha ao gerar gráfico para usuário {user_id}")
                 return jsonify({"success": False, "message": "Falha ao gerar gráfico"})
             
             # Atualizar ranking de top 5 após análise individual
-            user_data = connection_manager.get_user_data(user_id)
-            if "stats" in user_data:
+            stats = connection_manager.get_user_state(user_id, "stats")
+            if stats is not None:
                 # Simplificar a lógica - verificar apenas a flag de ranking limpo
                 # Se a flag for False ou não existir, permitir atualização do ranking
-                if not user_data.get('ranking_cleared', False):
-                    asset_stats = user_data["stats"]
-                    
-                    # Ordenar ativos por taxa de sucesso e depois por vitórias na primeira entrada
-                    top_assets = sorted(
-                        [(active_id, stats) for active_id, stats in asset_stats.items()],
-                        key=lambda x: (x[1]["win_rate"], x[1]["direct_wins"]),
-                        reverse=True
-                    )[:5]
-                    
-                    # Preparar dados para o ranking
-                    top5_data = [
-                        {
-                            "active": format_asset_name(active_id),
-                            "active_id": active_id,
-                            "win_rate": stats["win_rate"],
-                            "wins": stats["wins"],
-                            "losses": stats["losses"],
-                            "analyzed_blocks": stats["analyzed_blocks"],
-                            "direct_wins": stats["direct_wins"],
-                            "martingale1_wins": stats["martingale1_wins"],
-                            "martingale2_wins": stats["martingale2_wins"],
-                            "total_operations": stats["wins"] + stats["losses"],
-                            "win_first": stats["direct_wins"],
-                            "win_g1": stats["martingale1_wins"],
-                            "win_g2": stats["martingale2_wins"],
-                            "loss": stats["losses"],
-                            "name": format_asset_name(active_id),
-                            "last_update": int(time.time())
-                        }
-                        for active_id, stats in top_assets
-                    ]
+                if not connection_manager.get_user_state(user_id, "ranking_cleared", False):
+                    top5_data = build_top5_ranking(stats)
                     
                     # Salvar no user_data
-                    connection_manager.update_user_state(user_id, "top5_ativos", top5_data)
-                    
-                    # Atualizar diretamente o objeto user_data também
-                    user_data['top5_ativos'] = top5_data
+                    connection_manager.set_user_state(user_id, "top5_ativos", top5_data)
+                    event_broker.publish(user_channel(user_id), "ranking", top5_data)
                     
                     logger.info(f"Ranking atualizado após análise de {active} para usuário {user_id}")
                 else:
                     logger.info(f"Ranking não atualizado após análise de {active} porque foi limpo pelo usuário {user_id}")
             
             logger.info(f"Análise de {active} concluída para usuário {user_id}")
-            return jsonify({"success": True, "results": results, "chart": chart_json, "active": active})
+            # As velas já seguem no gráfico; a tabela só precisa dos blocos
+            return jsonify({
+                "success": True,
+                "results": {"success": True, "data": results["data"]},
+                "chart": chart_json,
+                "chart_mode": chart_mode,
+                "active": active
+            })
         
         except Exception as e:
             logger.exception(f"Erro ao analisar {active} para usuário {user_id}: {str(e)}")
             return jsonify({"success": False, "message": f"Erro na análise: {str(e)}"})
 
+# Rota para comparar estratégias em um ativo
+@app.route('/analyze_strategies', methods=['POST'])
+@login_required
+async def analyze_strategies_route():
+    """Avalia várias estratégias sobre as mesmas velas de um ativo e retorna as estatísticas lado a lado."""
+    user_id = session['user_id']
+    api_instance, _ = connection_manager.get_connection(user_id)
+    
+    active = request.form.get('active')
+    num_blocks = int(request.form.get('num_blocks', 10))
+    strategy_names = [name.strip() for name in request.form.get('strategies', ','.join(STRATEGIES)).split(',') if name.strip()]
+    
+    unknown = [name for name in strategy_names if name not in STRATEGIES]
+    if not active or not strategy_names or unknown:
+        return jsonify({
+            "success": False,
+            "message": f"Parâmetros inválidos. Estratégias disponíveis: {', '.join(STRATEGIES)}"
+        })
+    
+    logger.info(f"Comparando estratégias {strategy_names} em {active} para usuário {user_id}")
+    
+    try:
+        results = await analyze_strategies(api_instance, active, strategy_names, 60, num_blocks)
+        if "error" in results:
+            return jsonify({"success": False, "message": results["error"]})
+        return jsonify({"success": True, "active": active, "strategies": results["strategies"]})
+    
+    except Exception as e:
+        logger.exception(f"Erro ao comparar estratégias em {active} para usuário {user_id}: {str(e)}")
+        return jsonify({"success": False, "message": f"Erro na análise: {str(e)}"})
+
 # Rota para recarregar gráfico
 @app.route('/reload_chart', methods=['POST'])
 @login_required
 async def reload_chart():
     """Recarrega o gráfico para um ativo específico."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
-    api_instance = user_data['api']
-    user_lock = user_data['lock']
+    user_lock = connection_manager.get_lock(user_id)
     
     active = request.form.get('active')
+    chart_mode = request.form.get('chart_mode', CHART_MODE_COMPACT)
     
     logger.info(f"Recarregando gráfico para {active} para usuário {user_id}")
     
     with user_lock:
         try:
             # Verificar se há resultados armazenados
-            if "last_results" not in user_data or active not in user_data["last_results"]:
+            results = connection_manager.get_user_item(user_id, "last_results", active)
+            if results is None:
                 logger.error(f"Nenhum resultado armazenado para {active} - usuário {user_id}")
                 return jsonify({"success": False, "message": f"Nenhum resultado encontrado para {active}"})
             
-            results = user_data["last_results"][active]
-            
             # Gerar gráfico
-            chart_json = await generate_chart(api_instance, active, results["data"])
+            chart_json = await generate_chart(active, results, chart_mode)
             
             if not chart_json:
                 logger.error(f"Falha ao gerar gráfico para usuário {user_id}")
                 return jsonify({"success": False, "message": "Falha ao gerar gráfico"})
             
             logger.info(f"Gráfico recarregado para {active} - usuário {user_id}")
-            return jsonify({"success": True, "chart": chart_json, "active": active})
+            return jsonify({"success": True, "chart": chart_json, "chart_mode": chart_mode, "active": active})
         
         except Exception as e:
             logger.exception(f"Erro ao recarregar gráfico para {active} - usuário {user_id}: {str(e)}")
@@ -370,176 +429,109 @@ async def reload_chart():
 @app.route('/analyze_top5', methods=['POST'])
 @login_required
 async def analyze_top5():
-    """Analisa os 5 melhores ativos de todos os disponíveis."""
+    """Agenda a análise dos 5 melhores ativos em segundo plano e retorna o ID do job."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
-    api_instance = user_data['api']
-    user_lock = user_data['lock']
+    api_instance, _ = connection_manager.get_connection(user_id)
     
     num_blocks = int(request.form.get('num_blocks', 10))
     
+    # Se já existir uma análise em andamento, retornar o mesmo job
+    active_job_id = job_manager.get_active_job(user_id, "top5")
+    active_status = job_manager.get_job_status(active_job_id) if active_job_id else None
+    if active_status is not None:
+        logger.info(f"Análise top 5 já em andamento para usuário {user_id} (job {active_job_id})")
+        return jsonify({"success": True, "job_id": active_job_id, "status": active_status["status"]})
+    
     logger.info(f"Iniciando análise de todos os ativos disponíveis para usuário {user_id}")
     
     # Resetar a flag de ranking limpo ao iniciar uma análise completa
-    if user_data.get('ranking_cleared', False):
-        user_data['ranking_cleared'] = False
-        connection_manager.update_user_state(user_id, "ranking_cleared", False)
-        logger.info(f"Flag de ranking limpo resetada para usuário {user_id} durante análise completa")
-    
-    # Inicializar progresso da análise
-    analysis_progress = {
-        "in_progress": True,
-        "total_assets": 0,  # Será atualizado após obter a lista de ativos
-        "analyzed_assets": 0,
-        "current_asset": "",
-        "percent_complete": 0,
-        "success_count": 0,
-        "start_time": int(time.time())
-    }
-    connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
+    if connection_manager.get_user_state(user_id, "ranking_cleared", False):
+        if connection_manager.set_user_state(user_id, "ranking_cleared", False):
+            logger.info(f"Flag de ranking limpo resetada para usuário {user_id} durante análise completa")
+        else:
+            logger.warning(f"Não foi possível resetar a flag de ranking limpo para usuário {user_id}")
     
-    with user_lock:
-        try:
-            # Verificar conexão
-            check = await async_utils.run_blocking_func(api_instance.check_connect)
-            if not check:
-                logger.error(f"API não conectada para usuário {user_id} em analyze_top5")
-                connection_manager.update_connection_status(user_id, False)
-                return jsonify({"success": False, "message": "API desconectada, faça login novamente"})
-                
-            # Obter lista de ativos disponíveis
-            logger.info(f"Obtendo lista de ativos disponíveis para usuário {user_id}")
-            available_actives = await get_available_actives(api_instance)
-            
-            if not available_actives:
-                logger.error(f"Nenhum ativo disponível para usuário {user_id}")
-                # Atualizar progresso para finalizado
-                analysis_progress["in_progress"] = False
-                connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
-                return jsonify({"success": False, "message": "Nenhum ativo disponível para análise"})
-                
-            # Filtrar apenas ativos binary e limitar aos primeiros 50
-            selected_actives = [active for active in available_actives if is_binary_active(active)][:50]
-            logger.info(f"Selecionados {len(selected_actives)} ativos binary para análise (limitado a 50)")
-            
-            # Atualizar total de ativos no progresso
-            analysis_progress["total_assets"] = len(selected_actives)
-            connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
-            
-            logger.info(f"Iniciando análise de {len(selected_actives)} ativos binary disponíveis")
-            
-            # Inicializar resultados
-            all_results = {}
-            asset_stats = {}
-            analysis_results = {}  # Dicionário para rastrear resultados de cada ativo
-            
-            # Analisar cada ativo selecionado
-            for i, active in enumerate(selected_actives):
-                # Verificar se a análise foi cancelada
-                if not user_data.get("analysis_progress", {}).get("in_progress", True):
-                    logger.info(f"Análise cancelada pelo usuário {user_id} após analisar {i} ativos")
-                    analysis_results["canceled"] = True
-                    break
-                    
-                try:
-                    # Atualizar progresso
-                    analysis_progress["current_asset"] = active
-                    analysis_progress["analyzed_assets"] = i
-                    analysis_progress["percent_complete"] = round((i / len(selected_actives)) * 100)
-                    connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
-                    
-                    logger.info(f"Analisando ativo {i+1}/{len(selected_actives)}: {active} para usuário {user_id}")
-                    
-                    # Analisar candles com o mesmo método usado na análise individual
-                    results = await analyze_candles(api_instance, active, 60, num_blocks)
-                    
-                    if "error" not in results:
-                        # Armazenar resultados
-                        all_results[active] = results
-                        analysis_results[active] = "Sucesso"
-                        
-                        # Atualizar estatísticas
-                        update_asset_stats(user_id, active, results)
-                        
-                        # Obter estatísticas atualizadas
-                        user_data = connection_manager.get_user_data(user_id)
-                        if "stats" in user_data and active in user_data["stats"]:
-                            asset_stats[active] = user_data["stats"][active]
-                            analysis_progress["success_count"] += 1
-                    else:
-                        analysis_results[active] = f"Erro: {results['error']}"
-                        logger.error(f"Erro ao analisar {active} para usuário {user_id}: {results['error']}")
-                except Exception as e:
-                    analysis_results[active] = f"Erro: {str(e)}"
-                    logger.exception(f"Erro ao analisar {active} para usuário {user_id}: {str(e)}")
-            
-            # Finalizar progresso
-            analysis_progress["in_progress"] = False
-            analysis_progress["analyzed_assets"] = len(selected_actives)
-            analysis_progress["percent_complete"] = 100
-            connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
-            
-            # Se a análise foi cancelada pelo usuário, usar os resultados parciais
-            canceled = False
-            if analysis_results.get("canceled", False):
-                canceled = True
-                logger.info(f"Finalizando análise cancelada para usuário {user_id} - Usando resultados parciais")
-                
-            # Ordenar ativos por taxa de sucesso e depois por vitórias na primeira entrada
-            top_assets = sorted(
-                [(active, stats) for active, stats in asset_stats.items()],
-                key=lambda x: (x[1]["win_rate"], x[1]["direct_wins"]),
-                reverse=True
-            )[:5]
-            
-            # Preparar dados para retorno
-            top5_data = [
-                {
-                    "active": format_asset_name(active),
-                    "active_id": active,
-                    "win_rate": stats["win_rate"],
-                    "wins": stats["wins"],
-                    "losses": stats["losses"],
-                    "analyzed_blocks": stats["analyzed_blocks"],
-                    "direct_wins": stats["direct_wins"],
-                    "martingale1_wins": stats["martingale1_wins"],
-                    "martingale2_wins": stats["martingale2_wins"],
-                    "total_operations": stats["wins"] + stats["losses"],
-                    "win_first": stats["direct_wins"],
-                    "win_g1": stats["martingale1_wins"],
-                    "win_g2": stats["martingale2_wins"],
-                    "loss": stats["losses"],
-                    "name": format_asset_name(active),
-                    "last_update": int(time.time())
-                }
-                for active, stats in top_assets
-            ]
-            
-            # Salvar top5_data na chave 'top5_ativos' do user_data
-            connection_manager.update_user_state(user_id, "top5_ativos", top5_data)
-            
-            # Atualizar também o objeto user_data atual
-            user_data = connection_manager.get_user_data(user_id)
-            user_data['top5_ativos'] = top5_data
-            
-            logger.info(f"Análise top 5 concluída para usuário {user_id} - Analisados {len(selected_actives)} ativos")
-            return jsonify({
-                "success": True, 
-                "top5": top5_data,
-                "results": analysis_results,  # Incluir resultados da análise na resposta
-                "total_analyzed": len(selected_actives),
-                "successful_analysis": analysis_progress["success_count"],
-                "canceled": canceled
-            })
-        
-        except Exception as e:
-            # Finalizar progresso em caso de erro
-            analysis_progress = user_data["analysis_progress"]
-            analysis_progress["in_progress"] = False
-            connection_manager.update_user_state(user_id, "analysis_progress", analysis_progress)
-            
-            logger.exception(f"Erro na análise top 5 para usuário {user_id}: {str(e)}")
-            return jsonify({"success": False, "message": f"Erro na análise top 5: {str(e)}"})
+    # Servir o ranking global pré-calculado, se disponível para esta quantidade de blocos
+    snapshot = ranking_service.get_snapshot(num_blocks)
+    if snapshot is not None and request.form.get('force') != 'true':
+        top5_data = apply_ranking_snapshot(user_id, snapshot)
+        return jsonify({
+            "success": True,
+            "top5": top5_data,
+            "results": snapshot["results"],
+            "total_analyzed": snapshot["total_analyzed"],
+            "successful_analysis": snapshot["successful_analysis"],
+            "canceled": False,
+            "ranking_version": snapshot["version"],
+            "generated_at": snapshot["generated_at"]
+        })
+    
+    try:
+        job_id = job_manager.submit(user_id, "top5", run_top5_analysis, user_id, api_instance, num_blocks)
+        return jsonify({"success": True, "job_id": job_id, "status": "pending"})
+    except Exception as e:
+        logger.exception(f"Erro ao agendar análise top 5 para usuário {user_id}: {str(e)}")
+        return jsonify({"success": False, "message": f"Erro na análise top 5: {str(e)}"})
+
+# Rota para consultar um job em segundo plano
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+async def get_job(job_id):
+    """Retorna status, progresso, resultados parciais e resultado final de um job."""
+    user_id = session['user_id']
+    job = job_manager.get_job(job_id)
+    
+    # Só o dono do job pode consultá-lo
+    if job is None or job['user_id'] != user_id:
+        return jsonify({"success": False, "message": "Job não encontrado"}), 404
+    
+    job.pop('user_id', None)
+    job['success'] = True
+    return jsonify(job)
+
+# Rota de eventos (SSE) de um job: progresso, resultados por ativo e ranking final
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+async def job_events(job_id):
+    """Transmite os eventos de um job via Server-Sent Events."""
+    user_id = session['user_id']
+    
+    if job_manager.get_job_owner(job_id) != user_id:
+        return jsonify({"success": False, "message": "Job não encontrado"}), 404
+    
+    stream = event_broker.stream(
+        job_channel(job_id),
+        get_last_event_id(),
+        SSE_HEARTBEAT_INTERVAL,
+        max_duration=SSE_MAX_DURATION
+    )
+    return sse_response(stream)
+
+# Rota de eventos (SSE) do usuário: atualizações de ranking
+@app.route('/events', methods=['GET'])
+@login_required
+async def user_events():
+    """Transmite as atualizações de ranking do usuário via Server-Sent Events."""
+    user_id = session['user_id']
+    
+    # Em uma nova conexão, receber apenas eventos a partir de agora
+    last_event_id = get_last_event_id(default=event_broker.last_event_id())
+    stream = event_broker.stream(
+        user_channel(user_id),
+        last_event_id,
+        SSE_HEARTBEAT_INTERVAL,
+        max_duration=SSE_MAX_DURATION,
+        create=True
+    )
+    return sse_response(stream)
+
+# Rota para listar os jobs do usuário
+@app.route('/jobs', methods=['GET'])
+@login_required
+async def list_jobs():
+    """Lista os jobs do usuário (ativos e finalizados ainda retidos)."""
+    user_id = session['user_id']
+    return jsonify({"success": True, "jobs": job_manager.list_jobs(user_id)})
 
 # Rota para obter progresso da análise top 5
 @app.route('/get_analysis_progress', methods=['POST', 'GET'])
@@ -547,17 +539,16 @@ async def analyze_top5():
 async def get_analysis_progress():
     """Retorna o progresso atual da análise top 5."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
     
     # Inicializar resposta com valores padrão
     response = {"in_progress": False}
     
     # Adicionar status da flag de ranking
-    response["ranking_cleared"] = user_data.get('ranking_cleared', False)
+    response["ranking_cleared"] = connection_manager.get_user_state(user_id, "ranking_cleared", False)
     
     # Adicionar informações de progresso se disponíveis
-    if "analysis_progress" in user_data:
-        progress = user_data["analysis_progress"]
+    progress = connection_manager.get_user_state(user_id, "analysis_progress")
+    if progress is not None:
         response.update(progress)
         
         # Adicionar informações de tempo estimado
@@ -592,19 +583,47 @@ async def logout():
 async def top_ativos():
     """Página de exibição dos 5 melhores ativos."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
+    
+    # Job de análise em andamento (para retomar o acompanhamento após recarregar a página)
+    active_job_id = job_manager.get_active_job(user_id, "top5")
     
     # Verificar se existe ranking computado
-    if 'top5_ativos' in user_data:
-        top5 = user_data['top5_ativos']
+    top5 = connection_manager.get_user_state(user_id, "top5_ativos")
+    if top5 is not None:
         for ativo in top5:
             if 'last_update' not in ativo:
                 ativo['last_update'] = time.time()
         logger.info(f"Retornando top 5 ativos para usuário {user_id}")
-        return render_template('top_ativos.html', top5=top5, connected=True)
+        return render_template('top_ativos.html', top5=top5, connected=True, active_job_id=active_job_id)
+    
+    # Sem ranking próprio: usar o ranking global pré-calculado (exceto se o usuário o limpou)
+    snapshot = ranking_service.get_snapshot(ranking_service.supported_num_blocks[0]) if ranking_service.supported_num_blocks else None
+    if snapshot is not None and not connection_manager.get_user_state(user_id, "ranking_cleared", False):
+        logger.info(f"Retornando ranking global (versão {snapshot['version']}) para usuário {user_id}")
+        return render_template('top_ativos.html', top5=snapshot["top5"], connected=True, active_job_id=active_job_id)
     else:
         logger.info(f"Nenhum ativo analisado ainda para usuário {user_id}")
-        return render_template('top_ativos.html', top5=[], connected=True)
+        return render_template('top_ativos.html', top5=[], connected=True, active_job_id=active_job_id)
+
+# Rota para consultar o ranking global pré-calculado
+@app.route('/ranking', methods=['GET'])
+@login_required
+async def get_ranking():
+    """Retorna o snapshot mais recente do ranking global para uma quantidade de blocos."""
+    num_blocks = request.args.get('num_blocks', type=int)
+    if num_blocks is None and ranking_service.supported_num_blocks:
+        num_blocks = ranking_service.supported_num_blocks[0]
+    snapshot = ranking_service.get_snapshot(num_blocks, current_only=False) if num_blocks else None
+    if snapshot is None:
+        return jsonify({"success": False, "message": "Ranking global indisponível para esta quantidade de blocos"}), 404
+    return jsonify({
+        "success": True,
+        "version": snapshot["version"],
+        "num_blocks": snapshot["num_blocks"],
+        "generated_at": snapshot["generated_at"],
+        "next_refresh": snapshot["next_refresh"],
+        "top5": snapshot["top5"]
+    })
 
 # Rota para limpar o ranking
 @app.route('/clear_ranking', methods=['POST'])
@@ -612,26 +631,22 @@ async def top_ativos():
 async def clear_ranking():
     """Limpa o ranking de ativos analisados."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
     
     try:
         # Remover o ranking dos dados do usuário
-        if 'top5_ativos' in user_data:
-            del user_data['top5_ativos']
-            
-            # Definir flag indicando que o ranking foi explicitamente limpo pelo usuário
-            user_data['ranking_cleared'] = True
-            connection_manager.update_user_state(user_id, "ranking_cleared", True)
-            
+        removed = connection_manager.pop_user_state(user_id, 'top5_ativos') is not None
+        
+        # Definir flag indicando que o ranking foi explicitamente limpo pelo usuário
+        # (mesmo se não houver ranking para limpar)
+        if not connection_manager.set_user_state(user_id, "ranking_cleared", True):
+            logger.error(f"Usuário {user_id} não encontrado ao limpar o ranking")
+            return jsonify({"success": False, "error": "Usuário não encontrado"})
+        
+        if removed:
             logger.info(f"Ranking de ativos limpo e flag definida para usuário {user_id}")
             return jsonify({"success": True, "message": "Ranking limpo com sucesso"})
-        else:
-            # Definir a flag mesmo se não houver ranking para limpar
-            user_data['ranking_cleared'] = True
-            connection_manager.update_user_state(user_id, "ranking_cleared", True)
-            
-            logger.info(f"Não há ranking para limpar, mas flag definida para usuário {user_id}")
-            return jsonify({"success": True, "message": "Não há ranking para limpar"})
+        logger.info(f"Não há ranking para limpar, mas flag definida para usuário {user_id}")
+        return jsonify({"success": True, "message": "Não há ranking para limpar"})
     except Exception as e:
         logger.exception(f"Erro ao limpar ranking para usuário {user_id}: {str(e)}")
         return jsonify({"success": False, "error": str(e)})
@@ -642,21 +657,30 @@ async def clear_ranking():
 async def cancel_analysis():
     """Cancela a análise de ativos em andamento."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
     
     try:
         # Verificar se há uma análise em andamento
-        if "analysis_progress" in user_data and user_data["analysis_progress"].get("in_progress", False):
-            # Marcar a análise como cancelada
-            user_data["analysis_progress"]["in_progress"] = False
-            user_data["analysis_progress"]["canceled"] = True
-            user_data["analysis_progress"]["percent_complete"] = 100
-            connection_manager.update_user_state(user_id, "analysis_progress", user_data["analysis_progress"])
-            logger.info(f"Análise cancelada para usuário {user_id}")
-            return jsonify({"success": True, "message": "Análise cancelada com sucesso"})
-        else:
+        active_job_id = job_manager.get_active_job(user_id, "top5")
+        if not active_job_id:
             logger.info(f"Não há análise em andamento para cancelar para usuário {user_id}")
-            return jsonify({"success": True, "message": "Não há análise em andamento para cancelar"})
+            return jsonify({"success": False, "message": "Não há análise em andamento para cancelar"}), 404
+        
+        # Solicitar cancelamento do job: o token interrompe as chamadas bloqueantes em andamento,
+        # os resultados parciais são mantidos e o progresso final é publicado pelo próprio job
+        job_manager.cancel(active_job_id)
+        status = job_manager.get_job_status(active_job_id)
+        if status is None:
+            return jsonify({"success": False, "message": "Job não encontrado"}), 404
+        
+        logger.info(f"Análise cancelada para usuário {user_id}")
+        return jsonify({
+            "success": True,
+            "message": "Análise cancelada com sucesso",
+            "job_id": active_job_id,
+            "status": status["status"],
+            "canceled": status["cancel_requested"],
+            "in_progress": status["in_progress"]
+        })
     except Exception as e:
         logger.exception(f"Erro ao cancelar análise para usuário {user_id}: {str(e)}")
         return jsonify({"success": False, "error": str(e)})
@@ -667,16 +691,16 @@ async def cancel_analysis():
 async def toggle_ranking_behavior():
     """Alterna o comportamento do ranking (manter limpo ou atualizar após análises)."""
     user_id = session['user_id']
-    user_data = connection_manager.get_user_data(user_id)
     
     try:
         # Inverter o valor atual da flag
-        current_value = user_data.get('ranking_cleared', False)
+        current_value = connection_manager.get_user_state(user_id, "ranking_cleared", False)
         new_value = not current_value
         
         # Atualizar o valor
-        user_data['ranking_cleared'] = new_value
-        connection_manager.update_user_state(user_id, "ranking_cleared", new_value)
+        if not connection_manager.set_user_state(user_id, "ranking_cleared", new_value):
+            logger.error(f"Usuário {user_id} não encontrado ao alternar o comportamento do ranking")
+            return jsonify({"success": False, "error": "Usuário não encontrado"})
         
         message = "Ranking será mantido limpo após análises individuais" if new_value else "Ranking será atualizado após análises individuais"
         logger.info(f"Comportamento do ranking alterado para usuário {user_id}: {message}")
@@ -688,4 +712,26 @@ async def toggle_ranking_behavior():
         })
     except Exception as e:
         logger.exception(f"Erro ao alternar comportamento do ranking para usuário {user_id}: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}) 
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}) 
+
+# Rota administrativa com as métricas do cache por prefixo
+@app.route('/admin/cache', methods=['GET'])
+@admin_required
+async def admin_cache_metrics():
+    """Retorna acertos, faltas, gravações, bytes, remoções e latências do cache por prefixo de chave."""
+    return jsonify({"success": True, "cache": cache_manager.metrics()})
+
+# Rota administrativa com a ocupação do executor e os tempos por função
+@app.route('/admin/executor', methods=['GET'])
+@admin_required
+async def admin_executor_metrics():
+    """Retorna chamadas em execução e na fila, esperas, tempos de execução e timeouts por função."""
+    return jsonify({"success": True, "executor": async_utils.executor_stats()})
+
+# Exportação das métricas no formato do Prometheus
+@app.route('/admin/metrics', methods=['GET'])
+@admin_required
+async def admin_metrics():
+    """Retorna as métricas do cache e do executor no formato texto do Prometheus."""
+    body = cache_manager.metrics_prometheus() + async_utils.executor_metrics_prometheus()
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,688 @@
+"""
+Processo dono das sessões da Polarium, compartilhado pelos workers HTTP.
+
+As instâncias Polarium (websocket, estado global da API) e o estado de cada usuário
+(ConnectionManager) ficam em um único processo, o broker. Os workers do gunicorn falam
+com ele por um socket Unix, com um protocolo compacto: cada mensagem é um quadro com
+4 bytes de tamanho seguidos do valor codificado pelo CacheCodec (orjson/msgpack, com
+compressão dos valores grandes, ex: velas). Assim qualquer worker atende qualquer usuário.
+
+Nos workers, RemotePolarium e RemoteConnectionManager têm a mesma interface de Polarium e
+ConnectionManager e encaminham as chamadas ao broker. O broker também guarda o que precisa
+ser único entre os workers: os registros dos jobs (RemoteJobStore, em job_manager), os canais
+de eventos SSE (RemoteEventBroker, em event_stream), a liderança do ranking global
+(acquire_lease) e os snapshots do ranking (RemoteCache).
+
+Uso:
+    SESSION_BROKER_SOCKET=/run/catalogador/broker.sock python session_broker.py
+"""
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_logger
+from cache_codec import CacheCodec
+from async_utils import CancellationToken, OperationCanceled, current_cancel_token
+
+# Configurar o logging
+logger = get_logger("session_broker", "session_broker.log")
+
+# Socket Unix do broker; vazio mantém as sessões no próprio processo (um único worker)
+SESSION_BROKER_SOCKET = os.getenv('SESSION_BROKER_SOCKET', '')
+# Tempo máximo de uma chamada ao broker sem prazo próprio (segundos)
+SESSION_BROKER_TIMEOUT = float(os.getenv('SESSION_BROKER_TIMEOUT', '600'))
+# Sessões criadas e ainda não associadas a um usuário (ex: aguardando 2FA) expiram após este tempo
+SESSION_BROKER_PENDING_TTL = int(os.getenv('SESSION_BROKER_PENDING_TTL', '900'))
+
+# Métodos da Polarium que os workers podem chamar
+BROKER_METHODS = frozenset({
+    "connect", "close", "check_connect", "get_balance", "change_balance",
+    "get_candles", "check_win", "get_profit_all",
+})
+# Métodos que aceitam cancel_token (o prazo e o cancelamento do worker são repassados)
+CANCELABLE_METHODS = frozenset({"get_candles", "check_win"})
+# Métodos do ConnectionManager disponíveis aos workers
+STATE_METHODS = frozenset({
+    "get_user_data", "get_user_state", "get_user_item", "update_user_items", "update_connection_status",
+    "update_user_state", "set_user_state", "pop_user_state", "remove_connection", "list_connections",
+    "most_recent_user", "has_connection",
+})
+# Métodos do EventBroker disponíveis aos workers
+EVENT_METHODS = frozenset({"publish", "last_event_id", "close", "remove", "wait_for_events"})
+# Métodos do JobStore disponíveis aos workers
+JOB_METHODS = frozenset({"create", "get", "update", "merge", "find_active", "list", "request_cancel", "expire"})
+# Espera máxima de uma operação "lock" no broker; o worker repete até obter o lock ou desistir
+LOCK_WAIT_SLICE = 5.0
+
+_HEADER = struct.Struct("!I")
+_codec = CacheCodec()
+
+
+class SessionBrokerError(Exception):
+    """Erro retornado pelo broker (ou falha de comunicação com ele)."""
+
+
+def send_frame(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """Envia uma mensagem (tamanho + valor codificado)."""
+    data = _codec.dumps(message)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Conexão com o broker encerrada")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    """Recebe uma mensagem enviada por send_frame."""
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _codec.loads(_recv_exact(sock, size))
+
+
+class LockTable:
+    """
+    Locks reentrantes mantidos no broker (um por usuário), compartilhados por todos os workers.
+
+    O dono é o processo e a thread do worker (como um RLock). Cada aquisição vale por um prazo:
+    se o worker morrer segurando o lock, ele é liberado quando o prazo termina.
+    """
+
+    def __init__(self, ttl: float = SESSION_BROKER_TIMEOUT):
+        """
+        Inicializa a LockTable.
+
+        Args:
+            ttl (float): Prazo em segundos de cada aquisição (padrão: SESSION_BROKER_TIMEOUT)
+        """
+        self._ttl = ttl
+        self._condition = threading.Condition()
+        self._held: Dict[str, List[Any]] = {}  # nome -> [dono, contagem, expiração]
+
+    def acquire(self, name: str, owner: str, timeout: float) -> bool:
+        """
+        Adquire um lock, aguardando no máximo timeout segundos.
+
+        Returns:
+            bool: True se o lock foi adquirido (ou readquirido pelo mesmo dono)
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                held = self._held.get(name)
+                if held is not None and held[2] <= now:
+                    logger.warning(f"Lock {name} de {held[0]} expirado, liberando")
+                    del self._held[name]
+                    held = None
+                if held is None:
+                    self._held[name] = [owner, 1, now + self._ttl]
+                    return True
+                if held[0] == owner:
+                    held[1] += 1
+                    held[2] = now + self._ttl
+                    return True
+                if now >= deadline:
+                    return False
+                self._condition.wait(min(deadline, held[2]) - now)
+
+    def lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Obtém ou renova uma concessão exclusiva por ttl segundos, sem aguardar (ex: liderança
+        do ranking global). Outro dono só a obtém depois que ela expira sem ser renovada.
+
+        Returns:
+            bool: True se a concessão pertence ao dono
+        """
+        with self._condition:
+            now = time.monotonic()
+            held = self._held.get(name)
+            if held is not None and held[0] != owner and held[2] > now:
+                return False
+            self._held[name] = [owner, 1, now + ttl]
+            return True
+
+    def release(self, name: str, owner: str) -> bool:
+        """
+        Libera uma aquisição de um lock.
+
+        Returns:
+            bool: False se o lock não pertencia ao dono (ex: expirado)
+        """
+        with self._condition:
+            held = self._held.get(name)
+            if held is None or held[0] != owner:
+                return False
+            held[1] -= 1
+            if held[1] <= 0:
+                del self._held[name]
+                self._condition.notify_all()
+            return True
+
+
+class SessionBroker:
+    """
+    Servidor do broker: mantém as instâncias Polarium e o estado dos usuários e atende
+    os workers pelo socket Unix (uma thread por conexão).
+    """
+
+    def __init__(self, path: str = SESSION_BROKER_SOCKET):
+        """
+        Inicializa o SessionBroker.
+
+        Args:
+            path (str): Caminho do socket Unix
+        """
+        # Importados aqui: os workers só precisam do cliente
+        from cache_utils import MemoryCache, approx_size
+        from connection_manager import ConnectionManager
+        from event_stream import EventBroker
+        from job_manager import JobStore
+        from polariumapi.stable_api import Polarium
+
+        self._polarium_class = Polarium
+        self._approx_size = approx_size
+        self.path = path
+        self.connections = ConnectionManager()
+        self.events = EventBroker()
+        self.jobs = JobStore()
+        self.cache = MemoryCache(quotas={})
+        self.locks = LockTable()
+        self._lock = threading.Lock()
+        # Sessões ainda sem usuário (login em andamento): chave -> (instância, criação)
+        self._pending: Dict[str, Tuple[Any, float]] = {}
+        # Tokens das chamadas em andamento, para o cancelamento pelos workers
+        self._calls: Dict[str, CancellationToken] = {}
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def _api(self, key: str) -> Any:
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending[0]
+        api_instance, _ = self.connections.get_connection(key)
+        if api_instance is None:
+            raise SessionBrokerError(f"Sessão {key} não encontrada no broker")
+        return api_instance
+
+    def _prune_pending(self) -> None:
+        """Fecha as sessões de login abandonadas (ex: 2FA não concluído)."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, created) in self._pending.items() if now - created > SESSION_BROKER_PENDING_TTL]
+            instances = [self._pending.pop(key)[0] for key in expired]
+        for api_instance in instances:
+            try:
+                api_instance.close()
+            except Exception as e:
+                logger.error(f"Erro ao fechar sessão pendente: {str(e)}")
+        if expired:
+            logger.info(f"{len(expired)} sessões pendentes expiradas")
+
+    def handle(self, message: Dict[str, Any]) -> Any:
+        """
+        Executa uma operação recebida de um worker.
+
+        Args:
+            message (dict): Operação ("op") e seus parâmetros
+
+        Returns:
+            Resultado da operação (tipos JSON)
+        """
+        op = message.get("op")
+
+        if op == "call":
+            method = message["method"]
+            if method not in BROKER_METHODS:
+                raise SessionBrokerError(f"Método {method} não permitido")
+            api_instance = self._api(message["key"])
+            kwargs = message.get("kwargs") or {}
+            call_id = message.get("id")
+            cancel_token = None
+            if method in CANCELABLE_METHODS:
+                cancel_token = CancellationToken(message.get("timeout"))
+                kwargs["cancel_token"] = cancel_token
+                with self._lock:
+                    self._calls[call_id] = cancel_token
+            try:
+                return getattr(api_instance, method)(*(message.get("args") or ()), **kwargs)
+            finally:
+                if cancel_token is not None:
+                    with self._lock:
+                        self._calls.pop(call_id, None)
+
+        if op == "cancel":
+            with self._lock:
+                cancel_token = self._calls.get(message["call_id"])
+            if cancel_token is not None:
+                cancel_token.cancel(message.get("reason") or "cancelado")
+            return cancel_token is not None
+
+        if op == "open":
+            self._prune_pending()
+            key = uuid.uuid4().hex
+            api_instance = self._polarium_class(message["email"], message["password"])
+            with self._lock:
+                self._pending[key] = (api_instance, time.time())
+            return key
+
+        if op == "adopt":
+            # Sessão de login concluída: passa a ser a conexão do usuário
+            with self._lock:
+                pending = self._pending.pop(message["key"], None)
+            if pending is None:
+                raise SessionBrokerError(f"Sessão {message['key']} não encontrada no broker")
+            self.connections.add_connection(message["user_id"], pending[0])
+            return True
+
+        if op == "state":
+            method = message["method"]
+            if method not in STATE_METHODS:
+                raise SessionBrokerError(f"Operação {method} não permitida")
+            result = getattr(self.connections, method)(*(message.get("args") or ()))
+            if method == "get_user_data" and result is not None:
+                # A instância da API e o lock não saem do broker
+                result = {k: v for k, v in result.items() if k not in ("api", "lock")}
+            return result
+
+        if op == "events":
+            method = message["method"]
+            if method not in EVENT_METHODS:
+                raise SessionBrokerError(f"Operação {method} não permitida")
+            return getattr(self.events, method)(*(message.get("args") or ()))
+
+        if op == "jobs":
+            method = message["method"]
+            if method not in JOB_METHODS:
+                raise SessionBrokerError(f"Operação {method} não permitida")
+            return getattr(self.jobs, method)(*(message.get("args") or ()))
+
+        if op == "cache_get":
+            return list(self.cache.get(message["key"]))
+
+        if op == "cache_set":
+            value = message["value"]
+            return self.cache.set(message["key"], value, self._approx_size(value), message["ttl"])
+
+        if op == "lease":
+            return self.locks.lease(message["name"], message["owner"], message["ttl"])
+
+        if op == "lock":
+            return self.locks.acquire(message["name"], message["owner"], min(message.get("timeout", 0), LOCK_WAIT_SLICE))
+
+        if op == "unlock":
+            return self.locks.release(message["name"], message["owner"])
+
+        if op == "ping":
+            return {"pid": os.getpid(), "users": len(self.connections.list_connections())}
+
+        raise SessionBrokerError(f"Operação desconhecida: {op}")
+
+    def serve_forever(self) -> None:
+        """Abre o socket Unix e atende os workers até o processo ser encerrado."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Socket de uma execução anterior
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                while True:
+                    try:
+                        message = recv_frame(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    try:
+                        reply = {"id": message.get("id"), "ok": True, "result": broker.handle(message)}
+                        data = _codec.dumps(reply)
+                    except Exception as e:
+                        if not isinstance(e, (OperationCanceled, SessionBrokerError)):
+                            logger.exception(f"Erro na operação {message.get('op')} {message.get('method', '')}: {str(e)}")
+                        data = _codec.dumps({"id": message.get("id"), "ok": False, "error": type(e).__name__, "message": str(e)})
+                    try:
+                        self.request.sendall(_HEADER.pack(len(data)) + data)
+                    except OSError:
+                        return  # Worker desistiu da chamada e fechou a conexão
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.path, 0o600)
+        logger.info(f"Broker de sessões atendendo em {self.path} (processo {os.getpid()})")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class BrokerClient:
+    """
+    Cliente do broker usado nos workers: uma conexão por thread (as chamadas bloqueantes
+    rodam nas threads do executor), reaberta se o broker for reiniciado.
+    """
+
+    def __init__(self, path: str = SESSION_BROKER_SOCKET, timeout: float = SESSION_BROKER_TIMEOUT):
+        """
+        Inicializa o BrokerClient.
+
+        Args:
+            path (str): Caminho do socket Unix do broker
+            timeout (float): Tempo máximo de uma chamada sem prazo próprio (segundos)
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None or getattr(self._local, "pid", None) != os.getpid():
+            sock = self._local.sock = self._connect()
+            self._local.pid = os.getpid()
+        return sock
+
+    def _discard(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def request(self, message: Dict[str, Any], cancel_token: Optional[CancellationToken] = None) -> Any:
+        """
+        Envia uma operação ao broker e aguarda a resposta.
+
+        Enquanto aguarda, consulta o token de cancelamento: se ele for cancelado, pede ao broker
+        que interrompa a chamada (que então responde com OperationCanceled).
+
+        Args:
+            message (dict): Operação e parâmetros
+            cancel_token (CancellationToken): Token da chamada (None: sem cancelamento)
+
+        Returns:
+            Resultado da operação
+
+        Raises:
+            OperationCanceled: Se a chamada foi cancelada
+            SessionBrokerError: Erro no broker ou na comunicação
+        """
+        message["id"] = call_id = uuid.uuid4().hex
+        for attempt in range(2):
+            sock = self._socket()
+            try:
+                send_frame(sock, message)
+                break
+            except OSError:
+                self._discard()  # Broker reiniciado: reabrir a conexão e reenviar
+                if attempt:
+                    raise SessionBrokerError(f"Broker de sessões indisponível em {self.path}")
+
+        deadline = time.monotonic() + self.timeout
+        cancel_sent = False
+        try:
+            while True:
+                if cancel_token is not None and cancel_token.canceled and not cancel_sent:
+                    self._send_cancel(call_id, cancel_token.reason)
+                    cancel_sent = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SessionBrokerError(f"Tempo esgotado aguardando o broker ({message.get('method') or message['op']})")
+                sock.settimeout(min(remaining, 0.25) if cancel_token is not None else remaining)
+                try:
+                    reply = recv_frame(sock)
+                    break
+                except socket.timeout:
+                    continue
+        except BaseException:
+            self._discard()  # Resposta pendente nesta conexão: descartá-la
+            raise
+
+        if reply.get("id") != call_id:
+            self._discard()
+            raise SessionBrokerError("Resposta fora de ordem do broker")
+        if reply["ok"]:
+            return reply["result"]
+        if reply["error"] == "OperationCanceled":
+            raise OperationCanceled(reply["message"])
+        raise SessionBrokerError(f"{reply['error']}: {reply['message']}")
+
+    def _send_cancel(self, call_id: str, reason: Optional[str]) -> None:
+        """Pede o cancelamento de uma chamada por uma conexão separada."""
+        try:
+            with self._connect() as sock:
+                send_frame(sock, {"op": "cancel", "id": uuid.uuid4().hex, "call_id": call_id, "reason": reason})
+                recv_frame(sock)
+        except OSError as e:
+            logger.error(f"Erro ao cancelar chamada no broker: {str(e)}")
+
+
+_client: Optional[BrokerClient] = None
+
+
+def get_client() -> BrokerClient:
+    """Cliente do broker deste processo."""
+    global _client
+    if _client is None:
+        _client = BrokerClient()
+    return _client
+
+
+class RemotePolarium:
+    """
+    Sessão da Polarium mantida no broker, com a mesma interface usada pela aplicação
+    (connect, get_candles, get_balance...). Guarda apenas a chave da sessão, então pode
+    ser armazenada na sessão do Flask (ex: aguardando 2FA).
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+
+    @classmethod
+    def open(cls, email: str, password: str) -> "RemotePolarium":
+        """Cria a instância Polarium no broker (sem conectar). Operação bloqueante."""
+        return cls(get_client().request({"op": "open", "email": email, "password": password}))
+
+    def __getattr__(self, method: str):
+        if method not in BROKER_METHODS:
+            raise AttributeError(method)
+
+        def call(*args, cancel_token: Optional[CancellationToken] = None, **kwargs):
+            cancel_token = cancel_token or current_cancel_token.get()
+            message = {"op": "call", "key": self.key, "method": method, "args": list(args), "kwargs": kwargs}
+            if cancel_token is not None:
+                message["timeout"] = cancel_token.remaining()
+            return get_client().request(message, cancel_token)
+
+        call.__name__ = method
+        call.__qualname__ = f"RemotePolarium.{method}"
+        return call
+
+    def __repr__(self) -> str:
+        return f"RemotePolarium({self.key!r})"
+
+
+class BrokerLock:
+    """
+    Lock reentrante de um usuário mantido no broker (ver LockTable), com a interface de um RLock.
+    Serializa as operações do usuário em todos os workers, não só no worker atual.
+    """
+
+    def __init__(self, name: str, client: Optional[BrokerClient] = None):
+        self.name = name
+        self._client = client
+
+    def _request(self, message: Dict[str, Any]) -> Any:
+        message.update({"name": self.name, "owner": f"{os.getpid()}:{threading.get_ident()}"})
+        return (self._client or get_client()).request(message)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        """
+        Adquire o lock. Enquanto aguarda, respeita o token de cancelamento do contexto
+        (ex: prazo da requisição), lançando OperationCanceled.
+
+        Args:
+            blocking (bool): Aguardar o lock (False: apenas tentar)
+            timeout (float): Espera máxima em segundos (-1: sem limite)
+
+        Returns:
+            bool: True se o lock foi adquirido
+        """
+        deadline = time.monotonic() + timeout if blocking and timeout >= 0 else None
+        cancel_token = current_cancel_token.get()
+        while True:
+            if not blocking:
+                wait = 0.0
+            elif deadline is None:
+                wait = LOCK_WAIT_SLICE
+            else:
+                wait = max(0.0, min(LOCK_WAIT_SLICE, deadline - time.monotonic()))
+            if self._request({"op": "lock", "timeout": wait}):
+                return True
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            if cancel_token is not None:
+                cancel_token.raise_if_canceled()
+
+    def release(self) -> None:
+        if not self._request({"op": "unlock"}):
+            logger.warning(f"Lock {self.name} liberado sem pertencer a esta thread (prazo expirado?)")
+
+    def __enter__(self) -> "BrokerLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+def acquire_lease(name: str, ttl: float) -> bool:
+    """
+    Obtém ou renova, para este processo, uma concessão exclusiva mantida no broker (ver LockTable.lease).
+
+    Args:
+        name (str): Nome da concessão (ex: "ranking")
+        ttl (float): Validade em segundos; o processo deve renová-la antes que expire
+
+    Returns:
+        bool: True se este processo detém a concessão
+    """
+    return get_client().request({"op": "lease", "name": name, "owner": str(os.getpid()), "ttl": ttl})
+
+
+class RemoteCache:
+    """
+    Armazenamento chave-valor com prazo de validade mantido no broker, com a interface
+    get/set do cache_manager. Usado para valores que todos os workers precisam ler
+    (ex: snapshots do ranking global) quando não há Redis.
+    """
+
+    def __init__(self, client: Optional[BrokerClient] = None):
+        self._client = client
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        hit, value = (self._client or get_client()).request({"op": "cache_get", "key": key})
+        return hit, value
+
+    def set(self, key: str, value: Any, ttl: int) -> bool:
+        return (self._client or get_client()).request({"op": "cache_set", "key": key, "value": value, "ttl": ttl})
+
+
+class RemoteConnectionManager:
+    """
+    ConnectionManager dos workers quando as sessões ficam no broker: o estado dos usuários
+    é lido e gravado no broker, item a item (get_user_state, set_user_state, update_user_items),
+    e o lock de cada usuário também fica no broker. get_user_data retorna uma cópia completa
+    do registro e deve ser evitado nos caminhos frequentes.
+    """
+
+    def __init__(self, client: Optional[BrokerClient] = None):
+        self._client = client
+
+    def _state(self, method: str, *args) -> Any:
+        return (self._client or get_client()).request({"op": "state", "method": method, "args": list(args)})
+
+    def add_connection(self, user_id: str, api_instance: RemotePolarium) -> None:
+        (self._client or get_client()).request({"op": "adopt", "key": api_instance.key, "user_id": user_id})
+        api_instance.key = user_id
+
+    def get_connection(self, user_id: str) -> Tuple[Any, bool]:
+        connected = self._state("get_user_state", user_id, "connected")
+        if connected is None:
+            return None, False
+        return RemotePolarium(user_id), connected
+
+    def get_any_connection(self) -> Tuple[Optional[str], Any]:
+        user_id = self._state("most_recent_user")
+        return (user_id, RemotePolarium(user_id)) if user_id is not None else (None, None)
+
+    def most_recent_user(self) -> Optional[str]:
+        return self._state("most_recent_user")
+
+    def has_connection(self, user_id: str) -> bool:
+        return self._state("has_connection", user_id)
+
+    def get_user_data(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user_data = self._state("get_user_data", user_id)
+        if user_data is None:
+            return None
+        user_data["api"] = RemotePolarium(user_id)
+        user_data["lock"] = BrokerLock(f"user:{user_id}", self._client)
+        return user_data
+
+    def get_user_state(self, user_id: str, key: str, default: Any = None) -> Any:
+        return self._state("get_user_state", user_id, key, default)
+
+    def get_user_item(self, user_id: str, key: str, item: str, default: Any = None) -> Any:
+        return self._state("get_user_item", user_id, key, item, default)
+
+    def get_lock(self, user_id: str) -> Optional[BrokerLock]:
+        if not self.has_connection(user_id):
+            return None
+        return BrokerLock(f"user:{user_id}", self._client)
+
+    def update_connection_status(self, user_id: str, connected: bool) -> bool:
+        return self._state("update_connection_status", user_id, connected)
+
+    def update_user_state(self, user_id: str, key: str, value: Any) -> bool:
+        return self._state("update_user_state", user_id, key, value)
+
+    def set_user_state(self, user_id: str, key: str, value: Any) -> bool:
+        return self._state("set_user_state", user_id, key, value)
+
+    def update_user_items(self, user_id: str, key: str, items: Dict[str, Any]) -> bool:
+        return self._state("update_user_items", user_id, key, items)
+
+    def pop_user_state(self, user_id: str, key: str) -> Any:
+        return self._state("pop_user_state", user_id, key)
+
+    def remove_connection(self, user_id: str) -> bool:
+        return self._state("remove_connection", user_id)
+
+    def list_connections(self) -> Dict[str, Dict[str, Any]]:
+        return self._state("list_connections")
+
+
+if __name__ == "__main__":
+    if not SESSION_BROKER_SOCKET:
+        raise SystemExit("Defina SESSION_BROKER_SOCKET com o caminho do socket do broker")
+    SessionBroker(SESSION_BROKER_SOCKET).serve_forever()
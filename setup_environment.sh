@@ -4,11 +4,13 @@
 # Criar diretórios necessários
 mkdir -p logs
 mkdir -p flask_session
+mkdir -p data
 mkdir -p __pycache__
 
 # Configurar permissões
 chmod -R 755 logs
 chmod -R 755 flask_session
+chmod -R 755 data
 
 # Instalar dependências
 pip install -r requirements.txt
@@ -0,0 +1,352 @@
+import time
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np  # Importado sob demanda: só o backtest usa as versões vetorizadas
+
+# Políticas para velas doji dentro do bloco
+DOJI_VOID = "void"      # Qualquer doji anula o bloco (sinal NULO)
+DOJI_IGNORE = "ignore"  # Dojis são ignoradas na contagem de cores
+
+
+# Códigos numéricos das direções (mesma codificação para velas e sinais)
+CALL_CODE = 1
+PUT_CODE = -1
+DOJI_CODE = 0
+
+
+def candle_direction(candle: Dict[str, Any]) -> str:
+    """Cor de uma vela: "verde", "vermelha" ou "doji"."""
+    if candle['open'] == candle['close']:
+        return "doji"
+    return "verde" if candle['open'] < candle['close'] else "vermelha"
+
+
+def candle_signal(candle: Dict[str, Any]) -> str:
+    """Direção de uma vela no formato dos sinais: "CALL", "PUT" ou "DOJI"."""
+    direction = candle_direction(candle)
+    return "DOJI" if direction == "doji" else "CALL" if direction == "verde" else "PUT"
+
+
+class Strategy(ABC):
+    """
+    Estratégia de catalogação por blocos de velas.
+
+    Cada estratégia declara o tamanho do bloco, a posição da linha, a quantidade de martingales,
+    a política para dojis, a regra do sinal (pick_signal) e a regra de apuração (settle).
+    A apuração usa as velas seguintes ao bloco: entrada na primeira e um martingale em cada uma
+    das próximas, até max_martingale.
+    """
+
+    name = ""
+    label = ""
+    block_size = 5         # Velas por bloco
+    timeframe = 60         # Duração de cada vela em segundos
+    line_offset = 30       # A linha do bloco fica este número de segundos antes do seu início
+    max_martingale = 2
+    doji_policy = DOJI_VOID
+    signal_window = None   # Quantidade de velas finais do bloco usadas no sinal (None = bloco inteiro)
+
+    def __init__(self, **overrides):
+        """
+        Args:
+            **overrides: Atributos a substituir (ex: block_size=3, max_martingale=1)
+        """
+        for key, value in overrides.items():
+            if not hasattr(self, key):
+                raise AttributeError(f"Atributo de estratégia desconhecido: {key}")
+            setattr(self, key, value)
+
+    @property
+    def block_seconds(self) -> int:
+        return self.block_size * self.timeframe
+
+    def block_start(self, timestamp: float) -> int:
+        """Início do bloco que contém o timestamp."""
+        timestamp = int(timestamp)
+        return timestamp - (timestamp % self.block_seconds)
+
+    def block_candle_times(self, block_start: int) -> List[int]:
+        """Horários das velas entre as linhas do bloco."""
+        line_start = block_start - self.line_offset
+        first = line_start + (-line_start % self.timeframe)
+        return list(range(first, line_start + self.block_seconds, self.timeframe))[:self.block_size]
+
+    def settle_candle_times(self, block_start: int) -> List[int]:
+        """Horários das velas de entrada e martingales após o bloco."""
+        line_end = block_start + self.block_seconds - self.line_offset
+        first = line_end + (-line_end % self.timeframe)
+        return [first + i * self.timeframe for i in range(self.max_martingale + 1)]
+
+    def signal(self, candles_block: List[Dict[str, Any]]) -> str:
+        """
+        Calcula o sinal de um bloco completo.
+
+        Returns:
+            str: "CALL", "PUT", "DOJI" (empate) ou "NULO" (bloco anulado)
+        """
+        window = candles_block[-self.signal_window:] if self.signal_window else candles_block
+        directions = [c['direction'] for c in window]
+
+        if self.doji_policy == DOJI_VOID and "doji" in directions:
+            return "NULO"
+
+        return self.pick_signal(directions.count("verde"), directions.count("vermelha"))
+
+    @abstractmethod
+    def pick_signal(self, verde_count: int, vermelha_count: int) -> str:
+        """Regra do sinal a partir da contagem de cores. Implementada por cada estratégia."""
+
+    @abstractmethod
+    def pick_signal_codes(self, verde_counts: "np.ndarray", vermelha_counts: "np.ndarray") -> "np.ndarray":
+        """
+        Versão vetorizada de pick_signal, usada pelo backtest.
+
+        Returns:
+            np.ndarray: Códigos dos sinais (CALL_CODE, PUT_CODE ou DOJI_CODE para empate)
+        """
+
+    def with_params(self, **overrides) -> "Strategy":
+        """Cria uma variação desta estratégia, mantendo seus parâmetros e trocando os informados (ex: block_size=3)."""
+        return type(self)(**{**vars(self), **overrides})
+
+    def settle(self, signal: str, settle_candles: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Apura o resultado de um sinal com as velas de entrada e martingales já fechadas.
+
+        Args:
+            signal (str): Sinal do bloco
+            settle_candles: Velas de apuração em ordem; None para velas ainda não fechadas
+
+        Returns:
+            dict: {"result", "martingale"} ou None se ainda não houver resultado definitivo
+        """
+        if signal == "NULO":
+            return {"result": "NULO", "martingale": "NULO"}
+
+        for i, candle in enumerate(settle_candles):
+            if candle is None:
+                return None
+            if candle_signal(candle) == signal:
+                return {"result": "WIN", "martingale": i}
+        return {"result": "LOSS", "martingale": self.max_martingale}
+
+
+class MinorityStrategy(Strategy):
+    """Estratégia da minoria: entrada na cor com menos velas no bloco."""
+
+    name = "minoria"
+    label = "Minoria"
+
+    def pick_signal(self, verde_count, vermelha_count):
+        if verde_count < vermelha_count:
+            return "CALL"
+        if vermelha_count < verde_count:
+            return "PUT"
+        return "DOJI"  # Igual número de verdes e vermelhas
+
+    def pick_signal_codes(self, verde_counts, vermelha_counts):
+        import numpy as np
+        return np.sign(vermelha_counts.astype(np.int16) - verde_counts).astype(np.int8)
+
+
+class MajorityStrategy(Strategy):
+    """Estratégia da maioria: entrada na cor com mais velas no bloco."""
+
+    name = "maioria"
+    label = "Maioria"
+
+    def pick_signal(self, verde_count, vermelha_count):
+        if verde_count > vermelha_count:
+            return "CALL"
+        if vermelha_count > verde_count:
+            return "PUT"
+        return "DOJI"
+
+    def pick_signal_codes(self, verde_counts, vermelha_counts):
+        import numpy as np
+        return np.sign(verde_counts.astype(np.int16) - vermelha_counts).astype(np.int8)
+
+
+class MHIStrategy(MinorityStrategy):
+    """MHI: minoria das 3 últimas velas do bloco."""
+
+    name = "mhi"
+    label = "MHI"
+    signal_window = 3
+
+
+# Estratégias disponíveis para catalogação
+STRATEGIES: Dict[str, Strategy] = {
+    strategy.name: strategy
+    for strategy in (MinorityStrategy(), MajorityStrategy(), MHIStrategy())
+}
+
+
+def candles_needed(strategies: Iterable[Strategy], num_blocks: int) -> int:
+    """Quantidade de velas necessária para avaliar num_blocks blocos de todas as estratégias."""
+    return max(
+        (num_blocks + 1) * s.block_seconds // s.timeframe + s.max_martingale + 1
+        for s in strategies
+    )
+
+
+def evaluate_strategies(candles: List[Dict[str, Any]], strategies: Iterable[Strategy], num_blocks: int,
+                        current_time: Optional[float] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Avalia várias estratégias sobre a mesma série de velas em memória.
+
+    As velas são indexadas por horário em uma única passagem; cada estratégia consulta o índice
+    para montar seus blocos e apurar entrada e martingales. Só velas já fechadas são consideradas.
+
+    Args:
+        candles: Velas no formato da API (from, open, close, min, max)
+        strategies: Estratégias a avaliar
+        num_blocks (int): Quantidade de blocos (contando o bloco atual) de cada estratégia
+        current_time (float): Instante de referência (padrão: agora)
+
+    Returns:
+        dict: Blocos analisados por nome de estratégia, em ordem cronológica
+    """
+    current_time = int(current_time if current_time is not None else time.time())
+    strategies = list(strategies)
+    timeframe = strategies[0].timeframe if strategies else 60
+
+    closed = {}
+    for candle in candles:
+        if candle['from'] + timeframe <= current_time:
+            closed[candle['from']] = {
+                "time": candle['from'],
+                "direction": candle_direction(candle),
+                "open": candle['open'],
+                "close": candle['close'],
+                "high": candle['max'],
+                "low": candle['min']
+            }
+
+    results = {}
+    for strategy in strategies:
+        current_block = strategy.block_start(current_time)
+        blocks = []
+
+        for i in reversed(range(num_blocks)):
+            block_time = current_block - i * strategy.block_seconds
+            candles_block = [closed[t] for t in strategy.block_candle_times(block_time) if t in closed]
+            if len(candles_block) != strategy.block_size:  # Só considerar blocos completos
+                continue
+
+            signal = strategy.signal(candles_block)
+            settle_candles = [closed.get(t) for t in strategy.settle_candle_times(block_time)]
+            result_data = strategy.settle(signal, settle_candles)
+
+            blocks.append({
+                "block_time": block_time,
+                "time_str": datetime.fromtimestamp(block_time).strftime("%H:%M"),
+                "verde_count": sum(1 for c in candles_block if c['direction'] == "verde"),
+                "vermelha_count": sum(1 for c in candles_block if c['direction'] == "vermelha"),
+                "signal": signal,
+                "candles": candles_block,
+                "result": result_data["result"] if result_data else None,
+                "martingale": result_data["martingale"] if result_data else None
+            })
+
+        results[strategy.name] = blocks
+
+    return results
+
+
+def compute_block_stats(blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Calcula as estatísticas (vitórias, derrotas, martingales) de uma lista de blocos analisados.
+
+    Args:
+        blocks: Blocos no formato retornado por evaluate_strategies
+
+    Returns:
+        dict: Estatísticas dos blocos com resultado definido
+    """
+    wins = 0
+    losses = 0
+    direct_wins = 0
+    martingale1_wins = 0
+    martingale2_wins = 0
+    total_blocks = 0
+
+    for block in blocks:
+        if block["result"] is not None and block["result"] != "NULO":
+            total_blocks += 1
+
+            if block["result"] == "WIN":
+                wins += 1
+                if block["martingale"] == 0:
+                    direct_wins += 1
+                elif block["martingale"] == 1:
+                    martingale1_wins += 1
+                elif block["martingale"] == 2:
+                    martingale2_wins += 1
+            elif block["result"] == "LOSS":
+                losses += 1
+
+    return {
+        "wins": wins,
+        "losses": losses,
+        "win_rate": round((wins / total_blocks * 100) if total_blocks > 0 else 0, 2),
+        "martingale1_wins": martingale1_wins,
+        "martingale2_wins": martingale2_wins,
+        "direct_wins": direct_wins,
+        "analyzed_blocks": total_blocks,
+        "last_update": int(time.time())
+    }
+
+
+# Velas em colunas: horários, aberturas, fechamentos, mínimas e máximas
+CandleColumns = Tuple[array, array, array, array, array]
+
+
+def candle_columns(candles: List[Dict[str, Any]]) -> CandleColumns:
+    """
+    Converte velas no formato da API em colunas compactas (arrays), baratas de enviar a outro processo.
+
+    Args:
+        candles: Velas no formato da API (from, open, close, min, max)
+
+    Returns:
+        tuple: Arrays (from, open, close, min, max)
+    """
+    return (
+        array('q', [int(c['from']) for c in candles]),
+        array('d', [c['open'] for c in candles]),
+        array('d', [c['close'] for c in candles]),
+        array('d', [c['min'] for c in candles]),
+        array('d', [c['max'] for c in candles]),
+    )
+
+
+def score_candle_columns(columns: CandleColumns, strategy_name: str, num_blocks: int,
+                         current_time: float) -> Optional[Dict[str, Any]]:
+    """
+    Avalia uma estratégia sobre velas em colunas e retorna apenas as estatísticas dos blocos.
+
+    Usada pelos rankings no pool de processos (async_utils.run_cpu_func): entrada e saída
+    compactas, sem os blocos e velas necessários apenas para a tela.
+
+    Args:
+        columns: Velas no formato de candle_columns
+        strategy_name (str): Nome da estratégia (chave de STRATEGIES)
+        num_blocks (int): Quantidade de blocos (contando o bloco atual)
+        current_time (float): Instante de referência
+
+    Returns:
+        dict: Estatísticas (compute_block_stats) ou None se nenhum bloco completo foi encontrado
+    """
+    candles = [
+        {"from": t, "open": o, "close": c, "min": low, "max": high}
+        for t, o, c, low, high in zip(*columns)
+    ]
+    blocks = evaluate_strategies(candles, [STRATEGIES[strategy_name]], num_blocks, current_time)[strategy_name]
+    if not blocks:
+        return None
+    return compute_block_stats(blocks)
@@ -0,0 +1,156 @@
+import fnmatch
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# Os módulos da aplicação ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Os testes das rotas não iniciam a varredura do ranking global nem usam o broker de sessões
+os.environ.setdefault('RANKING_SERVICE_ENABLED', 'false')
+os.environ.pop('SESSION_BROKER_SOCKET', None)
+
+# Os handlers de log guardam o stderr capturado pelo pytest, já fechado quando o atexit de main roda
+logging.raiseExceptions = False
+
+
+def wait_until(predicate, timeout=5.0, interval=0.01):
+    """Aguarda até predicate() ser verdadeiro ou o tempo esgotar; retorna o último valor."""
+    deadline = time.monotonic() + timeout
+    while True:
+        value = predicate()
+        if value or time.monotonic() >= deadline:
+            return value
+        time.sleep(interval)
+
+
+class FakeRedisServer:
+    """Dados e canais de pub/sub compartilhados pelos clientes FakeRedis (como um servidor Redis)."""
+
+    def __init__(self):
+        self.data = {}  # chave -> (valor, expira_em)
+        self.channels = {}  # canal -> filas dos assinantes
+        self.lock = threading.Lock()
+
+
+class FakeRedis:
+    """
+    Cliente Redis em memória com os comandos usados pelo CacheManager. Os comandos recebidos
+    ficam em commands, para verificar idas ao servidor (pipeline) e o uso de SCAN em vez de KEYS.
+    """
+
+    def __init__(self, server=None):
+        self.server = server or FakeRedisServer()
+        self.commands = []
+
+    def _live(self, key):
+        item = self.server.data.get(key)
+        if item is not None and item[1] <= time.monotonic():
+            del self.server.data[key]
+            item = None
+        return item
+
+    def ping(self):
+        self.commands.append("ping")
+        return True
+
+    def get(self, key):
+        self.commands.append("get")
+        with self.server.lock:
+            item = self._live(key)
+        return item[0] if item else None
+
+    def pttl(self, key):
+        self.commands.append("pttl")
+        with self.server.lock:
+            item = self._live(key)
+        return int((item[1] - time.monotonic()) * 1000) if item else -2
+
+    def setex(self, key, ttl, value):
+        self.commands.append("setex")
+        with self.server.lock:
+            self.server.data[key] = (value, time.monotonic() + ttl)
+        return True
+
+    def delete(self, *keys):
+        self.commands.append("delete")
+        with self.server.lock:
+            return sum(self.server.data.pop(key, None) is not None for key in keys)
+
+    def unlink(self, *keys):
+        self.commands.append("unlink")
+        with self.server.lock:
+            return sum(self.server.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match="*", count=None):
+        self.commands.append("scan")
+        with self.server.lock:
+            keys = [key for key in self.server.data if fnmatch.fnmatchcase(key, match)]
+        yield from keys
+
+    def pipeline(self, transaction=True):
+        self.commands.append("pipeline")
+        return FakePipeline(self)
+
+    def publish(self, channel, message):
+        with self.server.lock:
+            queues = list(self.server.channels.get(channel, []))
+        for q in queues:
+            q.put({"type": "message", "channel": channel, "data": message.encode()})
+        return len(queues)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self.server)
+
+    def info(self, section=None):
+        return {"evicted_keys": 0, "expired_keys": 0, "keyspace_hits": 0, "keyspace_misses": 0}
+
+    def close(self):
+        pass
+
+
+class FakePipeline:
+    """Pipeline do FakeRedis: os comandos são enfileirados e executados juntos em execute()."""
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        return lambda *args, **kwargs: self._calls.append((method, args, kwargs))
+
+    def execute(self):
+        commands = list(self._client.commands)
+        replies = [method(*args, **kwargs) for method, args, kwargs in self._calls]
+        self._client.commands = commands + ["execute"]
+        return replies
+
+
+class FakePubSub:
+    """Assinatura de canais do FakeRedis; listen() bloqueia até chegar uma mensagem ou close()."""
+
+    def __init__(self, server):
+        self._server = server
+        self._queue = queue.Queue()
+
+    def subscribe(self, channel):
+        with self._server.lock:
+            self._server.channels.setdefault(channel, []).append(self._queue)
+
+    def listen(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        with self._server.lock:
+            for queues in self._server.channels.values():
+                if self._queue in queues:
+                    queues.remove(self._queue)
+        self._queue.put(None)
@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pytest
+
+from backtest import MISSING_CODE, build_direction_series, evaluate_series, summarize
+from strategies import CALL_CODE, DOJI_CODE, DOJI_IGNORE, DOJI_VOID, PUT_CODE, STRATEGIES, evaluate_strategies
+
+START = 1700000100  # Meio de um bloco de 5 minutos: o primeiro bloco da série fica incompleto
+
+
+def make_candles(count, seed=11, gaps=()):
+    """Velas de 1 minuto determinísticas, com ~10% de dojis e lacunas nas posições informadas."""
+    rng = random.Random(seed)
+    candles = []
+    for i in range(count):
+        o = round(1 + rng.random(), 5)
+        c = o if rng.random() < 0.1 else round(o + rng.choice([-1, 1]) * rng.random() / 100, 5)
+        if i not in gaps:
+            candles.append({'from': START + i * 60, 'open': o, 'close': c, 'min': min(o, c), 'max': max(o, c)})
+    return candles
+
+
+def online_outcomes(candles, strategy, current_time):
+    """Blocos decididos (vitória ou derrota) segundo o motor usado pelas rotas."""
+    num_blocks = (current_time - START) // strategy.block_seconds + 2
+    blocks = evaluate_strategies(candles, [strategy], num_blocks, current_time)[strategy.name]
+    return [
+        (b["block_time"], b["result"] == "WIN", b["martingale"] if b["result"] == "WIN" else 0)
+        for b in blocks if b["result"] in ("WIN", "LOSS")
+    ]
+
+
+def test_direction_series_marks_gaps():
+    candles = make_candles(6, gaps={2})
+    t0, directions = build_direction_series(candles)
+    assert t0 == START
+    assert len(directions) == 6
+    assert directions[2] == MISSING_CODE
+    assert set(directions.tolist()) <= {CALL_CODE, PUT_CODE, DOJI_CODE, MISSING_CODE}
+
+
+@pytest.mark.parametrize("name", sorted(STRATEGIES))
+@pytest.mark.parametrize("doji_policy", [DOJI_VOID, DOJI_IGNORE])
+@pytest.mark.parametrize("block_size,max_martingale", [(5, 2), (3, 1)])
+def test_vectorized_backtest_matches_the_online_engine(name, doji_policy, block_size, max_martingale):
+    candles = make_candles(600, gaps={37, 38, 250, 401})
+    current_time = candles[-1]['from'] + 60
+    params = {"strategy": name, "block_size": block_size, "line_offset": 30,
+              "max_martingale": max_martingale, "doji_policy": doji_policy}
+    strategy = STRATEGIES[name].with_params(block_size=block_size, max_martingale=max_martingale,
+                                            doji_policy=doji_policy)
+
+    t0, directions = build_direction_series(candles)
+    outcomes = evaluate_series(directions, t0, 60, params)
+    vectorized = list(zip(outcomes["block_time"].tolist(), outcomes["win"].tolist(),
+                          np.where(outcomes["win"], outcomes["level"], 0).tolist()))
+
+    expected = online_outcomes(candles, strategy, current_time)
+    assert expected
+    assert vectorized == expected
+
+
+def test_summary_counts_levels_and_profit():
+    outcomes = {
+        "block_time": np.array([0, 300, 600, 900]),
+        "win": np.array([True, True, False, True]),
+        "level": np.array([0, 2, 0, 1])
+    }
+    summary = summarize(outcomes, max_martingale=2, payout=0.8, multiplier=2.0)
+    assert (summary["operations"], summary["wins"], summary["losses"]) == (4, 3, 1)
+    assert summary["wins_by_level"] == [1, 1, 1]
+    # Vitória na entrada: +0.8; no G2: 3.2 - 3; derrota: -7; no G1: 1.6 - 1
+    assert summary["profit"] == round(0.8 + 0.2 - 7 + 0.6, 2)
+    assert summary["max_loss_streak"] == 1
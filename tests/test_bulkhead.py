@@ -0,0 +1,136 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from async_utils import (CALL_CLASS_BATCH, CALL_CLASS_CONTROL, CALL_CLASS_INTERACTIVE, BulkheadScheduler,
+                         CancellationToken)
+from conftest import wait_until
+
+
+@pytest.fixture
+def pool():
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=16)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+class Recorder:
+    """Chamadas bloqueantes de teste: registram a ordem e a concorrência e aguardam a liberação."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.order = []
+        self.running = {}
+        self.peak = {}
+
+    def call(self, label, group):
+        def fn():
+            with self.lock:
+                self.order.append(label)
+                self.running[group] = self.running.get(group, 0) + 1
+                self.peak[group] = max(self.peak.get(group, 0), self.running[group])
+            self.release.wait(5)
+            with self.lock:
+                self.running[group] -= 1
+            return label
+        return fn
+
+
+def test_user_limit(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=10, user_limit=2, class_limits={})
+    recorder = Recorder()
+    futures = [scheduler.submit(recorder.call(f"u1-{i}", "u1"), "u1") for i in range(6)]
+    futures.append(scheduler.submit(recorder.call("u2-0", "u2"), "u2"))
+
+    assert wait_until(lambda: len(recorder.order) == 3)
+    stats = scheduler.stats()
+    assert stats["users"]["u1"] == {"active": 2, "queued": 4}
+    assert stats["users"]["u2"] == {"active": 1, "queued": 0}
+
+    recorder.release.set()
+    assert [f.result(5) for f in futures][-1] == "u2-0"
+    assert recorder.peak == {"u1": 2, "u2": 1}
+    assert wait_until(lambda: scheduler.stats()["active"] == 0)
+
+
+def test_users_take_turns_under_the_global_limit(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={})
+    recorder = Recorder()
+    futures = [scheduler.submit(recorder.call(f"a{i}", "all"), "a") for i in range(4)]
+    futures.append(scheduler.submit(recorder.call("b0", "all"), "b"))
+
+    # Os usuários com chamadas pendentes se alternam: "b" não espera todas as chamadas de "a"
+    recorder.release.set()
+    concurrent.futures.wait(futures, 5)
+    assert recorder.order == ["a0", "a1", "b0", "a2", "a3"]
+    assert recorder.peak == {"all": 1}
+
+
+def test_calls_without_user_are_not_limited(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=10, user_limit=1, class_limits={})
+    recorder = Recorder()
+    futures = [scheduler.submit(recorder.call(i, "none")) for i in range(3)]
+    assert wait_until(lambda: recorder.peak.get("none") == 3)
+    recorder.release.set()
+    concurrent.futures.wait(futures, 5)
+
+
+def test_canceled_call_is_discarded_before_running(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={})
+    recorder = Recorder()
+    first = scheduler.submit(recorder.call("first", "all"), "u1")
+    token = CancellationToken()
+    second = scheduler.submit(recorder.call("second", "all"), "u1", cancel_token=token)
+    token.cancel()
+    recorder.release.set()
+
+    assert first.result(5) == "first"
+    assert wait_until(second.cancelled)
+    assert recorder.order == ["first"]
+
+
+def test_class_limit_keeps_room_for_interactive_calls(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=4, user_limit=0, class_limits={CALL_CLASS_BATCH: 1})
+    recorder = Recorder()
+    batch = [scheduler.submit(recorder.call(f"batch{i}", "batch"), "u1", CALL_CLASS_BATCH) for i in range(3)]
+    interactive = [scheduler.submit(recorder.call(f"inter{i}", "interactive"), "u2") for i in range(2)]
+
+    assert wait_until(lambda: len(recorder.order) == 3)
+    classes = scheduler.stats()["classes"]
+    assert (classes[CALL_CLASS_BATCH]["active"], classes[CALL_CLASS_BATCH]["queued"]) == (1, 2)
+    assert (classes[CALL_CLASS_INTERACTIVE]["active"], classes[CALL_CLASS_INTERACTIVE]["queued"]) == (2, 0)
+
+    recorder.release.set()
+    concurrent.futures.wait(batch + interactive, 5)
+    assert recorder.peak == {"batch": 1, "interactive": 2}
+
+
+def test_classes_are_served_by_priority(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={}, aging_seconds=60)
+    recorder = Recorder()
+    futures = [scheduler.submit(recorder.call("first", "all"), "u1", CALL_CLASS_BATCH)]
+    for call_class in (CALL_CLASS_BATCH, CALL_CLASS_INTERACTIVE, CALL_CLASS_CONTROL):
+        futures.append(scheduler.submit(recorder.call(call_class, "all"), "u1", call_class))
+
+    recorder.release.set()
+    concurrent.futures.wait(futures, 5)
+    assert recorder.order == ["first", CALL_CLASS_CONTROL, CALL_CLASS_INTERACTIVE, CALL_CLASS_BATCH]
+
+
+def test_waiting_batch_calls_age_into_priority(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={}, aging_seconds=0.05)
+    recorder = Recorder()
+    futures = [
+        scheduler.submit(recorder.call("first", "all"), "u1", CALL_CLASS_INTERACTIVE),
+        scheduler.submit(recorder.call("batch", "all"), "u1", CALL_CLASS_BATCH),
+    ]
+    # Após várias vezes aging_seconds na fila, a chamada de lote passa à frente de uma interativa nova
+    time.sleep(0.3)
+    futures.append(scheduler.submit(recorder.call("interactive", "all"), "u2", CALL_CLASS_INTERACTIVE))
+
+    recorder.release.set()
+    concurrent.futures.wait(futures, 5)
+    assert recorder.order == ["first", "batch", "interactive"]
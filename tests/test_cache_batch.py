@@ -0,0 +1,88 @@
+import pytest
+
+import cache_utils
+from cache_utils import CacheManager
+from conftest import FakeRedis, FakeRedisServer
+
+CANDLES = {f"candles:EURUSD:{i}": [{"from": 1700000000 + i * 60, "close": 1.085}] for i in range(5)}
+
+
+@pytest.fixture
+def memory_cache():
+    cache = CacheManager()
+    yield cache
+    cache.cleanup()
+
+
+@pytest.fixture
+def server():
+    return FakeRedisServer()
+
+
+@pytest.fixture
+def redis_cache(server):
+    cache = CacheManager()
+    cache._attach_redis(FakeRedis(server))
+    yield cache
+    cache.cleanup()
+
+
+def round_trips(client):
+    """Comandos enviados ao servidor, contando cada pipeline como uma ida."""
+    return [command for command in client.commands if command not in ("ping", "pipeline")]
+
+
+def test_memory_get_many_returns_only_the_keys_found(memory_cache):
+    assert memory_cache.set_many(CANDLES, ttl=60)
+    keys = list(CANDLES) + ["candles:EURUSD:missing"]
+    assert memory_cache.get_many(keys) == CANDLES
+    assert memory_cache.get_many([]) == {}
+
+
+def test_memory_clear_removes_only_the_pattern(memory_cache):
+    memory_cache.set_many(CANDLES, ttl=60)
+    memory_cache.set("chart:EURUSD", {"x": 1}, ttl=60)
+    assert memory_cache.clear("candles:EURUSD:*")
+    assert memory_cache.get_many(list(CANDLES)) == {}
+    assert memory_cache.get("chart:EURUSD") == (True, {"x": 1})
+
+
+def test_redis_set_many_and_get_many_use_one_pipeline_each(server, redis_cache):
+    assert redis_cache.set_many(CANDLES, ttl=60)
+    assert round_trips(redis_cache.redis_client) == ["execute"]
+    assert len(server.data) == 5
+
+    # Outro worker, com o cache local vazio: todas as chaves em uma única ida ao Redis
+    other = CacheManager()
+    other._attach_redis(FakeRedis(server))
+    try:
+        keys = list(CANDLES) + ["candles:EURUSD:missing"]
+        assert other.get_many(keys) == CANDLES
+        assert round_trips(other.redis_client) == ["execute"]
+
+        # A segunda leitura vem do cache local (L1), sem ir ao Redis
+        assert other.get_many(list(CANDLES)) == CANDLES
+        assert round_trips(other.redis_client) == ["execute"]
+    finally:
+        other.cleanup()
+
+
+def test_redis_get_many_splits_large_batches(monkeypatch, server, redis_cache):
+    monkeypatch.setattr(cache_utils, "CACHE_BATCH_SIZE", 2)
+    writer = FakeRedis(server)
+    for key, value in CANDLES.items():
+        writer.setex(key, 60, redis_cache.codec.dumps(value))
+    assert redis_cache.get_many(list(CANDLES)) == CANDLES
+    assert round_trips(redis_cache.redis_client) == ["execute"] * 3
+
+
+def test_redis_clear_scans_and_unlinks_in_batches(monkeypatch, server, redis_cache):
+    monkeypatch.setattr(cache_utils, "CACHE_BATCH_SIZE", 2)
+    redis_cache.set_many(CANDLES, ttl=60)
+    redis_cache.set("chart:EURUSD", {"x": 1}, ttl=60)
+    redis_cache.redis_client.commands.clear()
+
+    assert redis_cache.clear("candles:EURUSD:*")
+    assert redis_cache.redis_client.commands == ["scan", "unlink", "unlink", "unlink"]
+    assert list(server.data) == ["chart:EURUSD"]
+    assert redis_cache.get_many(list(CANDLES)) == {}
@@ -0,0 +1,119 @@
+import json
+import os
+import zlib
+
+import pytest
+
+from cache_codec import COMPRESSOR_IDS, COMPRESSOR_MASK, SERIALIZER_IDS, CacheCodec
+
+VALUE = {
+    "success": True,
+    "data": [
+        {"from": 1700000100 + i * 60, "open": 1.08512, "close": 1.08498, "min": 1.0849, "max": 1.0852, "volume": 12}
+        for i in range(3)
+    ],
+    "ativo": "EUR/USD (OTC)",
+    "vazio": None,
+    "lista": [],
+}
+
+
+def available_serializers():
+    names = []
+    for name in SERIALIZER_IDS:
+        codec = CacheCodec(serializer=name, compression="none")
+        if codec.serializer == name:
+            names.append(name)
+    return names
+
+
+@pytest.mark.parametrize("serializer", available_serializers())
+def test_round_trip(serializer):
+    codec = CacheCodec(serializer=serializer, compression="none")
+    data = codec.dumps(VALUE)
+    assert data[0] == SERIALIZER_IDS[serializer]
+    assert codec.loads(data) == VALUE
+
+
+@pytest.mark.parametrize("value", [VALUE, [1, 2, 3], "texto", 42, 1.5, True, None])
+def test_reads_legacy_json_values(value):
+    # Valores gravados antes do cabeçalho: JSON puro
+    codec = CacheCodec()
+    assert codec.loads(json.dumps(value).encode()) == value
+    assert codec.loads(json.dumps(value, separators=(",", ":")).encode()) == value
+
+
+@pytest.mark.parametrize("writer", available_serializers())
+def test_reads_values_written_with_another_serializer(writer):
+    data = CacheCodec(serializer=writer, compression="none").dumps(VALUE)
+    for reader in available_serializers():
+        assert CacheCodec(serializer=reader, compression="none").loads(data) == VALUE
+
+
+def test_unavailable_serializer_falls_back_to_json():
+    codec = CacheCodec(serializer="inexistente")
+    assert codec.serializer == "json"
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+
+
+def test_large_values_are_compressed():
+    codec = CacheCodec(serializer="json", compression="zlib", compress_threshold=256)
+    candles = [{"from": 1700000100 + i * 60, "open": 1.085, "close": 1.086} for i in range(200)]
+    data = codec.dumps(candles)
+    assert data[0] & COMPRESSOR_MASK == COMPRESSOR_IDS["zlib"]
+    assert len(data) < len(json.dumps(candles))
+    assert codec.loads(data) == candles
+    stats = codec.stats()
+    assert stats["compressed_values"] == 1 and stats["compression_ratio"] > 1
+
+
+def test_incompressible_values_are_stored_raw_and_not_counted():
+    codec = CacheCodec(serializer="json", compression="zlib", compress_threshold=16)
+    value = os.urandom(512).hex()[:40]  # Curto demais para a compressão compensar
+    data = codec.dumps(value)
+    assert data[0] & COMPRESSOR_MASK == 0
+    assert codec.loads(data) == value
+    assert codec.stats()["compressed_values"] == 0
+    assert codec.threshold == 16
+    assert CacheCodec(compression="none", compress_threshold=16).threshold == 0
+
+
+def test_reads_values_compressed_with_the_previous_zlib_flag():
+    # Antes dos compressores plugáveis, 0x04 indicava zlib
+    payload = json.dumps(VALUE, separators=(",", ":")).encode()
+    data = bytes((SERIALIZER_IDS["json"] | 0x04,)) + zlib.compress(payload)
+    assert CacheCodec().loads(data) == VALUE
+
+
+def candles(count):
+    return [{'id': i, 'from': 1700000000 + 60 * i, 'open': 1.1, 'close': 1.2, 'min': 1.0, 'max': 1.3, 'volume': 0}
+            for i in range(count)]
+
+
+def test_memory_cache_keeps_large_candle_lists_compressed():
+    from cache_utils import CacheManager, PackedValue
+
+    cache = CacheManager()
+    value = candles(550)
+    assert cache.set('candles:EURUSD:60', value)
+
+    hit, stored = cache.memory.get('candles:EURUSD:60')
+    assert hit and isinstance(stored, PackedValue)
+    assert len(stored.data) < len(json.dumps(value)) // 3
+    assert cache.get('candles:EURUSD:60') == (True, value)
+
+
+def test_memory_cache_threshold_uses_the_encoded_size():
+    from cache_utils import CacheManager, PackedValue
+
+    cache = CacheManager()
+    small = candles(2)
+    assert len(cache.codec.dumps(small)) < cache.codec.threshold
+    cache.set('candles:EURUSD:60', small)
+    assert cache.memory.get('candles:EURUSD:60') == (True, small)
+
+    # Outros prefixos continuam guardando o próprio objeto
+    large = candles(550)
+    cache.set('chart:EURUSD', large)
+    hit, stored = cache.memory.get('chart:EURUSD')
+    assert stored is large and not isinstance(stored, PackedValue)
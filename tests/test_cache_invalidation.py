@@ -0,0 +1,81 @@
+import pytest
+
+from cache_utils import CACHE_INVALIDATION_CHANNEL, CacheManager
+from conftest import FakeRedis, FakeRedisServer, wait_until
+
+
+@pytest.fixture
+def server():
+    return FakeRedisServer()
+
+
+@pytest.fixture
+def workers(server):
+    """Dois caches com Redis compartilhado, como dois workers do Gunicorn."""
+    caches = []
+    for _ in range(2):
+        cache = CacheManager()
+        cache._attach_redis(FakeRedis(server))
+        cache._bus.ensure_started()
+        caches.append(cache)
+    # Os dois já assinam o canal (e já receberam o "reset" da conexão)
+    assert wait_until(lambda: len(server.channels.get(CACHE_INVALIDATION_CHANNEL, [])) == 2)
+    yield caches
+    for cache in caches:
+        cache.cleanup()
+
+
+def in_l1(cache, key):
+    return cache.memory.get(key)[0]
+
+
+def test_set_in_one_worker_discards_the_other_workers_copy(workers):
+    first, second = workers
+    first.set("payout:all", {"EURUSD": 85}, ttl=60)
+    assert second.get("payout:all") == (True, {"EURUSD": 85})
+    assert in_l1(second, "payout:all")
+
+    first.set("payout:all", {"EURUSD": 90}, ttl=60)
+    assert wait_until(lambda: not in_l1(second, "payout:all"))
+    assert second.get("payout:all") == (True, {"EURUSD": 90})
+    # Quem gravou mantém a própria cópia
+    assert in_l1(first, "payout:all")
+
+
+def test_delete_and_clear_reach_the_other_workers(workers):
+    first, second = workers
+    first.set_many({"candles:EURUSD:1": [1], "candles:EURUSD:2": [2], "chart:EURUSD": [3]}, ttl=60)
+    assert second.get_many(["candles:EURUSD:1", "candles:EURUSD:2", "chart:EURUSD"])
+
+    first.delete("chart:EURUSD")
+    assert wait_until(lambda: not in_l1(second, "chart:EURUSD"))
+    first.clear("candles:EURUSD:*")
+    assert wait_until(lambda: second.memory.keys() == [])
+    assert second.get("candles:EURUSD:1") == (False, None)
+
+
+def test_reconnect_resets_the_local_cache(workers):
+    first, second = workers
+    first.set("payout:all", {"EURUSD": 85}, ttl=60)
+    second.get("payout:all")
+
+    assert in_l1(second, "payout:all")
+
+    # Conexão de pub/sub perdida: invalidações podem ter sido perdidas, o L1 é descartado ao reconectar
+    dropped = second._bus._pubsub
+    dropped._queue.put(None)
+    assert wait_until(lambda: second._bus._pubsub is not dropped)
+    assert wait_until(lambda: not in_l1(second, "payout:all"))
+
+
+def test_memory_caches_in_one_process_invalidate_each_other():
+    first, second = CacheManager(), CacheManager()
+    try:
+        first.set("ranking:10", [1], ttl=60)
+        second.set("ranking:10", [1], ttl=60)
+        first.set("ranking:10", [2], ttl=60)
+        assert second.get("ranking:10") == (False, None)
+        assert first.get("ranking:10") == (True, [2])
+    finally:
+        first.cleanup()
+        second.cleanup()
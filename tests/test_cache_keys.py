@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import uuid
+from datetime import datetime
+from enum import Enum
+
+import pytest
+
+from cache_utils import CacheManager, encode_key_args, key_digest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Argumentos cujo hash() muda entre processos (str em conjuntos e dicionários) ou sem ordem definida
+ARGS = """(
+    "EURUSD", 1, 300, 1.5, None, True, b"raw",
+    {"GBPUSD", "EURUSD", "USDJPY"},
+    frozenset({"a", "b"}),
+    {"timeframe": 60, "ativos": ["EURUSD", "GBPUSD"], "extra": {"z": 1, "a": 2}},
+    datetime(2024, 1, 2, 3, 4, 5),
+    uuid.UUID("12345678-1234-5678-1234-567812345678"),
+)"""
+
+PROBE = f"""
+import uuid
+from datetime import datetime
+from cache_utils import CacheManager
+args = {ARGS}
+print(CacheManager()._generate_key("analise", *args, num_blocks=10, strategy="minoria"))
+"""
+
+
+def key_in_process(seed, tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONHASHSEED=str(seed), LOGS_DIR=str(tmp_path / "logs"))
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert output.returncode == 0, output.stderr
+    return output.stdout.strip().splitlines()[-1]
+
+
+def test_keys_are_the_same_in_every_process(tmp_path):
+    keys = {key_in_process(seed, tmp_path) for seed in (0, 1, 12345)}
+    args = eval(ARGS)
+    local = CacheManager()._generate_key("analise", *args, num_blocks=10, strategy="minoria")
+    assert keys == {local}
+    assert local.startswith("analise:")
+
+
+def test_key_ignores_dict_and_keyword_order():
+    assert encode_key_args({"a": 1, "b": 2}, x=1, y=2) == encode_key_args({"b": 2, "a": 1}, y=2, x=1)
+
+
+@pytest.mark.parametrize("first, second", [
+    (1, True), (1, 1.0), (1, "1"), ("ab", b"ab"), ([1, 2], (1, 2)), (("a", "b"), ("ab",)), (None, "None"),
+])
+def test_different_values_give_different_keys(first, second):
+    assert key_digest(encode_key_args(first)) != key_digest(encode_key_args(second))
+
+
+def test_objects_need_a_stable_representation():
+    class Timeframe(Enum):
+        M1 = 60
+
+    class Strategy:
+        def __init__(self, blocks):
+            self.blocks = blocks
+
+        def __cache_key__(self):
+            return {"blocks": self.blocks}
+
+    assert encode_key_args(Timeframe.M1) != encode_key_args(60)
+    assert encode_key_args(Strategy(10)) == encode_key_args(Strategy(10))
+    assert encode_key_args(Strategy(10)) != encode_key_args(Strategy(12))
+    with pytest.raises(TypeError):
+        encode_key_args(object())
@@ -0,0 +1,116 @@
+import pytest
+
+from cache_utils import CacheManager
+from metrics_utils import Histogram, MetricsRegistry, cache_metrics
+
+
+@pytest.fixture
+def cache():
+    cache_metrics.reset()
+    cache = CacheManager()
+    yield cache
+    cache.cleanup()
+    cache_metrics.reset()
+
+
+def test_histogram_quantiles_use_the_bucket_upper_bound():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["sum"] == pytest.approx(5.605)
+    assert snapshot["p50"] == 0.1
+    assert snapshot["p99"] == float("inf")
+    assert Histogram().snapshot()["p50"] is None
+
+
+def test_registry_groups_by_label_and_exports_prometheus():
+    registry = MetricsRegistry("cache", buckets=(0.1, 1.0))
+    registry.inc("hits", 2, prefix="candles", tier="l1")
+    registry.inc("misses", prefix="candles")
+    registry.observe("get", 0.05, prefix="candles", backend="redis")
+
+    snapshot = registry.snapshot(group_by="prefix")
+    assert snapshot["candles"]["hits:tier=l1"] == 2
+    assert snapshot["candles"]["misses"] == 1
+    assert snapshot["candles"]["get:backend=redis"]["count"] == 1
+
+    text = registry.to_prometheus([("bytes", {"tier": "l1"}, 42)])
+    assert 'cache_hits_total{prefix="candles",tier="l1"} 2' in text
+    assert 'cache_get_seconds_bucket{backend="redis",prefix="candles",le="0.1"} 1' in text
+    assert 'cache_get_seconds_bucket{backend="redis",prefix="candles",le="+Inf"} 1' in text
+    assert "# TYPE cache_bytes gauge\ncache_bytes{tier=\"l1\"} 42" in text
+
+
+def test_cache_metrics_are_split_by_key_prefix(cache):
+    cache.set("candles:EURUSD", [1, 2, 3], ttl=60)
+    cache.set_many({"chart:EURUSD": {"t": [1]}, "chart:GBPUSD": {"t": [2]}}, ttl=60)
+    cache.get("candles:EURUSD")
+    cache.get("candles:USDJPY")
+    cache.get_many(["chart:EURUSD", "chart:GBPUSD", "chart:AUDUSD"])
+
+    prefixes = cache.metrics()["prefixes"]
+    assert prefixes["candles"]["sets"] == 1
+    assert prefixes["candles"]["hits:tier=memory"] == 1
+    assert prefixes["candles"]["misses"] == 1
+    assert prefixes["candles"]["hit_ratio"] == 0.5
+    assert prefixes["candles"]["bytes_stored"] > 0
+    assert prefixes["chart"]["sets"] == 2
+    assert prefixes["chart"]["hit_ratio"] == pytest.approx(2 / 3, abs=1e-4)
+    assert prefixes["chart"]["get:backend=memory"]["count"] == 1
+
+
+def test_cache_metrics_count_l1_and_redis_hits_separately(cache):
+    from conftest import FakeRedis
+
+    cache._attach_redis(FakeRedis())
+    cache.set("payout:all", {"EURUSD": 85}, ttl=60)
+    cache.memory.clear()
+    cache.get("payout:all")  # Redis
+    cache.get("payout:all")  # Cache local
+
+    metrics = cache.metrics()
+    assert metrics["backend"] == "redis"
+    assert metrics["prefixes"]["payout"]["hits:tier=redis"] == 1
+    assert metrics["prefixes"]["payout"]["hits:tier=l1"] == 1
+    assert metrics["redis"]["evicted_keys"] == 0
+    assert 'cache_hits_total{prefix="payout",tier="l1"} 1' in cache.metrics_prometheus()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import main  # noqa: F401 (registra as rotas)
+    import routes
+    from estrategia_minoria import app
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "segredo")
+    return app.test_client()
+
+
+def test_admin_routes_require_the_token(client, monkeypatch):
+    assert client.get("/admin/cache").status_code == 401
+    assert client.get("/admin/cache", headers={"Authorization": "Bearer errado"}).status_code == 401
+
+    import routes
+    monkeypatch.setattr(routes, "ADMIN_TOKEN", "")
+    assert client.get("/admin/cache", headers={"Authorization": "Bearer segredo"}).status_code == 404
+
+
+def test_admin_routes_export_cache_and_executor_metrics(client):
+    from cache_utils import cache_manager
+
+    cache_manager.set("admintest:1", [1], ttl=60)
+    cache_manager.get("admintest:1")
+    try:
+        response = client.get("/admin/cache", headers={"Authorization": "Bearer segredo"})
+        assert response.status_code == 200
+        assert response.get_json()["cache"]["prefixes"]["admintest"]["sets"] >= 1
+
+        response = client.get("/admin/executor", headers={"X-Admin-Token": "segredo"})
+        assert response.get_json()["success"] is True
+
+        response = client.get("/admin/metrics", headers={"X-Admin-Token": "segredo"})
+        assert response.mimetype == "text/plain"
+        assert 'cache_sets_total{prefix="admintest"}' in response.get_data(as_text=True)
+    finally:
+        cache_manager.delete("admintest:1")
@@ -0,0 +1,86 @@
+import random
+import threading
+
+from cache_utils import MemoryCache
+
+
+def shard_totals(cache):
+    """Soma dos tamanhos dos itens de cada partição, para conferir os contadores mantidos."""
+    return [(len(shard.items), sum(entry.size for entry in shard.items.values()), shard.bytes)
+            for shard in cache._shards]
+
+
+def test_keys_are_spread_and_limits_split_across_shards():
+    cache = MemoryCache(max_items=64, max_bytes=6400, quotas={}, sweep_interval=0, shards=8)
+    for i in range(64):
+        cache.set(f"candles:{i}", i, 10, 60)
+
+    assert sum(1 for shard in cache._shards if shard.items) > 1
+    assert all(shard.max_items == 8 and shard.max_bytes == 800 for shard in cache._shards)
+    assert all(len(shard.items) <= 8 for shard in cache._shards)
+    # Cada chave está sempre na mesma partição
+    assert all(cache.get(key) == (True, int(key.split(":")[1])) for key in cache.keys())
+
+
+def test_reads_do_not_wait_for_the_shard_lock():
+    cache = MemoryCache(sweep_interval=0, shards=4)
+    cache.set("payout:all", {"EURUSD": 85}, 10, 60)
+    shard = cache._shard("payout:all")
+    with shard.lock:
+        # Uma gravação em andamento na partição não bloqueia a leitura
+        assert cache.get("payout:all") == (True, {"EURUSD": 85})
+
+
+def test_concurrent_writers_and_readers_keep_the_shards_consistent():
+    cache = MemoryCache(max_items=200, max_bytes=20000, quotas={"chart": 4000}, sweep_interval=0, shards=8)
+    errors = []
+    wrong = []
+    barrier = threading.Barrier(8)
+
+    def writer(worker):
+        rnd = random.Random(worker)
+        barrier.wait()
+        try:
+            for i in range(2000):
+                key = f"{rnd.choice(['candles', 'chart'])}:{rnd.randrange(300)}"
+                operation = rnd.random()
+                if operation < 0.6:
+                    cache.set(key, key, rnd.randrange(10, 200), 60)
+                elif operation < 0.8:
+                    cache.set_many({key: (key, 50), f"{key}:b": (f"{key}:b", 50)}, 60)
+                else:
+                    cache.delete_many([key, f"{key}:b"])
+        except Exception as e:
+            errors.append(e)
+
+    def reader(worker):
+        rnd = random.Random(100 + worker)
+        barrier.wait()
+        try:
+            for i in range(4000):
+                key = f"{rnd.choice(['candles', 'chart'])}:{rnd.randrange(300)}"
+                hit, value = cache.get(key)
+                if hit and value != key:
+                    wrong.append((key, value))
+                for found_key, value in cache.get_many([key, f"{key}:b"]).items():
+                    if value != found_key:
+                        wrong.append((found_key, value))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(4)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert errors == [] and wrong == []
+    for items, entry_bytes, counted_bytes in shard_totals(cache):
+        assert entry_bytes == counted_bytes
+        assert items <= 25 and counted_bytes <= 2500
+    stats = cache.stats()
+    assert stats["items"] == len(cache.keys())
+    assert stats["bytes"] == sum(size for _, size, _ in shard_totals(cache))
+    assert stats["prefixes"]["chart"]["bytes"] <= 4000
+    assert stats["prefixes"]["chart"]["bytes"] + stats["prefixes"].get("candles", {"bytes": 0})["bytes"] == stats["bytes"]
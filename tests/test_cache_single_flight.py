@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import async_utils
+from async_utils import OperationCanceled
+from cache_utils import CacheManager
+from conftest import wait_until
+
+
+@pytest.fixture
+def cache():
+    return CacheManager()
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_misses_compute_once(cache):
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return {"candles": [1, 2, 3]}
+
+    results = run_concurrently(8, lambda: cache.get_or_compute("candles:EURUSD", compute, ttl=60))
+    assert len(calls) == 1
+    assert results == [{"candles": [1, 2, 3]}] * 8
+
+    # Depois do cálculo, o valor vem do cache
+    assert cache.get_or_compute("candles:EURUSD", compute, ttl=60) == {"candles": [1, 2, 3]}
+    assert len(calls) == 1
+
+
+def test_error_is_shared_and_not_cached(cache):
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError("API indisponível")
+
+    def call():
+        try:
+            return cache.get_or_compute("candles:GBPUSD", failing)
+        except ValueError as e:
+            return str(e)
+
+    assert run_concurrently(4, call) == ["API indisponível"] * 4
+    assert len(calls) == 1
+    assert cache.get_or_compute("candles:GBPUSD", lambda: [5]) == [5]
+
+
+def test_waiters_recompute_when_leader_is_canceled(cache):
+    started = threading.Event()
+    release = threading.Event()
+
+    def canceled():
+        started.set()
+        release.wait(5)
+        raise OperationCanceled("análise cancelada")
+
+    leader_error = []
+
+    def leader():
+        try:
+            cache.get_or_compute("candles:USDJPY", canceled)
+        except OperationCanceled as e:
+            leader_error.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    assert started.wait(5)
+    waiter = []
+    waiter_thread = threading.Thread(target=lambda: waiter.append(cache.get_or_compute("candles:USDJPY", lambda: [7])))
+    waiter_thread.start()
+    time.sleep(0.05)
+    release.set()
+    thread.join(5)
+    waiter_thread.join(5)
+    assert leader_error and waiter == [[7]]
+
+    # O valor recalculado por quem aguardava fica no cache
+    assert cache.get_or_compute("candles:USDJPY", lambda: [8]) == [7]
+
+
+def test_executor_threads_do_not_wait_for_the_leader(cache):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return [1]
+
+    thread = threading.Thread(target=lambda: cache.get_or_compute("candles:AUDUSD", slow))
+    thread.start()
+    try:
+        assert started.wait(5)
+        # Numa thread do executor, calcula na hora em vez de ocupar a thread aguardando
+        future = async_utils.executor.submit(cache.get_or_compute, "candles:AUDUSD", lambda: [2])
+        assert future.result(timeout=1) == [2]
+    finally:
+        release.set()
+        thread.join(5)
+
+
+def test_async_concurrent_misses_compute_once(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return [1, 2]
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async("payout:all", compute) for _ in range(10)))
+
+    assert asyncio.run(main()) == [[1, 2]] * 10
+    assert len(calls) == 1
+
+
+def test_stale_value_is_served_while_one_refresh_runs(cache):
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    # ttl=0: a entrada fica desatualizada imediatamente, mas é servida durante stale_ttl
+    assert cache.get_or_compute("ranking:10", compute, ttl=0, stale_ttl=60) == 1
+    assert [cache.get_or_compute("ranking:10", compute, ttl=0, stale_ttl=60) for _ in range(5)] == [1] * 5
+    assert wait_until(lambda: len(calls) == 2)
+
+    release.set()
+    assert wait_until(lambda: cache._lookup_entry("ranking:10")[2] == 2)
+    assert len(calls) == 2
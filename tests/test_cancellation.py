@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from async_utils import (CancellationToken, OperationCanceled, blocking_context, current_cancel_token,
+                         run_blocking_func, run_blocking_with_timeout)
+from polariumapi.stable_api import Polarium
+
+
+class SilentPolarium(Polarium):
+    """Polarium sem websocket: registra os pedidos de velas e nunca recebe resposta (API travada)."""
+
+    def __init__(self):
+        super().__init__("teste@example.com", "senha")
+        self.requests = []
+
+    def send_websocket_request(self, name, msg, request_id="", no_force_send=True):
+        self.requests.append(request_id)
+        return request_id
+
+
+def test_child_token_follows_parent_cancel_and_deadline():
+    parent = CancellationToken(timeout=60)
+    child = CancellationToken(timeout=120, parent=parent)
+    assert child.deadline == parent.deadline  # O prazo menor (do pai) prevalece
+
+    parent.cancel("job cancelado")
+    assert child.canceled and child.reason == "job cancelado"
+    with pytest.raises(OperationCanceled):
+        child.raise_if_canceled()
+
+    # Filho de um token já cancelado nasce cancelado
+    assert CancellationToken(parent=parent).canceled
+
+
+def test_token_sleep_wakes_on_cancel_and_deadline():
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+    started = time.monotonic()
+    assert token.sleep(5)
+    assert time.monotonic() - started < 1
+
+    expiring = CancellationToken(timeout=0.05)
+    assert expiring.sleep(5)
+    assert expiring.reason == "prazo esgotado"
+    assert expiring.remaining() == 0.0
+
+
+def test_timeout_stops_a_stuck_get_candles_call():
+    api = SilentPolarium()
+    finished = threading.Event()
+    outcome = []
+
+    def fetch():
+        # Como em estrategia_minoria.load_candles: o token da chamada é repassado à API
+        try:
+            return api.get_candles("EURUSD", 60, 10, 1700000000, cancel_token=current_cancel_token.get())
+        except BaseException as e:
+            outcome.append(e)
+            raise
+        finally:
+            finished.set()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await run_blocking_with_timeout(fetch, timeout=0.2)
+
+    started = time.monotonic()
+    asyncio.run(main())
+    # Sem o token, a thread ficaria presa em novas tentativas (10s cada) sem ninguém aguardando
+    assert finished.wait(2)
+    assert time.monotonic() - started < 2
+    assert isinstance(outcome[0], OperationCanceled)
+
+    sent = len(api.requests)
+    time.sleep(0.3)
+    assert len(api.requests) == sent == 1
+
+
+def test_canceling_the_context_token_stops_the_call():
+    token = CancellationToken()
+    progress = []
+
+    def scan():
+        while not current_cancel_token.get().sleep(0.01):
+            progress.append(1)
+        current_cancel_token.get().raise_if_canceled()
+
+    async def main():
+        with blocking_context(cancel_token=token):
+            call = asyncio.ensure_future(run_blocking_func(scan))
+        await asyncio.sleep(0.05)
+        token.cancel("job cancelado")
+        with pytest.raises(OperationCanceled):
+            await call
+
+    asyncio.run(main())
+    count = len(progress)
+    assert count > 0
+    time.sleep(0.1)
+    assert len(progress) == count  # A varredura parou junto com o token
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from candle_store import MAX_CANDLES_PER_REQUEST, CandleStore
+
+TIMEFRAME = 60
+NOW = 1700000000 - 1700000000 % TIMEFRAME + 30  # 30s depois da abertura da vela atual
+
+
+class FakeApi:
+    """API de velas sem rede: histórico contínuo até a vela atual, com o limite por requisição da real."""
+
+    def __init__(self, first=NOW - 10000 * TIMEFRAME):
+        self.first = first - first % TIMEFRAME
+        self.requests = []
+
+    def get_candles(self, active, timeframe, count, endtime):
+        self.requests.append((count, endtime))
+        count = min(count, MAX_CANDLES_PER_REQUEST)
+        last = endtime - endtime % timeframe
+        times = [t for t in range(last - (count - 1) * timeframe, last + 1, timeframe) if t >= self.first]
+        return [{'from': t, 'open': 1.0, 'close': 1.0 + (t // timeframe) % 3 / 10, 'min': 0.9, 'max': 1.5,
+                 'volume': 1} for t in times]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CandleStore(str(tmp_path / "velas" / "candles.db"), retention_days=0)
+
+
+def expected_times(count, end_time=NOW):
+    last = end_time - end_time % TIMEFRAME
+    return list(range(last - (count - 1) * TIMEFRAME, last + 1, TIMEFRAME))
+
+
+def test_creating_the_store_does_not_touch_the_disk(tmp_path):
+    store = CandleStore(str(tmp_path / "velas" / "candles.db"))
+    assert not os.path.exists(tmp_path / "velas")
+    assert store.read('EURUSD', TIMEFRAME) == []
+    assert os.path.exists(tmp_path / "velas" / "candles.db")
+
+
+def test_empty_store_fetches_the_whole_window(store):
+    api = FakeApi()
+    candles = store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, 100, NOW)
+    assert [c['from'] for c in candles] == expected_times(100)
+    assert api.requests == [(100, NOW)]
+
+
+def test_covered_window_fetches_only_since_the_last_candle(store):
+    api = FakeApi()
+    store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, 100, NOW)
+
+    later = NOW + 5 * TIMEFRAME
+    candles = store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, 100, later)
+    assert [c['from'] for c in candles] == expected_times(100, later)
+    # A última vela armazenada é buscada de novo (podia estar em formação)
+    assert api.requests[-1] == (6, later)
+
+
+def test_gap_in_the_window_refetches_everything(store):
+    api = FakeApi()
+    store.write('EURUSD', TIMEFRAME, [c for c in api.get_candles('EURUSD', TIMEFRAME, 100, NOW)
+                                      if c['from'] != expected_times(100)[50]])
+    api.requests.clear()
+
+    candles = store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, 100, NOW)
+    assert [c['from'] for c in candles] == expected_times(100)
+    assert api.requests == [(100, NOW)]
+
+
+def test_windows_larger_than_one_request_are_fetched_in_pages(store):
+    api = FakeApi()
+    count = 2 * MAX_CANDLES_PER_REQUEST + 500
+    candles = store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, count, NOW)
+    assert [c['from'] for c in candles] == expected_times(count)
+    assert [size for size, _ in api.requests] == [MAX_CANDLES_PER_REQUEST, MAX_CANDLES_PER_REQUEST, 500]
+
+
+def test_paging_stops_where_the_history_ends(store):
+    api = FakeApi(first=expected_times(1200)[0])
+    candles = store.get_candles(api.get_candles, 'EURUSD', TIMEFRAME, 3000, NOW)
+    assert len(candles) == 1200
+    assert len(api.requests) == 2
@@ -0,0 +1,104 @@
+import json
+
+from chart_utils import (CHART_MODE_COMPACT, LOSS_LINE, NULO_LINE, PENDING_LINE, RESULT_LINES,
+                         build_chart_payload, build_plotly_chart)
+
+CANDLES = [
+    {"time": 1700000040 + 60 * i, "open": 1.0 + i / 100, "high": 1.1 + i / 100, "low": 0.9 + i / 100,
+     "close": 1.05 + i / 100}
+    for i in range(10)
+]
+BLOCKS = [
+    {"block_time": 1700000100, "result": "WIN", "martingale": 1},
+    {"block_time": 1700000400, "result": "LOSS", "martingale": 2},
+    {"block_time": 1700000700, "result": "NULO", "martingale": "NULO"},
+    {"block_time": 1700001000, "result": None, "martingale": None},
+    {"block_time": 1700001300, "result": "WIN", "martingale": 5},  # Sem cor definida: sem linha
+]
+
+
+def test_payload_has_columns_and_one_line_per_styled_block():
+    payload = build_chart_payload("EURUSD", BLOCKS, CANDLES, block_seconds=300, line_offset=30)
+
+    assert payload["mode"] == CHART_MODE_COMPACT
+    assert payload["active"] == "EURUSD"
+    assert payload["t"] == [c["time"] for c in CANDLES]
+    assert [payload[k] for k in "ohlc"] == [[c[f] for c in CANDLES] for f in ("open", "high", "low", "close")]
+
+    # A linha fica 30s antes do fim do bloco
+    assert payload["lines"] == {
+        "t": [b["block_time"] + 270 for b in BLOCKS[:4]],
+        "color": [RESULT_LINES[("WIN", 1)][0], LOSS_LINE[0], NULO_LINE[0], PENDING_LINE[0]],
+        "width": [RESULT_LINES[("WIN", 1)][1], LOSS_LINE[1], NULO_LINE[1], PENDING_LINE[1]],
+    }
+    # Só listas simples: o payload vai direto para JSON
+    assert json.loads(json.dumps(payload)) == payload
+
+
+def test_plotly_figure_is_built_from_the_same_payload():
+    payload = build_chart_payload("EURUSD", BLOCKS, CANDLES)
+    figure = json.loads(build_plotly_chart(payload))
+
+    candlestick = figure["data"][0]
+    assert candlestick["type"] == "candlestick"
+    assert candlestick["open"] == payload["o"] and candlestick["close"] == payload["c"]
+    assert [shape["line"]["color"] for shape in figure["layout"]["shapes"]] == payload["lines"]["color"]
+    assert "EURUSD" in figure["layout"]["title"]["text"]
+
+
+def test_empty_chart():
+    payload = build_chart_payload("EURUSD", [], [])
+    assert payload["t"] == [] and payload["lines"]["t"] == []
+    assert json.loads(build_plotly_chart(payload))["data"][0]["open"] == []
+
+
+def analysis_results(count, start=1700000040):
+    """Resultado no formato de analyze_candles, a partir de velas em memória (sem API)."""
+    from estrategia_minoria import DEFAULT_STRATEGY, chart_candles
+    from strategies import evaluate_strategies
+
+    candles = [{'from': start + 60 * i, 'open': 1.0, 'close': 1.0 + (-1) ** i / 100, 'min': 0.9, 'max': 1.1}
+               for i in range(count)]
+    current_time = candles[-1]['from'] + 60
+    data = evaluate_strategies(candles, [DEFAULT_STRATEGY], 4, current_time)[DEFAULT_STRATEGY.name]
+    return {"success": True, "data": data, "num_blocks": 4, "candles": chart_candles(candles, data)}
+
+
+def test_chart_uses_the_analysed_candles_from_the_first_block():
+    results = analysis_results(40)
+    first_block_candle = results["data"][0]["candles"][0]["time"]
+    assert results["candles"][0]["time"] == first_block_candle
+    assert all(c["time"] >= first_block_candle for c in results["candles"])
+
+
+def test_rendered_charts_are_cached_per_last_closed_candle(monkeypatch):
+    import asyncio
+
+    import estrategia_minoria
+    from cache_utils import cache_manager
+
+    builds = []
+    real_build = estrategia_minoria.build_chart_payload
+
+    def counting_build(*args, **kwargs):
+        builds.append(args[0])
+        return real_build(*args, **kwargs)
+
+    monkeypatch.setattr(estrategia_minoria, 'build_chart_payload', counting_build)
+    try:
+        results = analysis_results(40)
+        chart = asyncio.run(estrategia_minoria.generate_chart("TESTCHART", results))
+        assert chart["t"] == [c["time"] for c in results["candles"]]
+
+        # Mesmas velas fechadas: gráfico servido do cache, para qualquer usuário
+        assert asyncio.run(estrategia_minoria.generate_chart("TESTCHART", analysis_results(40))) == chart
+        assert builds == ["TESTCHART"]
+
+        # Nova vela fechada: novo gráfico
+        asyncio.run(estrategia_minoria.generate_chart("TESTCHART", analysis_results(41)))
+        assert builds == ["TESTCHART", "TESTCHART"]
+
+        # Sem blocos analisados não há gráfico
+        assert asyncio.run(estrategia_minoria.generate_chart("TESTCHART", {"data": [], "candles": []})) is None
+    finally:
+        cache_manager.clear("chart:TESTCHART:*")
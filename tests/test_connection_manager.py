@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+
+from connection_manager import ConnectionManager
+
+
+class FakeApi:
+    """Instância da API de teste: conta quantas vezes foi fechada."""
+
+    def __init__(self, name, close_delay=0.0, release=None):
+        self.name = name
+        self.closed = 0
+        self.close_delay = close_delay
+        self.release = release
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(self.close_delay)
+        with self.lock:
+            self.closed += 1
+
+
+def test_concurrent_register_and_remove_close_each_api_once():
+    manager = ConnectionManager(shards=4)
+    users = [f"u{i}" for i in range(40)]
+    created = []
+    created_lock = threading.Lock()
+    errors = []
+    barrier = threading.Barrier(8)
+
+    def writer(worker):
+        rnd = random.Random(worker)
+        barrier.wait()
+        try:
+            for i in range(500):
+                user_id = rnd.choice(users)
+                if rnd.random() < 0.6:
+                    api = FakeApi(f"{worker}-{i}")
+                    with created_lock:
+                        created.append(api)
+                    manager.add_connection(user_id, api)
+                else:
+                    manager.remove_connection(user_id)
+        except Exception as e:
+            errors.append(e)
+
+    def reader(worker):
+        rnd = random.Random(100 + worker)
+        barrier.wait()
+        try:
+            for i in range(1000):
+                api, connected = manager.get_connection(rnd.choice(users))
+                if api is not None and not connected:
+                    errors.append(AssertionError("conexão registrada como desconectada"))
+                manager.list_connections()
+                manager.most_recent_user()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(6)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert errors == []
+    registered = {id(manager.get_connection(user_id)[0]) for user_id in users if manager.has_connection(user_id)}
+    # Cada instância substituída ou removida foi fechada exatamente uma vez; as registradas continuam abertas
+    for api in created:
+        assert api.closed == (0 if id(api) in registered else 1), api.name
+    assert set(manager.list_connections()) == {user_id for user_id in users if manager.has_connection(user_id)}
+
+
+def test_slow_close_does_not_hold_the_shard_lock():
+    manager = ConnectionManager(shards=1)
+    release = threading.Event()
+    manager.add_connection("u1", FakeApi("lenta", release=release))
+    remover = threading.Thread(target=manager.remove_connection, args=("u1",))
+    remover.start()
+    try:
+        time.sleep(0.05)  # u1 está sendo fechado, fora do lock
+        started = time.monotonic()
+        manager.add_connection("u2", FakeApi("nova"))
+        manager.add_connection("u1", FakeApi("reconectada"))
+        assert time.monotonic() - started < 1
+        assert manager.get_connection("u1")[0].name == "reconectada"
+    finally:
+        release.set()
+        remover.join(5)
+    assert manager.get_connection("u1")[0].closed == 0
+
+
+def test_cleanup_removes_only_idle_connections():
+    manager = ConnectionManager(max_idle_time=60, shards=4)
+    idle, active = FakeApi("inativa"), FakeApi("ativa")
+    manager.add_connection("idle", idle)
+    manager.add_connection("active", active)
+    manager.get_user_data("idle")["last_activity"] = time.time() - 120
+
+    manager._cleanup_inactive_connections()
+    assert not manager.has_connection("idle") and idle.closed == 1
+    assert manager.has_connection("active") and active.closed == 0
+    # Tarefas globais usam o usuário ativo mais recente, sem renovar sua atividade
+    assert manager.get_any_connection() == ("active", active)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import random
+
+import pytest
+
+import async_utils
+from async_utils import get_process_pool, run_cpu_func, start_process_pool
+from metrics_utils import executor_metrics
+from strategies import candle_columns, score_candle_columns
+
+START = 1700000100
+
+
+def make_candles(count, seed=7):
+    rng = random.Random(seed)
+    candles = []
+    for i in range(count):
+        o = round(1 + rng.random(), 5)
+        c = round(o + rng.choice([-1, 1]) * rng.random() / 100, 5)
+        candles.append({'from': START + i * 60, 'open': o, 'close': c, 'min': min(o, c), 'max': max(o, c)})
+    return candles
+
+
+def exit_in_child(parent_pid):
+    """Derruba o processo do pool (simula um processo morto); na thread, apenas informa onde rodou."""
+    if os.getpid() != parent_pid:
+        os._exit(1)
+    return "thread"
+
+
+@pytest.fixture
+def cpu_pool(monkeypatch):
+    monkeypatch.setattr(async_utils, "CPU_WORKERS", 2)
+    monkeypatch.setattr(async_utils, "_process_pool", None)
+    monkeypatch.setattr(async_utils, "_process_pool_pid", None)
+    executor_metrics.reset()
+    pool = start_process_pool()
+    yield pool
+    pool.shutdown(wait=True, cancel_futures=True)
+    executor_metrics.reset()
+
+
+def test_cpu_steps_run_in_the_process_pool(cpu_pool):
+    assert get_process_pool() is cpu_pool
+    assert start_process_pool() is cpu_pool  # Um único pool por processo
+
+    candles = make_candles(400)
+    current_time = START + 400 * 60
+    columns = candle_columns(candles)
+    args = (columns, "minoria", 20, current_time)
+
+    async def main():
+        return await asyncio.gather(run_cpu_func(os.getpid), run_cpu_func(score_candle_columns, *args))
+
+    pid, stats = asyncio.run(main())
+    assert pid != os.getpid()
+    # O resultado no pool é o mesmo da execução direta (exceto o horário da atualização)
+    direct = score_candle_columns(*args)
+    assert stats["analyzed_blocks"] == 18
+    assert {k: v for k, v in stats.items() if k != "last_update"} == {k: v for k, v in direct.items() if k != "last_update"}
+    assert executor_metrics.snapshot(group_by="func")["strategies.score_candle_columns"]["cpu_run"]["count"] == 1
+
+
+def test_broken_pool_falls_back_to_threads(cpu_pool):
+    assert asyncio.run(run_cpu_func(exit_in_child, os.getpid())) == "thread"
+    assert get_process_pool() is None  # Não é recriado: as próximas etapas já vão para as threads
+    assert asyncio.run(run_cpu_func(os.getpid)) == os.getpid()
+    assert executor_metrics.snapshot(group_by="func")["test_cpu_pool.exit_in_child"]["errors"] == 1
+
+
+def test_without_cpu_workers_steps_run_in_threads(monkeypatch):
+    monkeypatch.setattr(async_utils, "CPU_WORKERS", 0)
+    monkeypatch.setattr(async_utils, "_process_pool", None)
+    assert start_process_pool() is None
+    assert asyncio.run(run_cpu_func(os.getpid)) == os.getpid()
+
+
+def test_pool_from_another_process_is_not_used(cpu_pool, monkeypatch):
+    # Após o fork de um worker, o pool do processo pai não serve ao filho
+    monkeypatch.setattr(async_utils, "_process_pool_pid", os.getpid() + 1)
+    assert get_process_pool() is None
+    assert asyncio.run(run_cpu_func(os.getpid)) == os.getpid()
@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+from conftest import wait_until
+from event_stream import EventBroker, format_sse
+
+
+@pytest.fixture
+def broker():
+    return EventBroker(max_events_per_channel=3)
+
+
+def ids(events):
+    return [e['id'] for e in events]
+
+
+def test_replay_after_last_event_id(broker):
+    first = broker.publish('job:a', 'progress', {'percent_complete': 10})
+    other = broker.publish('job:b', 'progress', {})
+    second = broker.publish('job:a', 'progress', {'percent_complete': 20})
+    third = broker.publish('job:a', 'result', {'status': 'completed'})
+
+    # IDs globais e crescentes, independentes do canal
+    assert first < other < second < third
+    assert broker.last_event_id() == third
+
+    events, finished = broker.wait_for_events('job:a', first, timeout=0)
+    assert ids(events) == [second, third]
+    assert not finished
+    assert broker.wait_for_events('job:a', third, timeout=0) == ([], False)
+
+
+def test_history_is_bounded(broker):
+    published = [broker.publish('job:a', 'asset', {'key': n}) for n in range(5)]
+    events, _ = broker.wait_for_events('job:a', 0, timeout=0)
+    assert ids(events) == published[-3:]
+
+
+def test_closed_channel_delivers_remaining_events_then_finishes(broker):
+    first = broker.publish('job:a', 'progress', {})
+    last = broker.publish('job:a', 'result', {})
+    broker.close('job:a')
+
+    assert broker.wait_for_events('job:a', first, timeout=0) == ([{'id': last, 'event': 'result', 'data': {}}], False)
+    assert broker.wait_for_events('job:a', last, timeout=0) == ([], True)
+    assert broker.wait_for_events('job:inexistente', 0, timeout=0) == ([], True)
+
+
+def test_stream_resumes_from_last_event_id(broker):
+    first = broker.publish('job:a', 'progress', {'percent_complete': 50})
+    second = broker.publish('job:a', 'result', {'status': 'completed'})
+    broker.close('job:a')
+
+    assert list(broker.stream('job:a', 0)) == [
+        "retry: 3000\n\n",
+        format_sse(first, 'progress', {'percent_complete': 50}),
+        format_sse(second, 'result', {'status': 'completed'}),
+    ]
+    assert list(broker.stream('job:a', first)) == ["retry: 3000\n\n", format_sse(second, 'result', {'status': 'completed'})]
+
+
+def test_waiting_client_is_woken_by_publish(broker):
+    received = []
+    waiter = threading.Thread(target=lambda: received.extend(broker.wait_for_events('user:u1', 0, timeout=5, create=True)[0]))
+    waiter.start()
+    assert wait_until(lambda: 'user:u1' in broker._channels)
+    event_id = broker.publish('user:u1', 'ranking', [1])
+    waiter.join(5)
+    assert ids(received) == [event_id]
+
+
+def test_idle_channels_are_removed():
+    broker = EventBroker(channel_ttl=0)
+    broker.publish('job:a', 'progress', {})
+    assert broker.cleanup_idle_channels() == 1
+    assert broker.wait_for_events('job:a', 0, timeout=0) == ([], True)
+
+
+@pytest.fixture
+def client():
+    import main  # noqa: F401 (registra as rotas)
+    from estrategia_minoria import app, connection_manager
+    connection_manager.add_connection('u1', object())
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'u1'
+    yield client
+    connection_manager.remove_connection('u1')
+
+
+def test_job_events_route_honours_last_event_id_header(client):
+    from estrategia_minoria import job_manager
+    from event_stream import event_broker
+    from job_manager import job_channel
+
+    async def job(job_id):
+        for percent in (25, 50, 75):
+            job_manager.update_progress(job_id, {'percent_complete': percent})
+        return 'ok'
+
+    job_id = job_manager.submit('u1', 'top5', job)
+    assert wait_until(lambda: not job_manager.get_job_status(job_id)['in_progress'])
+    events, _ = event_broker.wait_for_events(job_channel(job_id), 0, timeout=0)
+    assert [e['event'] for e in events] == ['status', 'status', 'progress', 'progress', 'progress', 'result']
+
+    response = client.get(f'/jobs/{job_id}/events', headers={'Last-Event-ID': str(events[3]['id'])})
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert body == "retry: 3000\n\n" + "".join(format_sse(e['id'], e['event'], e['data']) for e in events[4:])
+
+    # Canal de outro usuário
+    with client.session_transaction() as session:
+        session['user_id'] = 'u2'
+    assert client.get(f'/jobs/{job_id}/events').status_code == 302  # u2 não está conectado
+
+
+def test_streams_beyond_the_worker_limit_are_refused(client, monkeypatch):
+    import routes
+    from estrategia_minoria import job_manager
+
+    async def job(job_id):
+        return 'ok'
+
+    job_id = job_manager.submit('u1', 'top5', job)
+    assert wait_until(lambda: not job_manager.get_job_status(job_id)['in_progress'])
+
+    monkeypatch.setattr(routes, 'sse_slots', threading.BoundedSemaphore(1))
+    open_stream = client.get(f'/jobs/{job_id}/events')
+    refused = client.get(f'/jobs/{job_id}/events')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+
+    # Ao fechar a conexão a vaga é devolvida
+    open_stream.close()
+    assert client.get(f'/jobs/{job_id}/events').status_code == 200
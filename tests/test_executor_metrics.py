@@ -0,0 +1,98 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+import async_utils
+from async_utils import CALL_CLASS_BATCH, BulkheadScheduler, callable_name, executor_stats
+from metrics_utils import executor_metrics
+
+
+@pytest.fixture
+def pool():
+    executor_metrics.reset()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=False)
+    executor_metrics.reset()
+
+
+def sleeper(seconds):
+    return lambda: time.sleep(seconds) or seconds
+
+
+def test_wait_and_run_times_are_recorded_per_function(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={}, wait_warning=0)
+    first = scheduler.submit(sleeper(0.1), "u1", name="Polarium.get_candles")
+    second = scheduler.submit(sleeper(0), "u1", CALL_CLASS_BATCH, name="ranking.scan")
+    second.result(5)
+    first.result(5)
+
+    functions = executor_metrics.snapshot(group_by="func")
+    candles = functions["Polarium.get_candles"]
+    assert candles["run"]["count"] == 1 and candles["run"]["sum"] >= 0.1
+    assert candles["wait:call_class=interactive"]["count"] == 1
+    # A segunda chamada esperou a primeira terminar (limite global de 1)
+    assert functions["ranking.scan"]["wait:call_class=batch"]["sum"] >= 0.09
+
+
+def test_errors_and_discarded_calls_are_counted(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={}, wait_warning=0)
+    release = threading.Event()
+    blocker = scheduler.submit(lambda: release.wait(5), name="blocker")
+    queued = scheduler.submit(sleeper(0), name="queued")
+    queued.cancel()  # Quem aguardava desistiu antes da chamada iniciar
+
+    def failing():
+        raise ValueError("API indisponível")
+
+    failed = scheduler.submit(failing, name="failing")
+    release.set()
+    blocker.result(5)
+    with pytest.raises(ValueError):
+        failed.result(5)
+
+    functions = executor_metrics.snapshot(group_by="func")
+    assert functions["queued"]["canceled"] == 1
+    assert "run" not in functions["queued"]
+    assert functions["failing"]["errors"] == 1
+
+
+def test_slow_waits_call_the_hooks(pool):
+    scheduler = BulkheadScheduler(pool, global_limit=1, user_limit=0, class_limits={}, wait_warning=0.05)
+    alerts = []
+    scheduler.add_wait_hook(lambda info: 1 / 0)  # Um gancho com erro não afeta a chamada nem os demais
+    scheduler.add_wait_hook(alerts.append)
+
+    first = scheduler.submit(sleeper(0.1), "u1", name="slow")
+    second = scheduler.submit(sleeper(0), "u2", name="waiting")
+    third = scheduler.submit(sleeper(0), "u3", name="waiting")
+    assert [f.result(5) for f in (first, second, third)] == [0.1, 0, 0]
+
+    assert alerts and alerts[0]["name"] == "waiting"
+    assert alerts[0]["user_id"] == "u2" and alerts[0]["call_class"] == "interactive"
+    assert alerts[0]["wait"] >= 0.05
+    assert alerts[0]["active"] == 1 and alerts[0]["queued"] == 1
+    assert executor_metrics.snapshot(group_by="func")["waiting"]["slow_waits:call_class=interactive"] == 2
+
+
+def test_timeouts_are_counted_and_exported(pool):
+    def stuck():
+        time.sleep(0.3)  # Não consulta o token: só o timeout de quem aguarda a interrompe
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await async_utils.run_blocking_with_timeout(stuck, timeout=0.05)
+
+    asyncio.run(main())
+    name = callable_name(stuck)
+    assert executor_metrics.snapshot(group_by="func")[name]["timeouts"] == 1
+
+    stats = executor_stats()
+    assert stats["max_workers"] == async_utils.MAX_WORKERS
+    assert set(stats["scheduler"]["classes"]) == {"control", "interactive", "batch"}
+    text = async_utils.executor_metrics_prometheus()
+    assert f'executor_timeouts_total{{func="{name}"}} 1' in text
+    assert 'executor_class_queued{call_class="batch"}' in text
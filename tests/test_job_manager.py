@@ -0,0 +1,151 @@
+import asyncio
+import threading
+
+import pytest
+
+from async_utils import current_cancel_token
+from conftest import wait_until
+from event_stream import event_broker
+from job_manager import (JOB_CANCELED, JOB_COMPLETED, JOB_FAILED, JOB_PENDING, JOB_RUNNING, JobManager,
+                         job_channel)
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_concurrent_jobs=1, retention_time=3600)
+    yield manager
+    manager.cleanup()
+
+
+def finished(manager, job_id):
+    return wait_until(lambda: not manager.get_job_status(job_id)['in_progress'])
+
+
+def test_job_lifecycle(manager):
+    async def job(job_id, value):
+        manager.update_progress(job_id, {'percent_complete': 50})
+        manager.add_partial_result(job_id, 'EURUSD', 'Sucesso')
+        return value * 2
+
+    job_id = manager.submit('u1', 'top5', job, 21)
+    assert finished(manager, job_id)
+
+    job = manager.get_job(job_id)
+    assert job['status'] == JOB_COMPLETED
+    assert job['result'] == 42
+    assert job['progress'] == {'percent_complete': 50}
+    assert job['partial_results'] == {'EURUSD': 'Sucesso'}
+    assert job['started_at'] <= job['finished_at']
+    assert manager.get_job_owner(job_id) == 'u1'
+    assert manager.get_active_job('u1', 'top5') is None
+    assert [j['job_id'] for j in manager.list_jobs('u1')] == [job_id]
+    assert manager.list_jobs('u2') == []
+
+    # Todos os eventos ficam no canal do job, que é fechado ao final
+    events, closed = event_broker.wait_for_events(job_channel(job_id), 0, timeout=0)
+    assert [e['event'] for e in events] == ['status', 'status', 'progress', 'asset', 'result']
+    assert [e['data'] for e in events[:2]] == [{'status': JOB_PENDING}, {'status': JOB_RUNNING}]
+    assert events[-1]['data'] == {'status': JOB_COMPLETED, 'result': 42, 'error': None}
+    assert event_broker.wait_for_events(job_channel(job_id), events[-1]['id'], timeout=0) == ([], True)
+
+
+def test_failed_job_keeps_error(manager):
+    async def job(job_id):
+        raise ValueError("falhou")
+
+    job_id = manager.submit('u1', 'top5', job)
+    assert finished(manager, job_id)
+    job = manager.get_job(job_id)
+    assert job['status'] == JOB_FAILED
+    assert job['error'] == "falhou"
+
+
+def test_cancel_running_job_keeps_partial_results(manager):
+    started = threading.Event()
+
+    async def job(job_id):
+        manager.add_partial_result(job_id, 'EURUSD', 'Sucesso')
+        started.set()
+        # Chamadas bloqueantes do job usam o token do job
+        token = current_cancel_token.get()
+        while not token.canceled:
+            await asyncio.sleep(0.01)
+        return {'stopped': manager.is_canceled(job_id)}
+
+    job_id = manager.submit('u1', 'top5', job)
+    assert started.wait(5)
+    assert manager.get_active_job('u1', 'top5') == job_id
+
+    assert manager.cancel(job_id)
+    assert finished(manager, job_id)
+    job = manager.get_job(job_id)
+    assert job['status'] == JOB_CANCELED
+    assert job['result'] == {'stopped': True}
+    assert job['partial_results'] == {'EURUSD': 'Sucesso'}
+
+    # Jobs finalizados não são cancelados de novo
+    assert not manager.cancel(job_id)
+
+
+def test_cancel_pending_job_never_runs(manager):
+    release = threading.Event()
+    calls = []
+
+    async def blocker(job_id):
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    async def job(job_id):
+        calls.append(job_id)
+
+    first = manager.submit('u1', 'top5', blocker)
+    second = manager.submit('u2', 'top5', job)
+    assert manager.cancel(second)
+    release.set()
+
+    assert finished(manager, first)
+    assert finished(manager, second)
+    assert manager.get_job(second)['status'] == JOB_CANCELED
+    assert calls == []
+
+
+def test_pending_job_channel_stays_open(manager):
+    release = threading.Event()
+
+    async def blocker(job_id):
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    first = manager.submit('u1', 'top5', blocker)
+    second = manager.submit('u2', 'top5', blocker)
+    try:
+        # Na fila, o stream recebe o status pendente e continua aberto
+        events, closed = event_broker.wait_for_events(job_channel(second), 0, timeout=0)
+        assert [e['data'] for e in events] == [{'status': JOB_PENDING}]
+        assert not closed
+    finally:
+        release.set()
+    assert finished(manager, first)
+    assert finished(manager, second)
+
+
+def test_unknown_job(manager):
+    assert manager.get_job('nao-existe') is None
+    assert manager.get_job_status('nao-existe') is None
+    assert not manager.cancel('nao-existe')
+    assert manager.is_canceled('nao-existe')
+
+
+def test_expired_jobs_are_removed():
+    manager = JobManager(retention_time=0)
+    try:
+        async def job(job_id):
+            return None
+
+        job_id = manager.submit('u1', 'top5', job)
+        assert finished(manager, job_id)
+        manager._cleanup_expired_jobs()
+        assert manager.get_job(job_id) is None
+        assert event_broker.wait_for_events(job_channel(job_id), 0, timeout=0) == ([], True)
+    finally:
+        manager.cleanup()
@@ -0,0 +1,81 @@
+import time
+
+from cache_utils import MemoryCache
+from conftest import wait_until
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("max_items", 100)
+    kwargs.setdefault("max_bytes", 10000)
+    kwargs.setdefault("quotas", {})
+    kwargs.setdefault("sweep_interval", 0)
+    # Uma partição: limites e ordem de remoção determinísticos
+    return MemoryCache(shards=1, **kwargs)
+
+
+def test_least_recently_used_item_is_evicted():
+    cache = make_cache(max_items=3)
+    for key in ("a", "b", "c"):
+        cache.set(key, key, 10, 60)
+    assert cache.get("a") == (True, "a")  # "a" ganha uma segunda chance
+
+    cache.set("d", "d", 10, 60)
+    assert sorted(cache.keys()) == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == {"lru": 1}
+
+
+def test_byte_limit_evicts_until_the_value_fits():
+    cache = make_cache(max_bytes=100)
+    cache.set("a", 1, 40, 60)
+    cache.set("b", 2, 40, 60)
+    cache.set("c", 3, 40, 60)
+    assert sorted(cache.keys()) == ["b", "c"]
+    assert cache.stats()["bytes"] == 80
+
+
+def test_prefix_quota_evicts_only_that_prefix():
+    cache = make_cache(quotas={"candles": 100})
+    cache.set("candles:EURUSD", 1, 60, 60)
+    cache.set("chart:EURUSD", 2, 60, 60)
+    cache.set("candles:GBPUSD", 3, 60, 60)
+
+    assert sorted(cache.keys()) == ["candles:GBPUSD", "chart:EURUSD"]
+    stats = cache.stats()
+    assert stats["evictions"] == {"quota": 1}
+    assert stats["prefixes"]["candles"] == {"bytes": 60, "quota": 100, "evictions": 1}
+
+
+def test_values_larger_than_the_limits_are_rejected():
+    cache = make_cache(max_bytes=100, quotas={"candles": 50})
+    assert not cache.set("candles:EURUSD", 1, 60, 60)
+    assert not cache.set("chart:EURUSD", 1, 101, 60)
+    assert cache.keys() == []
+    assert cache.stats()["rejected"] == 2
+
+
+def test_expired_items_are_removed_on_read():
+    cache = make_cache()
+    cache.set("a", 1, 10, 0.01)
+    time.sleep(0.02)
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["evictions"] == {"expired": 1}
+
+
+def test_sweeper_removes_expired_items_that_are_never_read():
+    cache = make_cache(sweep_interval=0.05)
+    try:
+        cache.set("candles:EURUSD:1", 1, 10, 0.01)
+        cache.set("candles:EURUSD:2", 2, 10, 60)
+        assert wait_until(lambda: cache.keys() == ["candles:EURUSD:2"])
+        assert cache.stats()["bytes"] == 10
+    finally:
+        cache.close()
+
+
+def test_limits_are_split_across_shards():
+    cache = MemoryCache(max_items=16, max_bytes=1600, quotas={"candles": 800}, sweep_interval=0, shards=4)
+    for i in range(100):
+        cache.set(f"candles:{i}", i, 10, 60)
+    stats = cache.stats()
+    assert stats["items"] <= 16
+    assert stats["prefixes"]["candles"]["bytes"] <= 800
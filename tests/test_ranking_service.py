@@ -0,0 +1,74 @@
+import estrategia_minoria
+
+
+class FakeApi:
+    def __init__(self):
+        self.connected = True
+
+    def check_connect(self):
+        return self.connected
+
+
+def test_service_account_has_its_own_session(monkeypatch):
+    logins = []
+
+    async def connect(email, password):
+        logins.append(email)
+        return True, "Conectado com sucesso!", FakeApi(), None
+
+    monkeypatch.setattr(estrategia_minoria, 'RANKING_EMAIL', 'ranking@exemplo.com')
+    monkeypatch.setattr(estrategia_minoria, 'RANKING_PASSWORD', 'segredo')
+    monkeypatch.setattr(estrategia_minoria, '_ranking_api', None)
+    monkeypatch.setattr(estrategia_minoria, 'connect_to_polarium', connect)
+
+    owner, api_instance = estrategia_minoria.ranking_connection()
+    assert owner == estrategia_minoria.RANKING_SERVICE_USER
+    assert estrategia_minoria.ranking_connection() == (owner, api_instance)
+    assert logins == ['ranking@exemplo.com']
+
+    # Sessão caída: reconecta
+    api_instance.connected = False
+    assert estrategia_minoria.ranking_connection()[1] is not api_instance
+    assert len(logins) == 2
+
+
+def test_without_service_account_borrows_the_most_recent_user(monkeypatch):
+    monkeypatch.setattr(estrategia_minoria, 'RANKING_EMAIL', None)
+    api_instance = FakeApi()
+    estrategia_minoria.connection_manager.add_connection('u-ranking', api_instance)
+    try:
+        assert estrategia_minoria.ranking_connection() == ('u-ranking', api_instance)
+    finally:
+        estrategia_minoria.connection_manager.remove_connection('u-ranking')
+
+
+def test_failed_service_login_falls_back_to_a_user(monkeypatch):
+    async def connect(email, password):
+        return False, "Erro na conexão: senha", None, "error"
+
+    monkeypatch.setattr(estrategia_minoria, 'RANKING_EMAIL', 'ranking@exemplo.com')
+    monkeypatch.setattr(estrategia_minoria, 'RANKING_PASSWORD', 'errada')
+    monkeypatch.setattr(estrategia_minoria, '_ranking_api', None)
+    monkeypatch.setattr(estrategia_minoria, 'connect_to_polarium', connect)
+    assert estrategia_minoria.ranking_connection() == (None, None)
+
+
+def test_ranking_route_without_supported_num_blocks(monkeypatch):
+    import main  # noqa: F401 (registra as rotas)
+    from ranking_service import RankingService
+
+    async def scan(api_instance, num_blocks):
+        return None
+
+    service = RankingService(scan_func=scan, api_provider=lambda: (None, None), schedule_func=lambda t: t + 300,
+                             supported_num_blocks=())
+    monkeypatch.setattr('routes.ranking_service', service)
+    estrategia_minoria.connection_manager.add_connection('u1', FakeApi())
+    try:
+        client = estrategia_minoria.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 'u1'
+        assert client.get('/ranking').status_code == 404
+        assert client.get('/ranking?num_blocks=10').status_code == 404
+    finally:
+        estrategia_minoria.connection_manager.remove_connection('u1')
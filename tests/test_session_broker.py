@@ -0,0 +1,219 @@
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+import job_manager as job_manager_module
+from async_utils import CALL_CLASS_BATCH, current_call_class, current_user
+from connection_manager import ConnectionManager
+from event_stream import EventBroker, RemoteEventBroker
+from job_manager import JOB_CANCELED, JobManager, RemoteJobStore
+from ranking_service import RankingService
+from session_broker import (BrokerClient, LockTable, RemoteCache, RemoteConnectionManager, RemotePolarium,
+                            SessionBroker)
+from conftest import wait_until
+
+
+class FakePolarium:
+    """Polarium sem rede, criada pelo broker no lugar da real."""
+
+    def __init__(self, email, password):
+        self.email = email
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def broker():
+    directory = tempfile.mkdtemp(prefix="broker")  # Caminhos de socket Unix têm limite de tamanho
+    broker = SessionBroker(f"{directory}/broker.sock")
+    broker._polarium_class = FakePolarium
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    assert wait_until(lambda: broker._server is not None)
+    yield broker
+    broker.shutdown()
+    thread.join(5)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def client(broker):
+    return BrokerClient(broker.path, timeout=10)
+
+
+def connection_scenario(manager, new_api):
+    """Sequência de operações das rotas; retorna os resultados comparáveis entre as implementações."""
+    def connection(result):
+        api_instance, connected = result
+        return api_instance is not None, connected
+
+    def user_data(data):
+        return None if data is None else {k: v for k, v in data.items() if k not in ('api', 'lock', 'last_activity')}
+
+    out = []
+    manager.add_connection('u1', new_api())
+    out.append(connection(manager.get_connection('u1')))
+    out.append((manager.has_connection('u1'), manager.has_connection('u2')))
+    out.append(manager.get_user_state('u1', 'ranking_cleared'))
+    out.append(manager.set_user_state('u1', 'ranking_cleared', True))
+    out.append(manager.get_user_state('u1', 'ranking_cleared'))
+    out.append(manager.update_user_state('u1', 'top5_ativos', [1]))  # Chave ainda não existe
+    out.append(manager.set_user_state('u1', 'top5_ativos', [{'active': 'EURUSD'}]))
+    out.append(manager.update_user_state('u1', 'analysis_progress', {'in_progress': True, 'percent_complete': 10}))
+    out.append(manager.update_user_items('u1', 'last_results', {'EURUSD': {'win_rate': 80.0}}))
+    out.append(manager.update_user_items('u1', 'last_results', {'GBPUSD': {'win_rate': 60.0}}))
+    out.append(manager.get_user_item('u1', 'last_results', 'EURUSD'))
+    out.append(manager.get_user_item('u1', 'last_results', 'USDJPY', '-'))
+    out.append(manager.get_user_state('u1', 'inexistente', 'padrão'))
+    out.append(manager.update_connection_status('u1', False))
+    out.append(connection(manager.get_connection('u1')))
+    out.append(manager.update_connection_status('u1', True))
+    out.append(manager.pop_user_state('u1', 'top5_ativos'))
+    out.append(manager.pop_user_state('u1', 'top5_ativos'))
+    out.append(manager.most_recent_user())
+    owner, api_instance = manager.get_any_connection()
+    out.append((owner, api_instance is not None))
+    out.append(user_data(manager.get_user_data('u1')))
+    out.append({
+        user_id: {k: v for k, v in summary.items() if not k.startswith('idle_time')}
+        for user_id, summary in manager.list_connections().items()
+    })
+    # Usuário inexistente
+    out.append((
+        manager.set_user_state('u9', 'ranking_cleared', True),
+        manager.get_user_state('u9', 'ranking_cleared'),
+        manager.update_user_items('u9', 'stats', {'EURUSD': {}}),
+        manager.get_user_item('u9', 'stats', 'EURUSD'),
+        manager.get_user_data('u9'),
+        connection(manager.get_connection('u9')),
+        manager.update_connection_status('u9', True),
+        manager.pop_user_state('u9', 'stats'),
+        manager.get_lock('u9'),
+    ))
+    out.append(manager.remove_connection('u1'))
+    out.append(manager.remove_connection('u1'))
+    out.append(connection(manager.get_connection('u1')))
+    out.append(manager.most_recent_user())
+    out.append(manager.get_any_connection())
+    return out
+
+
+def test_remote_connection_manager_matches_local(broker, client):
+    local = connection_scenario(ConnectionManager(), lambda: FakePolarium('a@b', 'x'))
+    remote = connection_scenario(
+        RemoteConnectionManager(client),
+        lambda: RemotePolarium(client.request({"op": "open", "email": "a@b", "password": "x"}))
+    )
+    assert remote == local
+    assert local[2] is False  # ranking_cleared existe desde a conexão
+
+
+def test_user_lock_is_held_in_the_broker(broker, client):
+    manager = RemoteConnectionManager(client)
+    manager.add_connection('u1', RemotePolarium(client.request({"op": "open", "email": "a@b", "password": "x"})))
+    lock = manager.get_lock('u1')
+    holding = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with lock:
+            with lock:  # Reentrante para o mesmo dono
+                holding.set()
+                release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    assert holding.wait(5)
+    # Outra thread (ou worker) não obtém o lock enquanto ele está com o dono
+    assert not manager.get_lock('u1').acquire(blocking=False)
+    release.set()
+    thread.join(5)
+    assert manager.get_lock('u1').acquire(timeout=1)
+    manager.get_lock('u1').release()
+    assert broker.locks._held == {}
+
+
+def test_lease_expires_without_renewal():
+    locks = LockTable()
+    assert locks.lease("ranking", "worker-1", 0.1)
+    assert not locks.lease("ranking", "worker-2", 0.1)
+    assert locks.lease("ranking", "worker-1", 0.1)  # Renovação
+    time.sleep(0.15)
+    assert locks.lease("ranking", "worker-2", 0.1)
+
+
+def test_remote_events_replay_across_workers(broker, client):
+    publisher = RemoteEventBroker(client)
+    subscriber = RemoteEventBroker(BrokerClient(broker.path, timeout=10))
+    first = publisher.publish('job:a', 'progress', {'percent_complete': 10})
+    second = publisher.publish('job:a', 'result', {'status': 'completed'})
+    publisher.close('job:a')
+
+    assert subscriber.last_event_id() == second
+    events, finished = subscriber.wait_for_events('job:a', first, timeout=0)
+    assert (events, finished) == ([{'id': second, 'event': 'result', 'data': {'status': 'completed'}}], False)
+    assert list(subscriber.stream('job:a', first)) == list(broker.events.stream('job:a', first))
+    assert isinstance(broker.events, EventBroker) and not isinstance(broker.events, RemoteEventBroker)
+
+
+def test_job_is_visible_and_cancelable_from_another_worker(broker, client, monkeypatch):
+    monkeypatch.setattr(job_manager_module, "JOB_CANCEL_POLL_INTERVAL", 0.05)
+    worker_a = JobManager(store=RemoteJobStore(client))
+    worker_b = JobManager(store=RemoteJobStore(BrokerClient(broker.path, timeout=10)))
+    started = threading.Event()
+
+    async def job(job_id):
+        import asyncio
+        from async_utils import current_cancel_token
+        worker_a.add_partial_result(job_id, 'EURUSD', 'Sucesso')
+        started.set()
+        token = current_cancel_token.get()
+        while not token.canceled:  # Só o token local: o pedido vem do outro worker
+            await asyncio.sleep(0.01)
+        return 'interrompido'
+
+    try:
+        job_id = worker_a.submit('u1', 'top5', job)
+        assert started.wait(5)
+        assert worker_b.get_active_job('u1', 'top5') == job_id
+        assert worker_b.get_job_owner(job_id) == 'u1'
+        assert worker_b.get_job(job_id)['partial_results'] == {'EURUSD': 'Sucesso'}
+
+        assert worker_b.cancel(job_id)
+        assert wait_until(lambda: not worker_b.get_job_status(job_id)['in_progress'])
+        job = worker_b.get_job(job_id)
+        assert (job['status'], job['result']) == (JOB_CANCELED, 'interrompido')
+        assert [j['job_id'] for j in worker_b.list_jobs('u1')] == [job_id]
+    finally:
+        worker_a.cleanup()
+        worker_b.cleanup()
+
+
+def test_only_the_ranking_leader_scans(broker, client):
+    scans = []
+
+    async def scan(api_instance, num_blocks):
+        # As chamadas da varredura contam no limite do dono da conexão, na classe de lote
+        scans.append((num_blocks, current_user.get(), current_call_class.get()))
+        return {"top5": [{"active": "EURUSD"}], "successful_analysis": 1}
+
+    def service(leader):
+        return RankingService(scan_func=scan, api_provider=lambda: ('u1', object()), schedule_func=lambda t: t + 300,
+                              supported_num_blocks=(10,), store=RemoteCache(client),
+                              lease_func=lambda ttl: leader)
+
+    leader, follower = service(True), service(False)
+    assert leader.refresh_all()
+    assert scans == [(10, 'u1', CALL_CLASS_BATCH)]
+
+    snapshot = follower.get_snapshot(10)
+    assert snapshot == leader.get_snapshot(10)
+    assert (snapshot["version"], snapshot["top5"]) == (1, [{"active": "EURUSD"}])
+
+    # Versões continuam crescendo quando a liderança muda de processo
+    assert service(True).refresh_all()
+    assert follower.get_snapshot(10, current_only=False)["version"] == 2
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importa a aplicação inteira em um processo limpo e informa o que a importação deixou carregado
+PROBE = """
+import json, os, sys, threading
+import main
+from config import LAZY_MODULES, get_logger
+get_logger("main")
+print(json.dumps({
+    "heavy": [name for name in LAZY_MODULES if name in sys.modules],
+    "threads": [t.name for t in threading.enumerate() if t is not threading.main_thread()],
+    "files": sorted(os.listdir(".")),
+    "main_handlers": len(get_logger("main").handlers) + len(__import__("logging").getLogger().handlers),
+}))
+"""
+
+
+def test_importing_the_app_is_lazy(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT, LOGS_DIR=str(tmp_path / "logs"), RANKING_SERVICE_ENABLED="false",
+               CANDLE_STORE_PATH=str(tmp_path / "data" / "candles.db"))
+    env.pop("SESSION_BROKER_SOCKET", None)
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert output.returncode == 0, output.stderr
+    probe = json.loads(output.stdout.strip().splitlines()[-1])
+
+    # Módulos pesados só quando usados
+    assert probe["heavy"] == []
+    # Nenhuma thread antes do fork dos workers (preload_app): cada processo inicia as suas no primeiro uso
+    assert probe["threads"] == []
+    # Nem arquivos de dados (o histórico de velas é criado no primeiro uso)
+    assert "data" not in probe["files"]
+    # Logging configurado uma única vez: console e main.log na raiz, nenhum handler no logger "main"
+    assert probe["main_handlers"] == 2
+
+
+def test_connection_cleanup_starts_with_the_first_connection():
+    from connection_manager import ConnectionManager
+
+    manager = ConnectionManager()
+    assert manager._cleanup_thread is None
+    manager.add_connection('u1', None)
+    assert manager._cleanup_thread.is_alive()
+    manager.remove_connection('u1')
@@ -0,0 +1,158 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from strategies import STRATEGIES, MinorityStrategy, Strategy, compute_block_stats, evaluate_strategies
+
+
+def make_candles(start, count, seed=7):
+    """Velas de 1 minuto determinísticas, com ~5% de dojis."""
+    rng = random.Random(seed)
+    candles = []
+    for i in range(count):
+        t = start + i * 60
+        o = round(1 + rng.random(), 5)
+        c = o if rng.random() < 0.05 else round(o + rng.choice([-1, 1]) * rng.random() / 100, 5)
+        candles.append({'from': t, 'open': o, 'close': c, 'min': min(o, c) - 0.001, 'max': max(o, c) + 0.001})
+    return candles
+
+
+# Implementação anterior ao motor de estratégias (estrategia_minoria.analyze_candles e check_result),
+# com a API simulada: get_candles(count, to) retorna as `count` velas até a que contém `to`
+
+def get_time_block(timestamp):
+    dt = datetime.fromtimestamp(timestamp)
+    minutes = dt.minute - (dt.minute % 5)
+    return int(datetime(dt.year, dt.month, dt.day, dt.hour, minutes, 0).timestamp())
+
+
+def get_line_position(block_time):
+    return block_time - 30
+
+
+def candle_in_block(candle_time, block_start):
+    return get_line_position(block_start) <= candle_time < get_line_position(block_start + 300)
+
+
+def old_check_result(by_time, current_time, block_time, next_block_time, signal):
+    line_end_time = get_line_position(next_block_time)
+    if current_time < line_end_time + 60:
+        return None
+    minutes_passed = min(3, max(1, (current_time - line_end_time) // 60))
+    to = line_end_time + minutes_passed * 60
+    last = to - to % 60
+    candles = [by_time[t] for t in range(last - (minutes_passed - 1) * 60, last + 1, 60) if t in by_time]
+    if len(candles) < 1:
+        return None
+    for i, candle in enumerate(candles):
+        candle_direction = "DOJI" if candle['open'] == candle['close'] else "CALL" if candle['open'] < candle['close'] else "PUT"
+        if signal == candle_direction:
+            return {"result": "WIN", "martingale": i}
+        if i == len(candles) - 1:
+            if i == 2 or minutes_passed >= 3:
+                return {"result": "LOSS", "martingale": 2}
+            return None
+    return None
+
+
+def old_analyze(candles, current_time, num_blocks):
+    by_time = {c['from']: c for c in candles}
+    current_block = get_time_block(current_time)
+    blocks = {current_block - i * 300: [] for i in range(num_blocks)}
+    for candle in candles:
+        for block_time in blocks.keys():
+            if candle_in_block(candle['from'], block_time):
+                if len(blocks[block_time]) < 5:
+                    is_doji = candle['open'] == candle['close']
+                    direction = "doji" if is_doji else "verde" if candle['open'] < candle['close'] else "vermelha"
+                    blocks[block_time].append({
+                        "time": candle['from'], "direction": direction, "open": candle['open'],
+                        "close": candle['close'], "high": candle['max'], "low": candle['min']
+                    })
+                break
+
+    results = []
+    for block_time, candles_block in sorted(blocks.items()):
+        if len(candles_block) != 5:
+            continue
+        verde_count = sum(1 for c in candles_block if c['direction'] == "verde")
+        vermelha_count = sum(1 for c in candles_block if c['direction'] == "vermelha")
+        if any(c['direction'] == "doji" for c in candles_block):
+            signal = "NULO"
+        elif verde_count < vermelha_count:
+            signal = "CALL"
+        elif vermelha_count < verde_count:
+            signal = "PUT"
+        else:
+            signal = "DOJI"
+        if signal != "NULO":
+            result_data = old_check_result(by_time, current_time, block_time, block_time + 300, signal)
+        else:
+            result_data = {"result": "NULO", "martingale": "NULO"}
+        results.append({
+            "block_time": block_time,
+            "time_str": datetime.fromtimestamp(block_time).strftime("%H:%M"),
+            "verde_count": verde_count,
+            "vermelha_count": vermelha_count,
+            "signal": signal,
+            "candles": candles_block,
+            "result": result_data["result"] if result_data else None,
+            "martingale": result_data["martingale"] if result_data else None
+        })
+    return results
+
+
+START = 1_700_000_100  # Início de um bloco de 5 minutos
+
+
+@pytest.mark.parametrize("num_blocks", [1, 5, 10, 30])
+@pytest.mark.parametrize("seconds_in_block", [0, 10, 60, 65, 125, 190, 241, 250])
+def test_minority_matches_candle_in_block_implementation(num_blocks, seconds_in_block):
+    current_time = START + 300 * 40 + seconds_in_block
+    # Velas já fechadas no instante de referência, como as usadas na análise
+    candles = [c for c in make_candles(START, 41 * 5, seed=seconds_in_block) if c['from'] + 60 <= current_time]
+
+    # A implementação anterior lia a vela ainda aberta após os 30 segundos de cada minuto;
+    # nos demais instantes as duas implementações devem coincidir
+    assert current_time % 60 < 30
+    expected = old_analyze(candles, current_time, num_blocks)
+    actual = evaluate_strategies(candles, [STRATEGIES["minoria"]], num_blocks, current_time)["minoria"]
+    assert actual == expected
+    assert compute_block_stats(actual) == compute_block_stats(expected)
+
+
+def test_results_cover_settled_and_pending_blocks():
+    current_time = START + 300 * 40 + 10
+    candles = [c for c in make_candles(START, 41 * 5, seed=3) if c['from'] + 60 <= current_time]
+    blocks = evaluate_strategies(candles, [STRATEGIES["minoria"]], 30, current_time)["minoria"]
+    assert {b["result"] for b in blocks} >= {"WIN", "LOSS"}
+    # O último bloco completo ainda não tem velas de apuração fechadas
+    assert blocks[-1]["result"] is None or blocks[-1]["signal"] == "NULO"
+
+
+def test_strategies_share_one_pass():
+    current_time = START + 300 * 20 + 5
+    candles = [c for c in make_candles(START, 21 * 5) if c['from'] + 60 <= current_time]
+    results = evaluate_strategies(candles, STRATEGIES.values(), 10, current_time)
+    assert set(results) == {"minoria", "maioria", "mhi"}
+    for minority, majority in zip(results["minoria"], results["maioria"]):
+        assert minority["block_time"] == majority["block_time"]
+        if minority["signal"] in ("CALL", "PUT"):
+            assert majority["signal"] == ("PUT" if minority["signal"] == "CALL" else "CALL")
+
+
+def test_strategy_without_signal_rule_fails_on_creation():
+    class Incomplete(Strategy):
+        def pick_signal(self, verde_count, vermelha_count):
+            return "CALL"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_with_params_keeps_previous_overrides():
+    strategy = MinorityStrategy().with_params(block_size=3).with_params(max_martingale=1)
+    assert (strategy.block_size, strategy.max_martingale) == (3, 1)
+    assert strategy.with_params(block_size=4).max_martingale == 1
+    assert MinorityStrategy().block_size == 5